@@ -0,0 +1,531 @@
+import asyncio
+import base64
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from email import message_from_bytes
+from typing import List, Optional, Tuple
+from urllib.parse import unquote
+
+import uvicorn
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from benchmarks.synthetic import SyntheticCalendar, SyntheticMailbox
+
+GMAIL_PREFIX = "/gmail/v1/users/me"
+GMAIL_UPLOAD_PREFIX = "/upload/gmail/v1/users/me"
+UPLOAD_SESSION_PATH = "/upload/sessions"
+CALENDAR_PREFIX = "/calendar/v3"
+CALENDAR_BATCH_PATH = "/batch/calendar/v3"
+TOKEN_PATH = "/token"
+
+# history.list historyTypes -> key of the matching history record field
+HISTORY_RECORD_KEYS = {
+    "messageAdded": "messagesAdded",
+    "messageDeleted": "messagesDeleted",
+    "labelAdded": "labelsAdded",
+    "labelRemoved": "labelsRemoved",
+}
+
+
+class FakeGoogleSettings:
+    """Latency and failure injection for the fake server"""
+
+    def __init__(
+        self,
+        latency_ms: float = 20.0,
+        jitter_ms: float = 10.0,
+        rate_limit_ratio: float = 0.0,
+        server_error_ratio: float = 0.0,
+        retry_after_seconds: float = 0.1,
+        seed: int = 1
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.server_error_ratio = server_error_ratio
+        self.retry_after_seconds = retry_after_seconds
+        self.rng = random.Random(seed)
+
+
+class FakeGoogleStats:
+    """Calls served per endpoint, plus the errors that were injected"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.injected = Counter()
+
+    def record(self, endpoint: str, injected: Optional[str] = None):
+        with self.lock:
+            self.calls[endpoint] += 1
+            if injected:
+                self.injected[injected] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"calls": dict(self.calls), "injected": dict(self.injected)}
+
+
+def _endpoint_name(method: str, path: str) -> str:
+    """Collapse IDs out of a path so calls can be counted per endpoint"""
+    if path.startswith(GMAIL_PREFIX):
+        parts = path[len(GMAIL_PREFIX):].strip("/").split("/")
+        if parts[0] == "messages" and len(parts) == 2 and parts[1] not in ("batchModify", "send"):
+            parts[1] = "{id}"
+        elif parts[0] == "messages" and len(parts) >= 3:
+            parts[1] = "{id}"
+            if len(parts) == 4:
+                parts[3] = "{id}"
+        return f"gmail {method} /" + "/".join(parts)
+    if path.startswith(GMAIL_UPLOAD_PREFIX):
+        return f"gmail upload {method} {path[len(GMAIL_UPLOAD_PREFIX):]}"
+    if path.startswith(UPLOAD_SESSION_PATH):
+        return f"gmail upload {method} /sessions/{{id}}"
+    if path.startswith(CALENDAR_PREFIX):
+        parts = path[len(CALENDAR_PREFIX):].strip("/").split("/")
+        if parts[0] == "calendars" and len(parts) >= 2:
+            parts[1] = "{calendarId}"
+            if len(parts) == 4:
+                parts[3] = "{eventId}"
+        return f"calendar {method} /" + "/".join(parts)
+    if path == CALENDAR_BATCH_PATH:
+        return f"calendar batch {method}"
+    return f"oauth {method} {path}"
+
+
+def _strip_body_data(part: dict) -> dict:
+    """Partial-response view of a MIME part without any body data"""
+    stripped = {key: value for key, value in part.items() if key != "parts"}
+    stripped["body"] = {key: value for key, value in part.get("body", {}).items() if key != "data"}
+    if part.get("parts"):
+        stripped["parts"] = [_strip_body_data(child) for child in part["parts"]]
+    return stripped
+
+
+def _page(items: list, page_token: Optional[str], max_results: int) -> tuple:
+    """Offset-based pagination; the page token is the offset of the next page"""
+    offset = int(page_token) if page_token else 0
+    page = items[offset:offset + max_results]
+    next_offset = offset + max_results
+    return page, (str(next_offset) if next_offset < len(items) else None)
+
+
+def create_fake_google_app(mailbox: SyntheticMailbox, calendar: SyntheticCalendar, settings: FakeGoogleSettings, stats: FakeGoogleStats) -> FastAPI:
+    """Stand-in for the Gmail, Calendar and OAuth token endpoints the sync code uses"""
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        endpoint = _endpoint_name(request.method, request.url.path)
+
+        delay = settings.latency_ms + settings.rng.uniform(0, settings.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if request.url.path != TOKEN_PATH:
+            if not request.headers.get("authorization", "").startswith("Bearer "):
+                stats.record(endpoint, "unauthorized")
+                return JSONResponse({"error": {"code": 401, "message": "Login Required"}}, status_code=401)
+
+            roll = settings.rng.random()
+            if roll < settings.rate_limit_ratio:
+                stats.record(endpoint, "rate_limited")
+                return JSONResponse(
+                    {"error": {"code": 429, "message": "Rate Limit Exceeded", "errors": [{"reason": "rateLimitExceeded"}]}},
+                    status_code=429,
+                    headers={"Retry-After": str(settings.retry_after_seconds)}
+                )
+            if roll < settings.rate_limit_ratio + settings.server_error_ratio:
+                stats.record(endpoint, "server_error")
+                return JSONResponse({"error": {"code": 503, "message": "Backend Error"}}, status_code=503)
+
+        stats.record(endpoint)
+        return await call_next(request)
+
+    def not_found(what: str) -> JSONResponse:
+        return JSONResponse({"error": {"code": 404, "message": f"{what} not found"}}, status_code=404)
+
+    # ----- OAuth -----
+
+    @app.post(TOKEN_PATH)
+    async def token():
+        return {"access_token": f"fake-access-{time.time_ns()}", "expires_in": 3600, "token_type": "Bearer"}
+
+    # ----- Gmail -----
+
+    @app.get(f"{GMAIL_PREFIX}/profile")
+    async def gmail_profile():
+        return {
+            "emailAddress": mailbox.email_address,
+            "messagesTotal": len(mailbox.messages),
+            "historyId": str(mailbox.history_id)
+        }
+
+    @app.get(f"{GMAIL_PREFIX}/labels")
+    async def gmail_labels():
+        names = sorted({label for message in mailbox.messages.values() for label in message["labelIds"]})
+        return {"labels": [{"id": name, "name": name, "type": "system"} for name in names]}
+
+    @app.get(f"{GMAIL_PREFIX}/messages")
+    async def gmail_list_messages(
+        labelIds: Optional[List[str]] = Query(None),
+        maxResults: int = 100,
+        pageToken: Optional[str] = None
+    ):
+        matches = mailbox.list_ids(labelIds)
+        page, next_token = _page(matches, pageToken, min(max(maxResults, 1), 500))
+        body = {"resultSizeEstimate": len(matches)}
+        if page:
+            body["messages"] = page
+        if next_token:
+            body["nextPageToken"] = next_token
+        return body
+
+    @app.get(f"{GMAIL_PREFIX}/history")
+    async def gmail_history(
+        startHistoryId: int,
+        historyTypes: Optional[List[str]] = Query(None),
+        maxResults: int = 100,
+        pageToken: Optional[str] = None
+    ):
+        records = mailbox.history_since(startHistoryId)
+        if records is None:
+            return not_found("Requested entity")
+        if historyTypes:
+            wanted = {HISTORY_RECORD_KEYS[history_type] for history_type in historyTypes if history_type in HISTORY_RECORD_KEYS}
+            records = [record for record in records if wanted & set(record)]
+        page, next_token = _page(records, pageToken, min(max(maxResults, 1), 500))
+        body = {"historyId": str(mailbox.history_id)}
+        if page:
+            body["history"] = page
+        if next_token:
+            body["nextPageToken"] = next_token
+        return body
+
+    @app.post(f"{GMAIL_PREFIX}/watch")
+    async def gmail_watch(request: Request):
+        body = await request.json()
+        if not body.get("topicName"):
+            return JSONResponse({"error": {"code": 400, "message": "Invalid topicName"}}, status_code=400)
+        mailbox.watching = True
+        expiration = int((time.time() + 7 * 24 * 3600) * 1000)
+        return {"historyId": str(mailbox.history_id), "expiration": str(expiration)}
+
+    @app.post(f"{GMAIL_PREFIX}/stop")
+    async def gmail_stop():
+        mailbox.watching = False
+        return Response(status_code=204)
+
+    @app.post(f"{GMAIL_PREFIX}/messages/batchModify")
+    async def gmail_batch_modify(request: Request):
+        body = await request.json()
+        ids = body.get("ids", [])
+        if len(ids) > 1000:
+            return JSONResponse({"error": {"code": 400, "message": "Too many ids"}}, status_code=400)
+        if any(gmail_id not in mailbox.messages for gmail_id in ids):
+            return JSONResponse({"error": {"code": 400, "message": "Invalid id value"}}, status_code=400)
+        for gmail_id in ids:
+            mailbox.modify(gmail_id, body.get("addLabelIds", []), body.get("removeLabelIds", []))
+        return Response(status_code=204)
+
+    @app.post(f"{GMAIL_PREFIX}/messages/send")
+    async def gmail_send(request: Request):
+        await request.body()
+        mailbox.history_id += 1
+        return {"id": f"sent{mailbox.history_id:012x}", "threadId": f"sent{mailbox.history_id:012x}", "labelIds": ["SENT"]}
+
+    upload_sessions = {}
+
+    @app.post(f"{GMAIL_UPLOAD_PREFIX}/messages/send")
+    async def gmail_upload_send_session(request: Request, uploadType: str = "resumable"):
+        await request.body()
+        session_id = f"{len(upload_sessions) + 1:08x}"
+        upload_sessions[session_id] = int(request.headers.get("x-upload-content-length", 0))
+        return Response(status_code=200, headers={"Location": f"{str(request.base_url).rstrip('/')}{UPLOAD_SESSION_PATH}/{session_id}"})
+
+    @app.put(f"{UPLOAD_SESSION_PATH}/{{session_id}}")
+    async def gmail_upload_send(session_id: str, request: Request):
+        expected = upload_sessions.pop(session_id, None)
+        if expected is None:
+            return JSONResponse({"error": {"code": 404, "message": "Upload session not found"}}, status_code=404)
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+        if expected and received != expected:
+            return JSONResponse({"error": {"code": 400, "message": "Content length mismatch"}}, status_code=400)
+        mailbox.history_id += 1
+        return {"id": f"sent{mailbox.history_id:012x}", "threadId": f"sent{mailbox.history_id:012x}", "labelIds": ["SENT"]}
+
+    @app.get(f"{GMAIL_PREFIX}/messages/{{gmail_id}}")
+    async def gmail_get_message(
+        gmail_id: str,
+        format: str = "full",
+        metadataHeaders: Optional[List[str]] = Query(None),
+        fields: Optional[str] = None
+    ):
+        message = mailbox.messages.get(gmail_id)
+        if message is None:
+            return not_found("Message")
+
+        payload = message["payload"]
+        if format == "metadata":
+            wanted = {name.lower() for name in (metadataHeaders or [])}
+            headers = [header for header in payload["headers"] if not wanted or header["name"].lower() in wanted]
+            return dict(message, payload={"partId": "", "mimeType": payload["mimeType"], "headers": headers})
+        if format == "minimal":
+            return {key: value for key, value in message.items() if key != "payload"}
+        if fields:
+            # Partial responses are only used to read the MIME tree without body data
+            return {"payload": _strip_body_data(payload)}
+        return message
+
+    @app.get(f"{GMAIL_PREFIX}/messages/{{gmail_id}}/attachments/{{attachment_id}}")
+    async def gmail_get_attachment(gmail_id: str, attachment_id: str):
+        data = mailbox.attachments.get(attachment_id)
+        if data is None:
+            return not_found("Attachment")
+        return {"attachmentId": attachment_id, "size": len(data) * 3 // 4, "data": data}
+
+    @app.post(f"{GMAIL_PREFIX}/messages/{{gmail_id}}/modify")
+    async def gmail_modify(gmail_id: str, request: Request):
+        body = await request.json()
+        message = mailbox.modify(gmail_id, body.get("addLabelIds", []), body.get("removeLabelIds", []))
+        if message is None:
+            return not_found("Message")
+        return {"id": gmail_id, "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+    @app.post(f"{GMAIL_PREFIX}/messages/{{gmail_id}}/trash")
+    async def gmail_trash(gmail_id: str):
+        message = mailbox.modify(gmail_id, ["TRASH"], ["INBOX"])
+        if message is None:
+            return not_found("Message")
+        return {"id": gmail_id, "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+    # ----- Calendar -----
+
+    @app.get(f"{CALENDAR_PREFIX}/users/me/calendarList")
+    async def calendar_list():
+        return {"kind": "calendar#calendarList", "items": list(calendar.calendars.values())}
+
+    @app.get(f"{CALENDAR_PREFIX}/calendars/{{calendar_id}}/events")
+    async def calendar_list_events(
+        calendar_id: str,
+        timeMin: Optional[str] = None,
+        timeMax: Optional[str] = None,
+        q: Optional[str] = None,
+        maxResults: int = 250,
+        pageToken: Optional[str] = None,
+        syncToken: Optional[str] = None
+    ):
+        if calendar_id not in calendar.calendars:
+            return not_found("Calendar")
+        if syncToken:
+            events = calendar.changes_since(calendar_id, syncToken)
+            if events is None:
+                return JSONResponse(
+                    {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required.", "errors": [{"reason": "fullSyncRequired"}]}},
+                    status_code=410
+                )
+        else:
+            events = calendar.list_events(calendar_id, timeMin, timeMax, q)
+        page, next_token = _page(events, pageToken, min(max(maxResults, 1), 2500))
+        body = {"kind": "calendar#events", "items": page}
+        if next_token:
+            body["nextPageToken"] = next_token
+        else:
+            body["nextSyncToken"] = calendar.sync_token()
+        return body
+
+    def calendar_call(method: str, path: str, body: Optional[dict]) -> Tuple[int, Optional[dict]]:
+        """One Calendar events call, as the batch endpoint dispatches it"""
+        parts = [unquote(part) for part in path[len(CALENDAR_PREFIX):].strip("/").split("/")]
+        if len(parts) < 3 or parts[0] != "calendars" or parts[2] != "events":
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        calendar_id = parts[1]
+        if calendar_id not in calendar.calendars:
+            return 404, {"error": {"code": 404, "message": "Calendar not found"}}
+
+        if len(parts) == 3 and method == "POST":
+            event_id = (body or {}).get("id")
+            if event_id and (event_id in calendar.events.get(calendar_id, {}) or event_id in calendar.cancelled.get(calendar_id, {})):
+                return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+            return 200, calendar.insert(calendar_id, body or {})
+        if len(parts) == 4:
+            event_id = parts[3]
+            if method == "GET":
+                event = calendar.events.get(calendar_id, {}).get(event_id)
+            elif method in ("PATCH", "PUT"):
+                event = calendar.update(calendar_id, event_id, body or {}, replace=method == "PUT")
+            elif method == "DELETE":
+                if not calendar.delete(calendar_id, event_id):
+                    return 410, {"error": {"code": 410, "message": "Resource has been deleted"}}
+                return 204, None
+            else:
+                return 405, {"error": {"code": 405, "message": "Method Not Allowed"}}
+            if event is None:
+                return 404, {"error": {"code": 404, "message": "Event not found"}}
+            return 200, event
+        return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+    @app.post(f"{CALENDAR_PREFIX}/calendars/{{calendar_id}}/events")
+    async def calendar_insert_event(calendar_id: str, request: Request):
+        status, body = calendar_call("POST", request.url.path, await request.json())
+        return JSONResponse(body, status_code=status)
+
+    @app.get(f"{CALENDAR_PREFIX}/calendars/{{calendar_id}}/events/{{event_id}}")
+    async def calendar_get_event(calendar_id: str, event_id: str):
+        event = calendar.events.get(calendar_id, {}).get(event_id)
+        return event if event is not None else not_found("Event")
+
+    @app.patch(f"{CALENDAR_PREFIX}/calendars/{{calendar_id}}/events/{{event_id}}")
+    async def calendar_patch_event(calendar_id: str, event_id: str, request: Request):
+        event = calendar.update(calendar_id, event_id, await request.json())
+        return event if event is not None else not_found("Event")
+
+    @app.put(f"{CALENDAR_PREFIX}/calendars/{{calendar_id}}/events/{{event_id}}")
+    async def calendar_update_event(calendar_id: str, event_id: str, request: Request):
+        event = calendar.update(calendar_id, event_id, await request.json(), replace=True)
+        return event if event is not None else not_found("Event")
+
+    @app.delete(f"{CALENDAR_PREFIX}/calendars/{{calendar_id}}/events/{{event_id}}")
+    async def calendar_delete_event(calendar_id: str, event_id: str):
+        if not calendar.delete(calendar_id, event_id):
+            return JSONResponse({"error": {"code": 410, "message": "Resource has been deleted"}}, status_code=410)
+        return Response(status_code=204)
+
+    @app.post(CALENDAR_BATCH_PATH)
+    async def calendar_batch(request: Request):
+        content_type = request.headers.get("content-type", "")
+        envelope = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + await request.body())
+        parts = envelope.get_payload() if envelope.is_multipart() else []
+        if not parts or len(parts) > 50:
+            return JSONResponse({"error": {"code": 400, "message": "A batch holds 1 to 50 calls"}}, status_code=400)
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        lines = []
+        for part in parts:
+            raw = (part.get_payload(decode=True) or b"").replace(b"\r\n", b"\n")
+            head, _, payload = raw.partition(b"\n\n")
+            method, path = head.decode().split("\n")[0].split()[:2]
+            status, body = calendar_call(method, path, json.loads(payload) if payload.strip() else None)
+            stats.record(_endpoint_name(method, path) + " (batched)")
+
+            lines += [
+                f"--{boundary}",
+                "Content-Type: application/http",
+                f"Content-ID: <response-{(part.get('Content-ID') or '').strip('<>')}>",
+                "",
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}"
+            ]
+            if body is not None:
+                lines += ["Content-Type: application/json; charset=UTF-8", "", json.dumps(body)]
+            else:
+                lines.append("")
+            lines.append("")
+        lines.append(f"--{boundary}--")
+
+        return Response("\r\n".join(lines), media_type=f"multipart/mixed; boundary={boundary}")
+
+    return app
+
+
+class FakePubSub:
+    """
+    Local stand-in for the Pub/Sub push subscription behind users.watch.
+
+    publish() wraps a Gmail notification in the push envelope Pub/Sub sends and
+    hands it to `subscriber` (an async callable, e.g. the app's push handler)
+    or POSTs it to `push_endpoint`.
+    """
+
+    def __init__(self, subscriber=None, push_endpoint: Optional[str] = None, subscription: str = "projects/bench/subscriptions/gmail-push"):
+        self.subscriber = subscriber
+        self.push_endpoint = push_endpoint
+        self.subscription = subscription
+        self.published = 0
+        self.responses = Counter()
+
+    def envelope(self, email_address: str, history_id: int, message_id: Optional[str] = None) -> dict:
+        self.published += 1
+        data = json.dumps({"emailAddress": email_address, "historyId": history_id}).encode()
+        return {
+            "message": {
+                "data": base64.b64encode(data).decode("ascii"),
+                "messageId": message_id or f"bench-{time.time_ns()}-{self.published}",
+                "publishTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            },
+            "subscription": self.subscription
+        }
+
+    async def push(self, envelope: dict) -> dict:
+        """Deliver one envelope (use this to redeliver a message, as Pub/Sub may)"""
+        if self.subscriber is not None:
+            result = await self.subscriber(envelope)
+        else:
+            import httpx
+
+            async with httpx.AsyncClient() as client:
+                response = await client.post(self.push_endpoint, json=envelope, timeout=10.0)
+                result = response.json() if response.content else {"status": response.status_code}
+        self.responses[result.get("status", "unknown")] += 1
+        return result
+
+    async def publish(self, email_address: str, history_id: int) -> dict:
+        return await self.push(self.envelope(email_address, history_id))
+
+
+class FakeGoogleServer:
+    """Runs the fake Google app with uvicorn on a background thread"""
+
+    def __init__(self, mailbox: SyntheticMailbox, calendar: SyntheticCalendar, settings: Optional[FakeGoogleSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.mailbox = mailbox
+        self.calendar = calendar
+        self.settings = settings or FakeGoogleSettings()
+        self.stats = FakeGoogleStats()
+        self.host = host
+        self.port = port or self._free_port()
+        self.app = create_fake_google_app(mailbox, calendar, self.settings, self.stats)
+        self.server = None
+        self.thread = None
+
+    def _free_port(self) -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind((self.host, 0))
+            return sock.getsockname()[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def environment(self) -> dict:
+        """Environment overrides that point config.google at this server"""
+        return {
+            "GOOGLE_GMAIL_API": f"{self.base_url}{GMAIL_PREFIX}",
+            "GOOGLE_GMAIL_UPLOAD_API": f"{self.base_url}{GMAIL_UPLOAD_PREFIX}",
+            "GOOGLE_CALENDAR_API": f"{self.base_url}{CALENDAR_PREFIX}",
+            "GOOGLE_CALENDAR_BATCH_URL": f"{self.base_url}{CALENDAR_BATCH_PATH}",
+            "GOOGLE_TOKEN_URL": f"{self.base_url}{TOKEN_PATH}",
+        }
+
+    def start(self, timeout: float = 10.0):
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name="fake-google", daemon=True)
+        self.thread.start()
+
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"Fake Google server did not start on {self.base_url}")
+            time.sleep(0.05)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.should_exit = True
+            self.thread.join(timeout=10)
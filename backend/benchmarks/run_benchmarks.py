@@ -0,0 +1,412 @@
+"""
+End-to-end sync benchmarks against the offline fake Google server.
+
+Run from backend/ against a scratch database:
+
+    DATABASE_URL=postgresql://postgres:pw@localhost/spa_bench python -m benchmarks.run_benchmarks
+
+A throwaway user with Gmail and Calendar connections is created for the run
+and removed afterwards (pass --keep to inspect it). Each scenario reports
+items/sec, Google API calls, injected errors, DB queries and wall time.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_google import FakeGoogleServer, FakeGoogleSettings, FakePubSub
+from benchmarks.synthetic import SyntheticCalendar, SyntheticMailbox
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ["gmail_full_sync", "gmail_resync", "gmail_push", "email_body", "local_to_gmail", "calendar_sync", "calendar_resync"]
+
+
+class QueryCounter:
+    """Counts SQL statements sent through an engine"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+
+
+class BenchmarkContext:
+    """Everything a scenario needs: the fake server, the benchmark user and CLI options"""
+
+    def __init__(self, server: FakeGoogleServer, options: argparse.Namespace):
+        self.server = server
+        self.options = options
+        self.user_id = None
+        self.session_id = None
+        self.calendar_ids = list(server.calendar.calendars)
+
+
+def make_request(session_id: str):
+    """Minimal Starlette request carrying the session cookie, for calling route functions directly"""
+    from starlette.requests import Request
+
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "query_string": b"",
+        "headers": [(b"cookie", f"session_id={session_id}".encode())]
+    })
+
+
+def create_benchmark_user(ctx: BenchmarkContext):
+    from database import SessionLocal
+    from models import models
+    from routes.auth.session import create_session
+
+    db = SessionLocal()
+    try:
+        tag = f"bench_{ctx.options.seed}_{int(time.time())}"
+        user = models.User(username=tag, email=f"{tag}@bench.test", password="!")
+        db.add(user)
+        db.flush()
+
+        token_expiry = datetime.now() + timedelta(hours=6)
+        db.add(models.GmailConnection(
+            user_id=user.id,
+            access_token="bench-token",
+            refresh_token="bench-refresh",
+            token_expiry=token_expiry,
+            email_address=ctx.server.mailbox.email_address
+        ))
+        db.add(models.GoogleCalendarConnection(
+            user_id=user.id,
+            access_token="bench-token",
+            refresh_token="bench-refresh",
+            token_expiry=token_expiry,
+            calendar_ids=ctx.calendar_ids
+        ))
+        db.commit()
+        ctx.user_id = user.id
+    finally:
+        db.close()
+
+    ctx.session_id = create_session(ctx.user_id)
+
+
+def delete_benchmark_user(ctx: BenchmarkContext):
+    from database import SessionLocal
+    from models import models
+
+    db = SessionLocal()
+    try:
+        email_ids = db.query(models.Email.id).filter(models.Email.user_id == ctx.user_id)
+        db.query(models.EmailAttachment).filter(models.EmailAttachment.email_id.in_(email_ids)).delete(synchronize_session=False)
+        for model in (models.Email, models.Event, models.SyncJob, models.SyncOutbox, models.Session, models.GmailConnection, models.GoogleCalendarConnection):
+            db.query(model).filter(model.user_id == ctx.user_id).delete(synchronize_session=False)
+        db.query(models.User).filter(models.User.id == ctx.user_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+# ----- Scenarios: each returns the number of items it processed -----
+
+async def bench_gmail_sync(ctx: BenchmarkContext) -> int:
+    from database import SessionLocal
+    from routes.gmail.gmail import run_native_label_sync
+
+    db = SessionLocal()
+    try:
+        result = await run_native_label_sync(db, ctx.user_id)
+        listed = sum(label.get("total_processed", 0) for label in result["label_results"].values())
+        return result["total_emails_synced"] or listed
+    finally:
+        db.close()
+
+
+async def bench_gmail_push(ctx: BenchmarkContext) -> int:
+    """New mail announced through the Pub/Sub stand-in, until all of it is stored"""
+    from database import SessionLocal
+    from models import models
+    from routes.gmail.gmail import run_gmail_sync_job
+    from routes.gmail.push import handle_gmail_push_notification, run_gmail_history_sync_job
+    from utils.sync_scheduler import sync_scheduler
+
+    if "gmail_history" not in sync_scheduler.kinds:
+        sync_scheduler.register("gmail_history", run_gmail_history_sync_job)
+        sync_scheduler.register("gmail", run_gmail_sync_job)
+    await sync_scheduler.start()
+
+    mailbox = ctx.server.mailbox
+    pubsub = FakePubSub(subscriber=handle_gmail_push_notification)
+    known_ids = set(mailbox.messages)
+
+    for _ in range(ctx.options.push_bursts):
+        envelope = pubsub.envelope(mailbox.email_address, mailbox.deliver(ctx.options.push_messages))
+        await pubsub.push(envelope)
+        await pubsub.push(envelope)  # Pub/Sub delivers at least once
+        await asyncio.sleep(0.2)
+
+    new_ids = [gmail_id for gmail_id in mailbox.messages if gmail_id not in known_ids]
+    db = SessionLocal()
+    try:
+        deadline = time.monotonic() + ctx.options.push_timeout
+        stored = 0
+        while time.monotonic() < deadline:
+            stored = db.query(models.Email).filter(models.Email.gmail_id.in_(new_ids)).count()
+            if stored >= len(new_ids):
+                break
+            db.rollback()  # End the read transaction so the next poll sees new rows
+            await asyncio.sleep(0.1)
+        logger.info(f"Benchmark - Push notifications: {dict(pubsub.responses)}")
+        return stored
+    finally:
+        db.close()
+
+
+async def bench_email_body(ctx: BenchmarkContext) -> int:
+    from database import SessionLocal
+    from models import models
+    from routes.gmail.gmail import get_email_body
+
+    db = SessionLocal()
+    try:
+        email_ids = [row[0] for row in db.query(models.Email.id).filter(
+            models.Email.user_id == ctx.user_id,
+            models.Email.body_cached.isnot(True)
+        ).order_by(models.Email.received_at.desc()).limit(ctx.options.bodies).all()]
+
+        for email_id in email_ids:
+            await get_email_body(email_id, make_request(ctx.session_id), db)
+        return len(email_ids)
+    finally:
+        db.close()
+
+
+async def bench_local_to_gmail(ctx: BenchmarkContext) -> int:
+    from database import SessionLocal
+    from models import models
+    from routes.gmail.gmail import sync_local_to_gmail
+    from utils.sync_outbox import GMAIL, record_change
+
+    db = SessionLocal()
+    try:
+        emails = db.query(models.Email).filter(
+            models.Email.user_id == ctx.user_id,
+            models.Email.is_deleted.isnot(True)
+        ).order_by(models.Email.received_at).limit(ctx.options.local_changes).all()
+        for email in emails:
+            email.is_deleted = True
+            email.deleted_at = datetime.now()
+            email.needs_gmail_sync = True
+            record_change(db, ctx.user_id, GMAIL, email.id, "delete")
+        db.commit()
+
+        connection = db.query(models.GmailConnection).filter(models.GmailConnection.user_id == ctx.user_id).first()
+        result = await sync_local_to_gmail(db, connection, ctx.user_id, {"Authorization": f"Bearer {connection.access_token}"})
+        return result["emails_deleted"] + result["updates_sent"]
+    finally:
+        db.close()
+
+
+async def bench_calendar_sync(ctx: BenchmarkContext, local_events: int = 0) -> int:
+    from database import SessionLocal
+    from models import models
+    from routes.google_calendar.google_calendar import run_calendar_sync
+    from utils.sync_outbox import GOOGLE_CALENDAR, record_change
+
+    db = SessionLocal()
+    try:
+        start = datetime.now().replace(minute=0, second=0, microsecond=0)
+        for index in range(local_events):
+            event = models.Event(
+                title=f"Bench local event {index}",
+                description="Created by the sync benchmark",
+                start_time=start + timedelta(days=index % 20, hours=index % 8),
+                end_time=start + timedelta(days=index % 20, hours=index % 8, minutes=30),
+                user_id=ctx.user_id,
+                category="general",
+                needs_google_sync=True
+            )
+            db.add(event)
+            db.flush()
+            record_change(db, ctx.user_id, GOOGLE_CALENDAR, event.id, "create")
+        db.commit()
+
+        connection = db.query(models.GoogleCalendarConnection).filter(
+            models.GoogleCalendarConnection.user_id == ctx.user_id
+        ).first()
+        result = await run_calendar_sync(db, connection, ctx.calendar_ids, ctx.user_id)
+        return result["total_events_synced"]
+    finally:
+        db.close()
+
+
+async def run_scenario(name: str, ctx: BenchmarkContext) -> int:
+    if name in ("gmail_full_sync", "gmail_resync"):
+        return await bench_gmail_sync(ctx)
+    if name == "gmail_push":
+        return await bench_gmail_push(ctx)
+    if name == "email_body":
+        return await bench_email_body(ctx)
+    if name == "local_to_gmail":
+        return await bench_local_to_gmail(ctx)
+    if name == "calendar_sync":
+        return await bench_calendar_sync(ctx, ctx.options.local_events)
+    if name == "calendar_resync":
+        return await bench_calendar_sync(ctx)
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+async def run_benchmarks(ctx: BenchmarkContext, scenarios: list, counter: QueryCounter) -> list:
+    from utils.http_clients import http_clients
+    from utils.sync_scheduler import sync_scheduler
+
+    results = []
+    try:
+        for name in scenarios:
+            api_before = ctx.server.stats.snapshot()
+            queries_before = counter.count
+            started = time.perf_counter()
+            error = None
+
+            try:
+                items = await run_scenario(name, ctx)
+            except Exception as e:
+                logger.exception(f"Benchmark - Scenario {name} failed")
+                items, error = 0, str(e)
+
+            wall = time.perf_counter() - started
+            api_after = ctx.server.stats.snapshot()
+            calls = {
+                endpoint: count - api_before["calls"].get(endpoint, 0)
+                for endpoint, count in api_after["calls"].items()
+                if count - api_before["calls"].get(endpoint, 0)
+            }
+            injected = sum(api_after["injected"].values()) - sum(api_before["injected"].values())
+
+            results.append({
+                "scenario": name,
+                "items": items,
+                "wall_seconds": round(wall, 3),
+                "items_per_second": round(items / wall, 2) if wall > 0 else 0.0,
+                "api_calls": sum(calls.values()),
+                "injected_errors": injected,
+                "db_queries": counter.count - queries_before,
+                "api_calls_by_endpoint": calls,
+                "error": error
+            })
+    finally:
+        await sync_scheduler.stop()
+        await http_clients.shutdown()
+    return results
+
+
+def print_report(results: list, verbose: bool):
+    header = f"{'scenario':<18}{'items':>8}{'items/s':>10}{'api calls':>11}{'injected':>10}{'db queries':>12}{'wall s':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['scenario']:<18}{result['items']:>8}{result['items_per_second']:>10}"
+            f"{result['api_calls']:>11}{result['injected_errors']:>10}{result['db_queries']:>12}{result['wall_seconds']:>9}"
+        )
+        if result["error"]:
+            print(f"    failed: {result['error']}")
+        if verbose:
+            for endpoint, count in sorted(result["api_calls_by_endpoint"].items()):
+                print(f"    {count:>6}  {endpoint}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark Gmail/Calendar sync against an offline fake Google API")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--messages", type=int, default=1000, help="Messages in the synthetic mailbox")
+    parser.add_argument("--attachment-ratio", type=float, default=0.2)
+    parser.add_argument("--inline-ratio", type=float, default=0.1)
+    parser.add_argument("--calendars", type=int, default=3)
+    parser.add_argument("--events", type=int, default=200, help="Events per synthetic calendar")
+    parser.add_argument("--push-bursts", type=int, default=5, help="Push notifications sent in the gmail_push scenario")
+    parser.add_argument("--push-messages", type=int, default=10, help="New messages delivered per push notification")
+    parser.add_argument("--push-timeout", type=float, default=60.0, help="Seconds to wait for pushed mail to be stored")
+    parser.add_argument("--bodies", type=int, default=50, help="Email bodies fetched in the email_body scenario")
+    parser.add_argument("--local-changes", type=int, default=50, help="Local deletions pushed in the local_to_gmail scenario")
+    parser.add_argument("--local-events", type=int, default=20, help="Local events pushed in the calendar_sync scenario")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of API calls answered with 429")
+    parser.add_argument("--server-error-ratio", type=float, default=0.0, help="Share of API calls answered with 503")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show API calls per endpoint")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark user and its data")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    scenarios = [name.strip() for name in options.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    # Gmail and event IDs are unique across users, so keep each run's IDs apart
+    run_tag = f"b{int(time.time()):x}"
+    mailbox = SyntheticMailbox(
+        seed=options.seed,
+        message_count=options.messages,
+        attachment_ratio=options.attachment_ratio,
+        inline_ratio=options.inline_ratio,
+        id_prefix=run_tag,
+        email_address=f"{run_tag}@bench.test"
+    )
+    calendar = SyntheticCalendar(seed=options.seed, calendar_count=options.calendars, events_per_calendar=options.events, id_prefix=run_tag)
+    settings = FakeGoogleSettings(
+        latency_ms=options.latency_ms,
+        jitter_ms=options.jitter_ms,
+        rate_limit_ratio=options.rate_limit_ratio,
+        server_error_ratio=options.server_error_ratio,
+        seed=options.seed
+    )
+
+    server = FakeGoogleServer(mailbox, calendar, settings)
+    server.start()
+    try:
+        # config.google reads these at import time, so they must be set before any app module is imported
+        os.environ.update(server.environment())
+
+        from sqlalchemy import event
+        from database import engine
+        from models.models import Base
+
+        Base.metadata.create_all(bind=engine)
+        counter = QueryCounter()
+        event.listen(engine, "before_cursor_execute", counter)
+
+        ctx = BenchmarkContext(server, options)
+        create_benchmark_user(ctx)
+        try:
+            results = asyncio.run(run_benchmarks(ctx, scenarios, counter))
+        finally:
+            if not options.keep:
+                delete_benchmark_user(ctx)
+
+        print_report(results, options.verbose)
+        if options.json_path:
+            with open(options.json_path, "w") as handle:
+                json.dump({"options": vars(options), "results": results}, handle, indent=2, default=str)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
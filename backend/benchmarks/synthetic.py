@@ -0,0 +1,350 @@
+import base64
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Dict, List, Optional
+
+# Labels the generator spreads messages across, with the share of messages carrying each one
+LABEL_WEIGHTS = {
+    "INBOX": 0.6,
+    "UNREAD": 0.3,
+    "IMPORTANT": 0.2,
+    "STARRED": 0.08,
+    "SENT": 0.15,
+    "DRAFT": 0.04,
+    "SPAM": 0.05,
+    "TRASH": 0.05,
+}
+CATEGORY_LABELS = ["CATEGORY_PERSONAL", "CATEGORY_SOCIAL", "CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_FORUMS"]
+
+WORDS = (
+    "meeting project update invoice review report schedule budget design launch team "
+    "deadline draft proposal feedback release notes client support travel agenda"
+).split()
+NAMES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+DOMAINS = ["example.com", "example.org", "mail.test", "corp.test"]
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+class SyntheticMailbox:
+    """
+    Seeded fake Gmail mailbox.
+
+    Messages are stored in the Gmail API's own JSON shape (full format), so the
+    fake server can serve them directly. A share of messages is multipart with
+    regular attachments, inline CID images or both. Changes after generation
+    (deliver, modify, delete) are recorded as history records for history.list.
+    """
+
+    def __init__(
+        self,
+        seed: int = 1,
+        message_count: int = 500,
+        attachment_ratio: float = 0.2,
+        inline_ratio: float = 0.1,
+        attachment_size: int = 20_000,
+        id_prefix: str = "",
+        email_address: str = "bench@example.com"
+    ):
+        self.rng = random.Random(seed)
+        self.id_prefix = id_prefix
+        self.email_address = email_address
+        self.attachment_ratio = attachment_ratio
+        self.inline_ratio = inline_ratio
+        self.attachment_size = attachment_size
+        self.messages: Dict[str, dict] = {}
+        self.attachments: Dict[str, str] = {}  # attachmentId -> base64url data
+        self.history_id = 1000
+        self.history: List[dict] = []
+        self.watching = False
+        # The fake server reads from its own thread while benchmarks deliver new mail
+        self.lock = threading.RLock()
+
+        now = datetime.now(timezone.utc)
+        for index in range(message_count):
+            received_at = now - timedelta(minutes=index * 37 + self.rng.randint(0, 30))
+            self._add_message(index, received_at, attachment_ratio, inline_ratio, attachment_size)
+        self.next_index = message_count
+
+    def _sentence(self, words: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize()
+
+    def _address(self) -> str:
+        return f"{self.rng.choice(NAMES)}@{self.rng.choice(DOMAINS)}"
+
+    def _labels(self) -> List[str]:
+        labels = [label for label, share in LABEL_WEIGHTS.items() if self.rng.random() < share]
+        if "INBOX" in labels:
+            labels.append(self.rng.choice(CATEGORY_LABELS))
+        return labels or ["INBOX", "CATEGORY_PERSONAL"]
+
+    def _attachment_part(self, gmail_id: str, part_id: str, filename: str, mime_type: str, size: int, content_id: Optional[str] = None) -> dict:
+        attachment_id = f"att{gmail_id}{part_id.replace('.', '')}"
+        self.attachments[attachment_id] = _b64(self.rng.randbytes(size))
+        headers = [{"name": "Content-Type", "value": mime_type}]
+        if content_id:
+            headers.append({"name": "Content-ID", "value": f"<{content_id}>"})
+            headers.append({"name": "Content-Disposition", "value": f'inline; filename="{filename}"'})
+        else:
+            headers.append({"name": "Content-Disposition", "value": f'attachment; filename="{filename}"'})
+        return {
+            "partId": part_id,
+            "mimeType": mime_type,
+            "filename": filename,
+            "headers": headers,
+            "body": {"attachmentId": attachment_id, "size": size}
+        }
+
+    def _add_message(self, index: int, received_at: datetime, attachment_ratio: float, inline_ratio: float, attachment_size: int) -> dict:
+        gmail_id = f"{self.id_prefix}{index:012x}{self.rng.getrandbits(16):04x}"
+        thread_id = f"{self.id_prefix}t{index // 3:011x}"
+        subject = self._sentence(self.rng.randint(3, 8))
+        text = "\n\n".join(self._sentence(self.rng.randint(8, 20)) for _ in range(self.rng.randint(2, 6)))
+
+        with_attachment = self.rng.random() < attachment_ratio
+        with_inline = self.rng.random() < inline_ratio
+
+        html = "<html><body>" + "".join(f"<p>{line}</p>" for line in text.split("\n\n"))
+        if with_inline:
+            html += '<img src="cid:logo@bench">'
+        html += "</body></html>"
+
+        alternative = {
+            "partId": "0",
+            "mimeType": "multipart/alternative",
+            "filename": "",
+            "headers": [{"name": "Content-Type", "value": "multipart/alternative"}],
+            "body": {"size": 0},
+            "parts": [
+                {"partId": "0.0", "mimeType": "text/plain", "filename": "", "headers": [{"name": "Content-Type", "value": "text/plain; charset=UTF-8"}], "body": {"size": len(text), "data": _b64(text.encode())}},
+                {"partId": "0.1", "mimeType": "text/html", "filename": "", "headers": [{"name": "Content-Type", "value": "text/html; charset=UTF-8"}], "body": {"size": len(html), "data": _b64(html.encode())}},
+            ]
+        }
+
+        parts = [alternative]
+        if with_inline:
+            parts.append(self._attachment_part(gmail_id, str(len(parts)), "logo.png", "image/png", max(attachment_size // 10, 64), content_id="logo@bench"))
+        if with_attachment:
+            parts.append(self._attachment_part(gmail_id, str(len(parts)), f"report-{index}.pdf", "application/pdf", attachment_size))
+
+        if len(parts) > 1:
+            content_type = "multipart/mixed" if with_attachment else "multipart/related"
+            payload = {"partId": "", "mimeType": content_type, "filename": "", "body": {"size": 0}, "parts": parts}
+        else:
+            content_type = "multipart/alternative"
+            payload = dict(alternative, partId="")
+
+        payload["headers"] = [
+            {"name": "Subject", "value": subject},
+            {"name": "From", "value": self._address()},
+            {"name": "To", "value": self._address()},
+            {"name": "Date", "value": format_datetime(received_at)},
+            {"name": "Message-ID", "value": f"<{gmail_id}@bench>"},
+            {"name": "Content-Type", "value": content_type},
+        ]
+
+        self.history_id += 1
+        self.messages[gmail_id] = {
+            "id": gmail_id,
+            "threadId": thread_id,
+            "labelIds": self._labels(),
+            "snippet": text[:120],
+            "historyId": str(self.history_id),
+            "internalDate": str(int(received_at.timestamp() * 1000)),
+            "sizeEstimate": len(text) + len(html),
+            "payload": payload
+        }
+        return self.messages[gmail_id]
+
+    def _record(self, change_type: str, message: dict, label_ids: Optional[List[str]] = None):
+        self.history_id += 1
+        message["historyId"] = str(self.history_id)
+        record = {"id": str(self.history_id), change_type: [{"message": {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}}]}
+        if label_ids is not None:
+            record[change_type][0]["labelIds"] = list(label_ids)
+        self.history.append(record)
+
+    def deliver(self, count: int = 1) -> int:
+        """Add `count` new messages as if they just arrived; returns the new history ID"""
+        with self.lock:
+            for _ in range(count):
+                message = self._add_message(self.next_index, datetime.now(timezone.utc), self.attachment_ratio, self.inline_ratio, self.attachment_size)
+                self.next_index += 1
+                self._record("messagesAdded", message)
+            return self.history_id
+
+    def delete(self, gmail_id: str) -> bool:
+        """Permanently delete a message"""
+        with self.lock:
+            message = self.messages.pop(gmail_id, None)
+            if message is None:
+                return False
+            self._record("messagesDeleted", message)
+            return True
+
+    def history_since(self, start_history_id: int) -> Optional[List[dict]]:
+        """History records after start_history_id, or None if that ID predates the kept history"""
+        with self.lock:
+            oldest = int(self.history[0]["id"]) - 1 if self.history else self.history_id
+            if start_history_id < min(oldest, 1000):
+                return None
+            return [record for record in self.history if int(record["id"]) > start_history_id]
+
+    def list_ids(self, label_ids: Optional[List[str]] = None) -> List[dict]:
+        """Messages carrying every label in label_ids, newest first"""
+        wanted = [label for label in (label_ids or []) if label != "ALL"]
+        with self.lock:
+            matches = [
+                message for message in self.messages.values()
+                if all(label in message["labelIds"] for label in wanted)
+            ]
+        matches.sort(key=lambda message: int(message["internalDate"]), reverse=True)
+        return [{"id": message["id"], "threadId": message["threadId"]} for message in matches]
+
+    def modify(self, gmail_id: str, add_labels: List[str], remove_labels: List[str]) -> Optional[dict]:
+        with self.lock:
+            message = self.messages.get(gmail_id)
+            if message is None:
+                return None
+            added = [label for label in add_labels if label not in message["labelIds"]]
+            removed = [label for label in remove_labels if label in message["labelIds"]]
+            message["labelIds"] = [label for label in message["labelIds"] if label not in removed] + added
+            if added:
+                self._record("labelsAdded", message, added)
+            if removed:
+                self._record("labelsRemoved", message, removed)
+            return message
+
+
+class SyntheticCalendar:
+    """Seeded fake Google Calendar account: a few calendars with events around today"""
+
+    def __init__(self, seed: int = 1, calendar_count: int = 3, events_per_calendar: int = 200, id_prefix: str = ""):
+        self.rng = random.Random(seed)
+        self.id_prefix = id_prefix
+        self.calendars: Dict[str, dict] = {}
+        self.events: Dict[str, Dict[str, dict]] = {}
+        self.next_event = 0
+        # Change sequence per event (including deletions) so syncToken listings can return deltas
+        self.changed: Dict[str, Dict[str, int]] = {}
+        self.cancelled: Dict[str, Dict[str, dict]] = {}
+        self.oldest_sync_token = 0
+
+        for index in range(calendar_count):
+            calendar_id = "primary" if index == 0 else f"{id_prefix}cal{index}@group.calendar.google.com"
+            self.calendars[calendar_id] = {
+                "id": calendar_id,
+                "summary": "Primary" if index == 0 else f"Calendar {index}",
+                "primary": index == 0,
+                "accessRole": "owner"
+            }
+            self.events[calendar_id] = {}
+            for _ in range(events_per_calendar):
+                self._add_event(calendar_id)
+
+    def _add_event(self, calendar_id: str) -> dict:
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(
+            days=self.rng.randint(-45, 45), hours=self.rng.randint(-8, 8)
+        )
+        end = start + timedelta(minutes=self.rng.choice([15, 30, 45, 60, 90]))
+        return self.insert(calendar_id, {
+            "summary": " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(2, 5))).capitalize(),
+            "description": " ".join(self.rng.choice(WORDS) for _ in range(10)),
+            "start": {"dateTime": start.isoformat().replace("+00:00", "Z")},
+            "end": {"dateTime": end.isoformat().replace("+00:00", "Z")},
+        })
+
+    def insert(self, calendar_id: str, body: dict) -> dict:
+        self.next_event += 1
+        event_id = body.get("id") or f"{self.id_prefix}ev{self.next_event:010d}"
+        event = dict(
+            body,
+            id=event_id,
+            status=body.get("status", "confirmed"),
+            etag=f'"{self.next_event}"',
+            updated=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            htmlLink=f"https://calendar.test/event?eid={event_id}"
+        )
+        self.events.setdefault(calendar_id, {})[event_id] = event
+        self.cancelled.get(calendar_id, {}).pop(event_id, None)
+        self.changed.setdefault(calendar_id, {})[event_id] = self.next_event
+        return event
+
+    def update(self, calendar_id: str, event_id: str, body: dict, replace: bool = False) -> Optional[dict]:
+        event = self.events.get(calendar_id, {}).get(event_id)
+        if event is None:
+            return None
+        self.next_event += 1
+        updated = dict(body) if replace else dict(event, **body)
+        updated.update(
+            id=event_id,
+            status=updated.get("status", "confirmed"),
+            etag=f'"{self.next_event}"',
+            updated=datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        )
+        self.events[calendar_id][event_id] = updated
+        self.changed.setdefault(calendar_id, {})[event_id] = self.next_event
+        return updated
+
+    def delete(self, calendar_id: str, event_id: str) -> bool:
+        if self.events.get(calendar_id, {}).pop(event_id, None) is None:
+            return False
+        self.next_event += 1
+        self.cancelled.setdefault(calendar_id, {})[event_id] = {"id": event_id, "status": "cancelled"}
+        self.changed.setdefault(calendar_id, {})[event_id] = self.next_event
+        return True
+
+    def sync_token(self) -> str:
+        return str(self.next_event)
+
+    def expire_sync_tokens(self):
+        """Make every token issued so far answer 410 Gone, like Google does after a while"""
+        self.oldest_sync_token = self.next_event
+
+    def changes_since(self, calendar_id: str, sync_token: str) -> Optional[List[dict]]:
+        """Events (or cancellation stubs) changed after `sync_token`, oldest change first; None if the token is invalid"""
+        try:
+            since = int(sync_token)
+        except ValueError:
+            return None
+        if since < self.oldest_sync_token:
+            return None
+
+        changed = sorted(
+            (sequence, event_id) for event_id, sequence in self.changed.get(calendar_id, {}).items() if sequence > since
+        )
+        return [
+            self.events.get(calendar_id, {}).get(event_id) or self.cancelled[calendar_id][event_id]
+            for _, event_id in changed
+        ]
+
+    def list_events(self, calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None, query: Optional[str] = None) -> List[dict]:
+        """Events of a calendar overlapping [time_min, time_max), ordered by start time"""
+        def parse(value: str) -> datetime:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+        lower = parse(time_min) if time_min else None
+        upper = parse(time_max) if time_max else None
+        if lower and lower.tzinfo is None:
+            lower = lower.replace(tzinfo=timezone.utc)
+        if upper and upper.tzinfo is None:
+            upper = upper.replace(tzinfo=timezone.utc)
+
+        matches = []
+        for event in self.events.get(calendar_id, {}).values():
+            start = parse(event["start"].get("dateTime") or event["start"]["date"] + "T00:00:00+00:00")
+            end = parse(event["end"].get("dateTime") or event["end"]["date"] + "T00:00:00+00:00")
+            if lower and end <= lower:
+                continue
+            if upper and start >= upper:
+                continue
+            if query and query.lower() not in event.get("summary", "").lower():
+                continue
+            matches.append((start, event))
+
+        matches.sort(key=lambda match: match[0])
+        return [event for _, event in matches]
@@ -22,8 +22,9 @@ class GoogleConfig:
     
     # Google API URLs
     GOOGLE_AUTH_URL: str = "https://accounts.google.com/o/oauth2/v2/auth"
-    GOOGLE_TOKEN_URL: str = "https://oauth2.googleapis.com/token"
-    GOOGLE_CALENDAR_API: str = "https://www.googleapis.com/calendar/v3"
+    GOOGLE_TOKEN_URL: str = os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token")
+    GOOGLE_CALENDAR_API: str = os.getenv("GOOGLE_CALENDAR_API", "https://www.googleapis.com/calendar/v3")
+    GOOGLE_CALENDAR_BATCH_URL: str = os.getenv("GOOGLE_CALENDAR_BATCH_URL", "https://www.googleapis.com/batch/calendar/v3")
     
     # OAuth Scopes
     GOOGLE_AUTH_SCOPES: list = ["email", "profile"]
@@ -42,8 +43,80 @@ class GoogleConfig:
         "https://www.googleapis.com/auth/gmail.send"  # Send emails
     ]
     
-    # Gmail API URLs
-    GOOGLE_GMAIL_API: str = "https://gmail.googleapis.com/gmail/v1/users/me"
+    # Gmail API URLs (overridable so benchmarks can point at a local fake server)
+    GOOGLE_GMAIL_API: str = os.getenv("GOOGLE_GMAIL_API", "https://gmail.googleapis.com/gmail/v1/users/me")
+    GOOGLE_GMAIL_UPLOAD_API: str = os.getenv("GOOGLE_GMAIL_UPLOAD_API", "https://gmail.googleapis.com/upload/gmail/v1/users/me")
+    
+    # Gmail sync settings
+    # "metadata" fetches headers + part structure only (bodies on demand), "full" fetches whole payloads
+    GMAIL_SYNC_FORMAT: str = os.getenv("GMAIL_SYNC_FORMAT", "metadata")
+    GMAIL_METADATA_HEADERS: list = ["Subject", "From", "To", "Date", "Content-Type"]
+    
+    # Gmail sync pipeline (list -> fetch -> parse -> persist)
+    GMAIL_SYNC_QUEUE_SIZE: int = int(os.getenv("GMAIL_SYNC_QUEUE_SIZE", "200"))
+    GMAIL_SYNC_FETCH_CONCURRENCY: int = int(os.getenv("GMAIL_SYNC_FETCH_CONCURRENCY", "8"))
+    GMAIL_SYNC_PARSE_WORKERS: int = int(os.getenv("GMAIL_SYNC_PARSE_WORKERS", "2"))
+    GMAIL_SYNC_PARSE_PROCESSES: int = int(os.getenv("GMAIL_SYNC_PARSE_PROCESSES", "0"))  # 0 = parse in-process
+    GMAIL_SYNC_PERSIST_BATCH: int = int(os.getenv("GMAIL_SYNC_PERSIST_BATCH", "100"))
+    
+    # Local -> Gmail propagation
+    GMAIL_BATCH_MODIFY_MAX_IDS: int = 1000  # Gmail's limit for messages.batchModify
+    GMAIL_SYNC_MAX_ATTEMPTS: int = int(os.getenv("GMAIL_SYNC_MAX_ATTEMPTS", "5"))
+    
+    # On-demand email bodies
+    GMAIL_INLINE_FETCH_CONCURRENCY: int = int(os.getenv("GMAIL_INLINE_FETCH_CONCURRENCY", "4"))  # Inline images fetched in parallel per body
+    GMAIL_BODY_PREFETCH_COUNT: int = int(os.getenv("GMAIL_BODY_PREFETCH_COUNT", "20"))  # Newest unread bodies warmed after each sync; 0 disables
+    GMAIL_BODY_PREFETCH_CONCURRENCY: int = int(os.getenv("GMAIL_BODY_PREFETCH_CONCURRENCY", "4"))
+    
+    # Outgoing attachments uploaded as multipart/form-data are kept on disk, not in the database
+    EMAIL_ATTACHMENT_DIR: str = os.getenv("EMAIL_ATTACHMENT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "storage", "attachments"))
+    EMAIL_ATTACHMENT_MAX_BYTES: int = int(os.getenv("EMAIL_ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))  # Gmail's per-message attachment limit
+    
+    # Gmail push notifications (users.watch -> Pub/Sub push subscription -> POST /api/gmail/push)
+    GMAIL_PUBSUB_TOPIC: Optional[str] = os.getenv("GMAIL_PUBSUB_TOPIC")  # projects/<project>/topics/<topic>; push is off when unset
+    GMAIL_PUSH_VERIFICATION_TOKEN: Optional[str] = os.getenv("GMAIL_PUSH_VERIFICATION_TOKEN")  # Expected as ?token= on the push endpoint URL
+    GMAIL_PUSH_DEBOUNCE_SECONDS: float = float(os.getenv("GMAIL_PUSH_DEBOUNCE_SECONDS", "2"))  # Notifications within this window share one sync
+    GMAIL_WATCH_RENEW_MARGIN_SECONDS: int = int(os.getenv("GMAIL_WATCH_RENEW_MARGIN_SECONDS", "86400"))  # Watches last 7 days; renew a day early
+    GMAIL_WATCH_RENEW_INTERVAL_SECONDS: int = int(os.getenv("GMAIL_WATCH_RENEW_INTERVAL_SECONDS", "3600"))
+    
+    # Deep Gmail backfill (older mail beyond the per-label sync limits)
+    GMAIL_BACKFILL_LABELS: list = [label.strip() for label in os.getenv("GMAIL_BACKFILL_LABELS", "INBOX,SENT").split(",") if label.strip()]
+    GMAIL_BACKFILL_DEFAULT_DEPTH: int = int(os.getenv("GMAIL_BACKFILL_DEFAULT_DEPTH", "5000"))  # Messages per label
+    GMAIL_BACKFILL_MAX_DEPTH: int = int(os.getenv("GMAIL_BACKFILL_MAX_DEPTH", "50000"))
+    GMAIL_BACKFILL_WINDOW_MESSAGES: int = int(os.getenv("GMAIL_BACKFILL_WINDOW_MESSAGES", "2000"))  # Messages listed per background window
+    GMAIL_BACKFILL_UNITS_PER_SECOND: int = int(os.getenv("GMAIL_BACKFILL_UNITS_PER_SECOND", "50"))  # Per-user quota budget (Gmail allows 250)
+    GMAIL_BACKFILL_PERSIST_BATCH: int = int(os.getenv("GMAIL_BACKFILL_PERSIST_BATCH", "500"))
+    
+    # Google Calendar sync (full syncs list this window; later syncs fetch changes via syncToken)
+    CALENDAR_SYNC_PAST_DAYS: int = int(os.getenv("CALENDAR_SYNC_PAST_DAYS", "30"))
+    CALENDAR_SYNC_FUTURE_DAYS: int = int(os.getenv("CALENDAR_SYNC_FUTURE_DAYS", "365"))
+    CALENDAR_SYNC_PAGE_SIZE: int = int(os.getenv("CALENDAR_SYNC_PAGE_SIZE", "1000"))  # events.list maxResults (Google allows up to 2500)
+    CALENDAR_SYNC_FETCH_CONCURRENCY: int = int(os.getenv("CALENDAR_SYNC_FETCH_CONCURRENCY", "4"))  # Calendars fetched in parallel per sync
+    GOOGLE_CALENDAR_EVENT_ID_PREFIX: str = os.getenv("GOOGLE_CALENDAR_EVENT_ID_PREFIX", "spa")  # Pushed events get IDs derived from our event IDs; base32hex chars (0-9, a-v) only
+    
+    # Google API quota governor (defaults follow Google's published limits)
+    GMAIL_USER_UNITS_PER_SECOND: int = int(os.getenv("GMAIL_USER_UNITS_PER_SECOND", "250"))
+    GMAIL_PROJECT_UNITS_PER_SECOND: int = int(os.getenv("GMAIL_PROJECT_UNITS_PER_SECOND", "20000"))  # 1,200,000 units/minute
+    CALENDAR_USER_REQUESTS_PER_SECOND: int = int(os.getenv("CALENDAR_USER_REQUESTS_PER_SECOND", "10"))
+    CALENDAR_PROJECT_REQUESTS_PER_SECOND: int = int(os.getenv("CALENDAR_PROJECT_REQUESTS_PER_SECOND", "160"))  # ~10,000 requests/minute
+    GOOGLE_API_MAX_RETRIES: int = int(os.getenv("GOOGLE_API_MAX_RETRIES", "5"))
+    GOOGLE_API_BASE_BACKOFF_SECONDS: float = float(os.getenv("GOOGLE_API_BASE_BACKOFF_SECONDS", "1"))
+    GOOGLE_API_MAX_BACKOFF_SECONDS: float = float(os.getenv("GOOGLE_API_MAX_BACKOFF_SECONDS", "32"))
+    
+    # Shared HTTP client pools (utils/http_clients.py)
+    GOOGLE_HTTP_MAX_CONNECTIONS: int = int(os.getenv("GOOGLE_HTTP_MAX_CONNECTIONS", "50"))
+    GOOGLE_HTTP_MAX_KEEPALIVE: int = int(os.getenv("GOOGLE_HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+    
+    # OAuth tokens are renewed this long before they expire
+    GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS: int = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+    GOOGLE_TOKEN_RENEW_INTERVAL_SECONDS: int = int(os.getenv("GOOGLE_TOKEN_RENEW_INTERVAL_SECONDS", "120"))  # Background renewal pass
+    
+    # Background sync scheduler
+    SYNC_SCHEDULER_WORKERS: int = int(os.getenv("SYNC_SCHEDULER_WORKERS", "4"))
+    SYNC_MIN_INTERVAL_SECONDS: int = int(os.getenv("SYNC_MIN_INTERVAL_SECONDS", "120"))  # Busy mailboxes/calendars
+    SYNC_MAX_INTERVAL_SECONDS: int = int(os.getenv("SYNC_MAX_INTERVAL_SECONDS", "1800"))  # Idle mailboxes/calendars
+    SYNC_SCHEDULER_TICK_SECONDS: int = int(os.getenv("SYNC_SCHEDULER_TICK_SECONDS", "30"))
     
     @classmethod
     def is_auth_configured(cls) -> bool:
@@ -60,6 +133,11 @@ class GoogleConfig:
         """Check if Gmail is properly configured"""
         return bool(cls.GOOGLE_GMAIL_CLIENT_ID and cls.GOOGLE_GMAIL_CLIENT_SECRET)
     
+    @classmethod
+    def use_gmail_metadata_sync(cls) -> bool:
+        """Check if Gmail sync should request metadata instead of full payloads"""
+        return cls.GMAIL_SYNC_FORMAT.lower() != "full"
+    
     @classmethod
     def get_auth_client_id(cls) -> str:
         """Get OAuth client ID for authentication"""
@@ -12,12 +12,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from database import engine
 from models.models import Base
 from routes import api_router
+from utils.schema_upgrades import upgrade_schema
 import asyncio
 import logging
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# Columns, indexes and constraints that create_all can't add to tables that already exist
+upgrade_schema(engine)
+
 app = FastAPI()
 
 # Configure CORS
@@ -51,3 +55,64 @@ async def cleanup_expired_sessions():
 async def startup_event():
     """Start background tasks on startup"""
     asyncio.create_task(cleanup_expired_sessions())
+    
+    # Shared pooled HTTP clients for Google/OpenAI
+    from utils.http_clients import http_clients
+    http_clients.startup()
+    
+    # Local edits flagged for sync before the outbox existed still need pushing; queue them before any sync can run
+    from utils.sync_outbox import backfill_sync_outbox
+    backfill_sync_outbox()
+    
+    # Background Gmail/Calendar syncs
+    from utils.sync_scheduler import sync_scheduler
+    from routes.gmail.gmail import run_gmail_sync_job, get_gmail_sync_user_ids
+    from routes.google_calendar.google_calendar import run_calendar_sync_job, get_calendar_sync_user_ids
+    from routes.sync_jobs.sync_jobs import record_sync_job, mark_interrupted_sync_jobs
+    from routes.gmail.backfill import run_gmail_backfill_job
+    from routes.gmail.push import run_gmail_history_sync_job, renew_gmail_watches_periodically
+    from routes.gmail.bodies import run_gmail_body_prefetch_job, queue_body_prefetch
+    sync_scheduler.register(
+        "gmail",
+        run_gmail_sync_job,
+        discover=get_gmail_sync_user_ids,
+        count_changes=lambda result: result.get("total_emails_synced", 0)
+    )
+    sync_scheduler.register(
+        "calendar",
+        run_calendar_sync_job,
+        discover=get_calendar_sync_user_ids,
+        count_changes=lambda result: result.get("total_events_synced", 0)
+    )
+    sync_scheduler.register("gmail_backfill", run_gmail_backfill_job)
+    sync_scheduler.register(
+        "gmail_history",
+        run_gmail_history_sync_job,
+        count_changes=lambda result: result.get("total_emails_synced", 0)
+    )
+    sync_scheduler.register("gmail_prefetch", run_gmail_body_prefetch_job)
+    sync_scheduler.add_listener(record_sync_job)
+    sync_scheduler.add_listener(queue_body_prefetch)
+    await sync_scheduler.start()
+    
+    # Pick up syncs that were cut off by the last shutdown/deploy; they resume from their checkpoints
+    for user_id, kind, params in mark_interrupted_sync_jobs():
+        await sync_scheduler.enqueue(user_id, kind, params=params, interactive=False)
+    
+    # Keep Gmail push subscriptions (users.watch) from lapsing
+    from config.google import google_config
+    if google_config.GMAIL_PUBSUB_TOPIC and not google_config.GMAIL_PUSH_VERIFICATION_TOKEN:
+        logging.warning("Gmail - GMAIL_PUSH_VERIFICATION_TOKEN is not set; POST /gmail/push rejects every notification")
+    asyncio.create_task(renew_gmail_watches_periodically())
+    
+    # Renew OAuth access tokens before they expire so syncs and requests don't wait on a refresh
+    from utils.google_token_manager import token_manager
+    asyncio.create_task(token_manager.renew_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks on shutdown"""
+    from utils.sync_scheduler import sync_scheduler
+    from utils.http_clients import http_clients
+    await sync_scheduler.stop()
+    await http_clients.shutdown()
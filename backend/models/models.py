@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, ForeignKey, UniqueConstraint, Date, Time, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, ForeignKey, UniqueConstraint, Index, Date, Time, Float, func, text
 from datetime import datetime, date
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import backref, declarative_base, relationship
 
 Base = declarative_base()
 
@@ -109,6 +109,8 @@ class Event(Base):
     # Google Calendar integration fields
     google_event_id = Column(String, nullable=True, unique=True)  # Google Calendar event ID
     google_calendar_id = Column(String, nullable=True)  # Google Calendar ID
+    google_etag = Column(String, nullable=True)  # etag of the Google copy last applied; unchanged etags are skipped on sync
+    google_updated = Column(DateTime, nullable=True)  # Google's "updated" timestamp of that copy
     repeat = Column(String, nullable=True)  # none, daily, weekly, monthly
     category = Column(String, nullable=True)  # general, work, personal, meeting, google_sync, google_sync_completed
     linked_task = Column(String, nullable=True)  # linked task ID
@@ -126,6 +128,44 @@ class Event(Base):
     is_deleted = Column(Boolean, default=False)  # Track deleted events for sync
     deleted_at = Column(DateTime, nullable=True)  # When event was deleted
 
+    __table_args__ = (
+        # One local-only event per title and start time; Google copies are already unique by google_event_id
+        Index(
+            "uq_events_local_title_start",
+            "user_id", "title", "start_time",
+            unique=True,
+            postgresql_where=text("google_event_id IS NULL AND is_deleted IS NOT TRUE"),
+            sqlite_where=text("google_event_id IS NULL AND is_deleted IS NOT TRUE")
+        ),
+        # Overlap queries (utils/interval_index.py) as tsrange && [a, b)
+        Index(
+            "ix_events_period",
+            func.tsrange(start_time, func.greatest(start_time, end_time), text("'[)'")),
+            postgresql_using="gist",
+            postgresql_where=text("start_time IS NOT NULL AND end_time IS NOT NULL")
+        ).ddl_if(dialect="postgresql"),  # tsrange and GiST are Postgres-only; elsewhere overlaps use the in-memory index
+    )
+
+class EventException(Base):
+    __tablename__ = "event_exceptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, nullable=True)  # Owner, copied from the event
+    original_start = Column(DateTime, nullable=False)  # Start of the occurrence this replaces, as the rule generates it
+    cancelled = Column(Boolean, default=False)  # Occurrence removed from the series
+    # Overrides; NULL keeps the series value
+    start_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True)
+    title = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("event_id", "original_start", name="uq_event_exceptions_event_start"),
+    )
+
 class GoogleCalendarConnection(Base):
     __tablename__ = "google_calendar_connections"
 
@@ -135,6 +175,7 @@ class GoogleCalendarConnection(Base):
     refresh_token = Column(Text, nullable=False)
     token_expiry = Column(DateTime, nullable=False)
     calendar_ids = Column(JSON, nullable=True)  # List of calendar IDs to sync
+    sync_tokens = Column(JSON, nullable=True)  # {calendar_id: nextSyncToken} for incremental events.list
     two_way_sync = Column(Boolean, default=True)
     last_sync = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
@@ -150,14 +191,55 @@ class GmailConnection(Base):
     token_expiry = Column(DateTime, nullable=False)
     last_sync = Column(DateTime, nullable=True)
     last_history_id = Column(String, nullable=True)  # Gmail history ID for incremental sync
+    email_address = Column(String, nullable=True, index=True)  # Mailbox address; push notifications are addressed by it
+    watch_expiration = Column(DateTime, nullable=True)  # When the users.watch subscription lapses
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+
+    id = Column(String(32), primary_key=True)  # Same ID the sync scheduler hands back to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String(20), nullable=False)  # gmail, calendar
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed, failed, interrupted, resumed
+    params = Column(JSON, nullable=True)  # Runner params (calendar_ids, depth, ...) so an interrupted job restarts with them
+    
+    # Checkpoint - where a resumed job picks up
+    label = Column(String, nullable=True)  # Label being listed when the checkpoint was taken
+    page_token = Column(String, nullable=True)  # Page token that lists the first unfinished page of that label
+    label_processed_count = Column(Integer, default=0)  # Messages already handled in that label
+    processed_count = Column(Integer, default=0)  # Messages handled across all labels
+    total_count = Column(Integer, nullable=True)  # Expected number of messages, for progress/ETA
+    last_history_id = Column(String, nullable=True)  # Highest Gmail history ID seen so far
+    resumed_from = Column(String(32), nullable=True)  # Job whose checkpoint this job continued from
+    
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+class SyncOutbox(Base):
+    __tablename__ = "sync_outbox"
+
+    id = Column(Integer, primary_key=True)  # Insertion order; push workers consume entries by ascending ID
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    target = Column(String(20), nullable=False)  # google_calendar (entity = events.id), gmail (entity = emails.id)
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)  # create, update, delete
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_sync_outbox_target_user", "target", "user_id", "id"),  # A worker's pending changes in order
+    )
+
 class Email(Base):
     __tablename__ = "emails"
 
     id = Column(Integer, primary_key=True, index=True)
-    gmail_id = Column(String, nullable=True, unique=True)  # Gmail message ID for deduplication
+    gmail_id = Column(String, nullable=True)  # Gmail message ID for deduplication (unique per user)
     thread_id = Column(String, nullable=True)  # Gmail thread ID
     sender = Column(String, nullable=False)
     to_recipients = Column(String, nullable=True)  # To field
@@ -180,6 +262,8 @@ class Email(Base):
     # Two-way sync fields
     needs_gmail_sync = Column(Boolean, default=False)  # Whether this email needs to be synced to Gmail
     last_gmail_sync = Column(DateTime, nullable=True)  # When this email was last synced to Gmail
+    gmail_sync_attempts = Column(Integer, default=0)  # Failed Local → Gmail pushes so far; gives up after GMAIL_SYNC_MAX_ATTEMPTS
+    gmail_labels = Column(Text, nullable=True)  # JSON labels as Gmail last had them; local edits are pushed as the difference
     
     # Deletion tracking for Gmail sync
     is_deleted = Column(Boolean, default=False)  # Track deleted emails for sync
@@ -187,6 +271,35 @@ class Email(Base):
     
     # Labels stored as JSON array (inbox, sent, starred, trash, etc.)
     
+    __table_args__ = (
+        # Two users can hold the same message (e.g. one sent to both), so IDs are unique per mailbox
+        UniqueConstraint("user_id", "gmail_id", name="uq_emails_user_gmail"),
+        Index("ix_emails_user_thread", "user_id", "thread_id", "received_at"),  # Thread detail in one index scan
+    )
+
+
+class EmailThread(Base):
+    __tablename__ = "email_threads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    thread_id = Column(String, nullable=False)  # Gmail thread ID (emails.thread_id)
+    subject = Column(String, nullable=True)  # Subject of the first message
+    snippet = Column(Text, nullable=True)  # Snippet of the latest message
+    message_count = Column(Integer, default=0)
+    participants = Column(Text, nullable=True)  # JSON array of addresses from From/To
+    labels = Column(Text, nullable=True)  # JSON array - union of the messages' labels
+    has_unread = Column(Boolean, default=False)
+    has_attachment = Column(Boolean, default=False)
+    latest_email_id = Column(Integer, nullable=True)
+    latest_at = Column(DateTime, nullable=True)  # received_at of the latest message
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "thread_id", name="uq_email_threads_user_thread"),
+        Index("ix_email_threads_user_latest", "user_id", "latest_at", "id"),  # Keyset pagination of the thread list
+    )
+
 
 
 class EmailAttachment(Base):
@@ -201,10 +314,11 @@ class EmailAttachment(Base):
     content_id = Column(String, nullable=True)  # Content-ID for inline attachments
     is_inline = Column(Boolean, default=False)  # Whether it's inline (CID) or regular attachment
     data = Column(Text, nullable=True)  # Base64 encoded data (for inline images)
+    storage_path = Column(String, nullable=True)  # File under EMAIL_ATTACHMENT_DIR for streamed uploads (data stays empty)
     created_at = Column(DateTime, default=datetime.now)
     
     # Relationship
-    email = relationship("Email", backref="attachments")
+    email = relationship("Email", backref=backref("attachments", cascade="all, delete-orphan"))  # Deleting an email deletes its attachment rows
 
 class UserPreferences(Base):
     __tablename__ = "user_preferences"
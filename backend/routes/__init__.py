@@ -10,6 +10,8 @@ from .ai import router as ai_router
 from .health import health_router
 from .voice_command import  voice_commands_router
 from .activities import activities_router
+from .sync_jobs import router as sync_jobs_router
+from .freebusy import router as freebusy_router
 
 api_router = APIRouter()
 
@@ -24,4 +26,6 @@ api_router.include_router(smart_prioritization_router, tags=["smart-prioritizati
 api_router.include_router(ai_router, tags=["ai"])
 api_router.include_router(health_router, tags=["health"])
 api_router.include_router(voice_commands_router, tags=["voice-commands"])
-api_router.include_router(activities_router, tags=["activities"])
\ No newline at end of file
+api_router.include_router(activities_router, tags=["activities"])
+api_router.include_router(sync_jobs_router, tags=["sync-jobs"])
+api_router.include_router(freebusy_router, tags=["calendar"])
\ No newline at end of file
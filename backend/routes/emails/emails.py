@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+from contextlib import ExitStack
+import base64
 import json
 import logging
 
@@ -16,6 +20,10 @@ from models import models
 from schemas import schemas
 from database import get_db
 from routes.auth.session import get_user_id  # Add this import
+from utils.email_threads import rebuild_email_threads
+from utils.attachment_store import AttachmentTooLarge, remove_attachment, store_attachment
+from utils.mailbox_transfer import EXPORT_FORMATS, export_mailbox, import_mailbox
+from utils.sync_outbox import GMAIL, is_connected, record_change
 
 
 
@@ -169,6 +177,100 @@ def list_emails(
     }
 
 
+def encode_thread_cursor(thread: models.EmailThread) -> str:
+    """Opaque keyset cursor for the thread after which the next page starts"""
+    return base64.urlsafe_b64encode(f"{thread.latest_at.isoformat()}|{thread.id}".encode()).decode()
+
+
+def decode_thread_cursor(cursor: str) -> tuple:
+    try:
+        latest_at, thread_pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(latest_at), int(thread_pk)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/threads", response_model=schemas.PaginatedEmailThreadResponse)
+def list_email_threads(
+    request: Request,
+    label: Optional[str] = Query(None, description="Only threads where some message has this label (inbox, starred, ...)"),
+    unread: Optional[bool] = Query(None),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page"),
+    page_size: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Conversation list, newest activity first, keyset-paginated over the email_threads summary table"""
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    query = db.query(models.EmailThread).filter(models.EmailThread.user_id == current_user_id)
+    
+    if label:
+        query = query.filter(models.EmailThread.labels.contains(f'"{label}"'))
+    if unread is not None:
+        query = query.filter(models.EmailThread.has_unread == unread)
+    if cursor:
+        # Seek past the last row of the previous page instead of OFFSET, so every page costs the same
+        query = query.filter(tuple_(models.EmailThread.latest_at, models.EmailThread.id) < tuple_(*decode_thread_cursor(cursor)))
+    
+    threads = query.order_by(
+        models.EmailThread.latest_at.desc(),
+        models.EmailThread.id.desc()
+    ).limit(page_size + 1).all()
+    
+    has_more = len(threads) > page_size
+    threads = threads[:page_size]
+    
+    return {
+        "results": threads,
+        "nextCursor": encode_thread_cursor(threads[-1]) if has_more else None,
+        "pageSize": page_size
+    }
+
+
+@router.get("/threads/{thread_id}", response_model=schemas.EmailThreadDetailResponse)
+def get_email_thread(thread_id: str, request: Request, db: Session = Depends(get_db)):
+    """A conversation's summary and its messages (oldest first), read through ix_emails_user_thread"""
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    thread = db.query(models.EmailThread).filter(
+        models.EmailThread.user_id == current_user_id,
+        models.EmailThread.thread_id == thread_id
+    ).first()
+    
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    
+    messages = db.query(models.Email).filter(
+        models.Email.user_id == current_user_id,
+        models.Email.thread_id == thread_id,
+        models.Email.is_deleted.isnot(True)
+    ).order_by(models.Email.received_at, models.Email.id).all()
+    
+    return {"thread": thread, "messages": messages}
+
+
+@router.post("/threads/rebuild")
+def rebuild_threads(request: Request, db: Session = Depends(get_db)):
+    """Rebuild the thread summaries of the current user from their stored emails"""
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    try:
+        threads = rebuild_email_threads(db, current_user_id)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to rebuild threads for user {current_user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild threads: {str(e)}")
+    
+    return {"message": "Threads rebuilt", "threads": threads}
+
+
 @router.get("/get/{email_id}", response_model=schemas.EmailResponse)
 def get_email(email_id: int, db: Session = Depends(get_db)):
     """Get a specific email by ID"""
@@ -178,19 +280,8 @@ def get_email(email_id: int, db: Session = Depends(get_db)):
     return email
 
 
-@router.post("/create", response_model=schemas.EmailResponse)
-def create_email(payload: schemas.EmailCreate, request: Request, db: Session = Depends(get_db)):
-    """Create a new email"""
-    logger.info(f"🔍 Backend: Creating email for user")
-    logger.info(f"🔍 Backend: Payload received: {payload}")
-    logger.info(f"🔍 Backend: Payload type: {type(payload)}")
-    logger.info(f"🔍 Backend: Payload dict: {payload.dict()}")
-    
-    # Get current user ID from session
-    current_user_id = get_user_id(request.cookies.get("session_id"))
-    if not current_user_id:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    
+def initial_email_labels(payload: schemas.EmailCreate) -> list:
+    """Labels for a newly created email: the provided ones, or defaults from its status and category"""
     # Use provided labels or initialize default labels
     if payload.labels and len(payload.labels) > 0:
         labels = payload.labels
@@ -207,7 +298,25 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
     if hasattr(payload, "category") and payload.category and payload.status != "sent":
         category_label = f"category_{payload.category.lower()}"
         if category_label not in labels:
-         labels.append(category_label)
+            labels.append(category_label)
+    
+    return labels
+
+
+@router.post("/create", response_model=schemas.EmailResponse)
+def create_email(payload: schemas.EmailCreate, request: Request, db: Session = Depends(get_db)):
+    """Create a new email"""
+    logger.info(f"🔍 Backend: Creating email for user")
+    logger.info(f"🔍 Backend: Payload received: {payload}")
+    logger.info(f"🔍 Backend: Payload type: {type(payload)}")
+    logger.info(f"🔍 Backend: Payload dict: {payload.dict()}")
+    
+    # Get current user ID from session
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    labels = initial_email_labels(payload)
     
     # Check if there are attachments
     has_attachments = hasattr(payload, 'attachments') and payload.attachments and len(payload.attachments) > 0
@@ -238,6 +347,7 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
         needs_gmail_sync=True  # Set to True for locally created emails to sync to Gmail later
     )
     db.add(email)
+    # No outbox entry: without a gmail_id there is nothing Local -> Gmail sync could push
     db.commit()
     db.refresh(email)
     
@@ -277,6 +387,8 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
             # Import required functions at the top
             from utils.email_utils import send_email_via_gmail_api, send_email
             from routes.gmail.gmail import refresh_gmail_access_token
+            from utils.google_token_manager import token_manager
+            from utils.http_clients import http_clients
             
             # First, try to send via Gmail API if user has Gmail connection
             gmail_connection = db.query(models.GmailConnection).filter(
@@ -286,12 +398,14 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
             if gmail_connection and gmail_connection.access_token:
                 # Check if Gmail token is still valid by testing it
                 try:
+                    # Renew the token up front if it is about to expire
+                    gmail_connection = token_manager.ensure_fresh(db, gmail_connection, "gmail")
+                    
                     # Test Gmail API connection first
-                    import httpx
                     test_url = "https://gmail.googleapis.com/gmail/v1/users/me/profile"
                     headers = {'Authorization': f'Bearer {gmail_connection.access_token}'}
                     
-                    with httpx.Client() as client:
+                    with http_clients.borrow("google") as client:
                         test_response = client.get(test_url, headers=headers)
                         
                     if test_response.status_code == 200:
@@ -304,7 +418,8 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
                             body=payload.body,
                             from_email=payload.sender,
                             access_token=gmail_connection.access_token,
-                            attachments=payload.attachments if hasattr(payload, 'attachments') else None
+                            attachments=payload.attachments if hasattr(payload, 'attachments') else None,
+                            user_id=gmail_connection.user_id
                         )
                         
                         if gmail_success:
@@ -316,13 +431,13 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
                         # Token is invalid/expired, try to refresh it
                         logger.warning(f"Gmail token invalid (status: {test_response.status_code}), attempting to refresh...")
                         try:
-                            refreshed_connection = refresh_gmail_access_token(db, gmail_connection)
+                            refreshed_connection = token_manager.ensure_fresh(db, gmail_connection, "gmail", force=True)
                             
                             # Verify the refreshed token works
                             test_refresh_url = "https://gmail.googleapis.com/gmail/v1/users/me/profile"
                             refresh_headers = {'Authorization': f'Bearer {refreshed_connection.access_token}'}
                             
-                            with httpx.Client() as refresh_client:
+                            with http_clients.borrow("google") as refresh_client:
                                 refresh_test_response = refresh_client.get(test_refresh_url, headers=refresh_headers)
                             
                             if refresh_test_response.status_code == 200:
@@ -335,7 +450,8 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
                                     body=payload.body,
                                     from_email=payload.sender,
                                     access_token=refreshed_connection.access_token,
-                                    attachments=payload.attachments if hasattr(payload, 'attachments') else None
+                                    attachments=payload.attachments if hasattr(payload, 'attachments') else None,
+                                    user_id=refreshed_connection.user_id
                                 )
                                 
                                 if gmail_success:
@@ -385,6 +501,169 @@ def create_email(payload: schemas.EmailCreate, request: Request, db: Session = D
     return email
 
 
+@router.post("/create-with-files", response_model=schemas.EmailResponse)
+def create_email_with_files(
+    request: Request,
+    payload: str = Form(..., description="EmailCreate fields as JSON; attachments go in `files`"),
+    files: List[UploadFile] = File([]),
+    db: Session = Depends(get_db)
+):
+    """
+    Create (and, for status "sent", send) an email with attachments as multipart/form-data.
+    
+    Uploads are copied to disk chunk by chunk and sent from their file handles,
+    so attachments are never held in memory or stored as base64 in the database.
+    """
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    try:
+        email_data = schemas.EmailCreate.model_validate_json(payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    
+    stored = []
+    try:
+        for upload in files:
+            path, size = store_attachment(upload.file, current_user_id)
+            stored.append((upload, path, size))
+    except AttachmentTooLarge as e:
+        for _, path, _ in stored:
+            remove_attachment(path)
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    email = models.Email(
+        sender=email_data.sender,
+        to_recipients=email_data.to_recipients,
+        subject=email_data.subject,
+        body=email_data.body,
+        received_at=email_data.received_at or datetime.now(),
+        auto_reply=email_data.auto_reply or "",
+        labels=json.dumps(initial_email_labels(email_data)),
+        in_reply_to=email_data.in_reply_to,
+        thread_id=email_data.thread_id,
+        forwarded_from=email_data.forwarded_from,
+        user_id=current_user_id,
+        has_attachment=bool(stored),
+        needs_gmail_sync=True
+    )
+    db.add(email)
+    db.flush()
+    
+    attachments = []
+    for upload, path, size in stored:
+        attachment = models.EmailAttachment(
+            email_id=email.id,
+            filename=upload.filename or "attachment",
+            mime_type=upload.content_type or "application/octet-stream",
+            size=size,
+            is_inline=False,
+            storage_path=path
+        )
+        db.add(attachment)
+        attachments.append(attachment)
+    
+    db.commit()
+    db.refresh(email)
+    logger.info(f"Created email {email.id} with {len(attachments)} streamed attachments for user {current_user_id}")
+    
+    if email_data.status == "sent" and email_data.to_recipients and email_data.sender:
+        send_email_with_stored_attachments(db, current_user_id, email_data, attachments)
+    
+    return email
+
+
+def send_email_with_stored_attachments(db: Session, user_id: int, email_data: schemas.EmailCreate, attachments: list) -> bool:
+    """Send via Gmail's upload endpoint, falling back to SMTP, reading attachments from disk"""
+    from utils.email_utils import send_email_via_gmail_upload, send_email_via_smtp_stream
+    from utils.google_token_manager import token_manager
+    
+    with ExitStack() as stack:
+        files = [
+            (attachment.filename, attachment.mime_type, stack.enter_context(open(attachment.storage_path, "rb")))
+            for attachment in attachments
+        ]
+        
+        gmail_connection = db.query(models.GmailConnection).filter(
+            models.GmailConnection.user_id == user_id
+        ).first()
+        
+        if gmail_connection and gmail_connection.access_token:
+            try:
+                gmail_connection = token_manager.ensure_fresh(db, gmail_connection, "gmail")
+                if send_email_via_gmail_upload(
+                    to_email=email_data.to_recipients,
+                    subject=email_data.subject,
+                    body=email_data.body or "",
+                    from_email=email_data.sender,
+                    access_token=gmail_connection.access_token,
+                    attachments=files,
+                    user_id=user_id
+                ):
+                    return True
+                logger.warning(f"Gmail upload failed, falling back to SMTP")
+            except Exception as gmail_error:
+                logger.warning(f"Gmail upload failed: {str(gmail_error)}, falling back to SMTP")
+        
+        smtp_success = send_email_via_smtp_stream(
+            to_email=email_data.to_recipients,
+            subject=email_data.subject,
+            body=email_data.body or "",
+            from_email=email_data.sender,
+            attachments=files
+        )
+        if not smtp_success:
+            logger.warning(f"Email saved to database but failed to send via SMTP to {email_data.to_recipients}")
+        return smtp_success
+
+
+@router.get("/export")
+def export_emails(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson or mbox"),
+    include_attachments: bool = Query(True, description="Embed attachment data (base64) in the export"),
+):
+    """Stream the current user's mailbox (emails, labels, attachments) for backup or migration"""
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    
+    filename = f"mailbox-{current_user_id}-{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        export_mailbox(current_user_id, format, include_attachments),
+        media_type="application/x-ndjson" if format == "ndjson" else "application/mbox",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@router.post("/import")
+def import_emails(
+    request: Request,
+    file: UploadFile = File(..., description="A file produced by /emails/export"),
+    format: str = Form("ndjson", description="ndjson or mbox"),
+    db: Session = Depends(get_db)
+):
+    """Bulk-import an exported mailbox into the current user's emails; emails already present (by gmail_id) are skipped"""
+    current_user_id = get_user_id(request.cookies.get("session_id"))
+    if not current_user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported import format: {format}")
+    
+    try:
+        result = import_mailbox(db, current_user_id, file.file, format)
+    except Exception as e:
+        logger.error(f"Failed to import mailbox for user {current_user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to import mailbox: {str(e)}")
+    
+    return {"message": "Mailbox imported", **result}
+
+
 @router.put("/update/{email_id}", response_model=schemas.EmailResponse)
 def update_email(email_id: int, payload: schemas.EmailCreate, db: Session = Depends(get_db)):
     """Update an existing email"""
@@ -444,6 +723,7 @@ def update_email(email_id: int, payload: schemas.EmailCreate, db: Session = Depe
     # Mark for Gmail sync if email was previously synced
     if email.gmail_id:
         email.needs_gmail_sync = True
+        record_change(db, email.user_id, GMAIL, email.id, "update")
 
     db.commit()
     db.refresh(email)
@@ -465,6 +745,7 @@ def delete_email(email_id: int, db: Session = Depends(get_db)):
         email.is_deleted = True
         email.deleted_at = datetime.now()
         email.needs_gmail_sync = True
+        record_change(db, email.user_id, GMAIL, email.id, "delete")
         db.commit()
         return {"message": "Email marked for deletion and will be removed from Gmail"}
     else:
@@ -650,6 +931,7 @@ async def perform_email_action(
         # Mark email as needing Gmail sync if it has a Gmail ID
         if email.gmail_id:
             email.needs_gmail_sync = True
+            record_change(db, current_user_id, GMAIL, email.id, "update")
             logger.info(f"Marked email {email_id} as needing Gmail sync")
             
             # Note: Gmail sync will be handled by the dedicated sync endpoint
@@ -798,6 +1080,7 @@ def perform_bulk_action(
         # Mark email as needing Gmail sync if it has a Gmail ID
         if hasattr(email, 'gmail_id') and email.gmail_id:
             email.needs_gmail_sync = True
+            record_change(db, current_user_id, GMAIL, email.id, "delete" if action == "delete" else "update")
             logger.info(f"Marked email {email.id} as needing Gmail sync")
             
             # Note: Gmail sync will be handled by the dedicated sync endpoint
@@ -887,7 +1170,8 @@ def mark_all_as_read(
     db: Session = Depends(get_db)
 ):
     """Mark all emails in a category as read"""
-    query = db.query(models.Email).filter(models.Email.read == False)
+    # Read state is the "unread" label, as Gmail keeps it
+    query = db.query(models.Email).filter(models.Email.labels.contains('"unread"'))
     
     if category:
         query = query.filter(
@@ -895,8 +1179,24 @@ def mark_all_as_read(
         )
     
     emails = query.all()
+    connected = {}
     for email in emails:
-        email.read = True
+        try:
+            labels = json.loads(email.labels)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        if "unread" not in labels:
+            continue
+        labels.remove("unread")
+        email.labels = json.dumps(labels)
+        
+        # Push the read state to Gmail for emails that came from it
+        if email.gmail_id:
+            email.needs_gmail_sync = True
+            if email.user_id not in connected:
+                connected[email.user_id] = is_connected(db, email.user_id, GMAIL)
+            if connected[email.user_id]:
+                record_change(db, email.user_id, GMAIL, email.id, "update")
     
     db.commit()
     return {"message": f"Marked {len(emails)} emails as read"}
@@ -963,6 +1263,12 @@ async def add_label_to_email(
         current_labels.append(label_data["label_name"])
         email.labels = json.dumps(current_labels)
         
+        # Gmail-backed emails carry system labels (starred, inbox, ...) back to Gmail
+        if email.gmail_id:
+            email.needs_gmail_sync = True
+            if is_connected(db, current_user_id, GMAIL):
+                record_change(db, current_user_id, GMAIL, email.id, "update")
+        
         db.commit()
         
         return {"message": "Label added successfully", "email_id": email_id, "label": label_data["label_name"]}
@@ -1010,6 +1316,12 @@ async def remove_label_from_email(
         current_labels.remove(label_name)
         email.labels = json.dumps(current_labels)
         
+        # Gmail-backed emails carry system labels (starred, inbox, ...) back to Gmail
+        if email.gmail_id:
+            email.needs_gmail_sync = True
+            if is_connected(db, current_user_id, GMAIL):
+                record_change(db, current_user_id, GMAIL, email.id, "update")
+        
         db.commit()
         
         return {"message": "Label removed successfully", "email_id": email_id, "label": label_name}
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 import sys
 import os
 import logging
@@ -10,6 +11,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from models import models
 from schemas import schemas
 from database import get_db
+from utils.sync_outbox import GOOGLE_CALENDAR, is_connected, record_change
+from utils.recurrence import events_in_window, expand_events, is_active_at, is_recurring, occurrence_starts, parse_repeat, recurring_filter
 from datetime import datetime, timedelta
 from typing import List, Optional
 
@@ -47,10 +50,10 @@ def get_active_events(db: Session = Depends(get_db), current_user_id: int = Depe
     events = db.query(models.Event).filter(
         models.Event.user_id == current_user_id,
         (models.Event.archived.is_(None) | (models.Event.archived == False)),  # Not archived (NULL or False)
-        models.Event.end_time >= now  # Not expired (end time is in the future)
+        (models.Event.end_time >= now) | recurring_filter()  # Not expired, or a series that may still have occurrences ahead
     ).order_by(models.Event.start_time.asc()).all()
     
-    return events
+    return [event for event in events if event.end_time >= now or is_active_at(event, now)]
 
 @router.get("/expired", response_model=List[schemas.EventOut])
 def get_expired_events(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
@@ -66,7 +69,8 @@ def get_expired_events(db: Session = Depends(get_db), current_user_id: int = Dep
         models.Event.end_time < now  # Expired (end time is in the past)
     ).order_by(models.Event.start_time.desc()).all()
     
-    return events
+    # A recurring event only expires once its last occurrence has ended
+    return [event for event in events if not is_active_at(event, now)]
 
 @router.get("/archived", response_model=List[schemas.EventOut])
 def get_archived_events(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
@@ -153,6 +157,16 @@ def get_event_stats(db: Session = Depends(get_db), current_user_id: int = Depend
         models.Event.end_time < now
     ).count()
     
+    # Recurring events past their first occurrence count as active until the series ends
+    running_series = sum(1 for event in db.query(models.Event).filter(
+        models.Event.user_id == current_user_id,
+        (models.Event.archived.is_(None) | (models.Event.archived == False)),
+        models.Event.end_time < now,
+        recurring_filter()
+    ).all() if is_active_at(event, now))
+    active_events += running_series
+    expired_events -= running_series
+    
     # Archived events
     archived_events = db.query(models.Event).filter(
         models.Event.user_id == current_user_id,
@@ -165,10 +179,23 @@ def get_event_stats(db: Session = Depends(get_db), current_user_id: int = Depend
     upcoming_events = db.query(models.Event).filter(
         models.Event.user_id == current_user_id,
         (models.Event.archived.is_(None) | (models.Event.archived == False)),  # Not archived (NULL or False)
+        ~recurring_filter(),
         models.Event.start_time >= now,
         models.Event.start_time <= week_from_now
     ).count()
     
+    # Each occurrence of a recurring event in the next 7 days counts
+    series = db.query(models.Event).filter(
+        models.Event.user_id == current_user_id,
+        (models.Event.archived.is_(None) | (models.Event.archived == False)),
+        models.Event.start_time <= week_from_now,
+        recurring_filter()
+    ).all()
+    upcoming_events += sum(
+        1 for occurrence in expand_events(db, series, now, week_from_now + timedelta(microseconds=1))
+        if occurrence["start_time"] >= now
+    )
+    
     return {
         "total": total_events,
         "active": active_events,
@@ -209,6 +236,13 @@ def create_event(payload: schemas.EventCreate, db: Session = Depends(get_db), cu
         needs_google_sync=True,  # Mark for Google Calendar sync
     )
     db.add(event)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="An event with this title and start time already exists")
+    if is_connected(db, current_user_id, GOOGLE_CALENDAR):
+        record_change(db, current_user_id, GOOGLE_CALENDAR, event.id, "create")
     db.commit()
     db.refresh(event)
     return event
@@ -261,8 +295,14 @@ def update_event(event_id: int, payload: schemas.EventUpdate, db: Session = Depe
     # Mark for Google Calendar sync if event was previously synced
     if event.google_event_id:
         event.needs_google_sync = True
+        if is_connected(db, current_user_id, GOOGLE_CALENDAR):
+            record_change(db, current_user_id, GOOGLE_CALENDAR, event.id, "update")
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="An event with this title and start time already exists")
     db.refresh(event)
     return event
 
@@ -286,6 +326,8 @@ def delete_event(event_id: int, db: Session = Depends(get_db), current_user_id:
         event.is_deleted = True
         event.deleted_at = datetime.now()
         event.needs_google_sync = True
+        if is_connected(db, current_user_id, GOOGLE_CALENDAR):
+            record_change(db, current_user_id, GOOGLE_CALENDAR, event.id, "delete")
         db.commit()
         return {"message": "Event marked for deletion and will be removed from Google Calendar"}
     else:
@@ -295,4 +337,90 @@ def delete_event(event_id: int, db: Session = Depends(get_db), current_user_id:
         return {"message": "Event deleted successfully"}
 
 
+def to_local(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive local time for a datetime from a request, as the event columns store it"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+@router.get("/occurrences")
+def list_event_occurrences(
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Events between start and end with recurring events expanded into their occurrences (for calendar views)"""
+    window_start, window_end = to_local(start), to_local(end)
+    if window_end <= window_start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if window_end - window_start > timedelta(days=366):
+        raise HTTPException(status_code=400, detail="Window can be at most 366 days")
+
+    occurrences = events_in_window(
+        db, current_user_id, window_start, window_end,
+        (models.Event.archived.is_(None) | (models.Event.archived == False))
+    )
+    return {"occurrences": occurrences, "count": len(occurrences)}
+
+
+@router.post("/{event_id}/exceptions", response_model=schemas.EventExceptionOut)
+def save_event_exception(
+    event_id: int,
+    payload: schemas.EventExceptionCreate,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Cancel or change one occurrence of a recurring event (replaces an earlier change to the same occurrence)"""
+    event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if not is_recurring(event):
+        raise HTTPException(status_code=400, detail="Event does not repeat")
+
+    original_start = to_local(payload.original_start)
+    duration = event.end_time - event.start_time
+    starts = occurrence_starts(event.start_time, duration, parse_repeat(event.repeat), original_start, original_start + timedelta(microseconds=1))
+    if original_start not in starts:
+        raise HTTPException(status_code=400, detail="original_start is not an occurrence of this event")
+
+    exception = db.query(models.EventException).filter(
+        models.EventException.event_id == event.id,
+        models.EventException.original_start == original_start
+    ).first()
+    if exception is None:
+        exception = models.EventException(event_id=event.id, user_id=current_user_id, original_start=original_start)
+        db.add(exception)
 
+    exception.cancelled = payload.cancelled
+    exception.start_time = to_local(payload.start_time)
+    exception.end_time = to_local(payload.end_time)
+    exception.title = payload.title
+    exception.description = payload.description
+    exception.updated_at = datetime.now()
+
+    db.commit()
+    db.refresh(exception)
+    return exception
+
+
+@router.delete("/{event_id}/exceptions/{exception_id}")
+def delete_event_exception(
+    event_id: int,
+    exception_id: int,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Restore an occurrence to what the series generates"""
+    exception = db.query(models.EventException).filter(
+        models.EventException.id == exception_id,
+        models.EventException.event_id == event_id,
+        models.EventException.user_id == current_user_id
+    ).first()
+    if not exception:
+        raise HTTPException(status_code=404, detail="Exception not found")
+
+    db.delete(exception)
+    db.commit()
+    return {"message": "Occurrence restored"}
@@ -0,0 +1,4 @@
+# Free/busy calendar routes package
+from .freebusy import router
+
+__all__ = ["router"]
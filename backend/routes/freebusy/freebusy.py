@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import logging
+
+from database import get_db
+from routes.auth.session import get_user_id
+from utils.freebusy import MAX_FREEBUSY_DAYS, SLOT_MINUTES, get_freebusy
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/calendar", tags=["Calendar"])
+
+def get_current_user_id(request: Request) -> int:
+    """Extract user ID from session cookie"""
+    session_id = request.cookies.get("session_id")
+
+    if not session_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    user_id = get_user_id(session_id)
+
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Session expired or invalid")
+
+    return user_id
+
+@router.get("/freebusy")
+def get_free_busy(
+    start: datetime = Query(..., description="Start of the range"),
+    end: datetime = Query(..., description="End of the range"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    Busy periods between start and end, plus one bitmap per day (hex, one bit
+    per slot, most significant bit first) for clients that scan slots themselves
+    """
+    # Event times are stored as naive local time
+    if start.tzinfo is not None:
+        start = start.astimezone().replace(tzinfo=None)
+    if end.tzinfo is not None:
+        end = end.astimezone().replace(tzinfo=None)
+
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > timedelta(days=MAX_FREEBUSY_DAYS):
+        raise HTTPException(status_code=400, detail=f"Range can be at most {MAX_FREEBUSY_DAYS} days")
+
+    freebusy = get_freebusy(db, current_user_id, start, end)
+
+    return {
+        "start": start,
+        "end": end,
+        "slot_minutes": SLOT_MINUTES,
+        "busy": [{"start": period_start, "end": period_end} for period_start, period_end in freebusy.busy_periods(start, end)],
+        "days": [
+            {
+                "date": (freebusy.first_day + timedelta(days=offset)).isoformat(),
+                "bitmap": busy.hex()
+            }
+            for offset, (busy, _) in enumerate(freebusy.packed_days)
+        ]
+    }
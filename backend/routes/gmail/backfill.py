@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from fastapi import HTTPException
+
+from models import models
+from database import SessionLocal
+from config.google import google_config
+from routes.gmail.sync_pipeline import GmailSyncPipeline
+from routes.sync_jobs.sync_jobs import claim_resumable_sync_job, start_sync_job_progress, save_sync_checkpoint
+from utils.sync_scheduler import sync_scheduler
+from utils.google_token_manager import token_manager
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaBudget:
+    """Token bucket of Gmail quota units for one user's background traffic"""
+
+    def __init__(self, units_per_second: float):
+        self.rate = max(units_per_second, 1)
+        self.capacity = self.rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, units: int):
+        """Wait until `units` quota units are available, then spend them"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= units:
+                    self.tokens -= units
+                    return
+
+                await asyncio.sleep((units - self.tokens) / self.rate)
+
+
+_budgets: Dict[int, QuotaBudget] = {}
+
+def get_backfill_budget(user_id: int) -> QuotaBudget:
+    """Per-user budget shared by every backfill window of that user"""
+    if user_id not in _budgets:
+        _budgets[user_id] = QuotaBudget(google_config.GMAIL_BACKFILL_UNITS_PER_SECOND)
+    return _budgets[user_id]
+
+
+async def run_gmail_backfill_job(user_id: int, params: dict) -> dict:
+    """
+    Sync scheduler entry point: import older mail one window at a time.
+
+    Each window lists at most GMAIL_BACKFILL_WINDOW_MESSAGES messages under the
+    user's quota budget and ends early when interactive syncs are waiting. An
+    unfinished backfill returns continue_with, so the scheduler queues the next
+    window behind whatever arrived meanwhile.
+    """
+    db = SessionLocal()
+    try:
+        job_id = params.get("job_id")
+        resume = params.get("resume")
+        depth = params.get("depth")
+
+        if resume is None:
+            # Fresh request, or a window cut off by a restart
+            resume = claim_resumable_sync_job(db, user_id, "gmail_backfill", job_id)
+            if resume and not depth and resume.get("total_count"):
+                depth = resume["total_count"] // max(len(google_config.GMAIL_BACKFILL_LABELS), 1)
+
+        depth = min(depth or google_config.GMAIL_BACKFILL_DEFAULT_DEPTH, google_config.GMAIL_BACKFILL_MAX_DEPTH)
+        labels = {label: depth for label in google_config.GMAIL_BACKFILL_LABELS}
+
+        connection = db.query(models.GmailConnection).filter(
+            models.GmailConnection.user_id == user_id
+        ).first()
+
+        if not connection:
+            raise HTTPException(status_code=404, detail="Gmail not connected")
+
+        connection = await token_manager.ensure_fresh_async(db, connection, "gmail")
+
+        headers = {"Authorization": f"Bearer {connection.access_token}"}
+        start_sync_job_progress(db, job_id, depth * len(labels), resume)
+
+        window_size = google_config.GMAIL_BACKFILL_WINDOW_MESSAGES
+        pipeline = None
+
+        def should_stop() -> bool:
+            listed = sum(result["total_processed"] for result in pipeline.label_results.values())
+            # Always make progress on at least one page before yielding
+            return listed >= window_size or (listed > 0 and sync_scheduler.has_interactive_waiting())
+
+        pipeline = GmailSyncPipeline(
+            db,
+            connection,
+            user_id,
+            headers,
+            on_checkpoint=lambda session, state: save_sync_checkpoint(session, job_id, state),
+            resume=resume,
+            throttle=get_backfill_budget(user_id).acquire,
+            should_stop=should_stop,
+            persist_batch_size=google_config.GMAIL_BACKFILL_PERSIST_BATCH
+        )
+        result = await pipeline.run(labels)
+
+        # Keep the last committed checkpoint on the row even if no batch was flushed this window
+        save_sync_checkpoint(db, job_id, result["checkpoint"])
+
+        logger.info(f"Gmail - Backfill window for user {user_id} synced {result['total_emails_synced']} emails ({result['processed_count']} processed, depth {depth})")
+
+        response = {
+            "total_emails_synced": result["total_emails_synced"],
+            "processed_count": result["processed_count"],
+            "depth": depth,
+            "labels": list(labels.keys()),
+            "label_results": result["label_results"],
+            "metrics": result["metrics"],
+            "finished": not result["stopped_early"]
+        }
+        if result["stopped_early"]:
+            response["continue_with"] = {
+                "depth": depth,
+                "resume": dict(result["checkpoint"], job_id=job_id, total_count=depth * len(labels))
+            }
+        return response
+    finally:
+        db.close()
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from models import models
+from database import SessionLocal
+from config.google import google_config
+from routes.gmail.gmail import collect_inline_parts, extract_body_from_payload
+from utils.google_rate_limiter import governed_request_async
+from utils.google_token_manager import token_manager
+from utils.http_clients import http_clients
+from utils.sync_scheduler import sync_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Body fetches in flight, by email ID; later callers await the same task instead of refetching
+_inflight: Dict[int, asyncio.Task] = {}
+
+
+async def fetch_email_body(user_id: int, email_id: int) -> dict:
+    """
+    Fetch, sanitize and cache an email body, collapsing concurrent calls per email.
+
+    The fetch runs as its own task with its own DB session, so a caller that goes
+    away (closed tab, cancelled request) doesn't cancel it for the others.
+    """
+    task = _inflight.get(email_id)
+    if task is None:
+        task = asyncio.create_task(_load_email_body(user_id, email_id))
+        _inflight[email_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(email_id, None))
+    else:
+        logger.info(f"Gmail - Joining in-flight body fetch for email {email_id}")
+
+    return await asyncio.shield(task)
+
+
+async def fetch_inline_attachments(client, headers: dict, gmail_id: str, parts: list, user_id: Optional[int] = None) -> dict:
+    """Fetch a message's inline (Content-ID) images concurrently, keyed by CID"""
+    inline_parts = collect_inline_parts(parts)
+    if not inline_parts:
+        return {}
+
+    semaphore = asyncio.Semaphore(google_config.GMAIL_INLINE_FETCH_CONCURRENCY)
+
+    async def fetch(cid: str, part: dict):
+        attachment_id = part["body"]["attachmentId"]
+        async with semaphore:
+            try:
+                response = await governed_request_async(
+                    client,
+                    "GET",
+                    f"{google_config.GOOGLE_GMAIL_API}/messages/{gmail_id}/attachments/{attachment_id}",
+                    user_id=user_id,
+                    headers=headers,
+                    timeout=30.0
+                )
+            except Exception as e:
+                logger.warning(f"Gmail - Failed to fetch attachment {cid}: {str(e)}")
+                return None
+
+        if response.status_code != 200:
+            logger.warning(f"Gmail - Failed to fetch attachment {cid}: {response.status_code}")
+            return None
+
+        data = response.json().get("data", "")
+        if not data:
+            return None
+        return cid, {
+            "data": data,
+            "filename": part.get("filename", ""),
+            "mime_type": part.get("mimeType", ""),
+            "size": len(data) * 3 // 4,  # Approximate size (base64 is ~33% larger)
+            "attachment_id": attachment_id
+        }
+
+    results = await asyncio.gather(*(fetch(cid, part) for cid, part in inline_parts))
+    return dict(result for result in results if result)
+
+
+async def _load_email_body(user_id: int, email_id: int) -> dict:
+    db = SessionLocal()
+    try:
+        email = db.query(models.Email).filter(
+            models.Email.id == email_id,
+            models.Email.user_id == user_id
+        ).first()
+
+        if not email:
+            raise HTTPException(status_code=404, detail="Email not found")
+
+        # Another fetch may have finished between the caller's check and this task starting
+        if email.body_cached and email.body:
+            return {"body": email.body, "cached": True, "cached_at": email.body_cached_at}
+
+        connection = db.query(models.GmailConnection).filter(
+            models.GmailConnection.user_id == user_id
+        ).first()
+
+        if not connection:
+            raise HTTPException(status_code=404, detail="Gmail not connected")
+
+        try:
+            connection = await token_manager.ensure_fresh_async(db, connection, "gmail")
+        except Exception as e:
+            logger.error(f"Gmail - Failed to refresh token for user {user_id}: {str(e)}")
+            raise HTTPException(
+                status_code=401,
+                detail="Authentication failed. Please reconnect your Gmail account."
+            )
+
+        headers = {"Authorization": f"Bearer {connection.access_token}"}
+
+        async with http_clients.borrow_async("google") as client:
+            response = await governed_request_async(
+                client,
+                "GET",
+                f"{google_config.GOOGLE_GMAIL_API}/messages/{email.gmail_id}",
+                user_id=user_id,
+                headers=headers,
+                params={"format": "full"},
+                timeout=30.0
+            )
+
+            if response.status_code != 200:
+                logger.error(f"Gmail - Failed to fetch message body: {response.status_code}")
+                raise HTTPException(status_code=response.status_code, detail="Failed to fetch email body")
+
+            payload = response.json().get("payload", {})
+
+            # Inline images for CID replacement
+            attachments = {}
+            if "parts" in payload:
+                attachments = await fetch_inline_attachments(client, headers, email.gmail_id, payload["parts"], user_id)
+
+        logger.info(f"Gmail - Found {len(attachments)} inline attachments for email {email_id}")
+
+        if attachments:
+            # One query for all of the message's inline attachment rows
+            for attachment in db.query(models.EmailAttachment).filter(
+                models.EmailAttachment.email_id == email_id,
+                models.EmailAttachment.content_id.in_(list(attachments))
+            ).all():
+                attachment.data = attachments[attachment.content_id]["data"]
+                attachment.size = attachments[attachment.content_id]["size"]
+
+        # Sanitizing large HTML is CPU-bound; keep it off the event loop
+        body = await asyncio.to_thread(extract_body_from_payload, payload, attachments)
+
+        if not body:
+            logger.warning(f"Gmail - No body content extracted for email {email_id}, using snippet")
+            body = email.snippet or "No content available"
+
+        email.body = body
+        email.body_cached = True
+        email.body_cached_at = datetime.now()
+        db.commit()
+
+        logger.info(f"Gmail - Cached email body for email {email_id}, length: {len(body)}")
+
+        return {"body": body, "cached": False, "cached_at": email.body_cached_at}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_gmail_body_prefetch_job(user_id: int, params: dict) -> dict:
+    """Sync scheduler entry point: warm the bodies of the newest unread emails so opening them is a cache hit"""
+    limit = params.get("limit", google_config.GMAIL_BODY_PREFETCH_COUNT)
+
+    db = SessionLocal()
+    try:
+        email_ids = [row[0] for row in db.query(models.Email.id).filter(
+            models.Email.user_id == user_id,
+            models.Email.body_cached.isnot(True),
+            models.Email.is_deleted.isnot(True),
+            models.Email.gmail_id.isnot(None),
+            models.Email.labels.contains('"unread"')
+        ).order_by(models.Email.received_at.desc()).limit(limit).all()]
+    finally:
+        db.close()
+
+    semaphore = asyncio.Semaphore(google_config.GMAIL_BODY_PREFETCH_CONCURRENCY)
+
+    async def prefetch(email_id: int) -> bool:
+        async with semaphore:
+            try:
+                await fetch_email_body(user_id, email_id)
+                return True
+            except Exception as e:
+                logger.warning(f"Gmail - Failed to prefetch body for email {email_id}: {getattr(e, 'detail', None) or str(e)}")
+                return False
+
+    results = await asyncio.gather(*(prefetch(email_id) for email_id in email_ids))
+    prefetched = sum(results)
+
+    logger.info(f"Gmail - Prefetched {prefetched}/{len(email_ids)} unread bodies for user {user_id}")
+    return {"prefetched": prefetched, "failed": len(email_ids) - prefetched}
+
+
+def queue_body_prefetch(scheduled_job) -> None:
+    """Sync scheduler listener: queue a body prefetch once a Gmail sync completes"""
+    if scheduled_job.kind not in ("gmail", "gmail_history") or scheduled_job.status != "completed":
+        return
+    if google_config.GMAIL_BODY_PREFETCH_COUNT <= 0:
+        return
+    asyncio.get_running_loop().create_task(
+        sync_scheduler.enqueue(scheduled_job.user_id, "gmail_prefetch", interactive=False)
+    )
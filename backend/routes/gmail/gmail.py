@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Optional
 from pydantic import BaseModel
 import httpx
+import asyncio
 import json
 import base64
 import email
@@ -23,9 +25,15 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
 from models import models
 from schemas import schemas
-from database import get_db
+from database import get_db, SessionLocal
 from routes.auth.session import get_user_id
 from config.google import google_config
+from utils.google_rate_limiter import governed_request, governed_request_async, rate_governor
+from utils.attachment_store import remove_attachment
+from utils.email_threads import refresh_email_threads
+from utils.google_token_manager import token_manager
+from utils.http_clients import http_clients
+from utils.sync_outbox import GMAIL, acknowledge, pending_changes
 
 router = APIRouter(prefix="/gmail")
 logger = logging.getLogger(__name__)
@@ -143,7 +151,7 @@ async def exchange_token_for_gmail(
     
     logger.info("Gmail - Exchanging code for tokens...")
     
-    async with httpx.AsyncClient() as client:
+    async with http_clients.borrow_async("google_oauth") as client:
         response = await client.post(google_config.GOOGLE_TOKEN_URL, data=token_data)
         
         if response.status_code != 200:
@@ -210,6 +218,14 @@ async def exchange_token_for_gmail(
         db.commit()
         logger.info(f"Gmail - Connection saved successfully for user {current_user_id}")
         
+        # Subscribe to push notifications so new mail arrives without polling
+        from routes.gmail.push import start_gmail_watch
+        try:
+            connection = existing_connection or new_connection
+            await asyncio.to_thread(start_gmail_watch, db, connection)
+        except Exception as e:
+            logger.warning(f"Gmail - Failed to start watch for user {current_user_id}: {str(e)}")
+        
         return {"message": "Successfully connected to Gmail"}
 
 
@@ -243,125 +259,9 @@ async def get_email_body(
                 "cached_at": email.body_cached_at
             }
         
-        # Get Gmail connection
-        connection = db.query(models.GmailConnection).filter(
-            models.GmailConnection.user_id == current_user_id
-        ).first()
-        
-        if not connection:
-            raise HTTPException(status_code=404, detail="Gmail not connected")
-        
-        # Check if token is expired and refresh if needed
-        if connection.token_expiry <= datetime.now():
-            logger.info(f"Gmail - Refreshing expired token for user {current_user_id}")
-            try:
-                connection = refresh_gmail_access_token(db, connection)
-            except Exception as e:
-                logger.error(f"Gmail - Failed to refresh token for user {current_user_id}: {str(e)}")
-                raise HTTPException(
-                    status_code=401, 
-                    detail="Authentication failed. Please reconnect your Gmail account."
-                )
-        
-        # Fetch full message from Gmail API
-        headers = {"Authorization": f"Bearer {connection.access_token}"}
-        
-        with httpx.Client() as client:
-            response = client.get(
-                f"{google_config.GOOGLE_GMAIL_API}/messages/{email.gmail_id}",
-                headers=headers,
-                params={"format": "full"}  # Get full message content
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Gmail - Failed to fetch message body: {response.status_code}")
-                raise HTTPException(status_code=response.status_code, detail="Failed to fetch email body")
-            
-            message_data = response.json()
-            
-            # Extract and process body content
-            body = ""
-            payload = message_data.get("payload", {})
-            
-            # 🔥 Extract attachments for CID replacement
-            attachments = {}
-            if "parts" in payload:
-                attachments = extract_attachments_from_parts(payload["parts"], connection.access_token, client)
-            
-            logger.info(f"Gmail - Processing email body for email {email_id}, payload mimeType: {payload.get('mimeType')}")
-            logger.info(f"Gmail - Payload structure: {list(payload.keys())}")
-            logger.info(f"Gmail - Found {len(attachments)} attachments for CID replacement")
-            
-            # Update attachment records with inline image data
-            if attachments:
-                try:
-                    for cid, attachment_info in attachments.items():
-                        # Find existing attachment record
-                        existing_attachment = db.query(models.EmailAttachment).filter(
-                            models.EmailAttachment.email_id == email_id,
-                            models.EmailAttachment.content_id == cid
-                        ).first()
-                        
-                        if existing_attachment:
-                            # Update with inline image data
-                            existing_attachment.data = attachment_info["data"]
-                            existing_attachment.size = attachment_info["size"]
-                            logger.debug(f"Gmail - Updated inline image data for attachment {existing_attachment.filename}")
-                        else:
-                            logger.warning(f"Gmail - No attachment record found for CID {cid}")
-                    
-                    # Commit attachment updates
-                    db.commit()
-                    logger.info(f"Gmail - Updated {len(attachments)} attachment records with inline image data")
-                    
-                except Exception as attachment_update_error:
-                    logger.warning(f"Gmail - Failed to update attachment records: {str(attachment_update_error)}")
-                    db.rollback()
-                    # Continue without failing the entire request
-            
-            if "parts" in payload:
-                # Multipart message
-                logger.info(f"Gmail - Multipart message detected for email {email_id}, parts count: {len(payload['parts'])}")
-                body = extract_body_from_parts(payload["parts"], attachments=attachments)
-                logger.info(f"Gmail - Multipart body extracted, length: {len(body) if body else 0}")
-            else:
-                # Simple message
-                logger.info(f"Gmail - Simple message for email {email_id}, mimeType: {payload.get('mimeType')}")
-                if payload.get("mimeType") == "text/plain":
-                    body_data = payload.get("body", {}).get("data", "")
-                    if body_data:
-                        body = base64.urlsafe_b64decode(body_data).decode("utf-8", errors="ignore")
-                        logger.info(f"Gmail - Plain text body extracted for email {email_id}, length: {len(body)}")
-                elif payload.get("mimeType") == "text/html":
-                    html_data = payload.get("body", {}).get("data", "")
-                    if html_data:
-                        html_content = base64.urlsafe_b64decode(html_data).decode("utf-8", errors="ignore")
-                        logger.info(f"Gmail - HTML content extracted for email {email_id}, raw length: {len(html_content)}")
-                        logger.info(f"Gmail - HTML content preview: {html_content[:200]}...")
-                        body = extract_body_from_html(html_content, attachments)
-                        logger.info(f"Gmail - HTML body extracted for email {email_id}, extracted length: {len(body)}")
-                        logger.info(f"Gmail - Extracted body preview: {body[:200]}...")
-            
-            # If still no body, use snippet
-            if not body:
-                logger.warning(f"Gmail - No body content extracted for email {email_id}, using snippet")
-                body = email.snippet or "No content available"
-            
-            logger.info(f"Gmail - Final body for email {email_id}, length: {len(body)}, is_html: {'<html' in body.lower() or '<!doctype' in body.lower()}")
-            
-            # Cache the body in database
-            email.body = body
-            email.body_cached = True
-            email.body_cached_at = datetime.now()
-            db.commit()
-            
-            logger.info(f"Gmail - Successfully cached email body for email {email_id}")
-            
-            return {
-                "body": body,
-                "cached": False,
-                "cached_at": email.body_cached_at
-            }
+        # Repeated opens (double clicks, a second tab, the prefetcher) share one Gmail fetch
+        from routes.gmail.bodies import fetch_email_body
+        return await fetch_email_body(current_user_id, email_id)
             
     except HTTPException:
         raise
@@ -374,13 +274,58 @@ async def sync_gmail_native_labels(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    """Sync emails using Gmail's native label system (store labels directly in emails table)"""
+    """Queue a background Gmail sync (or join the one already running) and return its job ID"""
     current_user_id = get_current_user_id(request)
     
     connection = db.query(models.GmailConnection).filter(
         models.GmailConnection.user_id == current_user_id
     ).first()
     
+    if not connection:
+        raise HTTPException(
+            status_code=404, 
+            detail="Gmail not connected. Please connect your Gmail account first."
+        )
+    
+    from utils.sync_scheduler import sync_scheduler
+    try:
+        job = await sync_scheduler.enqueue(current_user_id, "gmail")
+    except Exception as e:
+        logger.error(f"Gmail - Failed to queue sync for user {current_user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue sync: {str(e)}")
+    
+    return {
+        "message": "Gmail sync started in the background",
+        "job_id": job.id,
+        "status": job.status
+    }
+
+async def run_gmail_sync_job(user_id: int, params: dict) -> dict:
+    """Sync scheduler entry point: run a native label sync with its own DB session"""
+    from routes.sync_jobs.sync_jobs import claim_resumable_sync_job
+    db = SessionLocal()
+    try:
+        job_id = params.get("job_id")
+        # Continue from the checkpoint of a sync that died mid-way, if there is one
+        resume = claim_resumable_sync_job(db, user_id, "gmail", job_id)
+        return await run_native_label_sync(db, user_id, job_id=job_id, resume=resume)
+    finally:
+        db.close()
+
+def get_gmail_sync_user_ids() -> list:
+    """User IDs with a Gmail connection, for periodic background syncs"""
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.query(models.GmailConnection.user_id).all()]
+    finally:
+        db.close()
+
+async def run_native_label_sync(db: Session, current_user_id: int, job_id: Optional[str] = None, resume: Optional[dict] = None) -> dict:
+    """Sync emails using Gmail's native label system (store labels directly in emails table)"""
+    connection = db.query(models.GmailConnection).filter(
+        models.GmailConnection.user_id == current_user_id
+    ).first()
+    
     if not connection:
         raise HTTPException(
             status_code=404, 
@@ -388,9 +333,9 @@ async def sync_gmail_native_labels(
         )
     
     # Check if token is expired and refresh if needed
-    if connection.token_expiry <= datetime.now():
+    if token_manager.needs_refresh(connection.token_expiry):
         try:
-            connection = refresh_gmail_access_token(db, connection)
+            connection = await token_manager.ensure_fresh_async(db, connection, "gmail")
         except Exception as e:
             raise HTTPException(
                 status_code=401, 
@@ -433,177 +378,29 @@ async def sync_gmail_native_labels(
             # Don't fail the entire sync, just log the error
             local_sync_result = {"error": str(e)}
         
-        with httpx.Client() as client:
-            # Step 2: Sync System Labels (Sidebar items)
-            logger.info("Gmail - Step 2: Syncing System Labels (Sidebar navigation)")
-            for label_name, limit in SYSTEM_LABELS.items():
-                logger.info(f"Gmail - Syncing {label_name} label (limit: {limit})")
-                
-                try:
-                    # Use Gmail's native label query: labelIds=INBOX
-                    # Order by internalDate to get newest emails first
-                    params = {
-                        "maxResults": limit,
-                        "labelIds": [label_name],  # Direct label ID query
-                        "orderBy": "internalDate"  # Get newest emails first
-                    }
-                    
-                    # Fetch emails with this label
-                    response = client.get(
-                        f"{google_config.GOOGLE_GMAIL_API}/messages",
-                        headers=headers,
-                        params=params,
-                        timeout=30.0
-                    )
-                    
-                    if response.status_code != 200:
-                        logger.warning(f"Gmail - Failed to fetch {label_name} messages: {response.status_code}")
-                        continue
-                    
-                    messages_data = response.json()
-                    messages = messages_data.get("messages", [])
-                    logger.info(f"Gmail - Fetched {len(messages)} messages from {label_name} label")
-                    
-                    label_emails_synced = 0
-                    new_emails = []
-                    skipped_duplicates = 0
-                    
-                    # Process each message
-                    for msg in messages:
-                        try:
-                            # Check if email already exists
-                            existing_email = db.query(models.Email).filter(
-                                models.Email.gmail_id == msg['id'],
-                                models.Email.user_id == current_user_id
-                            ).first()
-                            
-                            if not existing_email:
-                                # Fetch full message details with format=full
-                                msg_response = client.get(
-                                    f"{google_config.GOOGLE_GMAIL_API}/messages/{msg['id']}?format=full",
-                                    headers=headers,
-                                    timeout=45.0
-                                )
-                                
-                                if msg_response.status_code == 200:
-                                    msg_detail = msg_response.json()
-                                    parsed_email = parse_gmail_message(msg_detail, connection.access_token, client)
-                                    
-                                    # Get all labels for this email
-                                    gmail_labels = msg_detail.get("labelIds", [])
-                                    
-                                    # Create new email record
-                                    new_email = models.Email(
-                                        gmail_id=parsed_email["id"],
-                                        thread_id=parsed_email["thread_id"],
-                                        sender=parsed_email["sender"],
-                                        to_recipients=parsed_email["to_recipients"],
-                                        subject=parsed_email["subject"],
-                                        snippet=parsed_email["snippet"],
-                                        body=parsed_email["body"],
-                                        has_attachment=parsed_email["has_attachment"],
-                                        received_at=parsed_email["received_at"],
-                                        auto_reply="",
-                                        user_id=current_user_id
-                                    )
-                                    
-                                    # Store all labels as JSON in the labels field
-                                    # Convert Gmail label IDs to our label names
-                                    label_names = []
-                                    for gmail_label in gmail_labels:
-                                        if gmail_label.startswith("CATEGORY_"):
-                                            # Convert Gmail categories to our label format
-                                            category_name = gmail_label.replace("CATEGORY_", "").lower()
-                                            label_names.append(f"category_{category_name}")
-                                        elif gmail_label in ["INBOX", "SENT", "DRAFT", "TRASH", "SPAM", "STARRED", "IMPORTANT", "UNREAD"]:
-                                            # System labels
-                                            label_names.append(gmail_label.lower())
-                                        else:
-                                            # Custom labels
-                                            label_names.append(gmail_label.lower())
-                                    
-                                    # Store labels as JSON string
-                                    new_email.labels = json.dumps(label_names)
-                                    
-                                    # Store parsed email data for attachment processing
-                                    new_email._parsed_data = parsed_email
-                                    
-                                    new_emails.append(new_email)
-                                    label_emails_synced += 1
-                                    logger.debug(f"Gmail - Added email {parsed_email['id']} to {label_name} queue with labels: {label_names}")
-                                else:
-                                    logger.warning(f"Gmail - Failed to fetch message {msg['id']} details: {msg_response.status_code}")
-                            else:
-                                skipped_duplicates += 1
-                                
-                        except Exception as e:
-                            logger.warning(f"Gmail - Failed to process message {msg['id']} in {label_name}: {str(e)}")
-                            continue
-                    
-                    # Add new emails to database
-                    if new_emails:
-                        try:
-                            for email in new_emails:
-                                db.add(email)
-                            
-                            db.commit()
-                            logger.info(f"Gmail - Successfully committed {len(new_emails)} emails to {label_name}")
-                            
-                            # Store attachments if available
-                            for email in new_emails:
-                                if hasattr(email, '_parsed_data'):
-                                    parsed_data = email._parsed_data
-                                    logger.info(f"Gmail - Processing attachments for email {email.id}: has_attachment={parsed_data.get('has_attachment')}, attachment_count={len(parsed_data.get('attachment_metadata', []))}")
-                                    
-                                    # Debug: Log the entire parsed_data structure
-                                    logger.info(f"Gmail - Full parsed_data keys: {list(parsed_data.keys())}")
-                                    logger.info(f"Gmail - parsed_data['has_attachment']: {parsed_data.get('has_attachment')}")
-                                    logger.info(f"Gmail - parsed_data['attachment_metadata']: {parsed_data.get('attachment_metadata')}")
-                                    logger.info(f"Gmail - parsed_data['attachment_metadata'] type: {type(parsed_data.get('attachment_metadata'))}")
-                                    logger.info(f"Gmail - parsed_data['attachment_metadata'] length: {len(parsed_data.get('attachment_metadata', []))}")
-                                    
-                                    # Debug: Log the actual attachment data structure
-                                    if parsed_data.get("attachment_metadata"):
-                                        for i, att in enumerate(parsed_data.get("attachment_metadata", [])):
-                                            logger.info(f"Gmail - Attachment {i+1}: filename={att.get('filename')}, mime_type={att.get('mime_type')}, size={att.get('size')}, gmail_id={att.get('gmail_attachment_id')}")
-                                    
-                                    if parsed_data.get("has_attachment") and parsed_data.get("attachment_metadata"):
-                                        try:
-                                            logger.info(f"Gmail - Storing {len(parsed_data.get('attachment_metadata', []))} attachments for email {email.id}")
-                                            store_email_attachments(db, email.id, parsed_data.get("attachment_metadata", []),current_user_id)
-                                            logger.info(f"Gmail - Successfully stored attachments for email {email.id}")
-                                        except Exception as attachment_error:
-                                            logger.error(f"Gmail - Failed to store attachments for email {email.id}: {str(attachment_error)}")
-                                            logger.error(f"Gmail - Attachment error details: {type(attachment_error).__name__}")
-                                            continue
-                                    else:
-                                        logger.info(f"Gmail - No attachments to store for email {email.id}")
-                                        logger.info(f"Gmail - Condition check: has_attachment={parsed_data.get('has_attachment')}, attachment_metadata={bool(parsed_data.get('attachment_metadata'))}")
-                                else:
-                                    logger.warning(f"Gmail - Email {email.id} has no _parsed_data attribute")
-                            
-                            # Clean up the temporary data AFTER attachment processing
-                            for email in new_emails:
-                                if hasattr(email, '_parsed_data'):
-                                    delattr(email, '_parsed_data')
-                            
-                        except Exception as add_error:
-                            logger.error(f"Gmail - Failed to add emails to {label_name}: {str(add_error)}")
-                            db.rollback()
-                            continue
-                    
-                    total_emails_synced += label_emails_synced
-                    label_sync_results[label_name] = {
-                        "synced": label_emails_synced,
-                        "skipped_duplicates": skipped_duplicates,
-                        "total_processed": len(messages)
-                    }
-                    
-                except Exception as e:
-                    logger.error(f"Gmail - Failed to sync {label_name} label: {str(e)}")
-                    label_sync_results[label_name] = {"error": str(e)}
-                    continue
-            
+        # Step 2: Sync System Labels (Sidebar items) through the staged list → fetch → parse → persist pipeline
+        logger.info("Gmail - Step 2: Syncing System Labels (Sidebar navigation)")
+        from routes.gmail.sync_pipeline import GmailSyncPipeline
+        from routes.sync_jobs.sync_jobs import start_sync_job_progress, save_sync_checkpoint
+        start_sync_job_progress(db, job_id, sum(SYSTEM_LABELS.values()), resume)
+        pipeline = GmailSyncPipeline(
+            db,
+            connection,
+            current_user_id,
+            headers,
+            on_checkpoint=lambda session, state: save_sync_checkpoint(session, job_id, state),
+            resume=resume
+        )
+        pipeline_result = await pipeline.run(SYSTEM_LABELS)
+        total_emails_synced += pipeline_result["total_emails_synced"]
+        label_sync_results.update(pipeline_result["label_results"])
+        
+        # Remember the newest history ID for incremental syncs
+        history_id = pipeline_result["last_history_id"]
+        if history_id and (not connection.last_history_id or int(history_id) > int(connection.last_history_id)):
+            connection.last_history_id = history_id
+        
+        async with http_clients.borrow_async("google") as client:
             # Step 3: Sync Category Labels (Top tabs - sub-labels of Inbox) with specific counts
             logger.info("Gmail - Step 3: Syncing Category Labels (Top tabs - sub-labels of Inbox)")
             for category, limit in GMAIL_CATEGORIES.items():
@@ -619,8 +416,11 @@ async def sync_gmail_native_labels(
                     }
                     
                     # Fetch emails with both labels
-                    response = client.get(
+                    response = await governed_request_async(
+                        client,
+                        "GET",
                         f"{google_config.GOOGLE_GMAIL_API}/messages",
+                        user_id=current_user_id,
                         headers=headers,
                         params=params,
                         timeout=30.0
@@ -634,33 +434,35 @@ async def sync_gmail_native_labels(
                         # For categories, we ensure the category labels are properly set in the labels field
                         # The emails should already be synced from INBOX step
                         category_emails_updated = 0
+                        category_label = f"category_{category.replace('CATEGORY_', '').lower()}"
+                        
+                        # Load every email on this page in one IN query
+                        category_ids = [msg['id'] for msg in messages]
+                        category_emails = []
+                        if category_ids:
+                            category_emails = db.query(models.Email).filter(
+                                models.Email.user_id == current_user_id,
+                                models.Email.gmail_id.in_(category_ids)
+                            ).all()
                         
-                        for msg in messages:
+                        for email in category_emails:
                             try:
-                                # Find the email in our database
-                                email = db.query(models.Email).filter(
-                                    models.Email.gmail_id == msg['id'],
-                                    models.Email.user_id == current_user_id
-                                ).first()
+                                # Parse existing labels
+                                current_labels = []
+                                if email.labels:
+                                    try:
+                                        current_labels = json.loads(email.labels)
+                                    except (json.JSONDecodeError, TypeError):
+                                        current_labels = []
                                 
-                                if email:
-                                    # Parse existing labels
-                                    current_labels = []
-                                    if email.labels:
-                                        try:
-                                            current_labels = json.loads(email.labels)
-                                        except (json.JSONDecodeError, TypeError):
-                                            current_labels = []
-                                    
-                                    # Add category label if not present
-                                    category_label = f"category_{category.replace('CATEGORY_', '').lower()}"
-                                    if category_label not in current_labels:
-                                        current_labels.append(category_label)
-                                        email.labels = json.dumps(current_labels)
-                                        category_emails_updated += 1
+                                # Add category label if not present
+                                if category_label not in current_labels:
+                                    current_labels.append(category_label)
+                                    email.labels = json.dumps(current_labels)
+                                    category_emails_updated += 1
                                 
                             except Exception as e:
-                                logger.warning(f"Gmail - Failed to update category {category} for message {msg['id']}: {str(e)}")
+                                logger.warning(f"Gmail - Failed to update category {category} for message {email.gmail_id}: {str(e)}")
                                 continue
                         
                         if category_emails_updated > 0:
@@ -687,6 +489,8 @@ async def sync_gmail_native_labels(
             "total_emails_synced": total_emails_synced,
             "label_results": label_sync_results,
             "local_to_gmail_sync": local_sync_result,
+            "pipeline_metrics": pipeline_result["metrics"],
+            "resumed_from": resume.get("job_id") if resume else None,
             "last_sync": connection.last_sync,
             "sync_method": "Categories as sub-labels of Inbox with specific counts + Local→Gmail sync",
             "system_labels": SYSTEM_LABELS,
@@ -697,6 +501,68 @@ async def sync_gmail_native_labels(
         logger.error(f"Gmail - Native label sync failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Sync failed: {str(e)}")
 
+@router.post("/backfill")
+async def start_gmail_backfill(
+    request: Request,
+    depth: Optional[int] = Query(None, ge=1, description="Messages to import per backfill label"),
+    db: Session = Depends(get_db)
+):
+    """Queue a deep background import of older mail and return its job ID"""
+    current_user_id = get_current_user_id(request)
+    
+    connection = db.query(models.GmailConnection).filter(
+        models.GmailConnection.user_id == current_user_id
+    ).first()
+    
+    if not connection:
+        raise HTTPException(
+            status_code=404, 
+            detail="Gmail not connected. Please connect your Gmail account first."
+        )
+    
+    depth = min(depth or google_config.GMAIL_BACKFILL_DEFAULT_DEPTH, google_config.GMAIL_BACKFILL_MAX_DEPTH)
+    
+    from utils.sync_scheduler import sync_scheduler
+    try:
+        job = await sync_scheduler.enqueue(current_user_id, "gmail_backfill", params={"depth": depth}, interactive=False)
+    except Exception as e:
+        logger.error(f"Gmail - Failed to queue backfill for user {current_user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue backfill: {str(e)}")
+    
+    return {
+        "message": "Gmail backfill started in the background",
+        "job_id": job.id,
+        "status": job.status,
+        "depth": depth,
+        "labels": google_config.GMAIL_BACKFILL_LABELS
+    }
+
+@router.post("/push")
+async def receive_gmail_push(
+    request: Request,
+    token: Optional[str] = Query(None, description="Shared secret configured on the Pub/Sub push subscription")
+):
+    """Gmail watch notifications (Pub/Sub push format); queues an incremental history sync"""
+    if not google_config.GMAIL_PUSH_VERIFICATION_TOKEN:
+        # Without a shared secret anyone could trigger syncs for any connected mailbox
+        raise HTTPException(status_code=403, detail="Gmail push notifications are not configured")
+    if token != google_config.GMAIL_PUSH_VERIFICATION_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid push token")
+    
+    try:
+        envelope = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    
+    from routes.gmail.push import handle_gmail_push_notification
+    return await handle_gmail_push_notification(envelope)
+
+@router.get("/quota-metrics")
+async def get_quota_metrics(request: Request):
+    """Google API rate governor counters (requests, throttling, rate-limit retries) and HTTP client pool stats"""
+    get_current_user_id(request)
+    return dict(rate_governor.get_metrics(), http_clients=http_clients.get_metrics())
+
 @router.post("/disconnect")
 async def disconnect_gmail(
     request: Request,
@@ -720,6 +586,9 @@ async def disconnect_gmail(
             }
         
         # Remove ONLY the Gmail connection from database (no token revocation)
+        from routes.gmail.push import stop_gmail_watch
+        await asyncio.to_thread(stop_gmail_watch, connection)
+        token_manager.invalidate("gmail", connection.id)
         db.delete(connection)
         db.commit()
         
@@ -783,7 +652,7 @@ def refresh_gmail_access_token(db: Session, connection: models.GmailConnection)
         "grant_type": "refresh_token"
     }
     
-    with httpx.Client() as client:
+    with http_clients.borrow("google_oauth") as client:
         response = client.post(google_config.GOOGLE_TOKEN_URL, data=token_data)
         
         if response.status_code != 200:
@@ -806,62 +675,45 @@ def refresh_gmail_access_token(db: Session, connection: models.GmailConnection)
         
         return connection
 
-def extract_attachments_from_parts(parts, access_token: str, client) -> dict:
-    """Extract attachments from Gmail message parts and create CID mapping"""
-    attachments = {}
+token_manager.register("gmail", refresh_gmail_access_token, models.GmailConnection)
+
+def collect_inline_parts(parts) -> list:
+    """Attachment parts with a Content-ID (inline images referenced as cid: in HTML bodies), depth first"""
+    inline_parts = []
     
-    try:
-        for part in parts:
-            # Check if this part is an attachment
-            if part.get("filename") and part.get("body", {}).get("attachmentId"):
-                attachment_id = part["body"]["attachmentId"]
-                content_id = part.get("headers", [])
-                filename = part.get("filename", "")
-                mime_type = part.get("mimeType", "")
-                
-                # Find Content-ID header
-                cid = None
-                for header in content_id:
-                    if header.get("name", "").lower() == "content-id":
-                        cid = header.get("value", "").strip("<>")  # Remove < > brackets
-                        break
-                
-                if cid:
-                    try:
-                        # Fetch attachment data
-                        attachment_response = client.get(
-                            f"{google_config.GOOGLE_GMAIL_API}/messages/{part.get('messageId', '')}/attachments/{attachment_id}",
-                            headers={"Authorization": f"Bearer {access_token}"}
-                        )
-                        
-                        if attachment_response.status_code == 200:
-                            attachment_data = attachment_response.json()
-                            data = attachment_data.get("data", "")
-                            
-                            if data:
-                                # Store attachment info with metadata
-                                attachments[cid] = {
-                                    "data": data,
-                                    "filename": filename,
-                                    "mime_type": mime_type,
-                                    "size": len(data) * 3 // 4,  # Approximate size (base64 is ~33% larger)
-                                    "attachment_id": attachment_id
-                                }
-                                logger.info(f"Gmail - Extracted attachment {cid} -> {filename} ({mime_type}) - {len(data)} chars")
-                    
-                    except Exception as e:
-                        logger.warning(f"Gmail - Failed to fetch attachment {cid}: {str(e)}")
-                        continue
-            
-            # Recursively check nested parts
-            if part.get("parts"):
-                nested_attachments = extract_attachments_from_parts(part["parts"], access_token, client)
-                attachments.update(nested_attachments)
+    for part in parts:
+        if part.get("filename") and part.get("body", {}).get("attachmentId"):
+            for header in part.get("headers", []):
+                if header.get("name", "").lower() == "content-id":
+                    cid = header.get("value", "").strip("<>")  # Remove < > brackets
+                    if cid:
+                        inline_parts.append((cid, part))
+                    break
+        
+        # Recursively check nested parts
+        if part.get("parts"):
+            inline_parts.extend(collect_inline_parts(part["parts"]))
     
-    except Exception as e:
-        logger.error(f"Gmail - Failed to extract attachments: {str(e)}")
+    return inline_parts
+
+
+def extract_body_from_payload(payload: dict, attachments: dict = None) -> str:
+    """Body of a format=full message payload, with cid: references resolved from attachments"""
+    if "parts" in payload:
+        # Multipart message
+        return extract_body_from_parts(payload["parts"], attachments=attachments)
     
-    return attachments
+    # Simple message
+    mime_type = payload.get("mimeType")
+    data = payload.get("body", {}).get("data", "")
+    if not data:
+        return ""
+    content = base64.urlsafe_b64decode(data).decode("utf-8", errors="ignore")
+    if mime_type == "text/plain":
+        return content
+    if mime_type == "text/html":
+        return extract_body_from_html(content, attachments)
+    return ""
 
 
 def extract_body_from_parts(parts, prefer_plain=True, attachments: dict = None):
@@ -1129,7 +981,9 @@ def extract_attachment_metadata(parts, access_token: str = None, client = None,
                     # If we have access_token and client, fetch the actual data for regular attachments
                     if access_token and client and message_id:
                         try:
-                            attachment_response = client.get(
+                            attachment_response = governed_request(
+                                client,
+                                "GET",
                                 f"{google_config.GOOGLE_GMAIL_API}/messages/{message_id}/attachments/{part['body']['attachmentId']}",
                                 headers={"Authorization": f"Bearer {access_token}"},
                                 timeout=30.0
@@ -1187,6 +1041,85 @@ def extract_attachment_metadata(parts, access_token: str = None, client = None,
     return attachments
 
 
+# Content types whose MIME tree can carry attachments and therefore needs a structure probe
+GMAIL_PROBE_CONTENT_TYPES = ("multipart/mixed", "multipart/related", "multipart/signed", "application/", "image/", "audio/", "video/")
+
+# Fields of a MIME part we need for attachment detection - never the body data itself
+GMAIL_PART_FIELDS = "partId,mimeType,filename,headers,body(attachmentId,size)"
+
+
+def build_part_structure_fields(depth: int = 5) -> str:
+    """Build a partial-response field mask returning the MIME tree without any body data"""
+    parts_mask = GMAIL_PART_FIELDS
+    for _ in range(depth):
+        parts_mask = f"{GMAIL_PART_FIELDS},parts({parts_mask})"
+    return f"payload(mimeType,filename,body(attachmentId,size),parts({parts_mask}))"
+
+
+GMAIL_PART_STRUCTURE_FIELDS = build_part_structure_fields()
+
+
+def needs_part_structure_probe(message_data: dict) -> bool:
+    """Check if a metadata-only message may contain attachments"""
+    payload = message_data.get("payload", {})
+    content_type = payload.get("mimeType", "")
+    
+    for header in payload.get("headers", []):
+        if header.get("name", "").lower() == "content-type":
+            content_type = header.get("value", "")
+            break
+    
+    return content_type.lower().startswith(GMAIL_PROBE_CONTENT_TYPES)
+
+
+async def fetch_gmail_message_for_sync(client: httpx.AsyncClient, headers: dict, gmail_id: str, user_id: Optional[int] = None) -> Optional[dict]:
+    """
+    Fetch a message for sync.
+    In metadata mode this requests only whitelisted headers, plus a body-less
+    part-structure probe for messages whose Content-Type can carry attachments.
+    Full payloads are fetched later by get_email_body / the attachment endpoints.
+    """
+    message_url = f"{google_config.GOOGLE_GMAIL_API}/messages/{gmail_id}"
+    
+    if not google_config.use_gmail_metadata_sync():
+        response = await governed_request_async(client, "GET", message_url, user_id=user_id, headers=headers, params={"format": "full"}, timeout=45.0)
+        if response.status_code != 200:
+            logger.warning(f"Gmail - Failed to fetch message {gmail_id} details: {response.status_code}")
+            return None
+        return response.json()
+    
+    params = [("format", "metadata")] + [("metadataHeaders", name) for name in google_config.GMAIL_METADATA_HEADERS]
+    response = await governed_request_async(client, "GET", message_url, user_id=user_id, headers=headers, params=params, timeout=30.0)
+    
+    if response.status_code != 200:
+        logger.warning(f"Gmail - Failed to fetch message {gmail_id} metadata: {response.status_code}")
+        return None
+    
+    message_data = response.json()
+    
+    if needs_part_structure_probe(message_data):
+        probe_response = await governed_request_async(
+            client,
+            "GET",
+            message_url,
+            user_id=user_id,
+            headers=headers,
+            params={"format": "full", "fields": GMAIL_PART_STRUCTURE_FIELDS},
+            timeout=30.0
+        )
+        
+        if probe_response.status_code == 200:
+            structure = probe_response.json().get("payload", {})
+            payload = message_data.setdefault("payload", {})
+            for key in ("mimeType", "filename", "body", "parts"):
+                if key in structure:
+                    payload[key] = structure[key]
+        else:
+            logger.warning(f"Gmail - Part structure probe failed for message {gmail_id}: {probe_response.status_code}")
+    
+    return message_data
+
+
 def parse_gmail_message(message_data: dict, access_token: str = None, client = None) -> dict:
     """Parse Gmail message data into our email format"""
     try:
@@ -1347,74 +1280,134 @@ def create_email_labels(db: Session, email_id: int, folder_name: str, user_id: i
         raise e
 
 
-def store_email_attachments(db: Session, email_id: int, attachment_metadata: list, user_id: int):
-    """Store email attachments in the database"""
+def gmail_label_ids_to_names(gmail_labels: list) -> list:
+    """Convert Gmail label IDs to the label names stored in the emails.labels JSON field"""
+    label_names = []
+    for gmail_label in gmail_labels or []:
+        if gmail_label.startswith("CATEGORY_"):
+            # Convert Gmail categories to our label format
+            category_name = gmail_label.replace("CATEGORY_", "").lower()
+            label_names.append(f"category_{category_name}")
+        else:
+            # System labels (INBOX, SENT, UNREAD, ...) and custom labels
+            label_names.append(gmail_label.lower())
+    return label_names
+
+
+def get_known_gmail_ids(db: Session, user_id: int, gmail_ids: list) -> set:
+    """Return the subset of gmail_ids already stored for this user (one IN query per page)"""
+    if not gmail_ids:
+        return set()
+    
+    rows = db.query(models.Email.gmail_id).filter(
+        models.Email.user_id == user_id,
+        models.Email.gmail_id.in_(gmail_ids)
+    ).all()
+    
+    return {row[0] for row in rows}
+
+
+def persist_parsed_emails(db: Session, user_id: int, parsed_emails: list) -> set:
+    """
+    Bulk insert parsed Gmail messages and their attachments.
+    Uses INSERT ... ON CONFLICT (user_id, gmail_id) DO NOTHING so concurrent syncs never double-insert.
+    Does not commit - the caller owns the transaction.
+    Returns the gmail IDs actually inserted (from RETURNING, so rows another sync stored first are left out).
+    """
+    if not parsed_emails:
+        return set()
+    
+    now = datetime.now()
+    email_rows = []
+    seen_ids = set()
+    
+    for parsed_email in parsed_emails:
+        gmail_id = parsed_email.get("id")
+        if not gmail_id or gmail_id in seen_ids:
+            continue
+        seen_ids.add(gmail_id)
+        
+        email_rows.append({
+            "gmail_id": gmail_id,
+            "thread_id": parsed_email.get("thread_id"),
+            "sender": parsed_email.get("sender") or "Unknown",
+            "to_recipients": parsed_email.get("to_recipients", ""),
+            "subject": parsed_email.get("subject") or "No Subject",
+            "snippet": parsed_email.get("snippet"),
+            "body": parsed_email.get("body", ""),
+            "has_attachment": bool(parsed_email.get("has_attachment")),
+            "received_at": parsed_email.get("received_at") or now,
+            "auto_reply": "",
+            "user_id": user_id,
+            "labels": json.dumps(gmail_label_ids_to_names(parsed_email.get("label_ids", []))),
+            "gmail_labels": json.dumps(gmail_label_ids_to_names(parsed_email.get("label_ids", []))),
+            "created_at": now,
+            "updated_at": now
+        })
+    
+    if not email_rows:
+        return set()
+    
+    insert_stmt = pg_insert(models.Email).values(email_rows).on_conflict_do_nothing(
+        index_elements=["user_id", "gmail_id"]
+    ).returning(models.Email.id, models.Email.gmail_id)
+    
+    inserted = {gmail_id: email_id for email_id, gmail_id in db.execute(insert_stmt).all()}
+    
+    # Attachments only for rows we actually inserted - existing emails keep theirs
+    attachment_rows = []
+    for parsed_email in parsed_emails:
+        email_id = inserted.get(parsed_email.get("id"))
+        if not email_id or not parsed_email.get("has_attachment"):
+            continue
+        
+        for attachment_info in parsed_email.get("attachment_metadata", []):
+            # Inline images stay embedded in the email body
+            if attachment_info.get("is_inline", False):
+                continue
+            attachment_rows.append({
+                "email_id": email_id,
+                "gmail_attachment_id": attachment_info.get("gmail_attachment_id"),
+                "filename": attachment_info.get("filename") or "attachment",
+                "mime_type": attachment_info.get("mime_type") or "application/octet-stream",
+                "size": attachment_info.get("size"),
+                "content_id": attachment_info.get("content_id"),
+                "is_inline": False,
+                "data": attachment_info.get("data"),
+                "created_at": now
+            })
+    
+    if attachment_rows:
+        db.execute(models.EmailAttachment.__table__.insert(), attachment_rows)
+    
+    # Bulk inserts skip the ORM flush hooks, so update the touched threads here
+    refresh_email_threads(db, user_id, {row["thread_id"] for row in email_rows if row["gmail_id"] in inserted})
+    
+    logger.info(f"Gmail - Bulk inserted {len(inserted)} emails ({len(email_rows) - len(inserted)} already present) and {len(attachment_rows)} attachments for user {user_id}")
+    return set(inserted)
+
+
+async def fetch_gmail_attachment_data(client, access_token: str, gmail_id: str, attachment_id: str, user_id: Optional[int] = None) -> Optional[str]:
+    """Fetch the base64url data of a single attachment from Gmail"""
     try:
-        # Debug: Check if EmailAttachment model is accessible
-        logger.info(f"Gmail - EmailAttachment model accessible: {hasattr(models, 'EmailAttachment')}")
-        logger.info(f"Gmail - EmailAttachment model: {getattr(models, 'EmailAttachment', 'NOT_FOUND')}")
+        response = await governed_request_async(
+            client,
+            "GET",
+            f"{google_config.GOOGLE_GMAIL_API}/messages/{gmail_id}/attachments/{attachment_id}",
+            user_id=user_id,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=30.0
+        )
         
-        external_attachments = 0
-        inline_images_skipped = 0
+        if response.status_code != 200:
+            logger.warning(f"Gmail - Failed to fetch attachment {attachment_id} for message {gmail_id}: {response.status_code}")
+            return None
         
-        logger.info(f"Gmail - Starting attachment storage for email {email_id}, {len(attachment_metadata)} attachments to process")
-        
-        for attachment_info in attachment_metadata:
-            logger.info(f"Gmail - Processing attachment: {attachment_info.get('filename')}, mime_type: {attachment_info.get('mime_type')}, size: {attachment_info.get('size')}")
-            
-            # 🔥 IMPORTANT: Skip inline images - they should stay embedded in the email body
-            # Only store external attachments that users can download separately
-            if attachment_info.get("is_inline", False):
-                logger.debug(f"Gmail - Skipping inline image {attachment_info['filename']} for email {email_id} - will stay embedded in body")
-                inline_images_skipped += 1
-                continue
-            
-            # Check if attachment already exists
-            existing_attachment = db.query(models.EmailAttachment).filter(
-                models.EmailAttachment.email_id == email_id,
-                models.EmailAttachment.gmail_attachment_id == attachment_info["gmail_attachment_id"]
-            ).first()
-            
-            if not existing_attachment:
-                # Create new attachment record for external attachment only
-                logger.info(f"Gmail - Creating new attachment record for {attachment_info.get('filename')}")
-                new_attachment = models.EmailAttachment(
-                    email_id=email_id,
-                    gmail_attachment_id=attachment_info["gmail_attachment_id"],
-                    filename=attachment_info["filename"],
-                    mime_type=attachment_info["mime_type"],
-                    size=attachment_info["size"],
-                    content_id=attachment_info["content_id"],
-                    is_inline=False,  # Force to False since we're only storing external attachments
-                    data=attachment_info.get("data")  # Store the base64 data if available
-                )
-                db.add(new_attachment)
-                external_attachments += 1
-                logger.info(f"Gmail - Added external attachment {attachment_info['filename']} for email {email_id}")
-            else:
-                # Update existing attachment
-                logger.info(f"Gmail - Updating existing attachment {attachment_info.get('filename')}")
-                existing_attachment.filename = attachment_info["filename"]
-                existing_attachment.mime_type = attachment_info["mime_type"]
-                existing_attachment.size = attachment_info["size"]
-                existing_attachment.content_id = attachment_info["content_id"]
-                existing_attachment.is_inline = False  # Force to False since we're only storing external attachments
-                # Update data if new data is available
-                if attachment_info.get("data"):
-                    existing_attachment.data = attachment_info["data"]
-                logger.info(f"Gmail - Updated external attachment {attachment_info['filename']} for email {email_id}")
-        
-        # Commit attachments
-        logger.info(f"Gmail - Committing {external_attachments} attachments to database for email {email_id}")
-        db.commit()
-        logger.info(f"Gmail - Successfully stored {external_attachments} external attachments for email {email_id} (skipped {inline_images_skipped} inline images)")
+        return response.json().get("data") or None
         
     except Exception as e:
-        logger.error(f"Gmail - Failed to store attachments for email {email_id}: {str(e)}")
-        logger.error(f"Gmail - Error type: {type(e).__name__}")
-        logger.error(f"Gmail - Error details: {e}")
-        db.rollback()
-        raise e
+        logger.warning(f"Gmail - Error fetching attachment {attachment_id} for message {gmail_id}: {str(e)}")
+        return None
 
 
 # new function for attachment getting 
@@ -1439,6 +1432,22 @@ async def get_email_attachments(
             models.EmailAttachment.is_inline == False
         ).all()
         
+        # Metadata sync doesn't download attachment data - fetch anything missing now and cache it
+        missing_data = [att for att in attachments if not att.data and att.gmail_attachment_id]
+        if missing_data and email.gmail_id:
+            connection = db.query(models.GmailConnection).filter(
+                models.GmailConnection.user_id == current_user_id
+            ).first()
+            
+            if connection:
+                if token_manager.needs_refresh(connection.token_expiry):
+                    connection = await token_manager.ensure_fresh_async(db, connection, "gmail")
+                
+                async with http_clients.borrow_async("google") as client:
+                    for att in missing_data:
+                        att.data = await fetch_gmail_attachment_data(client, connection.access_token, email.gmail_id, att.gmail_attachment_id, current_user_id)
+                db.commit()
+        
         response_attachments = []
         for att in attachments:
             data = att.data or ""
@@ -1498,8 +1507,13 @@ async def download_attachment(
         if not attachment:
             raise HTTPException(status_code=404, detail="Attachment not found")
         
+        # Attachments uploaded with an outgoing email are streamed from disk
+        if attachment.storage_path:
+            from fastapi.responses import FileResponse
+            return FileResponse(attachment.storage_path, media_type=attachment.mime_type, filename=attachment.filename)
+        
         # For attachments with stored data (inline images or cached regular attachments)
-        if attachment.data:
+        elif attachment.data:
             from fastapi.responses import Response
             import base64
             
@@ -1528,15 +1542,21 @@ async def download_attachment(
             if not connection:
                 raise HTTPException(status_code=404, detail="Gmail connection not found")
             
-            # Check if token is expired
-            if connection.token_expiry and connection.token_expiry < datetime.now():
-                raise HTTPException(status_code=401, detail="Gmail token expired")
+            # Refresh the token if it is expired or about to expire
+            try:
+                connection = await token_manager.ensure_fresh_async(db, connection, "gmail")
+            except Exception as e:
+                logger.error(f"Gmail - Failed to refresh token for user {current_user_id}: {str(e)}")
+                raise HTTPException(status_code=401, detail="Authentication failed. Please reconnect your Gmail account.")
             
             # Fetch attachment from Gmail API
             try:
-                with httpx.Client() as client:
-                    attachment_response = client.get(
+                async with http_clients.borrow_async("google") as client:
+                    attachment_response = await governed_request_async(
+                        client,
+                        "GET",
                         f"{google_config.GOOGLE_GMAIL_API}/messages/{email.gmail_id}/attachments/{attachment.gmail_attachment_id}",
+                        user_id=current_user_id,
                         headers={"Authorization": f"Bearer {connection.access_token}"},
                         timeout=30.0
                     )
@@ -1546,6 +1566,10 @@ async def download_attachment(
                         data = attachment_data.get("data", "")
                         
                         if data:
+                            # Cache the data so later downloads don't hit Gmail again
+                            attachment.data = data
+                            db.commit()
+                            
                             # Decode base64 data
                             file_data = base64.urlsafe_b64decode(data)
                             from fastapi.responses import Response
@@ -1573,135 +1597,129 @@ async def download_attachment(
 
 
 async def sync_local_to_gmail(db: Session, connection: models.GmailConnection, user_id: int, headers: dict):
-    """Sync local email changes back to Gmail"""
+    """Push the user's sync outbox to Gmail, batching identical label changes through messages.batchModify"""
     logger.info(f"Gmail - Syncing Local → Gmail for user {user_id}")
     
     try:
-        updates_sent = 0
-        errors = 0
         update_results = []
         emails_deleted = 0
-        
-        # Step 1: Handle deletions first (emails marked as deleted)
-        deleted_emails = db.query(models.Email).filter(
-            models.Email.user_id == user_id,
-            models.Email.is_deleted == True,
-            models.Email.gmail_id.isnot(None),
-            models.Email.needs_gmail_sync == True
-        ).all()
-        
-        logger.info(f"Gmail - Found {len(deleted_emails)} deleted emails to sync to Gmail")
-        
-        for email in deleted_emails:
-            try:
-                # Move email to trash in Gmail (Gmail doesn't have a true delete, only trash)
-                with httpx.Client() as client:
-                    # Add TRASH label to the email
-                    response = client.post(
-                        f"{google_config.GOOGLE_GMAIL_API}/messages/{email.gmail_id}/modify",
-                        headers=headers,
-                        json={"addLabelIds": ["TRASH"]}
-                    )
+        updates_sent = 0
+        errors = 0
+        gave_up = 0
+        batches = 0
+        after_id = 0
+        
+        async with http_clients.borrow_async("google") as client:
+            while True:
+                # Step 1: Next batch of outbox changes (one per email however often it was edited) and their emails
+                changes = pending_changes(db, user_id, GMAIL, after_id=after_id)
+                if not changes:
+                    break
+                after_id = max(entry_id for change in changes for entry_id in change.entry_ids)
+                
+                logger.info(f"Gmail - Found {len(changes)} emails with pending Gmail changes")
+                
+                emails = {
+                    email.id: email
+                    for email in db.query(models.Email).filter(
+                        models.Email.user_id == user_id,
+                        models.Email.id.in_([change.entity_id for change in changes])
+                    ).all()
+                }
+                
+                # Step 2: Group by identical add/remove label sets - deleted emails all get the same TRASH change
+                done = []
+                groups = {}
+                for change in changes:
+                    email = emails.get(change.entity_id)
+                    if email is None or not email.gmail_id:
+                        # Removed locally, or never in Gmail (local sends reach Gmail through the send path)
+                        done.append(change)
+                        continue
                     
-                    if response.status_code == 200:
-                        logger.info(f"Gmail - Successfully moved deleted email '{email.subject}' to trash")
-                        emails_deleted += 1
-                        
-                        # Mark as synced and delete from local DB
+                    if email.is_deleted:
+                        groups.setdefault((frozenset(["TRASH"]), frozenset()), []).append((change, email))
+                        continue
+                    
+                    # Labels are already loaded on the row - no need to query the email again
+                    add_labels, remove_labels = gmail_label_changes(email)
+                    
+                    if not add_labels and not remove_labels:
+                        # No actions needed, mark as synced
                         email.needs_gmail_sync = False
                         email.last_gmail_sync = datetime.now()
-                        db.delete(email)
-                    else:
-                        logger.error(f"Gmail - Failed to move deleted email '{email.subject}' to trash: {response.status_code}")
-                        # Mark as not needing sync to avoid retry loops
-                        email.needs_gmail_sync = False
-                        
-            except Exception as e:
-                logger.error(f"Gmail - Error moving deleted email '{email.subject}' to trash: {str(e)}")
-                # Mark as not needing sync to avoid retry loops
-                email.needs_gmail_sync = False
-                continue
-        
-        # Step 2: Handle regular updates (non-deleted emails)
-        pending_updates = db.query(models.Email).filter(
-            models.Email.user_id == user_id,
-            models.Email.gmail_id.isnot(None),
-            models.Email.needs_gmail_sync == True,
-            models.Email.is_deleted == False  # Only sync non-deleted emails
-        ).all()
-        
-        if not pending_updates:
-            logger.info(f"Gmail - No pending Gmail updates for user {user_id}")
-            return {
-                "message": f"Gmail sync completed - {emails_deleted} emails deleted",
-                "updates_sent": 0,
-                "errors": 0,
-                "emails_deleted": emails_deleted
-            }
-        
-        logger.info(f"Gmail - Found {len(pending_updates)} emails with pending Gmail updates")
-        
-        with httpx.Client() as client:
-            for email in pending_updates:
-                try:
-                    # Get current labels for this email
-                    current_labels = get_email_gmail_labels(db, email.id)
-                    
-                    # Determine what actions need to be performed
-                    actions_needed = determine_gmail_actions(email, current_labels)
+                        email.gmail_sync_attempts = 0
+                        email.gmail_labels = email.labels
+                        done.append(change)
+                        continue
                     
-                    if actions_needed:
-                        # Apply actions to Gmail
-                        success = apply_gmail_actions(client, headers, email.gmail_id, actions_needed)
+                    groups.setdefault((frozenset(add_labels), frozenset(remove_labels)), []).append((change, email))
+                
+                # Step 3: One batchModify per label set (and per 1000 IDs)
+                outcomes = {}
+                for (add_labels, remove_labels), members in groups.items():
+                    gmail_ids = [email.gmail_id for _, email in members]
+                    outcomes.update(await batch_modify_gmail_messages(client, headers, gmail_ids, add_labels, remove_labels, user_id))
+                batches += len(groups)
+                
+                # Step 4: Record the outcome per email; failed changes stay in the outbox for the next sync
+                removed_files = []
+                for (add_labels, remove_labels), members in groups.items():
+                    for change, email in members:
+                        succeeded = outcomes.get(email.gmail_id, False)
                         
-                        if success:
-                            # Mark as synced
+                        if succeeded:
                             email.needs_gmail_sync = False
                             email.last_gmail_sync = datetime.now()
-                            updates_sent += 1
-                            
-                            update_results.append({
-                                "email_id": email.id,
-                                "gmail_id": email.gmail_id,
-                                "actions": actions_needed,
-                                "status": "success"
-                            })
-                            
-                            logger.info(f"Gmail - Successfully synced email {email.id} to Gmail")
+                            email.gmail_sync_attempts = 0
+                            done.append(change)
+                            if email.is_deleted:
+                                # Deleted emails are gone once Gmail has them in trash
+                                if delete_trashed_email(db, email, removed_files):
+                                    emails_deleted += 1
+                            else:
+                                email.gmail_labels = email.labels
+                                updates_sent += 1
                         else:
                             errors += 1
-                            update_results.append({
-                                "email_id": email.id,
-                                "gmail_id": email.gmail_id,
-                                "actions": actions_needed,
-                                "status": "failed"
-                            })
-                            
-                            logger.warning(f"Gmail - Failed to sync email {email.id} to Gmail")
-                    else:
-                        # No actions needed, mark as synced
-                        email.needs_gmail_sync = False
-                        email.last_gmail_sync = datetime.now()
+                            email.gmail_sync_attempts = (email.gmail_sync_attempts or 0) + 1
+                            if email.gmail_sync_attempts >= google_config.GMAIL_SYNC_MAX_ATTEMPTS:
+                                # Stop retrying so one bad message can't keep failing every sync
+                                email.needs_gmail_sync = False
+                                done.append(change)
+                                gave_up += 1
+                                logger.error(f"Gmail - Giving up on syncing email {email.id} after {email.gmail_sync_attempts} attempts")
                         
-                except Exception as e:
-                    logger.error(f"Gmail - Error processing email {email.id} for Gmail sync: {str(e)}")
-                    errors += 1
-                    continue
+                        update_results.append({
+                            "email_id": email.id,
+                            "gmail_id": email.gmail_id,
+                            "add_labels": sorted(add_labels),
+                            "remove_labels": sorted(remove_labels),
+                            "status": "success" if succeeded else "failed",
+                            "attempts": email.gmail_sync_attempts
+                        })
+                
+                acknowledge(db, done)
+                
+                # Gmail already has this batch's changes, so record them before pushing the next one
+                try:
+                    db.commit()
+                except Exception as commit_error:
+                    logger.error(f"Gmail - Failed to commit sync results: {str(commit_error)}")
+                    db.rollback()
+                    raise commit_error
+                for path in removed_files:
+                    remove_attachment(path)
         
-        # Commit all changes
-        try:
-            db.commit()
-            logger.info(f"Gmail - Successfully synced {updates_sent} emails to Gmail for user {user_id}")
-        except Exception as commit_error:
-            logger.error(f"Gmail - Failed to commit sync results: {str(commit_error)}")
-            db.rollback()
-            raise commit_error
+        logger.info(f"Gmail - Successfully synced {updates_sent} emails and trashed {emails_deleted} to Gmail for user {user_id}")
         
         return {
             "message": f"Local → Gmail sync completed - {emails_deleted} emails deleted",
             "updates_sent": updates_sent,
             "errors": errors,
+            "gave_up": gave_up,
             "emails_deleted": emails_deleted,
+            "batches": batches,
             "update_results": update_results
         }
         
@@ -1710,156 +1728,124 @@ async def sync_local_to_gmail(db: Session, connection: models.GmailConnection, u
         raise e
 
 
-def get_email_gmail_labels(db: Session, email_id: int) -> list:
-    """Get current Gmail labels for an email from JSON labels field"""
+def delete_trashed_email(db: Session, email: models.Email, removed_files: list) -> bool:
+    """
+    Delete an email Gmail now has in trash, with its attachments, inside a savepoint.
+
+    A row that can't be deleted stays marked deleted without failing the other
+    outcomes of its batch. Paths of stored attachment files are added to
+    removed_files for the caller to remove once the deletion has committed.
+    """
+    savepoint = db.begin_nested()
     try:
-        # Get the email to access its labels field
-        email = db.query(models.Email).filter(models.Email.id == email_id).first()
-        if not email or not email.labels:
-            return []
-        
-        # Parse the JSON labels field
-        try:
-            labels = json.loads(email.labels)
-            if isinstance(labels, list):
-                return labels
-            else:
-                return []
-        except (json.JSONDecodeError, TypeError):
-            logger.warning(f"Gmail - Failed to parse labels for email {email_id}: {email.labels}")
-            return []
-            
+        paths = [attachment.storage_path for attachment in email.attachments if attachment.storage_path]
+        db.delete(email)
+        db.flush()
+        savepoint.commit()
     except Exception as e:
-        logger.error(f"Gmail - Failed to get labels for email {email_id}: {str(e)}")
-        return []
+        savepoint.rollback()
+        logger.error(f"Gmail - Failed to delete trashed email {email.id} locally: {str(e)}")
+        return False
+    removed_files.extend(paths)
+    return True
 
 
-def determine_gmail_actions(email: models.Email, current_labels: list) -> dict:
-    """Determine what Gmail actions need to be performed based on email state"""
-    actions = {}
-    
-    try:
-        # Check if email needs to be starred/unstarred
-        is_starred = any(label == 'starred' for label in current_labels)
-        if email.starred != is_starred:
-            actions['star'] = email.starred
-        
-        # Check if email needs to be moved to trash
-        if email.category == 'trash' and 'trash' not in current_labels:
-            actions['move_to_trash'] = True
-        
-        # Check if email needs to be archived
-        if email.category == 'archived' and 'archived' not in current_labels:
-            actions['archive'] = True
-        
-        # Check if email needs to be moved to inbox
-        if email.category == 'inbox' and 'inbox' not in current_labels:
-            actions['move_to_inbox'] = True
-        
-        # Check if email needs to be marked as read/unread
-        if hasattr(email, 'read') and email.read is not None:
-            actions['mark_read'] = email.read
-        
-        logger.debug(f"Gmail - Determined actions for email {email.id}: {actions}")
-        return actions
-        
-    except Exception as e:
-        logger.error(f"Gmail - Failed to determine actions for email {email.id}: {str(e)}")
-        return {}
+# System labels messages.modify accepts, by their stored (lowercase) name; SENT and DRAFT can't be changed
+PUSHED_SYSTEM_LABELS = ("inbox", "starred", "unread", "important", "spam", "trash")
+# Labels the email actions (star, mark read, archive, trash) change
+ACTION_LABELS = frozenset(["STARRED", "UNREAD", "INBOX", "TRASH"])
 
 
-def apply_gmail_actions(client, headers: dict, gmail_id: str, actions: dict) -> bool:
-    """Apply actions to Gmail via API"""
-    try:
-        success = True
-        
-        for action, value in actions.items():
-            try:
-                if action == 'star':
-                    # Add/remove star label
-                    if value:
-                        # Add star
-                        success &= add_gmail_label(client, headers, gmail_id, 'STARRED')
-                    else:
-                        # Remove star
-                        success &= remove_gmail_label(client, headers, gmail_id, 'STARRED')
-                
-                elif action == 'move_to_trash':
-                    # Move to trash
-                    success &= add_gmail_label(client, headers, gmail_id, 'TRASH')
-                    success &= remove_gmail_label(client, headers, gmail_id, 'INBOX')
-                
-                elif action == 'archive':
-                    # Archive (remove from inbox)
-                    success &= remove_gmail_label(client, headers, gmail_id, 'INBOX')
-                
-                elif action == 'move_to_inbox':
-                    # Move to inbox
-                    success &= add_gmail_label(client, headers, gmail_id, 'INBOX')
-                    success &= remove_gmail_label(client, headers, gmail_id, 'TRASH')
-                
-                elif action == 'mark_read':
-                    # Mark as read/unread
-                    if value:
-                        success &= remove_gmail_label(client, headers, gmail_id, 'UNREAD')
-                    else:
-                        success &= add_gmail_label(client, headers, gmail_id, 'UNREAD')
-                
-            except Exception as action_error:
-                logger.error(f"Gmail - Failed to apply action {action} to email {gmail_id}: {str(action_error)}")
-                success = False
-        
-        return success
-        
-    except Exception as e:
-        logger.error(f"Gmail - Failed to apply Gmail actions: {str(e)}")
-        return False
+def local_label_to_gmail_id(label: str) -> Optional[str]:
+    """Gmail label ID for a stored label name, or None for labels that only exist locally (archived, custom labels)"""
+    if label in PUSHED_SYSTEM_LABELS:
+        return label.upper()
+    if label.startswith("category_"):
+        return f"CATEGORY_{label[len('category_'):].upper()}"
+    return None
 
 
-def add_gmail_label(client, headers: dict, gmail_id: str, label_id: str) -> bool:
-    """Add a label to a Gmail message"""
-    try:
-        response = client.post(
-            f"{google_config.GOOGLE_GMAIL_API}/messages/{gmail_id}/modify",
-            headers=headers,
-            json={"addLabelIds": [label_id]},
-            timeout=30.0
-        )
-        
-        if response.status_code == 200:
-            logger.debug(f"Gmail - Successfully added label {label_id} to message {gmail_id}")
-            return True
-        else:
-            logger.warning(f"Gmail - Failed to add label {label_id} to message {gmail_id}: {response.status_code}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Gmail - Error adding label {label_id} to message {gmail_id}: {str(e)}")
-        return False
+def gmail_label_changes(email: models.Email) -> tuple:
+    """
+    (Gmail label IDs to add, Gmail label IDs to remove) to bring Gmail in line with the email's local labels.
 
+    The local labels are diffed against gmail_labels, the labels Gmail had when
+    the email was last synced, so only labels changed locally are sent and
+    changes made in Gmail meanwhile are left alone. Emails synced before
+    gmail_labels was tracked push the star/read/inbox/trash state outright.
+    """
+    local = {gmail_id for gmail_id in map(local_label_to_gmail_id, parse_email_labels(email)) if gmail_id}
+    
+    synced = None
+    if email.gmail_labels:
+        try:
+            synced = {gmail_id for gmail_id in map(local_label_to_gmail_id, json.loads(email.gmail_labels)) if gmail_id}
+        except (json.JSONDecodeError, TypeError):
+            logger.warning(f"Gmail - Failed to parse synced labels for email {email.id}: {email.gmail_labels}")
+    
+    if synced is None:
+        return local & ACTION_LABELS, ACTION_LABELS - local
+    
+    return local - synced, synced - local
 
-def remove_gmail_label(client, headers: dict, gmail_id: str, label_id: str) -> bool:
-    """Remove a label from a Gmail message"""
-    try:
-        response = client.post(
-            f"{google_config.GOOGLE_GMAIL_API}/messages/{gmail_id}/modify",
-            headers=headers,
-            json={"removeLabelIds": [label_id]},
-            timeout=30.0
-        )
+
+async def batch_modify_gmail_messages(client, headers: dict, gmail_ids: list, add_labels, remove_labels, user_id: Optional[int] = None) -> dict:
+    """
+    Apply one label change to many messages via messages.batchModify (1000 IDs per call).
+    Returns {gmail_id: succeeded}. A chunk rejected with 400/404 is split in half
+    and retried so a single bad ID doesn't fail the whole chunk.
+    """
+    outcomes = {}
+    max_ids = google_config.GMAIL_BATCH_MODIFY_MAX_IDS
+    pending = [gmail_ids[i:i + max_ids] for i in range(0, len(gmail_ids), max_ids)]
+    
+    while pending:
+        chunk = pending.pop()
+        body = {"ids": chunk}
+        if add_labels:
+            body["addLabelIds"] = sorted(add_labels)
+        if remove_labels:
+            body["removeLabelIds"] = sorted(remove_labels)
         
-        if response.status_code == 200:
-            logger.debug(f"Gmail - Successfully removed label {label_id} from message {gmail_id}")
-            return True
+        try:
+            response = await governed_request_async(
+                client,
+                "POST",
+                f"{google_config.GOOGLE_GMAIL_API}/messages/batchModify",
+                user_id=user_id,
+                headers=headers,
+                json=body,
+                timeout=30.0
+            )
+        except Exception as e:
+            logger.error(f"Gmail - batchModify request failed for {len(chunk)} messages: {str(e)}")
+            outcomes.update({gmail_id: False for gmail_id in chunk})
+            continue
+        
+        if response.status_code in (200, 204):
+            outcomes.update({gmail_id: True for gmail_id in chunk})
+        elif response.status_code in (400, 404) and len(chunk) > 1:
+            middle = len(chunk) // 2
+            pending.extend([chunk[:middle], chunk[middle:]])
         else:
-            logger.warning(f"Gmail - Failed to remove label {label_id} from message {gmail_id}: {response.status_code}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"Gmail - Error removing label {label_id} from message {gmail_id}: {str(e)}")
-        return False
+            logger.warning(f"Gmail - batchModify failed for {len(chunk)} messages: {response.status_code}")
+            outcomes.update({gmail_id: False for gmail_id in chunk})
+    
+    return outcomes
 
 
+def parse_email_labels(email: models.Email) -> list:
+    """Parse the JSON labels field of an already-loaded email"""
+    if not email or not email.labels:
+        return []
+    
+    try:
+        labels = json.loads(email.labels)
+        return labels if isinstance(labels, list) else []
+    except (json.JSONDecodeError, TypeError):
+        logger.warning(f"Gmail - Failed to parse labels for email {email.id}: {email.labels}")
+        return []
+
 
 def create_gmail_labels(db: Session, email_id: int, gmail_label_ids: list, user_id: int):
     """Create labels based on Gmail's actual label IDs"""
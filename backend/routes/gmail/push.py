@@ -0,0 +1,411 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from models import models
+from database import SessionLocal
+from config.google import google_config
+from routes.gmail.gmail import (
+    fetch_gmail_message_for_sync,
+    get_known_gmail_ids,
+    gmail_label_ids_to_names,
+    parse_gmail_message,
+    persist_parsed_emails,
+)
+from utils.google_rate_limiter import governed_request, governed_request_async
+from utils.email_threads import refresh_email_threads
+from utils.google_token_manager import token_manager
+from utils.http_clients import http_clients
+from utils.sync_scheduler import sync_scheduler
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+# Pub/Sub delivers at least once; remember recent message IDs to drop redeliveries
+_seen_messages: "OrderedDict[str, float]" = OrderedDict()
+_SEEN_LIMIT = 10000
+
+# Newest historyId announced per user, and users with a debounced sync already scheduled
+_announced_history: Dict[int, int] = {}
+_debounced_users: set = set()
+
+
+def decode_push_envelope(envelope: dict) -> dict:
+    """Decode a Pub/Sub push body into {message_id, email_address, history_id}"""
+    message = envelope.get("message") or {}
+    try:
+        data = json.loads(base64.b64decode(message.get("data", "")).decode("utf-8"))
+        return {
+            "message_id": message.get("messageId") or message.get("message_id"),
+            "email_address": data["emailAddress"].lower(),
+            "history_id": int(data["historyId"])
+        }
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Gmail push notification: {str(e)}")
+
+
+def _remember_message(message_id: Optional[str]) -> bool:
+    """Record a Pub/Sub message ID; False if it was already seen"""
+    if not message_id:
+        return True
+    if message_id in _seen_messages:
+        return False
+    _seen_messages[message_id] = time.monotonic()
+    while len(_seen_messages) > _SEEN_LIMIT:
+        _seen_messages.popitem(last=False)
+    return True
+
+
+async def _enqueue_after_debounce(user_id: int):
+    """Trailing debounce: one history sync for every notification of the window"""
+    try:
+        await asyncio.sleep(google_config.GMAIL_PUSH_DEBOUNCE_SECONDS)
+    finally:
+        _debounced_users.discard(user_id)
+    await sync_scheduler.enqueue(user_id, "gmail_history", interactive=True)
+
+
+async def handle_gmail_push_notification(envelope: dict) -> dict:
+    """
+    Turn a Gmail watch notification into an incremental history sync.
+
+    Redelivered Pub/Sub messages and notifications at or below the history ID we
+    already synced are dropped; the rest are debounced per user, so a burst of
+    new mail queues a single gmail_history job.
+    """
+    notification = decode_push_envelope(envelope)
+
+    if not _remember_message(notification["message_id"]):
+        return {"status": "duplicate"}
+
+    db = SessionLocal()
+    try:
+        connection = db.query(models.GmailConnection).filter(
+            models.GmailConnection.email_address == notification["email_address"]
+        ).first()
+        if not connection:
+            # Acknowledge anyway - Pub/Sub would otherwise keep redelivering it
+            logger.warning(f"Gmail - Push notification for unknown address {notification['email_address']}")
+            return {"status": "ignored"}
+
+        user_id = connection.user_id
+        synced_history_id = int(connection.last_history_id or 0)
+    finally:
+        db.close()
+
+    history_id = notification["history_id"]
+    if synced_history_id and history_id <= synced_history_id:
+        return {"status": "up_to_date"}
+
+    _announced_history[user_id] = max(history_id, _announced_history.get(user_id, 0))
+
+    if user_id in _debounced_users:
+        return {"status": "debounced"}
+
+    _debounced_users.add(user_id)
+    asyncio.create_task(_enqueue_after_debounce(user_id))
+    logger.info(f"Gmail - Push notification for user {user_id} (history {history_id}), history sync scheduled")
+    return {"status": "scheduled"}
+
+
+def _apply_label_changes(db: Session, user_id: int, label_changes: Dict[str, dict]) -> int:
+    """Apply labelAdded/labelRemoved history records to stored emails"""
+    if not label_changes:
+        return 0
+
+    emails = db.query(models.Email).filter(
+        models.Email.user_id == user_id,
+        models.Email.gmail_id.in_(list(label_changes))
+    ).all()
+
+    updated = 0
+    for email in emails:
+        changes = label_changes[email.gmail_id]
+        if email.gmail_labels is not None or not email.needs_gmail_sync:
+            # Gmail's side is recorded even under pending local edits, which are pushed as the difference from it
+            gmail_labels = _parse_labels(email.gmail_labels if email.gmail_labels is not None else email.labels)
+            email.gmail_labels = json.dumps(_changed_labels(gmail_labels, changes))
+        if email.needs_gmail_sync:
+            # Local edits not pushed yet win; Local -> Gmail sync reconciles them
+            continue
+
+        labels = _parse_labels(email.labels)
+        new_labels = _changed_labels(labels, changes)
+        if new_labels != labels:
+            email.labels = json.dumps(new_labels)
+            updated += 1
+    return updated
+
+
+def _parse_labels(stored: str) -> list:
+    try:
+        return json.loads(stored) if stored else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def _changed_labels(labels: list, changes: dict) -> list:
+    new_labels = [label for label in labels if label not in changes["removed"]]
+    new_labels.extend(label for label in changes["added"] if label not in new_labels)
+    return new_labels
+
+
+def _delete_emails(db: Session, user_id: int, gmail_ids: set) -> int:
+    """Remove emails that were permanently deleted in Gmail"""
+    if not gmail_ids:
+        return 0
+
+    rows = db.query(models.Email.id, models.Email.thread_id).filter(
+        models.Email.user_id == user_id,
+        models.Email.gmail_id.in_(list(gmail_ids)),
+        models.Email.needs_gmail_sync.isnot(True)
+    ).all()
+    if not rows:
+        return 0
+
+    email_ids = [row.id for row in rows]
+    db.query(models.EmailAttachment).filter(models.EmailAttachment.email_id.in_(email_ids)).delete(synchronize_session=False)
+    db.query(models.Email).filter(models.Email.id.in_(email_ids)).delete(synchronize_session=False)
+    refresh_email_threads(db, user_id, {row.thread_id for row in rows})
+    return len(email_ids)
+
+
+async def run_gmail_history_sync_job(user_id: int, params: dict) -> dict:
+    """
+    Sync scheduler entry point: apply Gmail history since connection.last_history_id.
+
+    New messages are fetched and bulk-inserted, label changes and deletions are
+    applied in place. Without a usable start point (first sync, or history older
+    than Gmail keeps) a full "gmail" sync is queued instead.
+    """
+    db = SessionLocal()
+    try:
+        connection = db.query(models.GmailConnection).filter(
+            models.GmailConnection.user_id == user_id
+        ).first()
+
+        if not connection:
+            raise HTTPException(status_code=404, detail="Gmail not connected")
+
+        if not connection.last_history_id:
+            await sync_scheduler.enqueue(user_id, "gmail", interactive=False)
+            return {"total_emails_synced": 0, "fallback": "full_sync"}
+
+        connection = await token_manager.ensure_fresh_async(db, connection, "gmail")
+        headers = {"Authorization": f"Bearer {connection.access_token}"}
+
+        added_ids = []
+        deleted_ids = set()
+        label_changes: Dict[str, dict] = {}
+        latest_history_id = int(connection.last_history_id)
+        page_token = None
+
+        async with http_clients.borrow_async("google") as client:
+            while True:
+                params_list = [("startHistoryId", connection.last_history_id), ("maxResults", 500)]
+                params_list += [("historyTypes", history_type) for history_type in HISTORY_TYPES]
+                if page_token:
+                    params_list.append(("pageToken", page_token))
+
+                response = await governed_request_async(
+                    client,
+                    "GET",
+                    f"{google_config.GOOGLE_GMAIL_API}/history",
+                    user_id=user_id,
+                    headers=headers,
+                    params=params_list,
+                    timeout=30.0
+                )
+
+                if response.status_code == 404:
+                    # startHistoryId is too old - only a full sync can catch up
+                    logger.warning(f"Gmail - History {connection.last_history_id} expired for user {user_id}, queuing full sync")
+                    await sync_scheduler.enqueue(user_id, "gmail", interactive=False)
+                    return {"total_emails_synced": 0, "fallback": "full_sync"}
+
+                if response.status_code != 200:
+                    raise HTTPException(status_code=response.status_code, detail="Failed to list Gmail history")
+
+                page = response.json()
+                latest_history_id = max(latest_history_id, int(page.get("historyId", 0)))
+
+                for record in page.get("history", []):
+                    for added in record.get("messagesAdded", []):
+                        gmail_id = added["message"]["id"]
+                        deleted_ids.discard(gmail_id)
+                        added_ids.append(gmail_id)
+                    for deleted in record.get("messagesDeleted", []):
+                        deleted_ids.add(deleted["message"]["id"])
+                    for change_type, key in (("labelsAdded", "added"), ("labelsRemoved", "removed")):
+                        for change in record.get(change_type, []):
+                            gmail_id = change["message"]["id"]
+                            changes = label_changes.setdefault(gmail_id, {"added": [], "removed": []})
+                            other = "removed" if key == "added" else "added"
+                            for label in gmail_label_ids_to_names(change.get("labelIds", [])):
+                                if label in changes[other]:
+                                    changes[other].remove(label)
+                                if label not in changes[key]:
+                                    changes[key].append(label)
+
+                page_token = page.get("nextPageToken")
+                if not page_token:
+                    break
+
+            added_ids = [gmail_id for gmail_id in dict.fromkeys(added_ids) if gmail_id not in deleted_ids]
+            new_ids = [gmail_id for gmail_id in added_ids if gmail_id not in get_known_gmail_ids(db, user_id, added_ids)]
+
+            semaphore = asyncio.Semaphore(max(1, google_config.GMAIL_SYNC_FETCH_CONCURRENCY))
+
+            async def fetch(gmail_id: str) -> Optional[dict]:
+                async with semaphore:
+                    return await fetch_gmail_message_for_sync(client, headers, gmail_id, user_id)
+
+            messages = await asyncio.gather(*(fetch(gmail_id) for gmail_id in new_ids), return_exceptions=True)
+
+        parsed_emails = [parse_gmail_message(message) for message in messages if isinstance(message, dict)]
+        inserted = len(persist_parsed_emails(db, user_id, parsed_emails))
+        labels_updated = _apply_label_changes(db, user_id, {
+            gmail_id: changes for gmail_id, changes in label_changes.items() if gmail_id not in deleted_ids
+        })
+        emails_deleted = _delete_emails(db, user_id, deleted_ids)
+
+        connection.last_history_id = str(latest_history_id)
+        connection.last_sync = datetime.now()
+        db.commit()
+
+        logger.info(f"Gmail - History sync for user {user_id}: {inserted} new, {labels_updated} relabelled, {emails_deleted} deleted (history {latest_history_id})")
+
+        result = {
+            "total_emails_synced": inserted,
+            "labels_updated": labels_updated,
+            "emails_deleted": emails_deleted,
+            "history_id": str(latest_history_id)
+        }
+
+        # A notification that arrived while we were listing needs one more pass
+        announced = _announced_history.get(user_id, 0)
+        if announced > latest_history_id:
+            result["continue_with"] = {}
+        else:
+            _announced_history.pop(user_id, None)
+        return result
+    finally:
+        db.close()
+
+
+def fetch_gmail_email_address(client, connection: models.GmailConnection) -> Optional[str]:
+    """Mailbox address of a connection, from users.getProfile"""
+    response = governed_request(
+        client,
+        "GET",
+        f"{google_config.GOOGLE_GMAIL_API}/profile",
+        user_id=connection.user_id,
+        headers={"Authorization": f"Bearer {connection.access_token}"},
+        timeout=15.0
+    )
+    if response.status_code != 200:
+        logger.warning(f"Gmail - Failed to fetch profile for user {connection.user_id}: {response.status_code}")
+        return None
+    return response.json().get("emailAddress", "").lower() or None
+
+
+def start_gmail_watch(db: Session, connection: models.GmailConnection) -> bool:
+    """Create or renew the users.watch subscription of a connection (no-op without GMAIL_PUBSUB_TOPIC)"""
+    if not google_config.GMAIL_PUBSUB_TOPIC:
+        return False
+
+    connection = token_manager.ensure_fresh(db, connection, "gmail")
+
+    with http_clients.borrow("google") as client:
+        if not connection.email_address:
+            connection.email_address = fetch_gmail_email_address(client, connection)
+
+        response = governed_request(
+            client,
+            "POST",
+            f"{google_config.GOOGLE_GMAIL_API}/watch",
+            user_id=connection.user_id,
+            headers={"Authorization": f"Bearer {connection.access_token}"},
+            json={"topicName": google_config.GMAIL_PUBSUB_TOPIC, "labelFilterBehavior": "exclude", "labelIds": ["SPAM"]},
+            timeout=15.0
+        )
+
+    if response.status_code != 200:
+        logger.error(f"Gmail - Watch request failed for user {connection.user_id}: {response.status_code} - {response.text}")
+        db.commit()
+        return False
+
+    watch = response.json()
+    connection.watch_expiration = datetime.fromtimestamp(int(watch["expiration"]) / 1000)
+    if not connection.last_history_id:
+        connection.last_history_id = str(watch.get("historyId"))
+    db.commit()
+
+    logger.info(f"Gmail - Watch active for user {connection.user_id} until {connection.watch_expiration}")
+    return True
+
+
+def stop_gmail_watch(connection: models.GmailConnection):
+    """Stop push notifications for a connection that is being removed"""
+    if not google_config.GMAIL_PUBSUB_TOPIC or not connection.watch_expiration:
+        return
+
+    try:
+        with http_clients.borrow("google") as client:
+            governed_request(
+                client,
+                "POST",
+                f"{google_config.GOOGLE_GMAIL_API}/stop",
+                user_id=connection.user_id,
+                headers={"Authorization": f"Bearer {connection.access_token}"},
+                timeout=15.0
+            )
+    except Exception as e:
+        logger.warning(f"Gmail - Failed to stop watch for user {connection.user_id}: {str(e)}")
+
+
+def renew_gmail_watches() -> int:
+    """Renew every watch that lapses within GMAIL_WATCH_RENEW_MARGIN_SECONDS"""
+    if not google_config.GMAIL_PUBSUB_TOPIC:
+        return 0
+
+    db = SessionLocal()
+    try:
+        cutoff = datetime.now() + timedelta(seconds=google_config.GMAIL_WATCH_RENEW_MARGIN_SECONDS)
+        connections = db.query(models.GmailConnection).filter(
+            (models.GmailConnection.watch_expiration.is_(None)) | (models.GmailConnection.watch_expiration < cutoff)
+        ).all()
+
+        renewed = 0
+        for connection in connections:
+            try:
+                if start_gmail_watch(db, connection):
+                    renewed += 1
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Gmail - Failed to renew watch for user {connection.user_id}: {str(e)}")
+        return renewed
+    finally:
+        db.close()
+
+
+async def renew_gmail_watches_periodically():
+    """Background task keeping users.watch subscriptions alive"""
+    while True:
+        try:
+            renewed = await asyncio.to_thread(renew_gmail_watches)
+            if renewed:
+                logger.info(f"Gmail - Renewed {renewed} Gmail watches")
+        except Exception as e:
+            logger.error(f"Gmail - Watch renewal failed: {str(e)}")
+
+        await asyncio.sleep(google_config.GMAIL_WATCH_RENEW_INTERVAL_SECONDS)
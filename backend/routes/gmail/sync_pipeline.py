@@ -0,0 +1,463 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy.orm import Session
+
+from models import models
+from config.google import google_config
+from utils.google_rate_limiter import governed_request_async
+from utils.google_token_manager import token_manager
+from utils.http_clients import http_clients
+from routes.gmail.gmail import (
+    fetch_gmail_message_for_sync,
+    get_known_gmail_ids,
+    parse_gmail_message,
+    persist_parsed_emails,
+)
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input
+_STOP = object()
+
+
+class StageMetrics:
+    """Throughput and queue-depth counters for one pipeline stage"""
+
+    def __init__(self, name: str, queue: Optional[asyncio.Queue] = None):
+        self.name = name
+        self.queue = queue
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def sample_queue(self):
+        """Record the current depth of this stage's input queue"""
+        if self.queue is not None:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    def as_dict(self) -> dict:
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "items_per_second": round(self.items / elapsed, 2) if elapsed > 0 else 0.0,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth
+        }
+
+
+class GmailSyncPipeline:
+    """
+    Staged Gmail ingest: list -> fetch -> parse -> persist.
+
+    Stages are connected by bounded asyncio queues, so a slow stage applies
+    backpressure all the way back to listing instead of buffering without limit.
+    Parsing can run in a process pool (GMAIL_SYNC_PARSE_PROCESSES) and persisting
+    commits in batches (GMAIL_SYNC_PERSIST_BATCH). All DB access goes through one
+    lock because the stages share a single SQLAlchemy session.
+
+    Every listed page is tracked until all of its messages are persisted (or
+    dropped), and after each committed batch on_checkpoint(db, state) is called
+    with the first unfinished page. Passing that state back as resume= continues
+    listing from there; messages persisted after the checkpoint are skipped by
+    the known-ID check.
+
+    A batch that still can't be stored after PERSIST_ATTEMPTS stops listing and
+    fails the run; its pages stay unfinished, so no checkpoint skips them.
+
+    Background callers can pass throttle (awaited with the Gmail quota units of
+    each call), should_stop (checked before each page; stopping early leaves a
+    checkpoint at the next page) and a larger persist_batch_size.
+    """
+
+    # Gmail API quota units per call
+    LIST_UNITS = 5
+    GET_UNITS = 5
+
+    # Tries per persist batch before the run gives up
+    PERSIST_ATTEMPTS = 2
+
+    def __init__(
+        self,
+        db: Session,
+        connection: models.GmailConnection,
+        user_id: int,
+        headers: dict,
+        on_checkpoint: Optional[Callable[[Session, dict], None]] = None,
+        resume: Optional[dict] = None,
+        throttle: Optional[Callable[[int], Awaitable[None]]] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        persist_batch_size: Optional[int] = None
+    ):
+        self.db = db
+        self.connection = connection
+        self.user_id = user_id
+        self.headers = headers
+        self.connection_id = connection.id
+        self.on_checkpoint = on_checkpoint
+        self.resume = resume or {}
+        self.throttle = throttle
+        self.should_stop = should_stop
+        self.stopped_early = False
+        self.persist_error: Optional[Exception] = None
+
+        queue_size = max(1, google_config.GMAIL_SYNC_QUEUE_SIZE)
+        self.fetch_queue = asyncio.Queue(maxsize=queue_size)
+        self.parse_queue = asyncio.Queue(maxsize=queue_size)
+        self.persist_queue = asyncio.Queue(maxsize=queue_size)
+
+        self.fetch_workers = max(1, google_config.GMAIL_SYNC_FETCH_CONCURRENCY)
+        self.parse_workers = max(1, google_config.GMAIL_SYNC_PARSE_WORKERS)
+        self.persist_batch_size = max(1, persist_batch_size or google_config.GMAIL_SYNC_PERSIST_BATCH)
+
+        self.metrics = {
+            "list": StageMetrics("list"),
+            "fetch": StageMetrics("fetch", self.fetch_queue),
+            "parse": StageMetrics("parse", self.parse_queue),
+            "persist": StageMetrics("persist", self.persist_queue),
+        }
+
+        self.db_lock = asyncio.Lock()
+        self.enqueued_ids = set()
+        self.label_results: Dict[str, dict] = {}
+
+        # Checkpoint bookkeeping
+        self.pages: List[dict] = []
+        self.list_position = None
+        self.processed_count = self.resume.get("processed_count", 0)
+        self.last_history_id = self.resume.get("last_history_id")
+
+    async def run(self, labels: Dict[str, int]) -> dict:
+        """Run the pipeline for {label_id: max_messages} and return per-label results and metrics"""
+        executor = None
+        if google_config.GMAIL_SYNC_PARSE_PROCESSES > 0:
+            executor = ProcessPoolExecutor(max_workers=google_config.GMAIL_SYNC_PARSE_PROCESSES)
+
+        try:
+            async with http_clients.borrow_async("google") as client:
+                fetch_tasks = [asyncio.create_task(self._fetch_worker(client)) for _ in range(self.fetch_workers)]
+                parse_tasks = [asyncio.create_task(self._parse_worker(executor)) for _ in range(self.parse_workers)]
+                persist_task = asyncio.create_task(self._persist_stage())
+                all_tasks = fetch_tasks + parse_tasks + [persist_task]
+
+                try:
+                    await self._list_stage(client, labels)
+                    await self._close_stage(self.fetch_queue, fetch_tasks, "list")
+                    await self._close_stage(self.parse_queue, parse_tasks, "fetch")
+                    await self._close_stage(self.persist_queue, [persist_task], "parse")
+                    self.metrics["persist"].finish()
+                except BaseException:
+                    for task in all_tasks:
+                        task.cancel()
+                    await asyncio.gather(*all_tasks, return_exceptions=True)
+                    raise
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+        if self.persist_error is not None:
+            # The last saved checkpoint still points at the unstored messages, so a resumed run picks them up
+            raise RuntimeError(f"Gmail sync stopped: emails could not be stored ({self.persist_error})") from self.persist_error
+
+        total_synced = sum(result.get("synced", 0) for result in self.label_results.values())
+        logger.info(f"Gmail - Sync pipeline finished for user {self.user_id}: {total_synced} emails synced, metrics: {self.get_metrics()}")
+
+        return {
+            "total_emails_synced": total_synced,
+            "label_results": self.label_results,
+            "processed_count": self.processed_count,
+            "last_history_id": self.last_history_id,
+            "stopped_early": self.stopped_early,
+            "checkpoint": self.checkpoint_state(),
+            "metrics": self.get_metrics()
+        }
+
+    def get_metrics(self) -> dict:
+        return {name: stage.as_dict() for name, stage in self.metrics.items()}
+
+    async def _close_stage(self, queue: asyncio.Queue, consumers: List[asyncio.Task], producer: str):
+        """Signal the end of input to every consumer of a queue and wait for them to drain it"""
+        self.metrics[producer].finish()
+        for _ in consumers:
+            await queue.put(_STOP)
+        await asyncio.gather(*consumers)
+
+    async def _db_call(self, func, *args):
+        """Run a blocking DB call off the event loop, one at a time"""
+        async with self.db_lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def _auth_headers(self) -> dict:
+        """Headers with a token that stays valid for long runs (backfills outlive a single access token)"""
+        cached = token_manager.cached_token("gmail", self.connection_id)
+        if cached is None or token_manager.needs_refresh(cached[1]):
+            async with self.db_lock:
+                await token_manager.ensure_fresh_async(self.db, self.connection, "gmail")
+            # Read the token from the cache - touching ORM attributes here could race the persist thread
+            cached = token_manager.cached_token("gmail", self.connection_id)
+            self.headers = {"Authorization": f"Bearer {cached[0]}"}
+        elif self.headers.get("Authorization") != f"Bearer {cached[0]}":
+            self.headers = {"Authorization": f"Bearer {cached[0]}"}
+        return self.headers
+
+    def _finish_items(self, page_index: int, count: int = 1):
+        """Mark messages of a listed page as handled (persisted, duplicate or dropped)"""
+        self.pages[page_index]["outstanding"] -= count
+        self.processed_count += count
+
+    def _track_history_id(self, message_data: dict):
+        history_id = message_data.get("historyId")
+        if history_id and (not self.last_history_id or int(history_id) > int(self.last_history_id)):
+            self.last_history_id = str(history_id)
+
+    def checkpoint_state(self) -> dict:
+        """Where a resumed run should start: the first page that still has unfinished messages"""
+        position = self.list_position
+        for page in self.pages:
+            if page["outstanding"] > 0:
+                position = page
+                break
+
+        state = {
+            "processed_count": self.processed_count,
+            "last_history_id": self.last_history_id
+        }
+        if position:
+            state.update({
+                "label": position["label"],
+                "page_token": position["page_token"],
+                "label_processed_count": position["label_processed"]
+            })
+        return state
+
+    # ----- Stage 1: list -----
+
+    async def _list_stage(self, client: httpx.AsyncClient, labels: Dict[str, int]):
+        metrics = self.metrics["list"]
+
+        label_names = list(labels.keys())
+        resume_label = self.resume.get("label")
+        if resume_label in labels:
+            # Labels before the checkpointed one were finished by the interrupted run
+            label_names = label_names[label_names.index(resume_label):]
+
+        for label_name in label_names:
+            result = self.label_results.setdefault(label_name, {
+                "synced": 0,
+                "skipped_duplicates": 0,
+                "total_processed": 0
+            })
+            page_token = None
+            label_processed = 0
+            if label_name == resume_label:
+                page_token = self.resume.get("page_token")
+                label_processed = self.resume.get("label_processed_count", 0)
+            remaining = labels[label_name] - label_processed
+
+            try:
+                while remaining > 0:
+                    self.list_position = {"label": label_name, "page_token": page_token, "label_processed": label_processed}
+                    if self.persist_error is not None:
+                        return
+                    if self.should_stop and self.should_stop():
+                        # Leave list_position at this page so the checkpoint points at it
+                        self.stopped_early = True
+                        logger.info(f"Gmail - Sync pipeline for user {self.user_id} stopping early at {label_name}")
+                        return
+
+                    params = {
+                        "maxResults": min(remaining, 500),
+                        "labelIds": [label_name],
+                        "orderBy": "internalDate"
+                    }
+                    if page_token:
+                        params["pageToken"] = page_token
+
+                    if self.throttle:
+                        await self.throttle(self.LIST_UNITS)
+
+                    started = time.monotonic()
+                    response = await governed_request_async(
+                        client,
+                        "GET",
+                        f"{google_config.GOOGLE_GMAIL_API}/messages",
+                        user_id=self.user_id,
+                        headers=await self._auth_headers(),
+                        params=params
+                    )
+                    metrics.busy_seconds += time.monotonic() - started
+
+                    if response.status_code != 200:
+                        logger.warning(f"Gmail - Failed to fetch {label_name} messages: {response.status_code}")
+                        result["error"] = f"List failed with status {response.status_code}"
+                        metrics.errors += 1
+                        break
+
+                    page = response.json()
+                    message_ids = list(dict.fromkeys(msg["id"] for msg in page.get("messages", [])))
+                    result["total_processed"] += len(message_ids)
+                    remaining -= len(message_ids)
+
+                    known_ids = await self._db_call(get_known_gmail_ids, self.db, self.user_id, message_ids)
+                    result["skipped_duplicates"] += len(known_ids)
+
+                    # Skip stored messages and ones already queued under another label
+                    new_ids = [gmail_id for gmail_id in message_ids if gmail_id not in known_ids and gmail_id not in self.enqueued_ids]
+                    page_index = len(self.pages)
+                    self.pages.append(dict(self.list_position, outstanding=len(new_ids)))
+                    self.processed_count += len(message_ids) - len(new_ids)
+                    label_processed += len(message_ids)
+
+                    for gmail_id in new_ids:
+                        self.enqueued_ids.add(gmail_id)
+                        await self.fetch_queue.put((label_name, gmail_id, page_index))
+                        metrics.items += 1
+                        self.metrics["fetch"].sample_queue()
+
+                    page_token = page.get("nextPageToken")
+                    if not page_token or not message_ids:
+                        break
+
+                # Label finished - a resumed run starts at the next one
+                self.list_position = None
+
+                logger.info(f"Gmail - Listed {result['total_processed']} messages from {label_name} label")
+
+            except Exception as e:
+                logger.error(f"Gmail - Failed to list {label_name} label: {str(e)}")
+                result["error"] = str(e)
+                metrics.errors += 1
+
+    # ----- Stage 2: fetch -----
+
+    async def _fetch_worker(self, client: httpx.AsyncClient):
+        metrics = self.metrics["fetch"]
+
+        while True:
+            item = await self.fetch_queue.get()
+            if item is _STOP:
+                return
+
+            label_name, gmail_id, page_index = item
+            started = time.monotonic()
+            try:
+                if self.throttle:
+                    await self.throttle(self.GET_UNITS)
+                message_data = await fetch_gmail_message_for_sync(client, await self._auth_headers(), gmail_id, self.user_id)
+                if message_data:
+                    self._track_history_id(message_data)
+                    await self.parse_queue.put((label_name, message_data, page_index))
+                    metrics.items += 1
+                    self.metrics["parse"].sample_queue()
+                else:
+                    metrics.errors += 1
+                    self._finish_items(page_index)
+            except Exception as e:
+                logger.warning(f"Gmail - Failed to fetch message {gmail_id} in {label_name}: {str(e)}")
+                metrics.errors += 1
+                self._finish_items(page_index)
+            finally:
+                metrics.busy_seconds += time.monotonic() - started
+
+    # ----- Stage 3: parse -----
+
+    async def _parse_worker(self, executor: Optional[ProcessPoolExecutor]):
+        metrics = self.metrics["parse"]
+        loop = asyncio.get_running_loop()
+
+        while True:
+            item = await self.parse_queue.get()
+            if item is _STOP:
+                return
+
+            label_name, message_data, page_index = item
+            started = time.monotonic()
+            try:
+                # Attachment data is never fetched here - the attachment endpoints load it on demand
+                if executor is not None:
+                    parsed_email = await loop.run_in_executor(executor, parse_gmail_message, message_data)
+                else:
+                    parsed_email = parse_gmail_message(message_data)
+                await self.persist_queue.put((label_name, parsed_email, page_index))
+                metrics.items += 1
+                self.metrics["persist"].sample_queue()
+            except Exception as e:
+                logger.warning(f"Gmail - Failed to parse message {message_data.get('id')}: {str(e)}")
+                metrics.errors += 1
+                self._finish_items(page_index)
+            finally:
+                metrics.busy_seconds += time.monotonic() - started
+
+    # ----- Stage 4: persist -----
+
+    async def _persist_stage(self):
+        batch = []
+
+        while True:
+            item = await self.persist_queue.get()
+            if item is _STOP:
+                break
+
+            batch.append(item)
+            if len(batch) >= self.persist_batch_size:
+                await self._flush(batch)
+                batch = []
+
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        metrics = self.metrics["persist"]
+        parsed_emails = [parsed_email for _, parsed_email, _ in batch]
+        started = time.monotonic()
+
+        try:
+            for attempt in range(1, self.PERSIST_ATTEMPTS + 1):
+                try:
+                    inserted_ids = await self._db_call(self._persist_batch, parsed_emails)
+                    break
+                except Exception as e:
+                    logger.error(f"Gmail - Failed to persist batch of {len(batch)} emails (attempt {attempt}/{self.PERSIST_ATTEMPTS}): {str(e)}")
+                    if attempt == self.PERSIST_ATTEMPTS:
+                        # Leave the batch's pages unfinished so no checkpoint moves past these messages,
+                        # and stop listing; run() reports the failure once the queued work has drained
+                        metrics.errors += len(batch)
+                        self.persist_error = e
+                        return
+        finally:
+            metrics.busy_seconds += time.monotonic() - started
+
+        metrics.items += len(inserted_ids)
+        for label_name, parsed_email, page_index in batch:
+            if parsed_email.get("id") in inserted_ids:
+                self.label_results[label_name]["synced"] += 1
+            self._finish_items(page_index)
+
+        if self.on_checkpoint:
+            try:
+                await self._db_call(self.on_checkpoint, self.db, self.checkpoint_state())
+            except Exception as e:
+                logger.warning(f"Gmail - Failed to save sync checkpoint: {str(e)}")
+
+    def _persist_batch(self, parsed_emails: list) -> set:
+        """Insert one batch and commit; returns the gmail IDs that were newly inserted"""
+        try:
+            inserted_ids = persist_parsed_emails(self.db, self.user_id, parsed_emails)
+            self.db.commit()
+            return inserted_ids
+        except Exception:
+            self.db.rollback()
+            raise
@@ -4,22 +4,36 @@ logger = logging.getLogger(__name__)
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Optional
 from pydantic import BaseModel
+import asyncio
 import httpx
 import json
-from datetime import datetime, timedelta
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
 import os
 import sys
+from urllib.parse import quote
 
 # Add the backend directory to the Python path
 # sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from database import get_db
+from database import get_db, SessionLocal
 import models as models
 import schemas as schemas   
 from config.google import google_config
+from utils.event_changes import mark_events_changed
+from utils.google_batch import BatchRequest, execute_calendar_batch
+from utils.google_rate_limiter import governed_request, governed_request_async
+from utils.google_token_manager import token_manager
+from utils.http_clients import http_clients
+from utils.sync_outbox import GOOGLE_CALENDAR, acknowledge, backfill_sync_outbox, is_connected, pending_changes, record_change
 from routes.auth.session import get_user_id
 
 router = APIRouter(prefix="/google-calendar", tags=["Google Calendar"])
@@ -166,7 +180,7 @@ async def exchange_token_for_calendar(
     
     logger.info("Google Calendar - Exchanging code for tokens...")
     
-    async with httpx.AsyncClient() as client:
+    async with http_clients.borrow_async("google_oauth") as client:
         response = await client.post(google_config.GOOGLE_TOKEN_URL, data=token_data)
         
         if response.status_code != 200:
@@ -234,6 +248,9 @@ async def exchange_token_for_calendar(
         db.commit()
         logger.info(f"Google Calendar - Connection saved successfully for user {current_user_id}")
         
+        # Events created or edited while the calendar wasn't connected go out with the next sync
+        backfill_sync_outbox(current_user_id)
+        
         return {"message": "Successfully connected to Google Calendar"}
 
 @router.get("/calendars")
@@ -256,10 +273,10 @@ def get_calendars(
     logger.info(f"Google Calendar - Connection found for user {current_user_id}")
     
     # Check if token is expired and refresh if needed
-    if connection.token_expiry <= datetime.now():
+    if token_manager.needs_refresh(connection.token_expiry):
         logger.info(f"Google Calendar - Token expired for user {current_user_id}, refreshing...")
         try:
-            connection = refresh_access_token(db, connection)
+            connection = token_manager.ensure_fresh(db, connection, "calendar")
         except HTTPException as e:
             # Re-raise HTTPExceptions as-is
             raise
@@ -271,15 +288,15 @@ def get_calendars(
     headers = {"Authorization": f"Bearer {connection.access_token}"}
     
     try:
-        with httpx.Client() as client:
+        with http_clients.borrow("google") as client:
             # First, test the token with a simple API call
-            test_response = client.get(f"{google_config.GOOGLE_CALENDAR_API}/users/me", headers=headers)
+            test_response = governed_request(client, "GET", f"{google_config.GOOGLE_CALENDAR_API}/users/me", api="calendar", user_id=current_user_id, headers=headers)
             if test_response.status_code == 401:
                 logger.error(f"Google Calendar - Token invalid for user {current_user_id}")
                 raise HTTPException(status_code=401, detail="Google Calendar access token is invalid")
             
             # Now fetch the calendar list
-            response = client.get(f"{google_config.GOOGLE_CALENDAR_API}/users/me/calendarList", headers=headers)
+            response = governed_request(client, "GET", f"{google_config.GOOGLE_CALENDAR_API}/users/me/calendarList", api="calendar", user_id=current_user_id, headers=headers)
             
             # Check response status before processing
             if response.status_code == 403:
@@ -326,7 +343,7 @@ async def sync_calendars(
     db: Session = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
-    """Simple two-way sync: Local events → Google Calendar, Google Calendar events → Local"""
+    """Queue a background two-way sync (or join the one already running) and return its job ID"""
     logger.info(f"Google Calendar - Two-way sync request from user {current_user_id}")
     
     connection = db.query(models.GoogleCalendarConnection).filter(
@@ -337,13 +354,62 @@ async def sync_calendars(
         logger.warning(f"Google Calendar - User {current_user_id} tried to sync without connection")
         raise HTTPException(status_code=404, detail="Google Calendar not connected")
     
+    # Remember the selection so periodic background syncs use the same calendars
+    connection.calendar_ids = sync_request.calendar_ids
+    connection.two_way_sync = sync_request.two_way_sync
+    db.commit()
+    
+    from utils.sync_scheduler import sync_scheduler
+    try:
+        job = await sync_scheduler.enqueue(
+            current_user_id,
+            "calendar",
+            params={"calendar_ids": sync_request.calendar_ids}
+        )
+    except Exception as e:
+        logger.error(f"Google Calendar - Failed to queue sync for user {current_user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue sync: {str(e)}")
+    
+    return {
+        "message": "Calendar sync started in the background",
+        "job_id": job.id,
+        "status": job.status
+    }
+
+async def run_calendar_sync_job(user_id: int, params: dict) -> dict:
+    """Sync scheduler entry point: run a two-way sync with its own DB session"""
+    db = SessionLocal()
+    try:
+        connection = db.query(models.GoogleCalendarConnection).filter(
+            models.GoogleCalendarConnection.user_id == user_id
+        ).first()
+        
+        if not connection:
+            raise HTTPException(status_code=404, detail="Google Calendar not connected")
+        
+        # Background syncs reuse the calendars picked in the last manual sync
+        calendar_ids = params.get("calendar_ids") or connection.calendar_ids or ["primary"]
+        return await run_calendar_sync(db, connection, calendar_ids, user_id)
+    finally:
+        db.close()
+
+def get_calendar_sync_user_ids() -> list:
+    """User IDs with a Google Calendar connection, for periodic background syncs"""
+    db = SessionLocal()
+    try:
+        return [row[0] for row in db.query(models.GoogleCalendarConnection.user_id).all()]
+    finally:
+        db.close()
+
+async def run_calendar_sync(db: Session, connection: models.GoogleCalendarConnection, calendar_ids: List[str], current_user_id: int) -> dict:
+    """Simple two-way sync: Local events → Google Calendar, Google Calendar events → Local"""
     connection.last_sync = datetime.now()
     
     # Check if token is expired and refresh if needed
-    if connection.token_expiry <= datetime.now():
+    if token_manager.needs_refresh(connection.token_expiry):
         logger.info(f"Google Calendar - Refreshing expired token for user {current_user_id}")
         try:
-            connection = refresh_access_token(db, connection)
+            connection = await token_manager.ensure_fresh_async(db, connection, "calendar")
         except Exception as e:
             logger.error(f"Google Calendar - Failed to refresh token for user {current_user_id}: {str(e)}")
             raise HTTPException(
@@ -357,8 +423,8 @@ async def sync_calendars(
     try:
         # Step 1: Sync events from Google Calendar to local database
         logger.info(f"Google Calendar - Syncing events FROM Google Calendar to local for user {current_user_id}")
-        for calendar_id in sync_request.calendar_ids:
-            events_synced_to_local += await sync_calendar_events(db, connection, calendar_id, current_user_id)
+        google_result = await sync_google_calendars(db, connection, calendar_ids, current_user_id)
+        events_synced_to_local = google_result["events_synced"]
         
         # Step 2: Sync events from local database to Google Calendar
         logger.info(f"Google Calendar - Syncing events FROM local to Google Calendar for user {current_user_id}")
@@ -373,6 +439,8 @@ async def sync_calendars(
             "events_synced_to_local": events_synced_to_local,
             "events_synced_to_google": events_synced_to_google,
             "total_events_synced": events_synced_to_local + events_synced_to_google,
+            "calendars": google_result["calendars"],
+            "write_seconds": google_result["write_seconds"],
             "last_sync": connection.last_sync
         }
         
@@ -392,6 +460,7 @@ def disconnect_calendar(
     ).first()
     
     if connection:
+        token_manager.invalidate("calendar", connection.id)
         db.delete(connection)
         db.commit()
     
@@ -414,10 +483,10 @@ def test_google_calendar_connection(
         raise HTTPException(status_code=404, detail="Google Calendar not connected")
     
     # Check if token is expired
-    if connection.token_expiry <= datetime.now():
+    if token_manager.needs_refresh(connection.token_expiry):
         logger.info(f"Google Calendar - Token expired for user {current_user_id}, attempting refresh...")
         try:
-            connection = refresh_access_token(db, connection)
+            connection = token_manager.ensure_fresh(db, connection, "calendar")
         except HTTPException as e:
             logger.error(f"Google Calendar - Token refresh failed with HTTP error: {e.status_code}")
             return {
@@ -439,16 +508,16 @@ def test_google_calendar_connection(
     headers = {"Authorization": f"Bearer {connection.access_token}"}
     
     try:
-        with httpx.Client() as client:
+        with http_clients.borrow("google") as client:
             # Test basic access
-            test_response = client.get(f"{google_config.GOOGLE_CALENDAR_API}/users/me", headers=headers)
+            test_response = governed_request(client, "GET", f"{google_config.GOOGLE_CALENDAR_API}/users/me", api="calendar", user_id=current_user_id, headers=headers)
             
             if test_response.status_code == 200:
                 user_info = test_response.json()
                 logger.info(f"Google Calendar - Basic access successful for user {current_user_id}")
                 
                 # Test calendar list access
-                calendar_response = client.get(f"{google_config.GOOGLE_CALENDAR_API}/users/me/calendarList", headers=headers)
+                calendar_response = governed_request(client, "GET", f"{google_config.GOOGLE_CALENDAR_API}/users/me/calendarList", api="calendar", user_id=current_user_id, headers=headers)
                 
                 if calendar_response.status_code == 200:
                     calendar_data = calendar_response.json()
@@ -492,280 +561,480 @@ def test_google_calendar_connection(
 
 
  
-async def sync_calendar_events(db: Session, connection: models.GoogleCalendarConnection, calendar_id: str, user_id: int) -> int:
-    """Sync events from a specific Google Calendar"""
-    headers = {"Authorization": f"Bearer {connection.access_token}"}
-    
-    # Get events from the last 30 days and next 30 days
-    now = datetime.now()
-    time_min = (now - timedelta(days=30)).isoformat() + "Z"
-    time_max = (now + timedelta(days=30)).isoformat() + "Z"
-    
-    params = {
-        "timeMin": time_min,
-        "timeMax": time_max,
-        "singleEvents": True,
-        "orderBy": "startTime"
-    }
+CALENDAR_UPSERT_CHUNK_SIZE = 1000  # Rows per INSERT ... ON CONFLICT statement
+
+class CalendarSyncTokenExpired(Exception):
+    """Google answered 410 Gone: the stored syncToken can no longer be used"""
+
+
+async def list_calendar_events(client: httpx.AsyncClient, headers: dict, calendar_id: str, user_id: int, sync_token: Optional[str] = None) -> tuple:
+    """
+    Page through events.list for one calendar; returns (events, nextSyncToken).
+    
+    With a sync token only events changed since it was issued come back, including
+    cancelled ones. Without one the whole sync window is listed.
+    """
+    import urllib.parse
+    encoded_calendar_id = urllib.parse.quote(calendar_id, safe='')
+    
+    if sync_token:
+        # syncToken can't be combined with timeMin/timeMax/orderBy
+        base_params = {"syncToken": sync_token}
+    else:
+        now = datetime.now()
+        base_params = {
+            "timeMin": (now - timedelta(days=google_config.CALENDAR_SYNC_PAST_DAYS)).isoformat() + "Z",
+            "timeMax": (now + timedelta(days=google_config.CALENDAR_SYNC_FUTURE_DAYS)).isoformat() + "Z"
+        }
+    base_params.update({"singleEvents": True, "maxResults": google_config.CALENDAR_SYNC_PAGE_SIZE})
+    
+    events = []
+    page_token = None
+    while True:
+        params = dict(base_params, pageToken=page_token) if page_token else base_params
+        response = await governed_request_async(
+            client,
+            "GET",
+            f"{google_config.GOOGLE_CALENDAR_API}/calendars/{encoded_calendar_id}/events",
+            api="calendar",
+            user_id=user_id,
+            headers=headers,
+            params=params
+        )
+        if response.status_code == 410:
+            raise CalendarSyncTokenExpired(calendar_id)
+        response.raise_for_status()
+        
+        data = response.json()
+        events.extend(data.get("items", []))
+        page_token = data.get("nextPageToken")
+        if not page_token:
+            return events, data.get("nextSyncToken")
+
+async def fetch_calendar_changes(client: httpx.AsyncClient, headers: dict, calendar_id: str, user_id: int, sync_token: Optional[str]) -> dict:
+    """Fetch one calendar's changes (or full listing after a 410); failures are reported, not raised"""
+    started = time.monotonic()
+    result = {"calendar_id": calendar_id, "events": [], "next_sync_token": None, "full": sync_token is None, "error": None}
     
     try:
-        with httpx.Client() as client:
-            # URL encode the calendar_id to handle special characters like #
-            import urllib.parse
-            encoded_calendar_id = urllib.parse.quote(calendar_id, safe='')
-            
-            response = client.get(
-                f"{google_config.GOOGLE_CALENDAR_API}/calendars/{encoded_calendar_id}/events",
-                headers=headers,
-                params=params
-            )
-            response.raise_for_status()
-            
-            events_data = response.json()
-            events = events_data.get("items", [])
-            
-            logger.info(f"Google Calendar - Found {len(events)} events in calendar {calendar_id}")
-            
-            events_synced = 0
-            
-            for event in events:
-                try:
-                    # Validate required fields
-                    if not all(key in event for key in ["id", "start", "end"]):
-                        logger.warning(f"Google Calendar - Skipping event with missing required fields: {event.get('summary', 'Unknown')}")
-                        continue
-                    
-                    # Check if event already exists using multiple criteria to prevent duplicates
-                    existing_event = db.query(models.Event).filter(
-                        models.Event.user_id == user_id,
-                        models.Event.google_event_id == event["id"]
-                    ).first()
-                    
-                    # If not found by google_event_id, check by title + start_time + calendar_id
-                    if not existing_event:
-                        existing_event = db.query(models.Event).filter(
-                            models.Event.user_id == user_id,
-                            models.Event.title == event.get("summary", "Untitled Event"),
-                            models.Event.start_time == parse_google_datetime(event["start"]),
-                            models.Event.google_calendar_id == calendar_id
-                        ).first()
-                    
-                    if not existing_event:
-                        # Create new event
-                        new_event = models.Event(
-                            title=event.get("summary", "Untitled Event"),
-                            description=event.get("description", ""),
-                            start_time=parse_google_datetime(event["start"]),
-                            end_time=parse_google_datetime(event["end"]),
-                            user_id=user_id,
-                            category="google_sync",
-                            google_event_id=event["id"],
-                            google_calendar_id=calendar_id
-                        )
-                        db.add(new_event)
-                        events_synced += 1
-                        logger.debug(f"Google Calendar - Added event: {new_event.title}")
-                    else:
-                        logger.debug(f"Google Calendar - Event already exists: {event.get('summary', 'Unknown')} (ID: {existing_event.id})")
-                        
-                except Exception as e:
-                    logger.error(f"Google Calendar - Error processing event {event.get('summary', 'Unknown')}: {str(e)}")
-                    continue  # Skip this event and continue with others
-            
-            logger.info(f"Google Calendar - Synced {events_synced} new events from calendar {calendar_id}")
-            return events_synced
-            
+        try:
+            result["events"], result["next_sync_token"] = await list_calendar_events(client, headers, calendar_id, user_id, sync_token)
+        except CalendarSyncTokenExpired:
+            logger.warning(f"Google Calendar - Sync token for calendar {calendar_id} expired, running a full resync")
+            result["full"] = True
+            result["events"], result["next_sync_token"] = await list_calendar_events(client, headers, calendar_id, user_id)
     except httpx.HTTPStatusError as e:
         logger.error(f"Google Calendar - HTTP error syncing calendar {calendar_id}: {e.response.status_code} - {e.response.text}")
-        raise HTTPException(status_code=500, detail=f"Failed to sync calendar {calendar_id}: HTTP {e.response.status_code}")
+        result["error"] = f"HTTP {e.response.status_code}"
     except Exception as e:
         logger.error(f"Google Calendar - Failed to sync calendar {calendar_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to sync calendar {calendar_id}: {str(e)}")
+        result["error"] = str(e)
+    
+    result["fetch_seconds"] = round(time.monotonic() - started, 3)
+    return result
 
-async def sync_local_events_to_google(db: Session, connection: models.GoogleCalendarConnection, user_id: int) -> int:
-    """Sync events from local database to Google Calendar (primary calendar only)"""
-    headers = {"Authorization": f"Bearer {connection.access_token}"}
+def apply_calendar_events(db: Session, user_id: int, fetched: list) -> dict:
+    """
+    Insert, update and delete local copies of Google events for every fetched calendar at once.
+    
+    Existing rows are prefetched in one query, unchanged events (same etag, or not
+    newer than the stored copy) are skipped, and the rest is written with
+    INSERT ... ON CONFLICT (google_event_id) DO UPDATE in chunks plus one DELETE.
+    Returns the number of changes per calendar. Does not commit.
+    """
+    now = datetime.now()
+    window_start = now - timedelta(days=google_config.CALENDAR_SYNC_PAST_DAYS)
+    window_end = now + timedelta(days=google_config.CALENDAR_SYNC_FUTURE_DAYS)
     
-    events_synced = 0
-    events_deleted = 0
+    # Later entries for the same event win (a delta can list an event more than once)
+    latest = {
+        result["calendar_id"]: {event["id"]: event for event in result["events"] if event.get("id")}
+        for result in fetched
+    }
+    full_calendars = [result["calendar_id"] for result in fetched if result["full"]]
+    delta_ids = [
+        google_event_id
+        for result in fetched if not result["full"]
+        for google_event_id in latest[result["calendar_id"]]
+    ]
+    
+    # A full listing is authoritative for the window, so those calendars load every local copy in it
+    conditions = []
+    if delta_ids:
+        conditions.append(models.Event.google_event_id.in_(delta_ids))
+    if full_calendars:
+        conditions.append(and_(
+            models.Event.google_calendar_id.in_(full_calendars),
+            models.Event.google_event_id.isnot(None),
+            models.Event.start_time >= window_start,
+            models.Event.start_time < window_end
+        ))
+    existing_rows = db.query(
+        models.Event.id,
+        models.Event.google_event_id,
+        models.Event.google_calendar_id,
+        models.Event.google_etag,
+        models.Event.google_updated,
+        models.Event.needs_google_sync,
+        models.Event.start_time
+    ).filter(models.Event.user_id == user_id, or_(*conditions)).all() if conditions else []
+    existing = {row.google_event_id: row for row in existing_rows}
+    existing.update(adopt_pushed_events(db, user_id, {
+        google_event_id: calendar_id
+        for calendar_id, events in latest.items()
+        for google_event_id in events
+        if google_event_id not in existing
+    }))
+    
+    upsert_rows = {}
+    delete_ids = set()
+    changes = {result["calendar_id"]: 0 for result in fetched}
+    unchanged = 0
+    
+    for calendar_id, events in latest.items():
+        for google_event_id, event in events.items():
+            current = existing.get(google_event_id)
+            
+            if event.get("status") == "cancelled":
+                if current and current.id not in delete_ids:
+                    delete_ids.add(current.id)
+                    changes[calendar_id] += 1
+                continue
+            
+            # Validate required fields
+            if "start" not in event or "end" not in event:
+                logger.warning(f"Google Calendar - Skipping event with missing required fields: {event.get('summary', 'Unknown')}")
+                continue
+            
+            updated = parse_google_datetime({"dateTime": event["updated"]}) if event.get("updated") else None
+            if current:
+                # Local edits still waiting to be pushed win over the Google copy
+                if current.needs_google_sync:
+                    unchanged += 1
+                    continue
+                if event.get("etag") and event.get("etag") == current.google_etag:
+                    unchanged += 1
+                    continue
+                if updated and current.google_updated and updated < current.google_updated:
+                    unchanged += 1
+                    continue
+            
+            if google_event_id not in upsert_rows:
+                changes[calendar_id] += 1
+            upsert_rows[google_event_id] = {
+                "title": event.get("summary", "Untitled Event"),
+                "description": event.get("description", ""),
+                "start_time": parse_google_datetime(event["start"]),
+                "end_time": parse_google_datetime(event["end"]),
+                "user_id": user_id,
+                "category": "google_sync",
+                "google_event_id": google_event_id,
+                "google_calendar_id": calendar_id,
+                "google_etag": event.get("etag"),
+                "google_updated": updated,
+                "last_synced": now,
+                "created_at": now,
+                "updated_at": now
+            }
     
-    # Step 1: Handle deletions first (events marked as deleted)
-    deleted_events = db.query(models.Event).filter(
+    for calendar_id in full_calendars:
+        for row in existing_rows:
+            if (
+                row.google_calendar_id == calendar_id
+                and row.google_event_id not in latest[calendar_id]
+                and row.google_event_id not in upsert_rows
+                and not row.needs_google_sync
+                and row.start_time is not None
+                and window_start <= row.start_time < window_end
+                and row.id not in delete_ids
+            ):
+                delete_ids.add(row.id)
+                changes[calendar_id] += 1
+    
+    rows = list(upsert_rows.values())
+    for start in range(0, len(rows), CALENDAR_UPSERT_CHUNK_SIZE):
+        insert_stmt = pg_insert(models.Event).values(rows[start:start + CALENDAR_UPSERT_CHUNK_SIZE])
+        db.execute(insert_stmt.on_conflict_do_update(
+            index_elements=["google_event_id"],
+            set_={
+                column: insert_stmt.excluded[column]
+                for column in ("title", "description", "start_time", "end_time", "google_calendar_id", "google_etag", "google_updated", "last_synced", "updated_at")
+            },
+            # google_event_id is unique across users; never overwrite someone else's row or pending local edits
+            where=(models.Event.user_id == insert_stmt.excluded.user_id) & models.Event.needs_google_sync.isnot(True)
+        ))
+    
+    if delete_ids:
+        db.query(models.Event).filter(models.Event.id.in_(delete_ids)).delete(synchronize_session=False)
+    if rows or delete_ids:
+        mark_events_changed(db, user_id)
+    
+    logger.info(f"Google Calendar - {len(fetched)} calendars: {len(rows)} events upserted, {len(delete_ids)} deleted, {unchanged} unchanged")
+    return changes
+
+def adopt_pushed_events(db: Session, user_id: int, calendar_by_event_id: dict) -> dict:
+    """
+    Link fetched events that a push created under local_google_event_id() to their local rows.
+
+    A push whose response was lost leaves the local event without its Google ID
+    even though Google has it, so the pull would otherwise insert a second copy.
+    The local row gets the Google ID instead; its pending change then goes out
+    as a PATCH (or DELETE). Returns {google_event_id: row} for the adopted events.
+    """
+    local_ids = {}
+    for google_event_id, calendar_id in calendar_by_event_id.items():
+        local_id = local_event_id_from_google_id(google_event_id, user_id)
+        if local_id is not None:
+            local_ids[local_id] = google_event_id
+    if not local_ids:
+        return {}
+    
+    rows = db.query(
+        models.Event.id,
+        models.Event.google_etag,
+        models.Event.google_updated,
+        models.Event.needs_google_sync,
+        models.Event.start_time
+    ).filter(
         models.Event.user_id == user_id,
-        models.Event.is_deleted == True,
-        models.Event.google_event_id.isnot(None),
-        models.Event.needs_google_sync == True
+        models.Event.id.in_(list(local_ids)),
+        models.Event.google_event_id.is_(None)
     ).all()
     
-    logger.info(f"Google Calendar - Found {len(deleted_events)} deleted events to sync to Google Calendar")
+    adopted = {}
+    for row in rows:
+        google_event_id = local_ids[row.id]
+        calendar_id = calendar_by_event_id[google_event_id]
+        db.query(models.Event).filter(models.Event.id == row.id).update(
+            {"google_event_id": google_event_id, "google_calendar_id": calendar_id},
+            synchronize_session=False
+        )
+        adopted[google_event_id] = SimpleNamespace(**row._asdict(), google_event_id=google_event_id, google_calendar_id=calendar_id)
+    
+    if adopted:
+        mark_events_changed(db, user_id)
+        logger.info(f"Google Calendar - Linked {len(adopted)} pushed events to their local copies for user {user_id}")
+    return adopted
+
+async def sync_google_calendars(db: Session, connection: models.GoogleCalendarConnection, calendar_ids: List[str], user_id: int) -> dict:
+    """
+    Google -> local for several calendars: fetch them concurrently (at most
+    CALENDAR_SYNC_FETCH_CONCURRENCY at a time), then apply everything in one batched write.
+    """
+    headers = {"Authorization": f"Bearer {connection.access_token}"}
+    sync_tokens = dict(connection.sync_tokens or {})
+    semaphore = asyncio.Semaphore(google_config.CALENDAR_SYNC_FETCH_CONCURRENCY)
+    
+    async def fetch(client: httpx.AsyncClient, calendar_id: str) -> dict:
+        async with semaphore:
+            return await fetch_calendar_changes(client, headers, calendar_id, user_id, sync_tokens.get(calendar_id))
+    
+    async with http_clients.borrow_async("google") as client:
+        fetched = await asyncio.gather(*(fetch(client, calendar_id) for calendar_id in dict.fromkeys(calendar_ids)))
+    
+    succeeded = [result for result in fetched if not result["error"]]
+    if fetched and not succeeded:
+        raise HTTPException(status_code=500, detail=f"Failed to sync calendars: {fetched[0]['error']}")
+    
+    started = time.monotonic()
+    changes = apply_calendar_events(db, user_id, succeeded)
+    write_seconds = round(time.monotonic() - started, 3)
+    
+    for result in succeeded:
+        if result["next_sync_token"]:
+            sync_tokens[result["calendar_id"]] = result["next_sync_token"]
+    connection.sync_tokens = sync_tokens  # Reassign so the JSON column is flagged dirty
+    
+    calendars = {
+        result["calendar_id"]: {
+            "mode": "full" if result["full"] else "incremental",
+            "events_fetched": len(result["events"]),
+            "changes": changes.get(result["calendar_id"], 0),
+            "fetch_seconds": result["fetch_seconds"],
+            "error": result["error"]
+        }
+        for result in fetched
+    }
     
-    for event in deleted_events:
-        try:
-            with httpx.Client() as client:
-                # Delete from Google Calendar
-                response = client.delete(
-                    f"{google_config.GOOGLE_CALENDAR_API}/calendars/primary/events/{event.google_event_id}",
-                    headers=headers
-                )
-                
-                if response.status_code == 204:  # Successfully deleted
-                    logger.info(f"Google Calendar - Successfully deleted event '{event.title}' from Google Calendar")
-                    events_deleted += 1
-                    
-                    # Now delete from local DB
-                    db.delete(event)
-                else:
-                    logger.error(f"Google Calendar - Failed to delete event '{event.title}' from Google: {response.status_code}")
-                    # Mark as not needing sync to avoid retry loops
-                    event.needs_google_sync = False
-                    
-        except Exception as e:
-            logger.error(f"Google Calendar - Error deleting event '{event.title}' from Google: {str(e)}")
-            # Mark as not needing sync to avoid retry loops
-            event.needs_google_sync = False
+    return {
+        "events_synced": sum(changes.values()),
+        "calendars": calendars,
+        "write_seconds": write_seconds
+    }
+
+def local_to_utc(local_time: datetime) -> datetime:
+    """Naive times are local system time; convert to UTC for the Google Calendar API"""
+    if local_time.tzinfo is None:
+        # Handles daylight saving time automatically
+        offset_seconds = -time.timezone if not time.daylight else -time.altzone
+        local_tz = timezone(timedelta(seconds=offset_seconds))
+        return local_time.replace(tzinfo=local_tz).astimezone(timezone.utc)
+    return local_time.astimezone(timezone.utc)
+
+
+def google_event_body(event: models.Event) -> dict:
+    """Google Calendar representation of a local event"""
+    return {
+        "summary": event.title,
+        "description": event.description,
+        "start": {
+            "dateTime": local_to_utc(event.start_time).isoformat(),
+            "timeZone": "UTC"  # Explicitly specify UTC
+        },
+        "end": {
+            "dateTime": local_to_utc(event.end_time).isoformat(),
+            "timeZone": "UTC"  # Explicitly specify UTC
+        },
+        "reminders": {
+            "useDefault": False,
+            "overrides": [
+                {"method": "email", "minutes": 10},
+                {"method": "popup", "minutes": 10}
+            ]
+        }
+    }
+
+
+def local_google_event_id(event: models.Event) -> str:
+    """
+    Google event ID for a local event, derived from our own IDs.
+
+    Inserting with a fixed ID makes the push idempotent: a retried insert of an
+    event that already reached Google comes back 409 instead of creating a
+    duplicate. Google only accepts base32hex characters (0-9, a-v); hex digits
+    are a subset and "v" separates the parts.
+    """
+    return f"{google_config.GOOGLE_CALENDAR_EVENT_ID_PREFIX}v{event.user_id:x}v{event.id:x}"
+
+
+def local_event_id_from_google_id(google_event_id: str, user_id: int) -> Optional[int]:
+    """Local event ID behind a local_google_event_id() of this user; None for any other Google event ID"""
+    match = re.fullmatch(rf"{re.escape(google_config.GOOGLE_CALENDAR_EVENT_ID_PREFIX)}v([0-9a-f]+)v([0-9a-f]+)", google_event_id)
+    if match is None or int(match.group(1), 16) != user_id:
+        return None
+    return int(match.group(2), 16)
+
+
+async def sync_local_events_to_google(db: Session, connection: models.GoogleCalendarConnection, user_id: int) -> int:
+    """
+    Push pending local creates, updates and deletes to Google Calendar.
+
+    Works through the user's sync outbox in order, one push per event however
+    many edits it has queued, so the cost follows the number of changes rather
+    than the size of the events table. Every change goes out in Calendar batch
+    requests (50 calls per HTTP request). New events are inserted under
+    local_google_event_id, so there's no search for an existing copy first; a
+    409 means an earlier push already created it, and the event is patched instead.
+    """
+    headers = {"Authorization": f"Bearer {connection.access_token}"}
+
+    events_pushed = 0
+    after_id = 0
+    async with http_clients.borrow_async("google") as client:
+        while True:
+            changes = pending_changes(db, user_id, GOOGLE_CALENDAR, after_id=after_id)
+            if not changes:
+                break
+            events_pushed += await push_event_changes(db, client, headers, user_id, changes)
+            after_id = max(entry_id for change in changes for entry_id in change.entry_ids)
+
+    return events_pushed
+
+
+async def push_event_changes(db: Session, client: httpx.AsyncClient, headers: dict, user_id: int, changes: list) -> int:
+    """Push one batch of outbox changes; entries are acknowledged unless the push should be retried"""
+    events = {
+        event.id: event
+        for event in db.query(models.Event).filter(
+            models.Event.user_id == user_id,
+            models.Event.id.in_([change.entity_id for change in changes])
+        ).all()
+    }
+
+    done = []
+    requests = []
+    for change in changes:
+        event = events.get(change.entity_id)
+        if event is None:
+            done.append(change)  # Removed locally before it ever reached Google
             continue
-    
-    # Step 2: Handle new events (not yet synced to Google)
-    local_events = db.query(models.Event).filter(
-        models.Event.user_id == user_id,
-        models.Event.google_event_id.is_(None),  # Events not yet synced to Google
-        models.Event.is_deleted == False,  # Only sync non-deleted events
-        models.Event.needs_google_sync == True
-    ).all()
-    
-    logger.info(f"Google Calendar - Found {len(local_events)} new local events to sync to Google Calendar")
-    
-    for event in local_events:
-        try:
-            # Always sync to primary calendar for simplicity
-            target_calendar = "primary"
-            
-            # Check if this event already exists in Google Calendar to prevent duplicates
-            # Search by title and start time
-            try:
-                with httpx.Client() as client:
-                    # Search for existing events with similar title and time
-                    search_params = {
-                        "q": event.title,
-                        "timeMin": (event.start_time - timedelta(minutes=5)).isoformat() + "Z",
-                        "timeMax": (event.start_time + timedelta(minutes=5)).isoformat() + "Z",
-                        "singleEvents": True
-                    }
-                    
-                    search_response = client.get(
-                        f"{google_config.GOOGLE_CALENDAR_API}/calendars/primary/events",
-                        headers=headers,
-                        params=search_params
-                    )
-                    
-                    if search_response.status_code == 200:
-                        existing_google_events = search_response.json().get("items", [])
-                        
-                        # Check if we found a matching event
-                        for google_event in existing_google_events:
-                            if (google_event.get("summary") == event.title and
-                                abs((parse_google_datetime(google_event["start"]) - event.start_time).total_seconds()) < 300):  # 5 minutes tolerance
-                                
-                                logger.info(f"Google Calendar - Event '{event.title}' already exists in Google Calendar, linking instead of creating")
-                                
-                                # Link the existing Google event to our local event
-                                event.google_event_id = google_event["id"]
-                                event.category = "google_sync_completed"
-                                event.synced_at = datetime.now()
-                                event.needs_google_sync = False
-                                events_synced += 1
-                                
-                                # Skip creating a new event
-                                continue
-            except Exception as e:
-                logger.warning(f"Google Calendar - Could not check for existing events: {str(e)}")
-                # Continue with creating the event
-            
-            # Convert local times to UTC for Google Calendar API
-            from datetime import timezone
-            import time
-            
-            # Convert local datetime to UTC
-            def local_to_utc(local_time):
-                # If no timezone info, assume it's local system time
-                if local_time.tzinfo is None:
-                    # Get the system's timezone offset
-                    # This handles daylight saving time automatically
-                    offset_seconds = -time.timezone if not time.daylight else -time.altzone
-                    offset_hours = offset_seconds // 3600
-                    
-                    # Create a timezone object with the local offset
-                    local_tz = timezone(timedelta(hours=offset_hours))
-                    
-                    # Make the local time timezone-aware, then convert to UTC
-                    local_time_with_tz = local_time.replace(tzinfo=local_tz)
-                    utc_time = local_time_with_tz.astimezone(timezone.utc)
-                    
-                    logger.info(f"  Timezone conversion: Local offset = UTC{offset_hours:+d}, {local_time} -> {utc_time}")
-                    return utc_time
-                else:
-                    # Already has timezone info, convert to UTC
-                    return local_time.astimezone(timezone.utc)
-            
-            # Convert start and end times to UTC
-            utc_start = local_to_utc(event.start_time)
-            utc_end = local_to_utc(event.end_time)
-            
-            logger.info(f"Google Calendar - Converting times for event '{event.title}':")
-            logger.info(f"  Local start: {event.start_time} -> UTC start: {utc_start}")
-            logger.info(f"  Local end: {event.end_time} -> UTC end: {utc_end}")
-            
-            # Prepare event data for Google Calendar API
-            event_data = {
-                "summary": event.title,
-                "description": event.description,
-                "start": {
-                    "dateTime": utc_start.isoformat(),
-                    "timeZone": "UTC"  # Explicitly specify UTC
-                },
-                "end": {
-                    "dateTime": utc_end.isoformat(),
-                    "timeZone": "UTC"  # Explicitly specify UTC
-                },
-                "reminders": {
-                    "useDefault": False,
-                    "overrides": [
-                        {"method": "email", "minutes": 10},
-                        {"method": "popup", "minutes": 10}
-                    ]
-                }
-            }
-            
-            logger.info(f"Google Calendar - Syncing local event: {event.title} (Category: {event.category}) to primary calendar")
-            
-            with httpx.Client() as client:
-                response = client.post(
-                    f"{google_config.GOOGLE_CALENDAR_API}/calendars/primary/events",
-                    headers=headers,
-                    json=event_data
-                )
-                response.raise_for_status()
-                
-                synced_event = response.json()
-                logger.info(f"Google Calendar - Local event {event.title} synced to Google: {synced_event.get('id')}")
-                events_synced += 1
-                
-                # Update the local event's google_event_id to the synced one
-                event.google_event_id = synced_event.get("id")
-                event.category = "google_sync_completed" # Mark as completed
-                event.synced_at = datetime.now() # Track when synced to Google
-                event.needs_google_sync = False # Mark as synced
-                
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Google Calendar - HTTP error syncing local event {event.title}: {e.response.status_code} - {e.response.text}")
-            # Don't raise here, continue with other events
+
+        calendar = quote(event.google_calendar_id or "primary", safe="")
+        key = f"event-{event.id}"
+
+        if event.is_deleted:
+            if not event.google_event_id:
+                db.delete(event)  # Never reached Google
+                done.append(change)
+                continue
+            requests.append((change, BatchRequest(key, "DELETE", f"/calendars/{calendar}/events/{quote(event.google_event_id, safe='')}")))
+        elif event.google_event_id:
+            requests.append((change, BatchRequest(key, "PATCH", f"/calendars/{calendar}/events/{quote(event.google_event_id, safe='')}", google_event_body(event))))
+        else:
+            body = google_event_body(event)
+            body["id"] = local_google_event_id(event)
+            requests.append((change, BatchRequest(key, "POST", f"/calendars/{calendar}/events", body)))
+
+    if not requests:
+        acknowledge(db, done)
+        return 0
+
+    logger.info(f"Google Calendar - Pushing {len(requests)} local changes to Google Calendar for user {user_id}")
+
+    results = await execute_calendar_batch(client, headers, [request for _, request in requests], user_id)
+
+    # Inserts that already landed on an earlier attempt: bring them up to date instead
+    conflicts = [
+        BatchRequest(request.key, "PATCH", f"{request.path}/{request.body['id']}", {k: v for k, v in request.body.items() if k != "id"})
+        for _, request in requests
+        if request.method == "POST" and results[request.key][0] == 409
+    ]
+    if conflicts:
+        logger.info(f"Google Calendar - {len(conflicts)} events were already on Google, patching them")
+        results.update(await execute_calendar_batch(client, headers, conflicts, user_id))
+        for request in conflicts:
+            events[int(request.key.split("-")[1])].google_event_id = request.path.rsplit("/", 1)[1]
+
+    events_synced = 0
+    events_deleted = 0
+    failed = 0
+    for change, request in requests:
+        event = events[change.entity_id]
+        status, body = results[request.key]
+
+        if request.method == "DELETE":
+            if status in (200, 204, 404, 410):  # Already gone on Google counts as deleted
+                db.delete(event)
+                events_deleted += 1
+                done.append(change)
+                continue
+        elif status == 200:
+            event.google_event_id = body.get("id") or event.google_event_id
+            event.google_calendar_id = event.google_calendar_id or "primary"
+            event.google_etag = body.get("etag")  # Our own write comes back in the next delta; skip it by etag
+            event.category = "google_sync_completed"
+            event.synced_at = datetime.now()
+            event.needs_google_sync = False
+            events_synced += 1
+            done.append(change)
             continue
-        except Exception as e:
-            logger.error(f"Google Calendar - Failed to sync local event {event.title}: {str(e)}")
-            # Don't raise here, continue with other events
+        elif request.method == "PATCH" and status in (404, 410):
+            # Deleted on Google while edited here; Google's deletion wins, as it does on pull
+            logger.info(f"Google Calendar - Event '{event.title}' no longer exists on Google, removing it locally")
+            db.delete(event)
+            done.append(change)
             continue
-    
-    logger.info(f"Google Calendar - Successfully synced {events_synced} new events and deleted {events_deleted} events for user {user_id}")
+
+        failed += 1
+        logger.error(f"Google Calendar - Failed to push {request.method} for event '{event.title}': {status}")
+        if 400 <= status < 500 and status != 429:
+            # Google won't accept this change; stop retrying it on every sync
+            event.needs_google_sync = False
+            done.append(change)
+
+    acknowledge(db, done)
+
+    logger.info(f"Google Calendar - Successfully synced {events_synced} events and deleted {events_deleted} events for user {user_id} ({failed} failed)")
     return events_synced + events_deleted
 
 @router.post("/create-event")
@@ -795,10 +1064,17 @@ async def create_local_event(
         category="google_sync",  # Mark for syncing to Google
         google_calendar_id=event.google_calendar_id or "primary",  # Default to primary calendar
         repeat=event.repeat,
-        linked_task=event.linked_task
+        linked_task=event.linked_task,
+        needs_google_sync=True
     )
     
     db.add(db_event)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="An event with this title and start time already exists")
+    record_change(db, current_user_id, GOOGLE_CALENDAR, db_event.id, "create")
     db.commit()
     db.refresh(db_event)
     
@@ -819,7 +1095,8 @@ def get_local_events(
     logger.info(f"Google Calendar - Getting local events for user {current_user_id}")
     
     events = db.query(models.Event).filter(
-        models.Event.user_id == current_user_id
+        models.Event.user_id == current_user_id,
+        models.Event.is_deleted.isnot(True)  # Deletions still waiting to be pushed
     ).order_by(models.Event.start_time.asc()).all()
     
     logger.info(f"Google Calendar - Found {len(events)} local events for user {current_user_id}")
@@ -854,8 +1131,15 @@ def update_local_event(
     if db_event.category == "google_sync_completed":
         db_event.category = "google_sync"
         db_event.synced_at = None
+    db_event.needs_google_sync = True
+    if is_connected(db, current_user_id, GOOGLE_CALENDAR):
+        record_change(db, current_user_id, GOOGLE_CALENDAR, db_event.id, "update")
     
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="An event with this title and start time already exists")
     db.refresh(db_event)
     
     logger.info(f"Google Calendar - Updated local event {db_event.title} for user {current_user_id}")
@@ -884,97 +1168,74 @@ def delete_local_event(
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found")
     
-    # If event was synced to Google, we should also delete it there
-    if db_event.google_event_id and db_event.google_calendar_id:
-        try:
-            connection = db.query(models.GoogleCalendarConnection).filter(
-                models.GoogleCalendarConnection.user_id == current_user_id
-            ).first()
-            
-            if connection:
-                headers = {"Authorization": f"Bearer {connection.access_token}"}
-                import urllib.parse
-                encoded_calendar_id = urllib.parse.quote(db_event.google_calendar_id, safe='')
-                
-                with httpx.Client() as client:
-                    response = client.delete(
-                        f"{google_config.GOOGLE_CALENDAR_API}/calendars/{encoded_calendar_id}/events/{db_event.google_event_id}",
-                        headers=headers
-                    )
-                    if response.status_code == 204:  # Successfully deleted
-                        logger.info(f"Google Calendar - Deleted event {db_event.title} from Google Calendar")
-                    else:
-                        logger.warning(f"Google Calendar - Failed to delete event from Google Calendar: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Google Calendar - Error deleting event from Google Calendar: {str(e)}")
-            # Continue with local deletion even if Google deletion fails
-    
-    # Delete the local event
-    db.delete(db_event)
+    if db_event.google_event_id:
+        # Removed from Google by the next push, then deleted here
+        db_event.is_deleted = True
+        db_event.deleted_at = datetime.now()
+        db_event.needs_google_sync = True
+        if is_connected(db, current_user_id, GOOGLE_CALENDAR):
+            record_change(db, current_user_id, GOOGLE_CALENDAR, db_event.id, "delete")
+    else:
+        db.delete(db_event)
     db.commit()
     
     logger.info(f"Google Calendar - Deleted local event {event_id} for user {current_user_id}")
     
     return {"message": "Event deleted successfully"}
 
+def duplicate_events_query(user_id: int, dialect: str):
+    """
+    IDs of a user's duplicate events (same title and start time), leaving one per group.
+
+    The kept event is the one with a Google event ID, then a (non-empty,
+    byte-wise greatest) description, then the highest ID.
+    """
+    description = func.coalesce(models.Event.description, "")
+    if dialect == "postgresql":
+        # Byte-wise order whatever the database collation; sqlite compares bytes already
+        description = description.collate("C")
+    rank = func.row_number().over(
+        partition_by=(models.Event.user_id, models.Event.title, models.Event.start_time),
+        order_by=(
+            models.Event.google_event_id.isnot(None).desc(),
+            description.desc(),
+            models.Event.id.desc()
+        )
+    ).label("rank")
+    ranked = select(models.Event.id, rank).where(models.Event.user_id == user_id).subquery()
+    return select(ranked.c.id).where(ranked.c.rank > 1)
+
+
 @router.post("/cleanup-duplicates")
 async def cleanup_duplicate_events(
+    dry_run: bool = False,
     db: Session = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
-    """Clean up duplicate events in the database"""
-    logger.info(f"Google Calendar - Starting duplicate cleanup for user {current_user_id}")
+    """Clean up duplicate events in the database; with dry_run, only list what would be removed"""
+    logger.info(f"Google Calendar - Starting duplicate cleanup for user {current_user_id} (dry run: {dry_run})")
     
     try:
-        # Find duplicate events by title, start_time, and user_id
-        from sqlalchemy import func
-        
-        # Get all events for the user
-        user_events = db.query(models.Event).filter(
-            models.Event.user_id == current_user_id
-        ).all()
+        duplicate_ids = duplicate_events_query(current_user_id, db.get_bind().dialect.name)
+        columns = (models.Event.id, models.Event.title, models.Event.start_time)
         
-        duplicates_removed = 0
-        
-        # Group events by title and start_time
-        event_groups = {}
-        for event in user_events:
-            key = (event.title, event.start_time)
-            if key not in event_groups:
-                event_groups[key] = []
-            event_groups[key].append(event)
-        
-        # Remove duplicates, keeping the one with the most complete data
-        for (title, start_time), events in event_groups.items():
-            if len(events) > 1:
-                logger.info(f"Google Calendar - Found {len(events)} duplicates for '{title}' at {start_time}")
-                
-                # Sort by completeness (events with google_event_id are more complete)
-                events.sort(key=lambda e: (
-                    e.google_event_id is not None,  # Has Google ID first
-                    e.description or "",  # Has description
-                    e.id  # Lower ID first (older)
-                ), reverse=True)
-                
-                # Keep the first (most complete) event, remove the rest
-                event_to_keep = events[0]
-                events_to_remove = events[1:]
-                
-                for event_to_remove in events_to_remove:
-                    logger.info(f"Google Calendar - Removing duplicate event: {event_to_remove.title} (ID: {event_to_remove.id})")
-                    db.delete(event_to_remove)
-                    duplicates_removed += 1
-        
-        db.commit()
+        if dry_run:
+            rows = db.execute(select(*columns).where(models.Event.id.in_(duplicate_ids))).all()
+        else:
+            # One set-based DELETE; RETURNING reports what went
+            rows = db.execute(
+                delete(models.Event).where(models.Event.id.in_(duplicate_ids)).returning(*columns)
+            ).all()
+            mark_events_changed(db, current_user_id)
+            db.commit()
         
-        logger.info(f"Google Calendar - Cleanup completed. Removed {duplicates_removed} duplicate events for user {current_user_id}")
+        logger.info(f"Google Calendar - Cleanup completed. {'Found' if dry_run else 'Removed'} {len(rows)} duplicate events for user {current_user_id}")
         
         return {
-            "message": "Duplicate cleanup completed successfully",
-            "duplicates_removed": duplicates_removed,
-            "total_events_after_cleanup": db.query(models.Event).filter(
-                models.Event.user_id == current_user_id
-            ).count()
+            "message": "Duplicate cleanup dry run completed" if dry_run else "Duplicate cleanup completed successfully",
+            "dry_run": dry_run,
+            "duplicates_removed": 0 if dry_run else len(rows),
+            "duplicates": [{"id": row.id, "title": row.title, "start_time": row.start_time} for row in rows]
         }
         
     except Exception as e:
@@ -1001,7 +1262,7 @@ def refresh_access_token(db: Session, connection: models.GoogleCalendarConnectio
     logger.info(f"Google Calendar - Refresh token exists: {bool(connection.refresh_token)}")
     
     try:
-        with httpx.Client() as client:
+        with http_clients.borrow("google_oauth") as client:
             response = client.post(google_config.GOOGLE_TOKEN_URL, data=token_data)
             response.raise_for_status()
             
@@ -1023,6 +1284,8 @@ def refresh_access_token(db: Session, connection: models.GoogleCalendarConnectio
         logger.error(f"Google Calendar - Failed to refresh token: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to refresh token: {str(e)}")
 
+token_manager.register("calendar", refresh_access_token, models.GoogleCalendarConnection)
+
 def parse_google_datetime(date_obj: dict) -> datetime:
     """Parse Google Calendar datetime object"""
     try:
@@ -9,6 +9,9 @@ from database import get_db
 from models import models
 from schemas import schemas
 from routes.auth.session import get_user_id
+from utils.interval_index import overlapping_events
+from utils.freebusy import MAX_FREEBUSY_DAYS, get_freebusy
+from utils.recurrence import is_recurring
 
 logger = logging.getLogger(__name__)
 
@@ -58,17 +61,9 @@ async def get_schedule_suggestions(
         
         end_date = start_date + timedelta(days=7)  # Look ahead 7 days
         
-        # Get local events
-        local_events = get_local_events(current_user_id, start_date, end_date, db)
-        logger.info(f"Smart Prioritization - Local events found: {len(local_events)}")
-        
-        # Get Google Calendar events if connected
-        google_events = await get_google_calendar_events(current_user_id, start_date, end_date)
-        logger.info(f"Smart Prioritization - Google events found: {len(google_events)}")
-        
-        # Combine and analyze events
-        all_events = local_events + google_events
-        busy_slots = analyze_busy_slots(all_events)
+        # Busy hours from the cached free/busy bitmap (covers local and synced Google events)
+        freebusy = get_freebusy(db, current_user_id, start_date, end_date)
+        busy_slots = freebusy.busy_hours(start_date, end_date)
         logger.info(f"Smart Prioritization - Busy slots: {busy_slots}")
         
         # Calculate free slots
@@ -188,8 +183,11 @@ async def analyze_conflicts(
         if not event:
             raise HTTPException(status_code=404, detail="Event not found")
 
-        # Find overlapping events
-        overlapping_events = find_overlapping_events(event, current_user_id, db)
+        # Find overlapping events; the bitmap rules out most events without a query
+        if has_possible_conflicts(event, current_user_id, db):
+            overlapping_events = find_overlapping_events(event, current_user_id, db)
+        else:
+            overlapping_events = []
 
         # Get Google Calendar conflicts if applicable
         google_conflicts = await get_google_calendar_conflicts(event, current_user_id)
@@ -247,21 +245,13 @@ async def get_task_schedule_suggestions(
         end_date = start_date + timedelta(days=7)  # Look ahead 7 days
         logger.info(f"Smart Prioritization - Date range: {start_date} to {end_date}")
         
-        # Get local events
-        local_events = get_local_events(current_user_id, start_date, end_date, db)
-        logger.info(f"Smart Prioritization - Local events found: {len(local_events)}")
-        
-        # Get Google Calendar events if connected
-        google_events = await get_google_calendar_events(current_user_id, start_date, end_date)
-        logger.info(f"Smart Prioritization - Google events found: {len(google_events)}")
-        
         # Get user's tasks for workload analysis
         user_tasks = get_user_tasks(current_user_id, db)
         logger.info(f"Smart Prioritization - User tasks found: {len(user_tasks)}")
         
-        # Combine and analyze events
-        all_events = local_events + google_events
-        busy_slots = analyze_busy_slots(all_events)
+        # Busy hours from the cached free/busy bitmap (covers local and synced Google events)
+        freebusy = get_freebusy(db, current_user_id, start_date, end_date)
+        busy_slots = freebusy.busy_hours(start_date, end_date)
         logger.info(f"Smart Prioritization - Busy slots: {busy_slots}")
         
         # Calculate free slots for task
@@ -358,84 +348,6 @@ async def get_user_preferences(user_id: int, db: Session):
         }
     }
 
-def get_local_events(user_id: int, start_date: datetime, end_date: datetime, db: Session):
-    """Get local calendar events for the date range"""
-    try:
-        events = db.query(models.Event).filter(
-            models.Event.user_id == user_id,
-            models.Event.start_time >= start_date,
-            models.Event.start_time <= end_date,
-            models.Event.archived == False
-        ).all()
-
-        logger.info(f"Smart Prioritization - Found {len(events)} local events for user {user_id}")
-        
-        return [
-            {
-                "id": event.id,
-                "title": event.title,
-                "start_time": event.start_time,
-                "end_time": event.end_time,
-                "category": event.category,
-                "source": "local"
-            }
-            for event in events
-        ]
-    except Exception as e:
-        logger.error(f"Smart Prioritization - Error fetching local events: {str(e)}")
-        return []
-
-async def get_google_calendar_events(user_id: int, start_date: datetime, end_date: datetime):
-    """Get Google Calendar events for the date range"""
-    try:
-        # Since Google Calendar events are synced to local database,
-        # we can get them from there with google_event_id filter
-        from database import get_db
-        db = next(get_db())
-        
-        google_events = db.query(models.Event).filter(
-            models.Event.user_id == user_id,
-            models.Event.start_time >= start_date,
-            models.Event.start_time <= end_date,
-            models.Event.archived == False,
-            models.Event.google_event_id.isnot(None)  # Only Google Calendar events
-        ).all()
-
-        logger.info(f"Smart Prioritization - Found {len(google_events)} Google Calendar events for user {user_id}")
-        
-        return [
-            {
-                "id": event.id,
-                "title": event.title,
-                "start_time": event.start_time,
-                "end_time": event.end_time,
-                "category": event.category,
-                "source": "google"
-            }
-            for event in google_events
-        ]
-    except Exception as e:
-        logger.error(f"Smart Prioritization - Error fetching Google Calendar events: {str(e)}")
-        return []
-
-def analyze_busy_slots(events: List[dict]):
-    """Analyze events to find busy time slots"""
-    busy_slots = []
-
-    for event in events:
-        start = event["start_time"]
-        end = event["end_time"]
-
-        # Convert to hour slots
-        start_hour = start.hour
-        end_hour = end.hour
-
-        for hour in range(start_hour, end_hour + 1):
-            if hour not in busy_slots:
-                busy_slots.append(hour)
-
-    return sorted(busy_slots)
-
 def calculate_free_slots(busy_slots: List[int], event_duration: int, user_prefs: dict, 
                         start_date: datetime, preferred_start: Optional[str], preferred_end: Optional[str]):
     """Calculate free time slots for the event"""
@@ -519,15 +431,19 @@ def rank_suggestions(free_slots: List[dict], user_prefs: dict, priority: str, ca
     # Sort by final score (highest first)
     return sorted(free_slots, key=lambda x: x["final_score"], reverse=True)
 
+def has_possible_conflicts(event: models.Event, user_id: int, db: Session):
+    """Cheap pre-check: False only when the free/busy bitmap shows nothing else overlapping the event"""
+    if event.start_time is None or event.end_time is None or event.end_time <= event.start_time:
+        return True
+    if event.archived or event.is_deleted or is_recurring(event) or event.end_time - event.start_time > timedelta(days=MAX_FREEBUSY_DAYS):
+        return True  # May not be in the bitmap as stored (or too long to build one for), so it can't rule the overlap out
+
+    freebusy = get_freebusy(db, user_id, event.start_time, event.end_time)
+    return freebusy.may_overlap(event.start_time, event.end_time)
+
 def find_overlapping_events(event: models.Event, user_id: int, db: Session):
     """Find events that overlap with the given event"""
-    overlapping = db.query(models.Event).filter(
-        models.Event.user_id == user_id,
-        models.Event.id != event.id,
-        models.Event.archived == False,
-        models.Event.start_time < event.end_time,
-        models.Event.end_time > event.start_time
-    ).all()
+    overlapping = overlapping_events(db, user_id, event.start_time, event.end_time, exclude_id=event.id)
 
     return [
         {
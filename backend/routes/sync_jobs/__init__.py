@@ -0,0 +1,4 @@
+# Sync job progress routes package
+from .sync_jobs import router
+
+__all__ = ["router"]
@@ -0,0 +1,244 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime, timedelta
+import logging
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from database import get_db, SessionLocal
+from models import models
+from routes.auth.session import get_user_id
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/sync-jobs", tags=["Sync Jobs"])
+
+# Checkpoints older than this are not resumed - a fresh sync is cheaper than replaying stale page tokens
+RESUME_WINDOW = timedelta(hours=24)
+
+def get_current_user_id(request: Request) -> int:
+    """Extract user ID from session cookie"""
+    session_id = request.cookies.get("session_id")
+
+    if not session_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    user_id = get_user_id(session_id)
+
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Session expired or invalid")
+
+    return user_id
+
+@router.get("/{job_id}")
+def get_sync_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Get status, progress and ETA of a sync job (cheap enough to poll)"""
+    job = db.query(models.SyncJob).filter(
+        models.SyncJob.id == job_id,
+        models.SyncJob.user_id == current_user_id
+    ).first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+
+    return serialize_sync_job(job)
+
+def serialize_sync_job(job: models.SyncJob) -> dict:
+    """Job row as a response dict with progress percentage and ETA"""
+    processed = job.processed_count or 0
+    total = job.total_count
+
+    progress = None
+    if job.status == "completed":
+        progress = 100.0
+    elif total:
+        progress = round(min(processed / total, 1.0) * 100, 1)
+
+    # ETA from the average rate since the job started
+    eta_seconds = None
+    if job.status == "running" and job.started_at and total and processed:
+        elapsed = (datetime.now() - job.started_at).total_seconds()
+        if elapsed > 0:
+            rate = processed / elapsed
+            eta_seconds = max(int((total - processed) / rate), 0)
+
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": progress,
+        "processed_count": processed,
+        "total_count": total,
+        "eta_seconds": eta_seconds,
+        "checkpoint": {
+            "label": job.label,
+            "page_token": job.page_token,
+            "label_processed_count": job.label_processed_count,
+            "last_history_id": job.last_history_id
+        },
+        "resumed_from": job.resumed_from,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "updated_at": job.updated_at
+    }
+
+def record_sync_job(scheduled_job) -> None:
+    """Sync scheduler listener: mirror a job's status into the sync_jobs table"""
+    db = SessionLocal()
+    try:
+        job = db.query(models.SyncJob).filter(models.SyncJob.id == scheduled_job.id).first()
+        if not job:
+            job = models.SyncJob(
+                id=scheduled_job.id,
+                user_id=scheduled_job.user_id,
+                kind=scheduled_job.kind,
+                created_at=scheduled_job.created_at
+            )
+            # Continuation windows start at their predecessor's checkpoint, so they are resumable even before running
+            resume = scheduled_job.params.get("resume")
+            if resume:
+                job.resumed_from = resume.get("job_id")
+                job.label = resume.get("label")
+                job.page_token = resume.get("page_token")
+                job.label_processed_count = resume.get("label_processed_count", 0)
+                job.processed_count = resume.get("processed_count", 0)
+                job.last_history_id = resume.get("last_history_id")
+                job.total_count = resume.get("total_count")
+            db.add(job)
+
+        job.status = scheduled_job.status
+        # job_id is added by the scheduler; the resume checkpoint is kept on the row itself
+        job.params = jsonable_encoder({
+            name: value for name, value in scheduled_job.params.items() if name not in ("job_id", "resume")
+        })
+        job.started_at = scheduled_job.started_at
+        job.finished_at = scheduled_job.finished_at
+        job.error = scheduled_job.error
+        if scheduled_job.result is not None:
+            job.result = jsonable_encoder(scheduled_job.result)
+
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Sync jobs - Failed to record job {scheduled_job.id}: {str(e)}")
+    finally:
+        db.close()
+
+def start_sync_job_progress(db: Session, job_id: Optional[str], total_count: int, resume: Optional[dict] = None) -> None:
+    """Set the expected total (and inherited progress when resuming) before a sync starts"""
+    if not job_id:
+        return
+
+    job = db.query(models.SyncJob).filter(models.SyncJob.id == job_id).first()
+    if not job:
+        return
+
+    job.total_count = total_count
+    if resume:
+        job.resumed_from = resume.get("job_id")
+        job.processed_count = resume.get("processed_count", 0)
+        job.last_history_id = resume.get("last_history_id")
+    db.commit()
+
+def save_sync_checkpoint(db: Session, job_id: Optional[str], state: dict) -> None:
+    """Persist the pipeline's checkpoint on the job row"""
+    if not job_id:
+        return
+
+    job = db.query(models.SyncJob).filter(models.SyncJob.id == job_id).first()
+    if not job:
+        return
+
+    job.label = state.get("label")
+    job.page_token = state.get("page_token")
+    job.label_processed_count = state.get("label_processed_count", 0)
+    job.processed_count = state.get("processed_count", 0)
+    job.last_history_id = state.get("last_history_id")
+    db.commit()
+
+def claim_resumable_sync_job(db: Session, user_id: int, kind: str, job_id: Optional[str]) -> Optional[dict]:
+    """
+    Find the newest interrupted/failed job with a checkpoint for this user and kind,
+    mark it as resumed by job_id and return its checkpoint state.
+    """
+    job = db.query(models.SyncJob).filter(
+        models.SyncJob.user_id == user_id,
+        models.SyncJob.kind == kind,
+        models.SyncJob.id != job_id,
+        models.SyncJob.status.in_(["interrupted", "failed"]),
+        models.SyncJob.label.isnot(None),
+        models.SyncJob.updated_at >= datetime.now() - RESUME_WINDOW
+    ).order_by(models.SyncJob.updated_at.desc()).first()
+
+    if not job:
+        return None
+
+    # A later job that already completed makes this checkpoint obsolete
+    newer_completed = db.query(models.SyncJob.id).filter(
+        models.SyncJob.user_id == user_id,
+        models.SyncJob.kind == kind,
+        models.SyncJob.status == "completed",
+        models.SyncJob.created_at > job.created_at
+    ).first()
+    if newer_completed:
+        return None
+
+    job.status = "resumed"
+    db.commit()
+
+    logger.info(f"Sync jobs - Job {job_id} resumes {kind} sync {job.id} at {job.label} ({job.processed_count} processed)")
+    return {
+        "job_id": job.id,
+        "label": job.label,
+        "page_token": job.page_token,
+        "label_processed_count": job.label_processed_count or 0,
+        "processed_count": job.processed_count or 0,
+        "total_count": job.total_count,
+        "last_history_id": job.last_history_id
+    }
+
+def mark_interrupted_sync_jobs() -> list:
+    """
+    On startup, flag jobs left queued/running by the previous process.
+
+    Returns (user_id, kind, params) to re-enqueue, one per user and kind;
+    params of several jobs for the same pair are merged as the scheduler
+    would have. Checkpoints are not passed along: the re-enqueued job claims
+    the interrupted row's latest one (claim_resumable_sync_job).
+    """
+    db = SessionLocal()
+    try:
+        jobs = db.query(models.SyncJob).filter(
+            models.SyncJob.status.in_(["queued", "running"])
+        ).order_by(models.SyncJob.created_at).all()
+
+        pending = {}
+        for job in jobs:
+            job.status = "interrupted"
+            params = pending.setdefault((job.user_id, job.kind), {})
+            for name, value in (job.params or {}).items():
+                if isinstance(params.get(name), list) and isinstance(value, list):
+                    params[name] = list(dict.fromkeys(params[name] + value))
+                else:
+                    params[name] = value
+        db.commit()
+
+        if jobs:
+            logger.info(f"Sync jobs - Marked {len(jobs)} unfinished jobs as interrupted")
+        return [(user_id, kind, params) for (user_id, kind), params in pending.items()]
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Sync jobs - Failed to mark interrupted jobs: {str(e)}")
+        return []
+    finally:
+        db.close()
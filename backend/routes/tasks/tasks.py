@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -468,7 +469,11 @@ def convert_task_to_event(
     )
     
     db.add(db_event)
-    db.flush()  # Get the event ID
+    try:
+        db.flush()  # Get the event ID
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="An event with this title and start time already exists")
     
     # Link task to event
     db_task.linked_event_id = db_event.id
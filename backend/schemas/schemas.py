@@ -160,6 +160,21 @@ class EventOut(EventCreate):
     class Config:
         from_attributes = True  # ✅ required for Pydantic v2
 
+class EventExceptionCreate(BaseModel):
+    original_start: datetime  # Occurrence being changed, as the series generates it
+    cancelled: bool = False
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+
+class EventExceptionOut(EventExceptionCreate):
+    id: int
+    event_id: int
+
+    class Config:
+        from_attributes = True
+
 # --- ✅ Google Calendar Integration Schemas ---
 
 class GoogleCalendarConnectionCreate(BaseModel):
@@ -344,6 +359,42 @@ class PaginatedEmailResponse(BaseModel):
     pageSize: int
 
 
+class EmailThreadResponse(BaseModel):
+    thread_id: str
+    subject: Optional[str] = None
+    snippet: Optional[str] = None
+    message_count: int = 0
+    participants: List[str] = []
+    labels: List[str] = []  # Union of the labels of every message in the thread
+    has_unread: bool = False
+    has_attachment: bool = False
+    latest_email_id: Optional[int] = None
+    latest_at: Optional[datetime] = None
+
+    @field_validator('participants', 'labels', mode='before')
+    @classmethod
+    def parse_json_list(cls, v):
+        """Convert JSON string to list if needed"""
+        if isinstance(v, str):
+            try:
+                return json.loads(v)
+            except (json.JSONDecodeError, TypeError):
+                return []
+        return v or []
+
+    class Config:
+        from_attributes = True
+
+class PaginatedEmailThreadResponse(BaseModel):
+    results: List[EmailThreadResponse]
+    nextCursor: Optional[str] = None  # Pass back as ?cursor= for the next page; None on the last page
+    pageSize: int
+
+class EmailThreadDetailResponse(BaseModel):
+    thread: EmailThreadResponse
+    messages: List[EmailResponse]  # Oldest first
+
+
 # --- ✅ Smart Suggestions Response (Optional) ---
 
 class TimeSlot(BaseModel):
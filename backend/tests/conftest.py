@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads DATABASE_URL when database.py is imported, so point it at a throwaway sqlite file first
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal, engine  # noqa: E402
+from models import models  # noqa: E402
+from utils.event_changes import mark_events_changed  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(username="alice", email="alice@example.com", password="x")
+    db.add(user)
+    db.flush()
+    # IDs restart with every test database, so drop whatever the event caches kept for this ID
+    mark_events_changed(db, user.id)
+    db.commit()
+    return user
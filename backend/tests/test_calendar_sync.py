@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+
+from models import models
+from routes.google_calendar import google_calendar
+
+
+def google_event(google_event_id, title="Standup", status="confirmed", start=None):
+    start = start or datetime.now().replace(microsecond=0) + timedelta(days=1)
+    return {
+        "id": google_event_id,
+        "status": status,
+        "etag": f'"{google_event_id}-1"',
+        "summary": title,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + timedelta(hours=1)).isoformat()},
+        "updated": datetime.utcnow().isoformat() + "Z"
+    }
+
+
+def delta(calendar_id, events):
+    return {"calendar_id": calendar_id, "events": events, "next_sync_token": "next", "full": False, "error": None}
+
+
+def pending_event(db, user, **fields):
+    start = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    event = models.Event(
+        title="Standup", start_time=start, end_time=start + timedelta(hours=1),
+        user_id=user.id, needs_google_sync=True, **fields
+    )
+    db.add(event)
+    db.commit()
+    return event
+
+
+def test_local_event_id_round_trips_through_the_google_id(db, user):
+    event = pending_event(db, user)
+    google_event_id = google_calendar.local_google_event_id(event)
+
+    assert google_calendar.local_event_id_from_google_id(google_event_id, user.id) == event.id
+    assert google_calendar.local_event_id_from_google_id(google_event_id, user.id + 1) is None
+    assert google_calendar.local_event_id_from_google_id("abc123def456", user.id) is None
+
+
+def test_pulled_copy_of_a_pushed_event_is_linked_not_duplicated(db, user):
+    # The push reached Google but its response was lost, so the local row has no Google ID yet
+    event = pending_event(db, user)
+    google_event_id = google_calendar.local_google_event_id(event)
+
+    changes = google_calendar.apply_calendar_events(db, user.id, [delta("primary", [google_event(google_event_id)])])
+    db.commit()
+
+    assert changes == {"primary": 0}
+    assert db.query(models.Event).filter(models.Event.user_id == user.id).count() == 1
+    db.refresh(event)
+    assert event.google_event_id == google_event_id
+    assert event.google_calendar_id == "primary"
+    assert event.needs_google_sync is True  # The pending change now goes out as a PATCH
+
+
+def test_pushed_event_cancelled_on_google_is_removed_locally(db, user):
+    event = pending_event(db, user)
+    google_event_id = google_calendar.local_google_event_id(event)
+
+    google_calendar.apply_calendar_events(db, user.id, [delta("primary", [google_event(google_event_id, status="cancelled")])])
+    db.commit()
+
+    assert db.query(models.Event).filter(models.Event.user_id == user.id).count() == 0
+
+
+class FakeCalendar:
+    """events.list for one calendar: pages of two, a nextSyncToken on the last page, 410 for the expired token"""
+
+    def __init__(self, events, expired_token="expired"):
+        self.events = events
+        self.expired_token = expired_token
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        params = dict(request.url.params)
+        self.requests.append(params)
+        if params.get("syncToken") == self.expired_token:
+            return httpx.Response(410, json={"error": {"message": "Sync token is no longer valid"}})
+        offset = int(params.get("pageToken", 0))
+        page = {"items": self.events[offset:offset + 2]}
+        if offset + 2 < len(self.events):
+            page["nextPageToken"] = str(offset + 2)
+        else:
+            page["nextSyncToken"] = "fresh"
+        return httpx.Response(200, json=page)
+
+    def fetch(self, sync_token):
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(self.handler)) as client:
+                return await google_calendar.fetch_calendar_changes(client, {}, "primary", 1, sync_token)
+        return asyncio.run(run())
+
+
+def test_incremental_fetch_sends_only_the_sync_token():
+    fake = FakeCalendar([google_event("a"), google_event("b"), google_event("c")])
+
+    result = fake.fetch("valid")
+
+    assert result["full"] is False
+    assert [event["id"] for event in result["events"]] == ["a", "b", "c"]
+    assert result["next_sync_token"] == "fresh"
+    assert all(request["syncToken"] == "valid" and "timeMin" not in request for request in fake.requests)
+
+
+def test_expired_sync_token_falls_back_to_a_full_listing():
+    fake = FakeCalendar([google_event("a"), google_event("b"), google_event("c")])
+
+    result = fake.fetch("expired")
+
+    assert result["error"] is None
+    assert result["full"] is True
+    assert [event["id"] for event in result["events"]] == ["a", "b", "c"]
+    assert result["next_sync_token"] == "fresh"
+    assert fake.requests[0]["syncToken"] == "expired"
+    assert all("syncToken" not in request and "timeMin" in request for request in fake.requests[1:])
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from models import models
+from routes.google_calendar import google_calendar
+
+START = datetime(2030, 1, 7, 9, 0)
+
+
+def add_events(db, user):
+    other = models.User(username="bob", email="bob@example.com", password="x")
+    db.add(other)
+    db.flush()
+
+    def event(event_id, title, owner=user, **fields):
+        return models.Event(id=event_id, title=title, start_time=START, end_time=START + timedelta(hours=1), user_id=owner.id, **fields)
+
+    db.add_all([
+        # A Google copy beats a local description, then a description beats a higher ID
+        event(1, "Standup", description="notes"),
+        event(2, "Standup", google_event_id="g-2", description="agenda"),
+        event(3, "Standup", google_event_id="g-3"),
+        # Without either, the highest ID stays
+        event(4, "Review", is_deleted=True),
+        event(5, "Review", description=""),
+        event(6, "Planning"),
+        # Another user's events are never touched
+        event(7, "Standup", owner=other, google_event_id="g-7"),
+        event(8, "Standup", owner=other, google_event_id="g-8"),
+    ])
+    db.commit()
+
+
+def cleanup(db, user, dry_run):
+    return asyncio.run(google_calendar.cleanup_duplicate_events(dry_run=dry_run, db=db, current_user_id=user.id))
+
+
+def test_dry_run_lists_duplicates_without_removing_them(db, user):
+    add_events(db, user)
+
+    result = cleanup(db, user, dry_run=True)
+
+    assert sorted(row["id"] for row in result["duplicates"]) == [1, 3, 4]
+    assert result["duplicates_removed"] == 0
+    assert db.query(models.Event).count() == 8
+
+
+def test_cleanup_keeps_one_event_per_title_and_start(db, user):
+    add_events(db, user)
+
+    result = cleanup(db, user, dry_run=False)
+
+    assert result["duplicates_removed"] == 3
+    assert sorted(row["id"] for row in result["duplicates"]) == [1, 3, 4]
+    assert sorted(event_id for (event_id,) in db.query(models.Event.id)) == [2, 5, 6, 7, 8]
+    assert cleanup(db, user, dry_run=False)["duplicates_removed"] == 0
@@ -0,0 +1,86 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models import models
+from utils import freebusy
+from utils.freebusy import SLOT, SLOTS_PER_DAY, FreeBusy, build_day_bitmaps, get_freebusy
+
+DAY = date(2026, 4, 6)
+MIDNIGHT = datetime(2026, 4, 6)
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "pure-python"])
+def numpy_available(request, monkeypatch):
+    if request.param and not freebusy.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(freebusy, "NUMPY_AVAILABLE", request.param)
+    return request.param
+
+
+def occurrence(start, end):
+    return {"start_time": start, "end_time": end}
+
+
+def coverage(occurrences, slot_start):
+    return sum(1 for item in occurrences if item["start_time"] < slot_start + SLOT and item["end_time"] > slot_start)
+
+
+def test_bitmaps_match_counting_each_slot(numpy_available):
+    rng = random.Random(3)
+    occurrences = []
+    for _ in range(40):
+        start = MIDNIGHT + timedelta(minutes=rng.randrange(-600, 3 * 24 * 60))
+        occurrences.append(occurrence(start, start + timedelta(minutes=rng.randrange(1, 240))))
+
+    fb = FreeBusy(DAY, build_day_bitmaps(occurrences, DAY, 3))
+
+    assert len(fb) == 3 * SLOTS_PER_DAY
+    for slot in range(len(fb)):
+        count = coverage(occurrences, MIDNIGHT + slot * SLOT)
+        assert bool(fb.busy[slot]) == (count > 0)
+        assert bool(fb.overlap[slot]) == (count > 1)
+
+
+def test_queries_on_a_day(numpy_available):
+    nine, ten = MIDNIGHT + timedelta(hours=9), MIDNIGHT + timedelta(hours=10)
+    fb = FreeBusy(DAY, build_day_bitmaps([
+        occurrence(nine, ten),
+        occurrence(ten, ten + timedelta(minutes=20)),  # Back to back, then partly into a slot
+        occurrence(MIDNIGHT + timedelta(hours=14), MIDNIGHT + timedelta(hours=15)),
+        occurrence(MIDNIGHT + timedelta(hours=14, minutes=30), MIDNIGHT + timedelta(hours=16)),
+    ], DAY, 1))
+
+    assert fb.is_free(MIDNIGHT + timedelta(hours=8), nine)
+    assert not fb.is_free(MIDNIGHT + timedelta(hours=8), nine + SLOT)
+    assert not fb.may_overlap(nine, MIDNIGHT + timedelta(hours=12))
+    assert fb.may_overlap(MIDNIGHT + timedelta(hours=14), MIDNIGHT + timedelta(hours=15))
+    assert fb.busy_periods() == [
+        (nine, ten + 2 * SLOT),
+        (MIDNIGHT + timedelta(hours=14), MIDNIGHT + timedelta(hours=16)),
+    ]
+    assert fb.busy_periods(nine + SLOT, MIDNIGHT + timedelta(hours=14, minutes=30)) == [
+        (nine + SLOT, ten + 2 * SLOT),
+        (MIDNIGHT + timedelta(hours=14), MIDNIGHT + timedelta(hours=14, minutes=30)),
+    ]
+    assert fb.busy_hours() == [9, 10, 14, 15]
+
+
+def test_get_freebusy_counts_recurring_events_and_sees_new_ones(db, user):
+    db.add(models.Event(title="Standup", user_id=user.id, repeat="daily",
+                        start_time=datetime(2026, 3, 1, 9), end_time=datetime(2026, 3, 1, 9, 30)))
+    db.add(models.Event(title="Archived", user_id=user.id, archived=True,
+                        start_time=datetime(2026, 4, 7, 13), end_time=datetime(2026, 4, 7, 14)))
+    db.commit()
+
+    week = get_freebusy(db, user.id, MIDNIGHT, MIDNIGHT + timedelta(days=7))
+    assert week.busy_hours() == [9]
+
+    db.add(models.Event(title="Lunch", user_id=user.id,
+                        start_time=datetime(2026, 4, 8, 12), end_time=datetime(2026, 4, 8, 13)))
+    db.commit()
+
+    week = get_freebusy(db, user.id, MIDNIGHT, MIDNIGHT + timedelta(days=7))
+    assert week.busy_hours() == [9, 12]
+    assert not week.is_free(datetime(2026, 4, 8, 12, 30), datetime(2026, 4, 8, 12, 45))
@@ -0,0 +1,101 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.fake_google import FakePubSub
+from config.google import google_config
+from models import models
+from routes.gmail import gmail, push
+
+TOKEN = "push-secret"
+
+
+def push_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(gmail.router, prefix="/api")
+    return app
+
+
+class FakeScheduler:
+    """Records sync_scheduler.enqueue calls instead of running jobs"""
+
+    def __init__(self):
+        self.enqueued = []
+
+    async def enqueue(self, user_id, kind, params=None, interactive=True):
+        self.enqueued.append((user_id, kind, interactive))
+
+
+def setup_push(db, user, monkeypatch, token=TOKEN):
+    db.add(models.GmailConnection(
+        user_id=user.id,
+        access_token="access",
+        refresh_token="refresh",
+        token_expiry=datetime(2030, 1, 1),
+        last_history_id="100",
+        email_address="alice@gmail.com"
+    ))
+    db.commit()
+
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(push, "sync_scheduler", scheduler)
+    monkeypatch.setattr(push, "_seen_messages", OrderedDict())
+    monkeypatch.setattr(push, "_announced_history", {})
+    monkeypatch.setattr(push, "_debounced_users", set())
+    monkeypatch.setattr(google_config, "GMAIL_PUSH_DEBOUNCE_SECONDS", 0.01)
+    monkeypatch.setattr(google_config, "GMAIL_PUSH_VERIFICATION_TOKEN", token)
+    return scheduler
+
+
+def test_push_notifications_queue_one_history_sync(db, user, monkeypatch):
+    scheduler = setup_push(db, user, monkeypatch)
+
+    async def run():
+        transport = httpx.ASGITransport(app=push_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            async def deliver(envelope):
+                response = await client.post("/api/gmail/push", params={"token": TOKEN}, json=envelope)
+                assert response.status_code == 200
+                return response.json()
+
+            pubsub = FakePubSub(subscriber=deliver)
+            first = pubsub.envelope("Alice@gmail.com", 150)
+            statuses = [
+                (await pubsub.push(first))["status"],
+                (await pubsub.push(first))["status"],  # Redelivery of the same Pub/Sub message
+                (await pubsub.push(pubsub.envelope("alice@gmail.com", 150)))["status"],
+                (await pubsub.push(pubsub.envelope("alice@gmail.com", 90)))["status"],
+                (await pubsub.push(pubsub.envelope("carol@gmail.com", 500)))["status"],
+            ]
+            await asyncio.sleep(0.1)
+            return statuses
+
+    statuses = asyncio.run(run())
+
+    assert statuses == ["scheduled", "duplicate", "debounced", "up_to_date", "ignored"]
+    assert scheduler.enqueued == [(user.id, "gmail_history", True)]
+    assert push._announced_history == {user.id: 150}
+    assert push._debounced_users == set()
+
+
+def test_push_requires_the_verification_token(db, user, monkeypatch):
+    scheduler = setup_push(db, user, monkeypatch)
+    envelope = FakePubSub().envelope("alice@gmail.com", 150)
+
+    async def post(**params):
+        transport = httpx.ASGITransport(app=push_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            return await client.post("/api/gmail/push", params=params, json=envelope)
+
+    assert asyncio.run(post()).status_code == 403
+    assert asyncio.run(post(token="wrong")).status_code == 403
+
+    monkeypatch.setattr(google_config, "GMAIL_PUSH_VERIFICATION_TOKEN", None)
+    assert asyncio.run(post(token=TOKEN)).status_code == 403
+    assert asyncio.run(post()).status_code == 403
+
+    assert scheduler.enqueued == []
+    assert push._announced_history == {}
@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import httpx
+
+from models import models
+from routes.gmail import gmail
+from utils.sync_outbox import GMAIL, pending_changes, record_change
+
+
+def make_email(labels, gmail_labels, **fields):
+    return models.Email(
+        id=fields.pop("id", 1),
+        gmail_id=fields.pop("gmail_id", "msg-1"),
+        sender="bob@example.com",
+        subject="Hello",
+        labels=json.dumps(labels),
+        gmail_labels=json.dumps(gmail_labels) if gmail_labels is not None else None,
+        **fields
+    )
+
+
+class FakeGmail:
+    """Answers messages.batchModify, recording each request body"""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if self.rejected & set(body["ids"]):
+            return httpx.Response(400, json={"error": {"message": "Invalid id"}})
+        return httpx.Response(204)
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+def test_label_changes_are_diffed_against_gmail_labels():
+    email = make_email(["inbox", "starred"], ["inbox", "unread", "important"])
+
+    add_labels, remove_labels = gmail.gmail_label_changes(email)
+
+    assert add_labels == {"STARRED"}
+    assert remove_labels == {"UNREAD", "IMPORTANT"}
+
+
+def test_label_changes_ignore_local_only_labels():
+    email = make_email(["archived", "project-x", "category_social"], ["inbox", "category_updates"])
+
+    add_labels, remove_labels = gmail.gmail_label_changes(email)
+
+    assert add_labels == {"CATEGORY_SOCIAL"}
+    assert remove_labels == {"INBOX", "CATEGORY_UPDATES"}
+
+
+def test_label_changes_without_gmail_labels_push_action_state():
+    email = make_email(["inbox", "starred"], None)
+
+    add_labels, remove_labels = gmail.gmail_label_changes(email)
+
+    assert add_labels == {"INBOX", "STARRED"}
+    assert remove_labels == {"UNREAD", "TRASH"}
+
+
+def test_local_star_and_read_reach_gmail_through_batch_modify(db, user, monkeypatch):
+    fake = FakeGmail()
+    monkeypatch.setattr(gmail.http_clients, "get_async_client", lambda name: fake.client())
+    emails = [
+        make_email(["inbox", "unread"], ["inbox", "unread"], id=email_id, gmail_id=f"msg-{email_id}", user_id=user.id)
+        for email_id in (1, 2)
+    ]
+    db.add_all(emails)
+    db.commit()
+
+    # What the star and mark_read actions do to an email
+    for email in emails:
+        email.labels = json.dumps(["inbox", "starred"])
+        email.needs_gmail_sync = True
+        record_change(db, user.id, GMAIL, email.id, "update")
+    db.commit()
+
+    result = asyncio.run(gmail.sync_local_to_gmail(db, None, user.id, {}))
+
+    assert fake.requests == [{"ids": ["msg-1", "msg-2"], "addLabelIds": ["STARRED"], "removeLabelIds": ["UNREAD"]}]
+    assert result["updates_sent"] == 2
+    assert result["batches"] == 1
+    for email in emails:
+        db.refresh(email)
+        assert email.needs_gmail_sync is False
+        assert json.loads(email.gmail_labels) == ["inbox", "starred"]
+    assert pending_changes(db, user.id, GMAIL) == []
+
+
+def test_unchanged_labels_are_acknowledged_without_a_request(db, user, monkeypatch):
+    fake = FakeGmail()
+    monkeypatch.setattr(gmail.http_clients, "get_async_client", lambda name: fake.client())
+    db.add(make_email(["inbox"], ["inbox"], user_id=user.id, needs_gmail_sync=True))
+    record_change(db, user.id, GMAIL, 1, "update")
+    db.commit()
+
+    asyncio.run(gmail.sync_local_to_gmail(db, None, user.id, {}))
+
+    assert fake.requests == []
+    assert pending_changes(db, user.id, GMAIL) == []
+
+
+def test_trashed_emails_are_deleted_with_their_attachments(db, user, monkeypatch, tmp_path):
+    fake = FakeGmail()
+    monkeypatch.setattr(gmail.http_clients, "get_async_client", lambda name: fake.client())
+    stored = tmp_path / "upload"
+    stored.write_bytes(b"report")
+    emails = [
+        make_email(["inbox"], ["inbox"], id=email_id, gmail_id=f"msg-{email_id}", user_id=user.id,
+                   is_deleted=True, needs_gmail_sync=True)
+        for email_id in (1, 2)
+    ]
+    db.add_all(emails)
+    db.flush()
+    db.add(models.EmailAttachment(email_id=1, filename="report.pdf", mime_type="application/pdf", storage_path=str(stored)))
+    db.add(models.EmailAttachment(email_id=2, filename="inline.png", mime_type="image/png", data="aGk="))
+    for email in emails:
+        record_change(db, user.id, GMAIL, email.id, "delete")
+    db.commit()
+
+    result = asyncio.run(gmail.sync_local_to_gmail(db, None, user.id, {}))
+
+    assert fake.requests == [{"ids": ["msg-1", "msg-2"], "addLabelIds": ["TRASH"]}]
+    assert result["emails_deleted"] == 2
+    assert db.query(models.Email).count() == 0
+    assert db.query(models.EmailAttachment).count() == 0
+    assert not stored.exists()
+    assert pending_changes(db, user.id, GMAIL) == []
+
+
+def test_batch_modify_bisects_around_a_rejected_id():
+    fake = FakeGmail(rejected={"msg-3"})
+    gmail_ids = [f"msg-{index}" for index in range(8)]
+
+    async def run():
+        async with fake.client() as client:
+            return await gmail.batch_modify_gmail_messages(client, {}, gmail_ids, {"STARRED"}, set())
+
+    outcomes = asyncio.run(run())
+
+    assert outcomes == {gmail_id: gmail_id != "msg-3" for gmail_id in gmail_ids}
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1: the rejected half is split until the bad ID stands alone
+    assert len(fake.requests) == 7
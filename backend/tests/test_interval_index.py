@@ -0,0 +1,62 @@
+import random
+from datetime import datetime, timedelta
+
+from models import models
+from utils.interval_index import IntervalIndex, overlapping_events
+
+BASE = datetime(2026, 3, 2, 8, 0)
+
+
+def add_event(db, user, title, start_hour, end_hour, **fields):
+    event = models.Event(
+        title=title, user_id=user.id,
+        start_time=BASE + timedelta(hours=start_hour), end_time=BASE + timedelta(hours=end_hour),
+        **fields
+    )
+    db.add(event)
+    db.commit()
+    return event
+
+
+def test_interval_index_matches_a_linear_scan():
+    rng = random.Random(7)
+    intervals = []
+    for value in range(500):
+        start = rng.randrange(0, 10000)
+        intervals.append((start, start + rng.randrange(0, 300), value))
+    index = IntervalIndex(intervals)
+
+    for _ in range(200):
+        start = rng.randrange(-100, 10100)
+        end = start + rng.randrange(1, 500)
+        expected = {value for lo, hi, value in intervals if lo < end and hi > start}
+        assert set(index.overlapping(start, end)) == expected
+
+
+def test_intervals_are_half_open():
+    index = IntervalIndex([(0, 10, "a"), (10, 20, "b")])
+
+    assert index.overlapping(10, 11) == ["b"]
+    assert index.overlapping(9, 10) == ["a"]
+    assert index.overlapping(20, 30) == []
+    assert IntervalIndex([]).overlapping(0, 10) == []
+
+
+def test_overlapping_events_skip_archived_deleted_and_excluded(db, user):
+    meeting = add_event(db, user, "Meeting", 1, 3)
+    add_event(db, user, "Archived", 1, 3, archived=True)
+    add_event(db, user, "Deleted", 1, 3, is_deleted=True)
+    later = add_event(db, user, "Later", 5, 6)
+
+    window = (BASE + timedelta(hours=2), BASE + timedelta(hours=6))
+    assert [event.id for event in overlapping_events(db, user.id, *window)] == [meeting.id, later.id]
+    assert [event.id for event in overlapping_events(db, user.id, *window, exclude_id=meeting.id)] == [later.id]
+
+
+def test_new_events_show_up_after_commit(db, user):
+    window = (BASE, BASE + timedelta(hours=4))
+    assert overlapping_events(db, user.id, *window) == []  # Builds and caches the user's empty index
+
+    event = add_event(db, user, "Call", 2, 3)
+
+    assert [found.id for found in overlapping_events(db, user.id, *window)] == [event.id]
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from models import models
+from utils.recurrence import (
+    events_in_window, expand_event, is_active_at, last_occurrence_end, occurrence_starts, parse_repeat
+)
+
+START = datetime(2026, 1, 31, 9, 0)
+HOUR = timedelta(hours=1)
+
+
+def series(repeat, start=START, duration=HOUR, **fields):
+    return models.Event(id=fields.pop("id", 1), title="Series", start_time=start, end_time=start + duration, repeat=repeat, **fields)
+
+
+def exception(original_start, **fields):
+    values = dict(cancelled=False, start_time=None, end_time=None, title=None, description=None)
+    values.update(fields)
+    return SimpleNamespace(original_start=original_start, **values)
+
+
+def test_parse_repeat_accepts_form_values_and_rrules():
+    assert parse_repeat("none") is None
+    assert parse_repeat("") is None
+    assert parse_repeat("weekly").freq == "WEEKLY"
+
+    rule = parse_repeat("RRULE:FREQ=DAILY;INTERVAL=2;COUNT=5")
+    assert (rule.freq, rule.interval, rule.count) == ("DAILY", 2, 5)
+    assert parse_repeat("FREQ=WEEKLY;UNTIL=20260301").until == datetime(2026, 3, 1, 23, 59, 59)
+    assert parse_repeat("FREQ=HOURLY") is None
+    assert parse_repeat("FREQ=DAILY;COUNT=x") is None
+
+
+def test_monthly_series_skip_months_without_the_day():
+    starts = list(occurrence_starts(START, HOUR, parse_repeat("monthly"), START, datetime(2026, 6, 1)))
+
+    assert [start.month for start in starts] == [1, 3, 5]
+
+
+def test_window_far_into_a_series_matches_walking_it_from_the_start():
+    for repeat in ("daily", "FREQ=WEEKLY;INTERVAL=3", "monthly", "FREQ=YEARLY;INTERVAL=2", "FREQ=MONTHLY;COUNT=40"):
+        rule = parse_repeat(repeat)
+        window_start, window_end = datetime(2029, 5, 1), datetime(2029, 9, 1)
+        walked = [
+            start for start in occurrence_starts(START, HOUR, rule, START, window_end)
+            if start + HOUR > window_start
+        ]
+        assert list(occurrence_starts(START, HOUR, rule, window_start, window_end)) == walked, repeat
+
+
+def test_count_and_until_end_the_series():
+    assert last_occurrence_end(series("FREQ=DAILY;COUNT=3")) == START + timedelta(days=2) + HOUR
+    assert last_occurrence_end(series("FREQ=WEEKLY;UNTIL=20260215T090000")) == datetime(2026, 2, 14, 10, 0)
+    assert last_occurrence_end(series("daily")) is None
+    assert last_occurrence_end(series("none")) == START + HOUR
+
+    assert is_active_at(series("FREQ=DAILY;COUNT=3"), START + timedelta(days=2))
+    assert not is_active_at(series("FREQ=DAILY;COUNT=3"), START + timedelta(days=3))
+
+
+def test_exceptions_cancel_and_move_occurrences():
+    event = series("daily")
+    second, third = START + timedelta(days=1), START + timedelta(days=2)
+    moved_in = START + timedelta(days=10)
+    exceptions = [
+        exception(second, cancelled=True),
+        exception(third, start_time=third + 3 * HOUR, title="Moved"),
+        exception(moved_in, start_time=START + timedelta(days=3, hours=5)),
+    ]
+
+    occurrences = list(expand_event(event, START, START + timedelta(days=4), exceptions))
+
+    assert [(occurrence["original_start"], occurrence["start_time"]) for occurrence in occurrences] == [
+        (START, START),
+        (third, third + 3 * HOUR),
+        (START + timedelta(days=3), START + timedelta(days=3)),
+        (moved_in, START + timedelta(days=3, hours=5)),
+    ]
+    assert occurrences[1]["title"] == "Moved"
+    assert occurrences[1]["end_time"] == third + 4 * HOUR
+
+
+def test_events_in_window_include_series_started_before_it(db, user):
+    db.add_all([
+        models.Event(title="Standup", user_id=user.id, start_time=START, end_time=START + HOUR, repeat="daily"),
+        models.Event(title="Old one-off", user_id=user.id, start_time=START, end_time=START + HOUR, repeat="none"),
+        models.Event(title="One-off", user_id=user.id, start_time=datetime(2026, 3, 10, 14), end_time=datetime(2026, 3, 10, 15)),
+    ])
+    db.commit()
+
+    occurrences = events_in_window(db, user.id, datetime(2026, 3, 10), datetime(2026, 3, 11))
+
+    assert [(occurrence["title"], occurrence["start_time"].hour) for occurrence in occurrences] == [("Standup", 9), ("One-off", 14)]
+    assert occurrences[0]["occurrence_id"] == "1:2026-03-10T09:00:00"
@@ -0,0 +1,114 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from models import models
+from routes.emails import emails
+from routes.events import events
+from schemas import schemas
+from utils.sync_outbox import GMAIL, GOOGLE_CALENDAR, acknowledge, backfill_sync_outbox, pending_changes, record_change
+
+
+def connect_calendar(db, user):
+    db.add(models.GoogleCalendarConnection(
+        user_id=user.id, access_token="token", refresh_token="refresh", token_expiry=datetime.now() + timedelta(hours=1)
+    ))
+    db.commit()
+
+
+def connect_gmail(db, user):
+    db.add(models.GmailConnection(
+        user_id=user.id, access_token="token", refresh_token="refresh", token_expiry=datetime.now() + timedelta(hours=1)
+    ))
+    db.commit()
+
+
+def new_event(title="Review"):
+    start = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    return schemas.EventCreate(title=title, description="", start_time=start, end_time=start + timedelta(hours=1))
+
+
+def test_pending_changes_fold_entries_per_entity(db, user):
+    for entity_id, operation in ((7, "update"), (8, "create"), (7, "delete"), (8, "update")):
+        record_change(db, user.id, GOOGLE_CALENDAR, entity_id, operation)
+    db.commit()
+
+    changes = pending_changes(db, user.id, GOOGLE_CALENDAR)
+
+    assert [(change.entity_id, change.operation, len(change.entry_ids)) for change in changes] == [(7, "delete", 2), (8, "create", 2)]
+
+    acknowledge(db, changes[:1])
+    db.commit()
+    assert [change.entity_id for change in pending_changes(db, user.id, GOOGLE_CALENDAR)] == [8]
+
+
+def test_pending_changes_page_past_entries_left_for_retry(db, user):
+    for entity_id in range(1, 6):
+        record_change(db, user.id, GOOGLE_CALENDAR, entity_id, "update")
+    db.commit()
+
+    first = pending_changes(db, user.id, GOOGLE_CALENDAR, limit=2)
+    second = pending_changes(db, user.id, GOOGLE_CALENDAR, after_id=max(first[-1].entry_ids), limit=2)
+
+    assert [change.entity_id for change in first] == [1, 2]
+    assert [change.entity_id for change in second] == [3, 4]
+
+
+def test_event_edits_are_recorded_only_with_a_calendar_connection(db, user):
+    event = events.create_event(new_event(), db=db, current_user_id=user.id)
+
+    assert event.needs_google_sync is True
+    assert pending_changes(db, user.id, GOOGLE_CALENDAR) == []
+
+    connect_calendar(db, user)
+    other = events.create_event(new_event("Planning"), db=db, current_user_id=user.id)
+
+    assert [change.entity_id for change in pending_changes(db, user.id, GOOGLE_CALENDAR)] == [other.id]
+
+
+def test_backfill_queues_flagged_rows_of_connected_users_only(db, user):
+    events.create_event(new_event(), db=db, current_user_id=user.id)
+    assert backfill_sync_outbox() == 0
+
+    connect_calendar(db, user)
+    assert backfill_sync_outbox(user.id) == 1
+    assert backfill_sync_outbox(user.id) == 0  # Already queued
+    assert len(pending_changes(db, user.id, GOOGLE_CALENDAR)) == 1
+
+
+def test_backfill_skips_emails_that_never_came_from_gmail(db, user):
+    connect_gmail(db, user)
+    db.add_all([
+        models.Email(id=1, user_id=user.id, sender="alice@example.com", subject="Draft", needs_gmail_sync=True),
+        models.Email(id=2, user_id=user.id, gmail_id="msg-2", sender="bob@example.com", subject="Hello", needs_gmail_sync=True)
+    ])
+    db.commit()
+
+    assert backfill_sync_outbox(user.id) == 1
+    assert [change.entity_id for change in pending_changes(db, user.id, GMAIL)] == [2]
+
+
+def test_label_and_read_changes_reach_the_gmail_outbox(db, user, monkeypatch):
+    monkeypatch.setattr(emails, "get_user_id", lambda session_id: user.id)
+    request = SimpleNamespace(cookies={})
+    connect_gmail(db, user)
+    db.add_all([
+        models.Email(id=1, user_id=user.id, gmail_id="msg-1", sender="bob@example.com", subject="Hello", labels='["inbox", "unread"]'),
+        models.Email(id=2, user_id=user.id, gmail_id="msg-2", sender="bob@example.com", subject="Report", labels='["inbox", "unread"]'),
+        models.Email(id=3, user_id=user.id, sender="alice@example.com", subject="Draft", labels='["unread"]')
+    ])
+    db.commit()
+
+    asyncio.run(emails.add_label_to_email(1, {"label_name": "starred"}, request, db=db))
+    asyncio.run(emails.remove_label_from_email(2, "inbox", request, db=db))
+    asyncio.run(emails.add_label_to_email(3, {"label_name": "starred"}, request, db=db))
+    assert [change.entity_id for change in pending_changes(db, user.id, GMAIL)] == [1, 2]
+
+    emails.mark_all_as_read(category=None, db=db)
+
+    changes = pending_changes(db, user.id, GMAIL)
+    assert [(change.entity_id, len(change.entry_ids)) for change in changes] == [(1, 2), (2, 2)]
+    for email in db.query(models.Email).all():
+        assert "unread" not in json.loads(email.labels)
+        assert email.needs_gmail_sync is bool(email.gmail_id)
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from config.google import google_config
+from models import models
+from routes.gmail import sync_pipeline
+from routes.gmail.sync_pipeline import GmailSyncPipeline
+
+MESSAGE_IDS = ["m0", "m1", "m2", "m3", "m4", "m5"]
+
+
+def gmail_handler(request: httpx.Request) -> httpx.Response:
+    """messages.list in pages of two (page token = offset) and metadata-only messages.get"""
+    path = request.url.path
+    if path.endswith("/messages"):
+        offset = int(request.url.params.get("pageToken", 0))
+        page = {"messages": [{"id": gmail_id} for gmail_id in MESSAGE_IDS[offset:offset + 2]]}
+        if offset + 2 < len(MESSAGE_IDS):
+            page["nextPageToken"] = str(offset + 2)
+        return httpx.Response(200, json=page)
+    gmail_id = path.rsplit("/", 1)[1]
+    return httpx.Response(200, json={
+        "id": gmail_id,
+        "threadId": f"thread-{gmail_id}",
+        "labelIds": ["INBOX"],
+        "historyId": "100",
+        "payload": {"mimeType": "text/plain", "headers": [{"name": "Subject", "value": gmail_id}]}
+    })
+
+
+@pytest.fixture
+def connection(db, user, monkeypatch):
+    # One fetch and one parse worker keep batches in listing order
+    monkeypatch.setattr(google_config, "GMAIL_SYNC_FETCH_CONCURRENCY", 1)
+    monkeypatch.setattr(google_config, "GMAIL_SYNC_PARSE_WORKERS", 1)
+    monkeypatch.setattr(google_config, "GMAIL_SYNC_PARSE_PROCESSES", 0)
+    monkeypatch.setattr(sync_pipeline.http_clients, "get_async_client",
+                        lambda name: httpx.AsyncClient(transport=httpx.MockTransport(gmail_handler)))
+    connection = models.GmailConnection(
+        user_id=user.id, access_token="token", refresh_token="refresh", token_expiry=datetime.now() + timedelta(hours=1)
+    )
+    db.add(connection)
+    db.commit()
+    return connection
+
+
+def run_pipeline(db, connection, checkpoints):
+    pipeline = GmailSyncPipeline(
+        db, connection, connection.user_id, {"Authorization": "Bearer token"},
+        on_checkpoint=lambda session, state: checkpoints.append(state),
+        persist_batch_size=2
+    )
+    return pipeline, asyncio.run(pipeline.run({"INBOX": len(MESSAGE_IDS)}))
+
+
+def stored_ids(db, user):
+    return {row.gmail_id for row in db.query(models.Email.gmail_id).filter(models.Email.user_id == user.id)}
+
+
+def test_pipeline_stores_every_listed_message(db, user, connection):
+    checkpoints = []
+
+    _, result = run_pipeline(db, connection, checkpoints)
+
+    assert result["total_emails_synced"] == len(MESSAGE_IDS)
+    assert stored_ids(db, user) == set(MESSAGE_IDS)
+    assert checkpoints[-1]["processed_count"] == len(MESSAGE_IDS)
+    assert "page_token" not in checkpoints[-1]  # Label finished
+
+
+def test_failed_batch_is_not_checkpointed_past(db, user, connection, monkeypatch):
+    persist_batch = GmailSyncPipeline._persist_batch
+    attempts = []
+
+    def persist_failing_on_m3(self, parsed_emails):
+        if any(parsed_email["id"] == "m3" for parsed_email in parsed_emails):
+            attempts.append(len(parsed_emails))
+            raise RuntimeError("database went away")
+        return persist_batch(self, parsed_emails)
+
+    monkeypatch.setattr(GmailSyncPipeline, "_persist_batch", persist_failing_on_m3)
+    checkpoints = []
+
+    with pytest.raises(RuntimeError, match="could not be stored"):
+        run_pipeline(db, connection, checkpoints)
+
+    assert len(attempts) == GmailSyncPipeline.PERSIST_ATTEMPTS
+    assert {"m0", "m1"} <= stored_ids(db, user)
+    assert not {"m2", "m3"} & stored_ids(db, user)
+    # Every checkpoint still points at the page holding m2/m3, so a resumed run lists it again
+    assert checkpoints and all(checkpoint["page_token"] == "2" for checkpoint in checkpoints)
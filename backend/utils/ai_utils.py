@@ -14,9 +14,10 @@ logger = logging.getLogger(__name__)
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-# Configure OpenAI client
+# Configure OpenAI client (on the shared pooled HTTP client)
 if OPENAI_KEY:
-    client = openai.OpenAI(api_key=OPENAI_KEY)
+    from utils.http_clients import http_clients
+    client = openai.OpenAI(api_key=OPENAI_KEY, http_client=http_clients.get_client("openai"))
     logger.info("OpenAI API key loaded successfully")
 else:
     logger.warning("OpenAI API key not found in environment variables")
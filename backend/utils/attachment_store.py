@@ -0,0 +1,52 @@
+import logging
+import os
+import uuid
+from typing import BinaryIO, Tuple
+
+from config.google import google_config
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class AttachmentTooLarge(Exception):
+    pass
+
+
+def store_attachment(fileobj: BinaryIO, user_id: int) -> Tuple[str, int]:
+    """
+    Copy an uploaded file into EMAIL_ATTACHMENT_DIR one chunk at a time.
+
+    Returns (path, size). Files over EMAIL_ATTACHMENT_MAX_BYTES are removed
+    again and AttachmentTooLarge is raised.
+    """
+    directory = os.path.join(google_config.EMAIL_ATTACHMENT_DIR, str(user_id))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, uuid.uuid4().hex)
+
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = fileobj.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > google_config.EMAIL_ATTACHMENT_MAX_BYTES:
+                    raise AttachmentTooLarge(f"Attachment exceeds {google_config.EMAIL_ATTACHMENT_MAX_BYTES} bytes")
+                out.write(chunk)
+    except Exception:
+        remove_attachment(path)
+        raise
+
+    return path, size
+
+
+def remove_attachment(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to remove stored attachment {path}: {str(e)}")
@@ -0,0 +1,178 @@
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from email.utils import getaddresses
+from typing import Iterable, Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+MAX_PARTICIPANTS = 20
+REBUILD_CHUNK_SIZE = 500
+
+# Email columns whose changes can change a thread summary
+THREAD_FIELDS = ("thread_id", "labels", "is_deleted", "received_at", "sender", "to_recipients", "subject", "snippet", "has_attachment")
+
+
+def _parse_labels(raw: Optional[str]) -> list:
+    if not raw:
+        return []
+    try:
+        labels = json.loads(raw)
+        return labels if isinstance(labels, list) else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def _addresses(*headers: Optional[str]) -> list:
+    return [address.lower() for _, address in getaddresses([header for header in headers if header]) if address]
+
+
+def build_thread_summary(user_id: int, thread_id: str, rows: list) -> dict:
+    """Summary row for one thread from its emails, ordered oldest first"""
+    participants = []
+    labels = []
+    for row in rows:
+        for address in _addresses(row.sender, row.to_recipients):
+            if address not in participants and len(participants) < MAX_PARTICIPANTS:
+                participants.append(address)
+        for label in _parse_labels(row.labels):
+            if label not in labels:
+                labels.append(label)
+
+    latest = rows[-1]
+    return {
+        "user_id": user_id,
+        "thread_id": thread_id,
+        "subject": rows[0].subject,
+        "snippet": latest.snippet,
+        "message_count": len(rows),
+        "participants": json.dumps(participants),
+        "labels": json.dumps(labels),
+        "has_unread": "unread" in labels,
+        "has_attachment": any(row.has_attachment for row in rows),
+        "latest_email_id": latest.id,
+        "latest_at": latest.received_at,
+        "updated_at": datetime.now()
+    }
+
+
+def refresh_email_threads(db: Session, user_id: int, thread_ids: Iterable[str]) -> int:
+    """
+    Recompute the email_threads rows of the given threads.
+
+    Costs one query over just those threads' emails plus one upsert, so ingest
+    and label changes stay proportional to the threads they touch. Threads
+    left without (non-deleted) emails are removed. Does not commit.
+    """
+    thread_ids = sorted({thread_id for thread_id in thread_ids if thread_id})
+    if not thread_ids:
+        return 0
+
+    rows = db.execute(
+        select(
+            models.Email.id,
+            models.Email.thread_id,
+            models.Email.sender,
+            models.Email.to_recipients,
+            models.Email.subject,
+            models.Email.snippet,
+            models.Email.labels,
+            models.Email.has_attachment,
+            models.Email.received_at
+        ).where(
+            models.Email.user_id == user_id,
+            models.Email.thread_id.in_(thread_ids),
+            models.Email.is_deleted.isnot(True)
+        ).order_by(models.Email.thread_id, models.Email.received_at, models.Email.id)
+    ).all()
+
+    by_thread = defaultdict(list)
+    for row in rows:
+        by_thread[row.thread_id].append(row)
+
+    summaries = [build_thread_summary(user_id, thread_id, thread_rows) for thread_id, thread_rows in by_thread.items()]
+    if summaries:
+        insert_stmt = pg_insert(models.EmailThread).values(summaries)
+        db.execute(insert_stmt.on_conflict_do_update(
+            index_elements=["user_id", "thread_id"],
+            set_={column: insert_stmt.excluded[column] for column in summaries[0] if column not in ("user_id", "thread_id")}
+        ))
+
+    empty = [thread_id for thread_id in thread_ids if thread_id not in by_thread]
+    if empty:
+        db.execute(
+            models.EmailThread.__table__.delete().where(
+                models.EmailThread.user_id == user_id,
+                models.EmailThread.thread_id.in_(empty)
+            )
+        )
+
+    return len(summaries)
+
+
+def rebuild_email_threads(db: Session, user_id: int) -> int:
+    """Rebuild every thread summary of a user (e.g. for mail stored before threads existed)"""
+    thread_ids = [row[0] for row in db.query(models.Email.thread_id).filter(
+        models.Email.user_id == user_id,
+        models.Email.thread_id.isnot(None)
+    ).distinct().all()]
+
+    db.query(models.EmailThread).filter(models.EmailThread.user_id == user_id).delete(synchronize_session=False)
+
+    refreshed = 0
+    for start in range(0, len(thread_ids), REBUILD_CHUNK_SIZE):
+        refreshed += refresh_email_threads(db, user_id, thread_ids[start:start + REBUILD_CHUNK_SIZE])
+    logger.info(f"Email threads - Rebuilt {refreshed} threads for user {user_id}")
+    return refreshed
+
+
+def _collect_thread_changes(session: Session, flush_context, instances):
+    """before_flush: remember which threads the pending Email changes touch"""
+    pending = session.info.setdefault("email_thread_keys", set())
+
+    for email in session.new:
+        if isinstance(email, models.Email) and email.thread_id:
+            pending.add((email.user_id, email.thread_id))
+
+    for email in session.deleted:
+        if isinstance(email, models.Email) and email.thread_id:
+            pending.add((email.user_id, email.thread_id))
+
+    for email in session.dirty:
+        if not isinstance(email, models.Email):
+            continue
+        state = inspect(email)
+        if not any(state.attrs[field].history.has_changes() for field in THREAD_FIELDS):
+            continue
+        if email.thread_id:
+            pending.add((email.user_id, email.thread_id))
+        # A message moved to another thread also changes the one it left
+        for old_thread_id in state.attrs.thread_id.history.deleted or ():
+            if old_thread_id:
+                pending.add((email.user_id, old_thread_id))
+
+
+def _refresh_changed_threads(session: Session, flush_context):
+    """after_flush_postexec: bring the touched threads' summaries up to date in the same transaction"""
+    pending = session.info.pop("email_thread_keys", None)
+    if not pending:
+        return
+
+    by_user = defaultdict(set)
+    for user_id, thread_id in pending:
+        by_user[user_id].add(thread_id)
+
+    for user_id, thread_ids in by_user.items():
+        refresh_email_threads(session, user_id, thread_ids)
+
+
+event.listen(SessionLocal, "before_flush", _collect_thread_changes)
+event.listen(SessionLocal, "after_flush_postexec", _refresh_changed_threads)
@@ -7,7 +7,10 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from typing import Optional
+from email.message import Message
+from typing import BinaryIO, Optional
+import tempfile
+import uuid
 import logging
 
 
@@ -309,7 +312,8 @@ def send_email_via_gmail_api(
     body: str, 
     from_email: str = None,
     access_token: str = None,
-    attachments: list = None
+    attachments: list = None,
+    user_id: int = None
 ) -> bool:
     """
     Send an email via Gmail API instead of SMTP.
@@ -322,6 +326,7 @@ def send_email_via_gmail_api(
         from_email: Sender email (should match the authenticated Gmail account)
         access_token: Gmail OAuth access token
         attachments: Optional list of attachment objects with filename, mime_type, size, data, is_inline
+        user_id: Owner of the Gmail connection, for per-user rate limiting
     
     Returns:
         bool: True if email sent successfully, False otherwise
@@ -335,7 +340,8 @@ def send_email_via_gmail_api(
             logger.error("from_email is required for Gmail API")
             return False
         
-        import httpx
+        from utils.google_rate_limiter import governed_request
+        from utils.http_clients import http_clients
         
         # Create the email message in Gmail API format
         email_message = {
@@ -409,9 +415,12 @@ def send_email_via_gmail_api(
             'Content-Type': 'application/json'
         }
         
-        with httpx.Client() as client:
-            response = client.post(
+        with http_clients.borrow("google") as client:
+            response = governed_request(
+                client,
+                "POST",
                 gmail_api_url,
+                user_id=user_id,
                 headers=headers,
                 json=email_message
             )
@@ -425,4 +434,191 @@ def send_email_via_gmail_api(
             
     except Exception as e:
         logger.error(f"Error sending email via Gmail API to {to_email}: {str(e)}")
-        return False 
\ No newline at end of file
+        return False 
+
+
+# Multiple of 57 bytes, so each read encodes to whole 76-character base64 lines
+MIME_BASE64_CHUNK = 57 * 1024
+# Composed messages stay in memory up to this size, then spill to a temp file
+MIME_SPOOL_MAX_BYTES = 1024 * 1024
+
+
+def write_mime_message(
+    out: BinaryIO,
+    to_email: str,
+    subject: str,
+    body: str,
+    from_email: str,
+    attachments: list = None
+) -> None:
+    """
+    Write a multipart/mixed message to `out`, streaming attachment contents.
+
+    Args:
+        attachments: (filename, mime_type, fileobj) tuples; each file is read and
+            base64-encoded one chunk at a time instead of being loaded whole
+    """
+    boundary = f"=============={uuid.uuid4().hex}=="
+    
+    headers = Message()
+    headers['MIME-Version'] = '1.0'
+    headers['From'] = from_email
+    headers['To'] = to_email
+    headers['Subject'] = subject
+    if from_email != EMAIL_USER:
+        headers['Reply-To'] = from_email
+    headers['Content-Type'] = f'multipart/mixed; boundary="{boundary}"'
+    out.write(b"".join(headers.policy.fold_binary(name, value) for name, value in headers.items()))
+    out.write(b"\n")
+    
+    delimiter = f"--{boundary}\n".encode()
+    
+    out.write(delimiter)
+    out.write(MIMEText(body, 'html' if '<' in body and '>' in body else 'plain', 'utf-8').as_bytes())
+    out.write(b"\n")
+    
+    for filename, mime_type, fileobj in attachments or []:
+        maintype, _, subtype = (mime_type or 'application/octet-stream').partition('/')
+        part = MIMEBase(maintype, subtype or 'octet-stream')
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.set_payload('')
+        
+        out.write(delimiter)
+        out.write(part.as_bytes())
+        while True:
+            chunk = fileobj.read(MIME_BASE64_CHUNK)
+            if not chunk:
+                break
+            out.write(base64.encodebytes(chunk))
+        out.write(b"\n")
+    
+    out.write(f"--{boundary}--\n".encode())
+
+
+class _FileChunks:
+    """Re-iterable request body over a seekable file, so a retried upload starts from the beginning"""
+    
+    def __init__(self, fileobj: BinaryIO, chunk_size: int = 256 * 1024):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+    
+    def __iter__(self):
+        self.fileobj.seek(0)
+        while True:
+            chunk = self.fileobj.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def send_email_via_gmail_upload(
+    to_email: str,
+    subject: str,
+    body: str,
+    from_email: str,
+    access_token: str,
+    attachments: list = None,
+    user_id: int = None
+) -> bool:
+    """
+    Send an email through Gmail's resumable media upload.
+    
+    The MIME message is composed into a spooled temp file straight from the
+    attachment file handles and uploaded as message/rfc822, so neither the raw
+    files nor a base64 JSON copy of the message are ever held in memory.
+    
+    Args:
+        attachments: (filename, mime_type, fileobj) tuples
+    
+    Returns:
+        bool: True if email sent successfully, False otherwise
+    """
+    try:
+        from config.google import google_config
+        from utils.google_rate_limiter import governed_request
+        from utils.http_clients import http_clients
+        
+        with tempfile.SpooledTemporaryFile(max_size=MIME_SPOOL_MAX_BYTES) as mime_file:
+            write_mime_message(mime_file, to_email, subject, body, from_email, attachments)
+            size = mime_file.tell()
+            
+            with http_clients.borrow("google") as client:
+                # Open an upload session, then send the message bytes to it
+                session_response = governed_request(
+                    client,
+                    "POST",
+                    f"{google_config.GOOGLE_GMAIL_UPLOAD_API}/messages/send",
+                    user_id=user_id,
+                    params={"uploadType": "resumable"},
+                    headers={
+                        'Authorization': f'Bearer {access_token}',
+                        'X-Upload-Content-Type': 'message/rfc822',
+                        'X-Upload-Content-Length': str(size)
+                    },
+                    json={}
+                )
+                
+                upload_url = session_response.headers.get("Location")
+                if session_response.status_code != 200 or not upload_url:
+                    logger.error(f"Gmail upload error: {session_response.status_code} - {session_response.text}")
+                    return False
+                
+                response = governed_request(
+                    client,
+                    "PUT",
+                    upload_url,
+                    user_id=user_id,
+                    units=1,  # The send was already charged when the session was opened
+                    headers={
+                        'Authorization': f'Bearer {access_token}',
+                        'Content-Type': 'message/rfc822',
+                        'Content-Length': str(size)
+                    },
+                    content=_FileChunks(mime_file),
+                    timeout=120.0
+                )
+        
+        if response.status_code == 200:
+            logger.info(f"Email sent successfully via Gmail upload to {to_email} from {from_email} ({size} bytes)")
+            return True
+        else:
+            logger.error(f"Gmail upload error: {response.status_code} - {response.text}")
+            return False
+            
+    except Exception as e:
+        logger.error(f"Error sending email via Gmail upload to {to_email}: {str(e)}")
+        return False
+
+
+def send_email_via_smtp_stream(
+    to_email: str,
+    subject: str,
+    body: str,
+    from_email: str = None,
+    attachments: list = None
+) -> bool:
+    """SMTP fallback for send_email_via_gmail_upload, taking the same (filename, mime_type, fileobj) attachments"""
+    try:
+        if not from_email:
+            from_email = EMAIL_USER
+        
+        with tempfile.SpooledTemporaryFile(max_size=MIME_SPOOL_MAX_BYTES) as mime_file:
+            write_mime_message(mime_file, to_email, subject, body, from_email, attachments)
+            mime_file.seek(0)
+            
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            try:
+                server.starttls()
+                server.login(EMAIL_USER, EMAIL_PASSWORD)
+                # smtplib wants the whole message; this is its only in-memory copy
+                server.sendmail(from_email, to_email, mime_file.read())
+            finally:
+                server.quit()
+        
+        logger.info(f"Email sent successfully to {to_email} from {from_email}")
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error sending email to {to_email}: {str(e)}")
+        return False
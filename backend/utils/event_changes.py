@@ -0,0 +1,59 @@
+import logging
+from itertools import chain
+from typing import Callable, List, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "changed_event_users"
+
+# Called with the set of user IDs whose events changed, after the change commits
+_listeners: List[Callable[[Set[int]], None]] = []
+
+
+def add_event_change_listener(listener: Callable[[Set[int]], None]):
+    """Register an in-process cache to drop a user's entries when their events change"""
+    _listeners.append(listener)
+
+
+def mark_events_changed(session: Session, user_id: int):
+    """
+    Record that a user's events changed in this transaction.
+
+    ORM adds, edits and deletes of Event rows are picked up on flush; bulk
+    statements (insert ... on conflict, query.delete, delete()) have to call this.
+    """
+    session.info.setdefault(SESSION_KEY, set()).add(user_id)
+
+
+def _collect_event_changes(session: Session, flush_context, instances):
+    """before_flush: remember whose events the pending changes touch"""
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (models.Event, models.EventException)) and obj.user_id is not None:
+            mark_events_changed(session, obj.user_id)
+
+
+def _notify_event_changes(session: Session):
+    """after_commit: tell the listeners once the changes are visible to other sessions"""
+    user_ids = session.info.pop(SESSION_KEY, None)
+    if not user_ids:
+        return
+    for listener in _listeners:
+        try:
+            listener(user_ids)
+        except Exception as e:
+            logger.error(f"Event changes - Listener {listener.__name__} failed: {str(e)}")
+
+
+def _discard_event_changes(session: Session):
+    session.info.pop(SESSION_KEY, None)
+
+
+event.listen(SessionLocal, "before_flush", _collect_event_changes)
+event.listen(SessionLocal, "after_commit", _notify_event_changes)
+event.listen(SessionLocal, "after_rollback", _discard_event_changes)
@@ -0,0 +1,237 @@
+import logging
+import math
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import models
+from utils.event_changes import add_event_change_listener
+from utils.recurrence import events_in_window
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+SLOT_MINUTES = 15  # 5 also works; SLOTS_PER_DAY has to stay a multiple of 8 for the packed rows
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+SLOTS_PER_DAY = 24 * SLOTS_PER_HOUR
+SLOT = timedelta(minutes=SLOT_MINUTES)
+
+MAX_CACHED_USERS = 256
+MAX_CACHED_DAYS = 366  # Per user; the days cached longest ago go first
+MAX_FREEBUSY_DAYS = 62  # Largest window one call may build
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _slot_bounds(occurrences: Sequence[dict], origin: datetime, total: int) -> List[Tuple[int, int]]:
+    """[first, last) slot of each occurrence, clipped to the bitmap; partly covered slots count as busy"""
+    bounds = []
+    for occurrence in occurrences:
+        first = math.floor((occurrence["start_time"] - origin) / SLOT)
+        last = math.ceil((occurrence["end_time"] - origin) / SLOT)
+        first, last = max(first, 0), min(last, total)
+        if first < last:
+            bounds.append((first, last))
+    return bounds
+
+
+def _pack(bits) -> bytes:
+    """Bit array (most significant bit first, as numpy.packbits) of a sequence of booleans"""
+    if NUMPY_AVAILABLE:
+        return np.packbits(np.asarray(bits, dtype=bool)).tobytes()
+    packed = bytearray((len(bits) + 7) // 8)
+    for index, bit in enumerate(bits):
+        if bit:
+            packed[index >> 3] |= 0x80 >> (index & 7)
+    return bytes(packed)
+
+
+def _unpack(packed: bytes):
+    if NUMPY_AVAILABLE:
+        return np.unpackbits(np.frombuffer(packed, dtype=np.uint8)).astype(bool)
+    return [bool(packed[index >> 3] & (0x80 >> (index & 7))) for index in range(len(packed) * 8)]
+
+
+def build_day_bitmaps(occurrences: Sequence[dict], first_day: date, day_count: int) -> List[Tuple[bytes, bytes]]:
+    """
+    Packed (busy, overlap) bit arrays for each of `day_count` days from `first_day`.
+
+    A slot is busy when at least one occurrence touches it and overlapping
+    when two or more do. Coverage is counted with a difference array: +1 at
+    each first slot, -1 after each last, and a cumulative sum.
+    """
+    total = day_count * SLOTS_PER_DAY
+    bounds = _slot_bounds(occurrences, _day_start(first_day), total)
+
+    if NUMPY_AVAILABLE:
+        coverage = np.zeros(total + 1, dtype=np.int32)
+        if bounds:
+            pairs = np.array(bounds, dtype=np.int64)
+            np.add.at(coverage, pairs[:, 0], 1)
+            np.add.at(coverage, pairs[:, 1], -1)
+        counts = np.cumsum(coverage[:-1]).reshape(day_count, SLOTS_PER_DAY)
+        busy = np.packbits(counts > 0, axis=1)
+        overlap = np.packbits(counts > 1, axis=1)
+        return [(busy[day].tobytes(), overlap[day].tobytes()) for day in range(day_count)]
+
+    coverage = [0] * (total + 1)
+    for first, last in bounds:
+        coverage[first] += 1
+        coverage[last] -= 1
+    counts, running = [], 0
+    for delta in coverage[:-1]:
+        running += delta
+        counts.append(running)
+    return [
+        (_pack([count > 0 for count in counts[offset:offset + SLOTS_PER_DAY]]),
+         _pack([count > 1 for count in counts[offset:offset + SLOTS_PER_DAY]]))
+        for offset in range(0, total, SLOTS_PER_DAY)
+    ]
+
+
+class FreeBusy:
+    """A user's busy and overlapping slots over consecutive days, SLOT_MINUTES per slot"""
+
+    def __init__(self, first_day: date, days: List[Tuple[bytes, bytes]]):
+        self.first_day = first_day
+        self.origin = _day_start(first_day)
+        self.packed_days = days
+        self.busy = _unpack(b"".join(busy for busy, _ in days))
+        self.overlap = _unpack(b"".join(overlap for _, overlap in days))
+
+    def __len__(self) -> int:
+        return len(self.busy)
+
+    def _slots(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        first = max(math.floor((start - self.origin) / SLOT), 0)
+        last = min(math.ceil((end - self.origin) / SLOT), len(self.busy))
+        return first, max(first, last)
+
+    @staticmethod
+    def _any(bits, first: int, last: int) -> bool:
+        return bool(bits[first:last].any()) if NUMPY_AVAILABLE else any(bits[first:last])
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        """No event touches any slot of [start, end)"""
+        return not self._any(self.busy, *self._slots(start, end))
+
+    def may_overlap(self, start: datetime, end: datetime) -> bool:
+        """
+        Two or more events share a slot of [start, end).
+
+        False means none of the events in the range overlap each other. True
+        can also come from events that only meet inside one slot, so callers
+        that need certainty check the events themselves.
+        """
+        return self._any(self.overlap, *self._slots(start, end))
+
+    def busy_periods(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Tuple[datetime, datetime]]:
+        """Merged busy runs as (start, end), clipped to [start, end) when given"""
+        first, last = self._slots(start or self.origin, end or self.origin + SLOT * len(self.busy))
+        if NUMPY_AVAILABLE:
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], self.busy[first:last], [False])).astype(np.int8)))
+            runs = zip(edges[0::2].tolist(), edges[1::2].tolist())
+        else:
+            runs, run_start = [], None
+            for index, bit in enumerate(list(self.busy[first:last]) + [False]):
+                if bit and run_start is None:
+                    run_start = index
+                elif not bit and run_start is not None:
+                    runs.append((run_start, index))
+                    run_start = None
+
+        periods = []
+        for run_start, run_end in runs:
+            period_start = self.origin + SLOT * (first + run_start)
+            period_end = self.origin + SLOT * (first + run_end)
+            periods.append((max(period_start, start) if start else period_start, min(period_end, end) if end else period_end))
+        return periods
+
+    def busy_hours(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[int]:
+        """Hours of the day (0-23) that are busy on at least one day of the range"""
+        first, last = self._slots(start or self.origin, end or self.origin + SLOT * len(self.busy))
+        if NUMPY_AVAILABLE:
+            busy = np.zeros(len(self.busy), dtype=bool)
+            busy[first:last] = self.busy[first:last]
+            return np.flatnonzero(busy.reshape(-1, 24, SLOTS_PER_HOUR).any(axis=(0, 2))).tolist()
+        return sorted({(index % SLOTS_PER_DAY) // SLOTS_PER_HOUR for index in range(first, last) if self.busy[index]})
+
+
+class _FreeBusyCache:
+    """LRU of per-day bitmaps by user, dropped when the user's events change"""
+
+    def __init__(self, max_users: int = MAX_CACHED_USERS, max_days: int = MAX_CACHED_DAYS):
+        self.max_users = max_users
+        self.max_days = max_days
+        self._users: "OrderedDict[int, OrderedDict[date, Tuple[bytes, bytes]]]" = OrderedDict()
+        self._generations: Dict[int, int] = {}  # Bumped on invalidation so a build that raced a write isn't kept
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int, first_day: date, last_day: date) -> FreeBusy:
+        day_count = (last_day - first_day).days + 1
+        wanted = [first_day + timedelta(days=offset) for offset in range(day_count)]
+
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is not None:
+                self._users.move_to_end(user_id)
+            days = {day: cached[day] for day in wanted if cached is not None and day in cached}
+            generation = self._generations.get(user_id, 0)
+
+        missing = [day for day in wanted if day not in days]
+        if missing:
+            # One query covers the whole gap, including any cached days inside it
+            build_start, build_end = missing[0], missing[-1]
+            build_days = (build_end - build_start).days + 1
+            occurrences = events_in_window(
+                db, user_id, _day_start(build_start), _day_start(build_end + timedelta(days=1)),
+                models.Event.archived.isnot(True)
+            )
+            built = build_day_bitmaps(occurrences, build_start, build_days)
+            for offset, bitmaps in enumerate(built):
+                days[build_start + timedelta(days=offset)] = bitmaps
+
+            with self._lock:
+                if self._generations.get(user_id, 0) == generation:
+                    cached = self._users.setdefault(user_id, OrderedDict())
+                    self._users.move_to_end(user_id)
+                    for offset, bitmaps in enumerate(built):
+                        cached[build_start + timedelta(days=offset)] = bitmaps
+                    while len(cached) > self.max_days:
+                        cached.popitem(last=False)
+                    while len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+
+        return FreeBusy(first_day, [days[day] for day in wanted])
+
+    def invalidate(self, user_ids: Set[int]):
+        with self._lock:
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+_freebusy_cache = _FreeBusyCache()
+add_event_change_listener(_freebusy_cache.invalidate)
+
+
+def get_freebusy(db: Session, user_id: int, start: datetime, end: datetime) -> FreeBusy:
+    """
+    Free/busy bitmap of a user's live events for the whole days covering [start, end).
+
+    Recurring events count with every occurrence. Days already cached for the
+    user are reused; the rest are built with one event query.
+    """
+    last_day = (end - timedelta(microseconds=1)).date() if end > start else start.date()
+    return _freebusy_cache.get(db, user_id, start.date(), last_day)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import uuid
+from email import message_from_bytes
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+from config.google import google_config
+from utils.google_rate_limiter import governed_request_async, rate_governor
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_BATCH_MAX_REQUESTS = 50  # Google's limit per Calendar batch request
+
+
+class BatchRequest:
+    """One API call inside a batch; `path` is relative to the API root (e.g. /calendars/primary/events)"""
+
+    def __init__(self, key: str, method: str, path: str, body: Optional[dict] = None):
+        self.key = key
+        self.method = method
+        self.path = path
+        self.body = body
+
+
+def encode_batch(requests: List[BatchRequest], api_root: str) -> Tuple[str, bytes]:
+    """multipart/mixed body of a batch request; returns (content_type, body)"""
+    boundary = f"batch_{uuid.uuid4().hex}"
+    prefix = urlparse(api_root).path.rstrip("/")
+
+    lines = []
+    for request in requests:
+        lines += [
+            f"--{boundary}",
+            "Content-Type: application/http",
+            f"Content-ID: <{request.key}>",
+            "",
+            f"{request.method} {prefix}{request.path}"
+        ]
+        if request.body is not None:
+            lines += ["Content-Type: application/json", "", json.dumps(request.body)]
+        else:
+            lines.append("")
+        lines.append("")
+    lines.append(f"--{boundary}--")
+
+    return f"multipart/mixed; boundary={boundary}", "\r\n".join(lines).encode()
+
+
+def decode_batch(content_type: str, content: bytes) -> Dict[str, Tuple[int, Optional[dict], dict]]:
+    """Parts of a batch response keyed by request key: (status, JSON body or None, headers)"""
+    envelope = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + content)
+    results = {}
+
+    for part in envelope.get_payload() if envelope.is_multipart() else []:
+        key = (part.get("Content-ID") or "").strip("<>")
+        if key.startswith("response-"):
+            key = key[len("response-"):]
+
+        raw = part.get_payload(decode=True) or b""
+        head, _, body = raw.replace(b"\r\n", b"\n").partition(b"\n\n")
+        status_line, *header_lines = head.decode("utf-8", errors="replace").split("\n")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            continue
+
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            payload = json.loads(body) if body.strip() else None
+        except json.JSONDecodeError:
+            payload = None
+        results[key] = (status, payload, headers)
+
+    return results
+
+
+def _retryable(status: int, body: Optional[dict]) -> bool:
+    if status in (429, 500, 502, 503, 504):
+        return True
+    if status == 403 and body:
+        reasons = [error.get("reason") for error in body.get("error", {}).get("errors", [])]
+        return any(reason in ("rateLimitExceeded", "userRateLimitExceeded") for reason in reasons)
+    return False
+
+
+async def execute_calendar_batch(
+    client: httpx.AsyncClient,
+    headers: dict,
+    requests: List[BatchRequest],
+    user_id: Optional[int] = None
+) -> Dict[str, Tuple[int, Optional[dict]]]:
+    """
+    Send Calendar API calls as batch requests of up to 50 and return (status, body) per request key.
+
+    Calls that come back rate limited or with a 5xx are resent in a later batch
+    with exponential backoff; after GOOGLE_API_MAX_RETRIES their last answer is
+    returned. A batch that fails as a whole reports its status for every call in it.
+    """
+    results: Dict[str, Tuple[int, Optional[dict]]] = {}
+    pending = list(requests)
+
+    for attempt in range(google_config.GOOGLE_API_MAX_RETRIES + 1):
+        retry = []
+        for start in range(0, len(pending), CALENDAR_BATCH_MAX_REQUESTS):
+            chunk = pending[start:start + CALENDAR_BATCH_MAX_REQUESTS]
+            content_type, body = encode_batch(chunk, google_config.GOOGLE_CALENDAR_API)
+
+            response = await governed_request_async(
+                client,
+                "POST",
+                google_config.GOOGLE_CALENDAR_BATCH_URL,
+                api="calendar",
+                user_id=user_id,
+                units=len(chunk),  # Calendar quota counts every call inside a batch
+                headers={**headers, "Content-Type": content_type},
+                content=body,
+                timeout=60.0
+            )
+
+            if response.status_code != 200:
+                logger.error(f"Google Calendar - Batch of {len(chunk)} calls failed: {response.status_code}")
+                for request in chunk:
+                    results[request.key] = (response.status_code, None)
+                continue
+
+            parts = decode_batch(response.headers.get("content-type", ""), response.content)
+            for request in chunk:
+                status, payload, _ = parts.get(request.key, (502, None, {}))
+                results[request.key] = (status, payload)
+                if _retryable(status, payload):
+                    retry.append(request)
+
+        if not retry or attempt == google_config.GOOGLE_API_MAX_RETRIES:
+            break
+
+        delay = min(google_config.GOOGLE_API_BASE_BACKOFF_SECONDS * (2 ** attempt), google_config.GOOGLE_API_MAX_BACKOFF_SECONDS)
+        rate_governor.metrics["calendar"].add(retries=len(retry))
+        logger.warning(f"Google Calendar - Retrying {len(retry)} batched calls in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        pending = retry
+
+    return results
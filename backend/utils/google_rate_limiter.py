@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import httpx
+
+from config.google import google_config
+
+logger = logging.getLogger(__name__)
+
+# Gmail API quota units per method (https://developers.google.com/gmail/api/reference/quota)
+GMAIL_QUOTA_UNITS = [
+    ("POST", re.compile(r"/messages/batchModify$"), 50),
+    ("POST", re.compile(r"/messages/batchDelete$"), 50),
+    ("POST", re.compile(r"/messages/send$"), 100),
+    ("POST", re.compile(r"/drafts/send$"), 100),
+    ("POST", re.compile(r"/watch$"), 100),
+    ("GET", re.compile(r"/messages/[^/]+/attachments/[^/]+$"), 5),
+    ("GET", re.compile(r"/messages/[^/]+$"), 5),
+    ("GET", re.compile(r"/messages$"), 5),
+    ("POST", re.compile(r"/messages/[^/]+/(modify|trash|untrash)$"), 5),
+    ("DELETE", re.compile(r"/messages/[^/]+$"), 10),
+    ("GET", re.compile(r"/threads/[^/]+$"), 10),
+    ("GET", re.compile(r"/threads$"), 10),
+    ("GET", re.compile(r"/history$"), 2),
+    ("GET", re.compile(r"/labels(/[^/]+)?$"), 1),
+    ("POST", re.compile(r"/labels$"), 5),
+    ("GET", re.compile(r"/profile$"), 1),
+]
+GMAIL_DEFAULT_UNITS = 5
+
+# Reasons Google uses in 403 bodies when a rate limit (not a permission) was hit
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "dailyLimitExceeded")
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+def gmail_quota_units(method: str, url: str) -> int:
+    """Quota cost of a Gmail API call"""
+    path = url.split("?", 1)[0]
+    for rule_method, pattern, units in GMAIL_QUOTA_UNITS:
+        if rule_method == method.upper() and pattern.search(path):
+            return units
+    return GMAIL_DEFAULT_UNITS
+
+
+class TokenBucket:
+    """
+    Token bucket whose rate adapts AIMD-style: halved when Google says we are
+    over quota, then grown back by 10% of the configured rate per clean second.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.max_rate = max(rate, 0.1)
+        self.rate = self.max_rate
+        self.capacity = capacity or self.max_rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.penalized_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if now >= self.penalized_until and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1 * elapsed)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def reserve(self, units: float) -> float:
+        """Take `units` tokens; returns how long the caller must wait before using them"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= units
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def penalize(self, pause_seconds: float):
+        """Back off after a rate-limit response"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            self.penalized_until = now + pause_seconds
+
+
+class QuotaMetrics:
+    """Counters for one Google API"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.units = 0
+        self.throttled = 0
+        self.throttle_wait_seconds = 0.0
+        self.rate_limited = 0
+        self.retries = 0
+        self.gave_up = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "units": self.units,
+                "throttled": self.throttled,
+                "throttle_wait_seconds": round(self.throttle_wait_seconds, 3),
+                "rate_limited": self.rate_limited,
+                "retries": self.retries,
+                "gave_up": self.gave_up
+            }
+
+
+class GoogleRateGovernor:
+    """
+    Shared rate governor for Gmail and Calendar calls.
+
+    Every call reserves its quota units from a per-user bucket and a
+    per-project bucket for that API before it is sent. 429s, 403
+    rateLimitExceeded and 5xx responses are retried with exponential backoff
+    (Retry-After wins when Google sends it) and halve the offending bucket's rate.
+    """
+
+    def __init__(self):
+        self.limits = {
+            "gmail": (google_config.GMAIL_USER_UNITS_PER_SECOND, google_config.GMAIL_PROJECT_UNITS_PER_SECOND),
+            "calendar": (google_config.CALENDAR_USER_REQUESTS_PER_SECOND, google_config.CALENDAR_PROJECT_REQUESTS_PER_SECOND),
+        }
+        self.user_buckets: Dict[tuple, TokenBucket] = {}
+        self.project_buckets: Dict[str, TokenBucket] = {}
+        self.metrics: Dict[str, QuotaMetrics] = {api: QuotaMetrics() for api in self.limits}
+        self.lock = threading.Lock()
+
+    def _buckets(self, api: str, user_id: Optional[int]) -> list:
+        user_rate, project_rate = self.limits[api]
+        with self.lock:
+            if api not in self.project_buckets:
+                self.project_buckets[api] = TokenBucket(project_rate)
+            buckets = [self.project_buckets[api]]
+            if user_id is not None:
+                key = (api, user_id)
+                if key not in self.user_buckets:
+                    self.user_buckets[key] = TokenBucket(user_rate)
+                buckets.append(self.user_buckets[key])
+        return buckets
+
+    def units_for(self, api: str, method: str, url: str) -> int:
+        return gmail_quota_units(method, url) if api == "gmail" else 1
+
+    def reserve(self, api: str, user_id: Optional[int], units: int) -> float:
+        """Reserve quota in every bucket; returns the longest wait"""
+        wait = max(bucket.reserve(units) for bucket in self._buckets(api, user_id))
+        metrics = self.metrics[api]
+        metrics.add(requests=1, units=units)
+        if wait > 0:
+            metrics.add(throttled=1, throttle_wait_seconds=wait)
+        return wait
+
+    def is_rate_limited(self, response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        if response.status_code == 403:
+            try:
+                errors = response.json().get("error", {}).get("errors", [])
+            except Exception:
+                return False
+            return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+        return False
+
+    def should_retry(self, response: httpx.Response) -> bool:
+        return response.status_code in RETRYABLE_STATUS or self.is_rate_limited(response)
+
+    def backoff_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Retry-After if present, otherwise exponential backoff with full jitter"""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), google_config.GOOGLE_API_MAX_BACKOFF_SECONDS)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(delay, 0.0), google_config.GOOGLE_API_MAX_BACKOFF_SECONDS)
+                except Exception:
+                    pass
+        ceiling = min(google_config.GOOGLE_API_MAX_BACKOFF_SECONDS, google_config.GOOGLE_API_BASE_BACKOFF_SECONDS * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def record_failure(self, api: str, user_id: Optional[int], response: httpx.Response, delay: float):
+        metrics = self.metrics[api]
+        if self.is_rate_limited(response):
+            metrics.add(rate_limited=1)
+            for bucket in self._buckets(api, user_id):
+                bucket.penalize(delay)
+        metrics.add(retries=1)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            user_buckets = list(self.user_buckets.items())
+            project_buckets = dict(self.project_buckets)
+        return {
+            api: dict(
+                metrics.as_dict(),
+                project_rate=round(project_buckets[api].rate, 2) if api in project_buckets else self.limits[api][1],
+                throttled_users=sum(1 for (bucket_api, _), bucket in user_buckets if bucket_api == api and bucket.rate < bucket.max_rate)
+            )
+            for api, metrics in self.metrics.items()
+        }
+
+
+rate_governor = GoogleRateGovernor()
+
+
+def governed_request(
+    client: httpx.Client,
+    method: str,
+    url: str,
+    api: str = "gmail",
+    user_id: Optional[int] = None,
+    units: Optional[int] = None,
+    **kwargs
+) -> httpx.Response:
+    """Send a Google API request through the rate governor, retrying rate-limit and 5xx responses"""
+    units = units or rate_governor.units_for(api, method, url)
+    max_retries = google_config.GOOGLE_API_MAX_RETRIES
+
+    for attempt in range(max_retries + 1):
+        wait = rate_governor.reserve(api, user_id, units)
+        if wait > 0:
+            time.sleep(wait)
+
+        response = client.request(method, url, **kwargs)
+        if not rate_governor.should_retry(response) or attempt == max_retries:
+            break
+
+        delay = rate_governor.backoff_delay(response, attempt)
+        rate_governor.record_failure(api, user_id, response, delay)
+        logger.warning(f"Google API - {method} {url} returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+        time.sleep(delay)
+
+    if rate_governor.should_retry(response):
+        rate_governor.metrics[api].add(gave_up=1)
+    return response
+
+
+async def governed_request_async(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    api: str = "gmail",
+    user_id: Optional[int] = None,
+    units: Optional[int] = None,
+    **kwargs
+) -> httpx.Response:
+    """Async variant of governed_request"""
+    units = units or rate_governor.units_for(api, method, url)
+    max_retries = google_config.GOOGLE_API_MAX_RETRIES
+
+    for attempt in range(max_retries + 1):
+        wait = rate_governor.reserve(api, user_id, units)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        response = await client.request(method, url, **kwargs)
+        if not rate_governor.should_retry(response) or attempt == max_retries:
+            break
+
+        delay = rate_governor.backoff_delay(response, attempt)
+        rate_governor.record_failure(api, user_id, response, delay)
+        logger.warning(f"Google API - {method} {url} returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+        await asyncio.sleep(delay)
+
+    if rate_governor.should_retry(response):
+        rate_governor.metrics[api].add(gave_up=1)
+    return response
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config.google import google_config
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """
+    In-memory cache of Google access tokens per connection.
+
+    Tokens are refreshed once they are within GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS
+    of expiry, and concurrent refreshes of the same connection collapse into
+    one: the first caller refreshes while the others wait on a per-connection
+    lock and then reuse its token. renew_periodically() refreshes tokens in
+    the background before they get that close, so requests rarely wait on one.
+    """
+
+    def __init__(self):
+        self.refreshers: Dict[str, Callable] = {}
+        self.models: Dict[str, type] = {}
+        self.cache: Dict[Tuple[str, int], Tuple[str, datetime]] = {}
+        self.locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self.async_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+        self.renewal_failures: Dict[Tuple[str, int], datetime] = {}
+        self.lock = threading.Lock()
+        self.refresh_count = 0
+        self.cache_hits = 0
+
+    def register(self, kind: str, refresher: Callable, model: Optional[type] = None):
+        """
+        Register refresher(db, connection) -> connection for a connection kind ("gmail", "calendar").
+
+        `model` is the kind's connection table; its rows are renewed in the background.
+        """
+        self.refreshers[kind] = refresher
+        if model is not None:
+            self.models[kind] = model
+
+    def _lock_for(self, key: tuple) -> threading.Lock:
+        with self.lock:
+            if key not in self.locks:
+                self.locks[key] = threading.Lock()
+            return self.locks[key]
+
+    def _async_lock_for(self, key: tuple) -> asyncio.Lock:
+        with self.lock:
+            if key not in self.async_locks:
+                self.async_locks[key] = asyncio.Lock()
+            return self.async_locks[key]
+
+    def needs_refresh(self, expiry: Optional[datetime]) -> bool:
+        margin = timedelta(seconds=google_config.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS)
+        return expiry is None or expiry - datetime.now() <= margin
+
+    def cached_token(self, kind: str, connection_id: int) -> Optional[Tuple[str, datetime]]:
+        """(access_token, expiry) from the cache without touching the database"""
+        return self.cache.get((kind, connection_id))
+
+    def _apply(self, connection, token: str, expiry: datetime):
+        """Copy a token refreshed elsewhere onto this session's connection object"""
+        if connection.access_token != token:
+            connection.access_token = token
+            connection.token_expiry = expiry
+
+    def _fresh_without_refresh(self, connection, kind: str) -> bool:
+        """Bring the connection up to date from the cache or its own row if either is still fresh"""
+        key = (kind, connection.id)
+        cached = self.cache.get(key)
+        if cached and not self.needs_refresh(cached[1]):
+            self.cache_hits += 1
+            self._apply(connection, *cached)
+            return True
+        if not self.needs_refresh(connection.token_expiry):
+            self.cache[key] = (connection.access_token, connection.token_expiry)
+            return True
+        return False
+
+    def ensure_fresh(self, db: Session, connection, kind: str, force: bool = False):
+        """
+        Return the connection with an access token that is valid for at least the refresh margin.
+
+        Blocking (the refresh is an HTTP call); coroutines use ensure_fresh_async.
+        """
+        key = (kind, connection.id)
+
+        if not force and self._fresh_without_refresh(connection, kind):
+            return connection
+
+        stale_token = connection.access_token
+        with self._lock_for(key):
+            # Someone may have refreshed while we waited for the lock
+            cached = self.cache.get(key)
+            if cached and cached[0] != stale_token and not self.needs_refresh(cached[1]):
+                self.cache_hits += 1
+                self._apply(connection, *cached)
+                return connection
+
+            # ...or another process did, in which case the row is already fresh
+            db.refresh(connection)
+            if connection.access_token != stale_token and not self.needs_refresh(connection.token_expiry):
+                self.cache[key] = (connection.access_token, connection.token_expiry)
+                return connection
+
+            connection = self.refreshers[kind](db, connection)
+            self.refresh_count += 1
+            self.cache[key] = (connection.access_token, connection.token_expiry)
+            logger.info(f"Token manager - Refreshed {kind} token for user {connection.user_id}, valid until {connection.token_expiry}")
+            return connection
+
+    async def ensure_fresh_async(self, db: Session, connection, kind: str, force: bool = False):
+        """
+        ensure_fresh for coroutines.
+
+        A fresh token is returned without leaving the event loop. Otherwise
+        coroutines refreshing the same connection queue on an asyncio.Lock and
+        the refresh itself runs in a worker thread; whoever gets the lock after
+        it finds the new token in the cache.
+        """
+        if not force and self._fresh_without_refresh(connection, kind):
+            return connection
+
+        async with self._async_lock_for((kind, connection.id)):
+            if not force and self._fresh_without_refresh(connection, kind):
+                return connection
+            return await asyncio.to_thread(self.ensure_fresh, db, connection, kind, force)
+
+    def renew_expiring(self) -> int:
+        """
+        Refresh every registered connection whose token would enter the refresh
+        margin before the next renewal pass. Blocking; returns how many were renewed.
+
+        A connection whose refresh fails (e.g. revoked access) is skipped for an
+        hour instead of being retried on every pass.
+        """
+        now = datetime.now()
+        horizon = now + timedelta(seconds=google_config.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS + google_config.GOOGLE_TOKEN_RENEW_INTERVAL_SECONDS)
+        renewed = 0
+
+        db = SessionLocal()
+        try:
+            for kind, model in self.models.items():
+                for connection in db.query(model).filter(model.token_expiry <= horizon).all():
+                    key = (kind, connection.id)
+                    failed_at = self.renewal_failures.get(key)
+                    if not connection.refresh_token or (failed_at and now - failed_at < timedelta(hours=1)):
+                        continue
+                    try:
+                        self.ensure_fresh(db, connection, kind, force=True)
+                        self.renewal_failures.pop(key, None)
+                        renewed += 1
+                    except Exception as e:
+                        db.rollback()
+                        self.renewal_failures[key] = now
+                        logger.warning(f"Token manager - Background renewal of {kind} token for user {connection.user_id} failed: {str(e)}")
+        finally:
+            db.close()
+        return renewed
+
+    async def renew_periodically(self):
+        """Background task: renew tokens ahead of expiry every GOOGLE_TOKEN_RENEW_INTERVAL_SECONDS"""
+        while True:
+            try:
+                renewed = await asyncio.to_thread(self.renew_expiring)
+                if renewed:
+                    logger.info(f"Token manager - Renewed {renewed} tokens ahead of expiry")
+            except Exception as e:
+                logger.error(f"Token manager - Background renewal failed: {str(e)}")
+            await asyncio.sleep(google_config.GOOGLE_TOKEN_RENEW_INTERVAL_SECONDS)
+
+    def invalidate(self, kind: str, connection_id: int):
+        """Forget a cached token (e.g. after a 401 or a disconnect)"""
+        self.cache.pop((kind, connection_id), None)
+
+
+token_manager = TokenManager()
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict
+
+import httpx
+
+from config.google import google_config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401 - httpx only needs it importable to negotiate HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class UpstreamMetrics:
+    """Request counters for one upstream, fed by httpx event hooks"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.http_versions: Dict[str, int] = {}
+
+    def record(self, response: httpx.Response, elapsed: float):
+        with self.lock:
+            self.requests += 1
+            self.total_seconds += elapsed
+            if response.status_code >= 400:
+                self.errors += 1
+            self.http_versions[response.http_version] = self.http_versions.get(response.http_version, 0) + 1
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "avg_latency_ms": round(self.total_seconds / self.requests * 1000, 1) if self.requests else 0.0,
+                "http_versions": dict(self.http_versions)
+            }
+
+
+class HttpClientRegistry:
+    """
+    Application-lifetime httpx clients, one sync and one async per upstream.
+
+    Reusing them keeps TCP/TLS connections (and HTTP/2 streams when h2 is
+    installed) alive across calls instead of handshaking on every request.
+    Pool sizes and timeouts are configured per upstream.
+    """
+
+    UPSTREAMS = {
+        # name: (max_connections, max_keepalive, timeout seconds)
+        "google": (google_config.GOOGLE_HTTP_MAX_CONNECTIONS, google_config.GOOGLE_HTTP_MAX_KEEPALIVE, 30.0),
+        "google_oauth": (10, 5, 15.0),
+        "openai": (20, 10, 60.0),
+    }
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.Client] = {}
+        self.async_clients: Dict[str, httpx.AsyncClient] = {}
+        self.metrics: Dict[str, UpstreamMetrics] = {name: UpstreamMetrics() for name in self.UPSTREAMS}
+        self.lock = threading.Lock()
+
+    def _settings(self, name: str) -> dict:
+        max_connections, max_keepalive, timeout = self.UPSTREAMS[name]
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=google_config.HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            "timeout": httpx.Timeout(timeout, connect=10.0)
+        }
+
+    def _sync_hooks(self, name: str) -> dict:
+        metrics = self.metrics[name]
+
+        def on_request(request: httpx.Request):
+            request.extensions["started_at"] = time.monotonic()
+
+        def on_response(response: httpx.Response):
+            started = response.request.extensions.get("started_at", time.monotonic())
+            metrics.record(response, time.monotonic() - started)
+
+        return {"request": [on_request], "response": [on_response]}
+
+    def _async_hooks(self, name: str) -> dict:
+        metrics = self.metrics[name]
+
+        async def on_request(request: httpx.Request):
+            request.extensions["started_at"] = time.monotonic()
+
+        async def on_response(response: httpx.Response):
+            started = response.request.extensions.get("started_at", time.monotonic())
+            metrics.record(response, time.monotonic() - started)
+
+        return {"request": [on_request], "response": [on_response]}
+
+    def get_client(self, name: str) -> httpx.Client:
+        """Shared sync client for an upstream (created on first use)"""
+        client = self.clients.get(name)
+        if client is None or client.is_closed:
+            with self.lock:
+                client = self.clients.get(name)
+                if client is None or client.is_closed:
+                    client = httpx.Client(event_hooks=self._sync_hooks(name), **self._settings(name))
+                    self.clients[name] = client
+        return client
+
+    def get_async_client(self, name: str) -> httpx.AsyncClient:
+        """Shared async client for an upstream (created on first use)"""
+        client = self.async_clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(event_hooks=self._async_hooks(name), **self._settings(name))
+            self.async_clients[name] = client
+        return client
+
+    @contextmanager
+    def borrow(self, name: str):
+        """`with` drop-in for `with httpx.Client() as client` that leaves the shared client open"""
+        yield self.get_client(name)
+
+    @asynccontextmanager
+    async def borrow_async(self, name: str):
+        """`async with` drop-in for `async with httpx.AsyncClient() as client`"""
+        yield self.get_async_client(name)
+
+    def startup(self):
+        """Open every client up front so the first request doesn't pay for it"""
+        for name in self.UPSTREAMS:
+            self.get_client(name)
+            self.get_async_client(name)
+        logger.info(f"HTTP clients ready for {', '.join(self.UPSTREAMS)} (HTTP/2 {'on' if HTTP2_AVAILABLE else 'off - install h2 to enable'})")
+
+    async def shutdown(self):
+        for client in self.clients.values():
+            client.close()
+        for client in self.async_clients.values():
+            await client.aclose()
+        self.clients = {}
+        self.async_clients = {}
+
+    def get_metrics(self) -> dict:
+        return {name: metrics.as_dict() for name, metrics in self.metrics.items()}
+
+
+http_clients = HttpClientRegistry()
@@ -0,0 +1,160 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from models import models
+from utils.event_changes import add_event_change_listener
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_USERS = 256
+
+# Same expression as the ix_events_period GiST index on events, so Postgres can use it.
+# GREATEST keeps a row whose end precedes its start from breaking tsrange().
+EVENT_PERIOD = func.tsrange(
+    models.Event.start_time,
+    func.greatest(models.Event.start_time, models.Event.end_time),
+    text("'[)'")
+)
+
+
+class IntervalIndex:
+    """
+    Static interval tree over half-open [start, end) intervals.
+
+    Intervals are sorted by start and laid out as an implicit balanced tree
+    (the middle of each range is its root); every node also keeps the largest
+    end in its subtree. overlapping() skips subtrees that end too early or
+    start too late, so a query costs O(log n + k) for k matches.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[Any, Any, Any]]):
+        items = sorted(intervals, key=lambda item: item[0])
+        self.starts = [item[0] for item in items]
+        self.ends = [item[1] for item in items]
+        self.values = [item[2] for item in items]
+        self.max_ends = list(self.ends)
+        if items:
+            self._build(0, len(items))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _build(self, lo: int, hi: int):
+        mid = (lo + hi) // 2
+        best = self.ends[mid]
+        if lo < mid:
+            best = max(best, self._build(lo, mid))
+        if mid + 1 < hi:
+            best = max(best, self._build(mid + 1, hi))
+        self.max_ends[mid] = best
+        return best
+
+    def overlapping(self, start, end) -> List[Any]:
+        """Values whose interval overlaps [start, end), in start order"""
+        found = []
+        stack = [(0, len(self.starts), False)]
+        while stack:
+            lo, hi, visited = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if not visited:
+                if self.max_ends[mid] <= start:
+                    continue  # Everything below ends before the window
+                # Left subtree first, then come back for this node and the right subtree
+                stack.append((lo, hi, True))
+                stack.append((lo, mid, False))
+                continue
+            if self.starts[mid] >= end:
+                continue  # This node and everything right of it start after the window
+            if self.ends[mid] > start:
+                found.append(self.values[mid])
+            stack.append((mid + 1, hi, False))
+        return found
+
+
+class _UserIntervalCache:
+    """Per-user IntervalIndex of event IDs for databases without range types, dropped when the user's events change"""
+
+    def __init__(self, max_users: int = MAX_CACHED_USERS):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[int, IntervalIndex]" = OrderedDict()
+        self._generations: Dict[int, int] = {}  # Bumped on invalidation so a build that raced a write isn't kept
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int) -> IntervalIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+            generation = self._generations.get(user_id, 0)
+
+        rows = db.query(models.Event.id, models.Event.start_time, models.Event.end_time).filter(
+            models.Event.user_id == user_id,
+            models.Event.start_time.isnot(None),
+            models.Event.end_time.isnot(None)
+        ).all()
+        index = IntervalIndex((row.start_time, max(row.start_time, row.end_time), row.id) for row in rows)
+
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return index
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, user_ids: Set[int]):
+        with self._lock:
+            for user_id in user_ids:
+                self._indexes.pop(user_id, None)
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+_interval_cache = _UserIntervalCache()
+add_event_change_listener(_interval_cache.invalidate)
+
+
+def overlapping_events(
+    db: Session,
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    exclude_id: Optional[int] = None
+) -> List[models.Event]:
+    """
+    A user's live (not archived, not deleted) events overlapping [start, end), by start time.
+
+    On Postgres this is a tsrange && query served by the ix_events_period GiST
+    index; elsewhere (SQLite in tests) a cached in-memory interval tree picks
+    the IDs and one primary-key lookup loads them.
+    """
+    query = db.query(models.Event).filter(
+        models.Event.user_id == user_id,
+        models.Event.archived.isnot(True),
+        models.Event.is_deleted.isnot(True)
+    )
+    if exclude_id is not None:
+        query = query.filter(models.Event.id != exclude_id)
+
+    if db.get_bind().dialect.name == "postgresql":
+        query = query.filter(
+            models.Event.start_time.isnot(None),
+            models.Event.end_time.isnot(None),
+            EVENT_PERIOD.op("&&")(func.tsrange(start, end, text("'[)'")))
+        )
+    else:
+        event_ids = _interval_cache.get(db, user_id).overlapping(start, end)
+        if not event_ids:
+            return []
+        query = query.filter(models.Event.id.in_(event_ids))
+
+    return query.order_by(models.Event.start_time).all()
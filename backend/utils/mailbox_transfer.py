@@ -0,0 +1,374 @@
+import base64
+import json
+import logging
+import time
+from datetime import datetime
+from email import message_from_bytes, policy
+from email.generator import BytesGenerator
+from email.message import EmailMessage
+from email.utils import format_datetime, parseaddr, parsedate_to_datetime
+from io import BytesIO
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import models
+from database import SessionLocal
+from utils.email_threads import refresh_email_threads
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("ndjson", "mbox")
+EXPORT_BATCH_SIZE = 500  # Rows per server-side cursor fetch (and per attachment lookup)
+IMPORT_BATCH_SIZE = 500  # Emails per INSERT, committed batch by batch
+
+# Email columns carried in an export; the source row ID is exported for reference only
+EXPORT_FIELDS = (
+    "id", "gmail_id", "thread_id", "sender", "to_recipients", "subject", "snippet", "body",
+    "body_cached", "has_attachment", "received_at", "auto_reply", "labels", "is_deleted", "deleted_at"
+)
+DATETIME_FIELDS = ("received_at", "deleted_at")
+ATTACHMENT_FIELDS = ("filename", "mime_type", "size", "content_id", "is_inline", "gmail_attachment_id")
+
+
+def _labels(raw: Optional[str]) -> list:
+    try:
+        labels = json.loads(raw) if raw else []
+        return labels if isinstance(labels, list) else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def _attachment_data(attachment) -> Optional[str]:
+    """Base64url data of an attachment, read from disk for streamed uploads"""
+    if attachment.data:
+        return attachment.data
+    if attachment.storage_path:
+        try:
+            with open(attachment.storage_path, "rb") as stored:
+                return base64.urlsafe_b64encode(stored.read()).decode()
+        except OSError as e:
+            logger.warning(f"Mailbox export - Stored attachment {attachment.id} unreadable: {str(e)}")
+    return None
+
+
+def _iter_email_batches(db: Session, user_id: int) -> Iterator[list]:
+    """The user's emails in ID order, EXPORT_BATCH_SIZE at a time, each with its attachments"""
+    email_table = models.Email.__table__
+    result = db.execute(
+        select(*[email_table.c[field] for field in EXPORT_FIELDS])
+        .where(email_table.c.user_id == user_id)
+        .order_by(email_table.c.id)
+        .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    for rows in result.partitions():
+        attachments = {}
+        with_attachments = [row.id for row in rows if row.has_attachment]
+        if with_attachments:
+            for attachment in db.query(models.EmailAttachment).filter(
+                models.EmailAttachment.email_id.in_(with_attachments)
+            ).order_by(models.EmailAttachment.id):
+                attachments.setdefault(attachment.email_id, []).append(attachment)
+        yield [(row, attachments.get(row.id, [])) for row in rows]
+        # Attachment rows carry their data; don't let the session hold on to them
+        db.expunge_all()
+
+
+def _ndjson_record(row, attachments: list, include_attachments: bool) -> dict:
+    record = {"type": "email"}
+    for field in EXPORT_FIELDS:
+        value = getattr(row, field)
+        if field in DATETIME_FIELDS and value is not None:
+            value = value.isoformat()
+        elif field == "labels":
+            value = _labels(value)
+        record[field] = value
+    record["attachments"] = [
+        {
+            **{field: getattr(attachment, field) for field in ATTACHMENT_FIELDS},
+            "data": _attachment_data(attachment) if include_attachments else None
+        }
+        for attachment in attachments
+    ]
+    return record
+
+
+def _mbox_message(row, attachments: list, include_attachments: bool) -> bytes:
+    message = EmailMessage()
+    message["From"] = row.sender
+    if row.to_recipients:
+        message["To"] = row.to_recipients
+    message["Subject"] = row.subject
+    if row.received_at:
+        message["Date"] = format_datetime(row.received_at)
+    message["X-Gmail-Labels"] = ",".join(_labels(row.labels))
+    if row.gmail_id:
+        message["X-Gmail-Id"] = row.gmail_id
+    if row.thread_id:
+        message["X-Thread-Id"] = row.thread_id
+
+    body = row.body or row.snippet or ""
+    message.set_content(body, subtype="html" if "<" in body and ">" in body else "plain")
+
+    for attachment in attachments:
+        data = _attachment_data(attachment) if include_attachments else None
+        if not data:
+            continue
+        maintype, _, subtype = (attachment.mime_type or "application/octet-stream").partition("/")
+        message.add_attachment(
+            base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)),
+            maintype=maintype,
+            subtype=subtype or "octet-stream",
+            filename=attachment.filename,
+            cid=f"<{attachment.content_id}>" if attachment.content_id else None,
+            disposition="inline" if attachment.is_inline else "attachment"
+        )
+
+    buffer = BytesIO()
+    sender = parseaddr(row.sender or "")[1] or "MAILER-DAEMON"
+    received_at = row.received_at or datetime.now()
+    buffer.write(f"From {sender} {received_at.strftime('%a %b %d %H:%M:%S %Y')}\n".encode())
+    # mangle_from_ escapes body lines starting with "From " so they don't split the mbox
+    BytesGenerator(buffer, mangle_from_=True).flatten(message)
+    buffer.write(b"\n")
+    return buffer.getvalue()
+
+
+def export_mailbox(user_id: int, format: str = "ndjson", include_attachments: bool = True) -> Iterator[bytes]:
+    """
+    Stream a user's emails as NDJSON lines or mbox messages.
+
+    Rows come from a server-side cursor, so memory stays flat however big the
+    mailbox is. NDJSON exports end with a {"type": "summary"} line carrying counts
+    and throughput. Uses its own session because the response outlives the request.
+    """
+    started = time.monotonic()
+    exported = 0
+    attachment_count = 0
+
+    db = SessionLocal()
+    try:
+        for batch in _iter_email_batches(db, user_id):
+            chunk = []
+            for row, attachments in batch:
+                if format == "mbox":
+                    chunk.append(_mbox_message(row, attachments, include_attachments))
+                else:
+                    chunk.append(json.dumps(_ndjson_record(row, attachments, include_attachments)).encode() + b"\n")
+                exported += 1
+                attachment_count += len(attachments)
+            yield b"".join(chunk)
+
+        seconds = time.monotonic() - started
+        summary = {
+            "type": "summary",
+            "emails": exported,
+            "attachments": attachment_count,
+            "seconds": round(seconds, 3),
+            "emails_per_second": round(exported / seconds, 1) if seconds > 0 else None
+        }
+        logger.info(f"Mailbox export - Exported {exported} emails ({attachment_count} attachments) as {format} for user {user_id} in {seconds:.1f}s")
+        if format == "ndjson":
+            yield json.dumps(summary).encode() + b"\n"
+    finally:
+        db.close()
+
+
+def _read_ndjson(stream: BinaryIO) -> Iterator[dict]:
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"Mailbox import - Skipping malformed line {line_number}")
+            continue
+        if record.get("type", "email") == "email":
+            yield record
+
+
+def _parse_mbox_message(raw: bytes) -> dict:
+    message = message_from_bytes(raw, policy=policy.default)
+
+    received_at = None
+    if message["Date"]:
+        try:
+            received_at = parsedate_to_datetime(str(message["Date"]))
+            if received_at.tzinfo:
+                received_at = received_at.astimezone().replace(tzinfo=None)
+        except (TypeError, ValueError):
+            received_at = None
+
+    body_part = message.get_body(preferencelist=("html", "plain"))
+    attachments = []
+    for part in message.iter_attachments():
+        payload = part.get_payload(decode=True) or b""
+        content_id = part.get("Content-ID")
+        attachments.append({
+            "filename": part.get_filename() or "attachment",
+            "mime_type": part.get_content_type(),
+            "size": len(payload),
+            "content_id": content_id.strip("<>") if content_id else None,
+            "is_inline": part.get_content_disposition() == "inline",
+            "data": base64.urlsafe_b64encode(payload).decode()
+        })
+
+    labels = str(message["X-Gmail-Labels"] or "")
+    return {
+        "gmail_id": str(message["X-Gmail-Id"]) if message["X-Gmail-Id"] else None,
+        "thread_id": str(message["X-Thread-Id"]) if message["X-Thread-Id"] else None,
+        "sender": str(message["From"] or ""),
+        "to_recipients": str(message["To"] or ""),
+        "subject": str(message["Subject"] or ""),
+        "body": body_part.get_content() if body_part else "",
+        "body_cached": body_part is not None,
+        "received_at": received_at,
+        "labels": [label for label in labels.split(",") if label],
+        "attachments": attachments
+    }
+
+
+def _read_mbox(stream: BinaryIO) -> Iterator[dict]:
+    """Messages of an mbox stream, holding only the current one in memory"""
+    lines = []
+    previous_blank = True
+    for line in stream:
+        if line.startswith(b"From ") and previous_blank:
+            if lines:
+                yield _parse_mbox_message(b"".join(lines))
+            lines = []
+        else:
+            # Undo the ">From " escaping the exporter applied to body lines
+            lines.append(line[1:] if line.startswith(b">From ") else line)
+        previous_blank = not line.strip()
+    if lines:
+        yield _parse_mbox_message(b"".join(lines))
+
+
+def _email_row(record: dict, user_id: int, now: datetime) -> dict:
+    received_at = record.get("received_at")
+    if isinstance(received_at, str):
+        received_at = datetime.fromisoformat(received_at)
+    deleted_at = record.get("deleted_at")
+    if isinstance(deleted_at, str):
+        deleted_at = datetime.fromisoformat(deleted_at)
+    labels = record.get("labels") or []
+    if isinstance(labels, str):
+        labels = _labels(labels)
+
+    return {
+        "gmail_id": record.get("gmail_id"),
+        "thread_id": record.get("thread_id"),
+        "sender": record.get("sender") or "Unknown",
+        "to_recipients": record.get("to_recipients") or "",
+        "subject": record.get("subject") or "No Subject",
+        "snippet": record.get("snippet"),
+        "body": record.get("body"),
+        "body_cached": bool(record.get("body_cached")),
+        "body_cached_at": now if record.get("body_cached") else None,
+        "has_attachment": bool(record.get("has_attachment") or record.get("attachments")),
+        "received_at": received_at or now,
+        "auto_reply": record.get("auto_reply") or "",
+        "user_id": user_id,
+        "labels": json.dumps([str(label).lower() for label in labels]),
+        "is_deleted": bool(record.get("is_deleted")),
+        "deleted_at": deleted_at,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def _import_batch(db: Session, user_id: int, records: list) -> tuple:
+    """Insert one batch of emails and their attachments; returns (imported, skipped, attachments)"""
+    now = datetime.now()
+
+    # Take IDs from the sequence up front so attachments can be matched to their emails
+    # even for local emails that have no gmail_id to join back on
+    email_ids = [row[0] for row in db.execute(
+        select(func.nextval(func.pg_get_serial_sequence("emails", "id"))).select_from(func.generate_series(1, len(records)))
+    ).all()]
+
+    email_rows = []
+    for email_id, record in zip(email_ids, records):
+        row = _email_row(record, user_id, now)
+        row["id"] = email_id
+        email_rows.append(row)
+
+    inserted = {row[0] for row in db.execute(
+        pg_insert(models.Email).values(email_rows).on_conflict_do_nothing(
+            index_elements=["user_id", "gmail_id"]
+        ).returning(models.Email.id)
+    ).all()}
+
+    attachment_rows = []
+    for email_id, record in zip(email_ids, records):
+        if email_id not in inserted:
+            continue
+        for attachment in record.get("attachments") or []:
+            attachment_rows.append({
+                "email_id": email_id,
+                "gmail_attachment_id": attachment.get("gmail_attachment_id"),
+                "filename": attachment.get("filename") or "attachment",
+                "mime_type": attachment.get("mime_type") or "application/octet-stream",
+                "size": attachment.get("size"),
+                "content_id": attachment.get("content_id"),
+                "is_inline": bool(attachment.get("is_inline")),
+                "data": attachment.get("data"),
+                "created_at": now
+            })
+
+    if attachment_rows:
+        db.execute(models.EmailAttachment.__table__.insert(), attachment_rows)
+
+    # Bulk inserts skip the ORM flush hooks, so keep the thread summaries in step here
+    refresh_email_threads(db, user_id, {row["thread_id"] for row in email_rows if row["id"] in inserted})
+
+    return len(inserted), len(records) - len(inserted), len(attachment_rows)
+
+
+def import_mailbox(db: Session, user_id: int, stream: BinaryIO, format: str = "ndjson") -> dict:
+    """
+    Import an export_mailbox stream into a user's mailbox.
+
+    Records are read one at a time and inserted IMPORT_BATCH_SIZE per statement,
+    committing each batch. Emails whose gmail_id the user already has are skipped, so
+    re-running an import is safe. Reply/forward links point at source row IDs
+    and are not carried over.
+    """
+    records: Iterable[dict] = _read_mbox(stream) if format == "mbox" else _read_ndjson(stream)
+
+    started = time.monotonic()
+    totals = {"imported": 0, "skipped": 0, "attachments": 0}
+    batch = []
+
+    def flush():
+        imported, skipped, attachments = _import_batch(db, user_id, batch)
+        db.commit()
+        totals["imported"] += imported
+        totals["skipped"] += skipped
+        totals["attachments"] += attachments
+        batch.clear()
+
+    try:
+        for record in records:
+            batch.append(record)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+    except Exception:
+        db.rollback()
+        raise
+
+    seconds = time.monotonic() - started
+    processed = totals["imported"] + totals["skipped"]
+    logger.info(f"Mailbox import - Imported {totals['imported']} emails ({totals['skipped']} skipped) for user {user_id} in {seconds:.1f}s")
+    return {
+        **totals,
+        "seconds": round(seconds, 3),
+        "emails_per_second": round(processed / seconds, 1) if seconds > 0 else None
+    }
@@ -0,0 +1,305 @@
+import calendar
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from models import models
+from utils.event_changes import add_event_change_listener
+
+logger = logging.getLogger(__name__)
+
+# Event.repeat values from the event form, and the RRULE FREQ each one stands for
+SIMPLE_FREQUENCIES = {"daily": "DAILY", "weekly": "WEEKLY", "monthly": "MONTHLY", "yearly": "YEARLY"}
+NON_RECURRING = (None, "", "none")
+
+MAX_OCCURRENCES_PER_WINDOW = 5000  # A daily series over a multi-year window stops here
+OCCURRENCE_CACHE_SIZE = 4096
+
+
+class RecurrenceRule:
+    """The subset of an RFC 5545 RRULE that Event.repeat can carry: FREQ, INTERVAL, COUNT, UNTIL"""
+
+    def __init__(self, freq: str, interval: int = 1, count: Optional[int] = None, until: Optional[datetime] = None):
+        self.freq = freq
+        self.interval = max(1, interval)
+        self.count = count
+        self.until = until
+
+
+def parse_repeat(repeat: Optional[str]) -> Optional[RecurrenceRule]:
+    """
+    Rule for an Event.repeat value, or None for a single event.
+
+    Accepts the form's values (daily, weekly, monthly, yearly) and RRULE
+    strings such as "RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=10". Anything else
+    is treated as not repeating.
+    """
+    if repeat is None or repeat.strip().lower() in NON_RECURRING:
+        return None
+
+    value = repeat.strip()
+    if value.lower() in SIMPLE_FREQUENCIES:
+        return RecurrenceRule(SIMPLE_FREQUENCIES[value.lower()])
+
+    if value.upper().startswith("RRULE:"):
+        value = value[len("RRULE:"):]
+    parts = dict(part.split("=", 1) for part in value.upper().split(";") if "=" in part)
+    if parts.get("FREQ") not in SIMPLE_FREQUENCIES.values():
+        return None
+
+    try:
+        until = None
+        if "UNTIL" in parts:
+            raw = parts["UNTIL"].rstrip("Z")
+            until = datetime.strptime(raw, "%Y%m%dT%H%M%S") if "T" in raw else datetime.strptime(raw, "%Y%m%d").replace(hour=23, minute=59, second=59)
+        return RecurrenceRule(
+            parts["FREQ"],
+            interval=int(parts.get("INTERVAL", 1)),
+            count=int(parts["COUNT"]) if "COUNT" in parts else None,
+            until=until
+        )
+    except ValueError:
+        logger.warning(f"Recurrence - Ignoring malformed repeat rule {repeat!r}")
+        return None
+
+
+def is_recurring(event: models.Event) -> bool:
+    return event.start_time is not None and event.end_time is not None and parse_repeat(event.repeat) is not None
+
+
+def recurring_filter():
+    """SQL condition for events whose repeat value may make them recurring"""
+    return and_(models.Event.repeat.isnot(None), models.Event.repeat.notin_([value for value in NON_RECURRING if value is not None]))
+
+
+def _add_months(start: datetime, months: int) -> Optional[datetime]:
+    """start shifted by whole months; None when that month has no such day (RRULE skips those)"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    if start.day > calendar.monthrange(year, month)[1]:
+        return None
+    return start.replace(year=year, month=month)
+
+
+def _nth_start(start: datetime, rule: RecurrenceRule, n: int) -> Optional[datetime]:
+    if rule.freq == "DAILY":
+        return start + timedelta(days=n * rule.interval)
+    if rule.freq == "WEEKLY":
+        return start + timedelta(weeks=n * rule.interval)
+    if rule.freq == "MONTHLY":
+        return _add_months(start, n * rule.interval)
+    return _add_months(start, 12 * n * rule.interval)
+
+
+def _first_candidate(start: datetime, duration: timedelta, rule: RecurrenceRule, window_start: datetime) -> int:
+    """Index of an occurrence at or before the first one that can end inside the window, without walking the series"""
+    if rule.count is not None and rule.freq in ("MONTHLY", "YEARLY"):
+        return 0  # Skipped dates don't count towards COUNT, so indexes have to be walked
+    earliest = window_start - duration
+    if earliest <= start:
+        return 0
+    if rule.freq in ("DAILY", "WEEKLY"):
+        step = timedelta(days=rule.interval * (7 if rule.freq == "WEEKLY" else 1))
+        return int((earliest - start) // step)
+    months = (earliest.year - start.year) * 12 + earliest.month - start.month
+    per_step = rule.interval * (12 if rule.freq == "YEARLY" else 1)
+    return max(0, months // per_step - 1)
+
+
+def occurrence_starts(start: datetime, duration: timedelta, rule: RecurrenceRule, window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+    """Lazily yield the original start of every occurrence that overlaps [window_start, window_end)"""
+    n = _first_candidate(start, duration, rule, window_start)
+    produced = n  # Occurrences before the first candidate (exact for every rule that skips ahead)
+    while True:
+        if rule.count is not None and produced >= rule.count:
+            return
+        occurrence = _nth_start(start, rule, n)
+        n += 1
+        if occurrence is None:
+            continue
+        produced += 1
+        if rule.until is not None and occurrence > rule.until:
+            return
+        if occurrence >= window_end:
+            return
+        if occurrence + duration > window_start:
+            yield occurrence
+
+
+def last_occurrence_end(event: models.Event) -> Optional[datetime]:
+    """When a series' final occurrence ends; None for a series without COUNT or UNTIL"""
+    if not is_recurring(event):
+        return event.end_time
+    rule = parse_repeat(event.repeat)
+    duration = event.end_time - event.start_time
+    if rule.count is None and rule.until is None:
+        return None
+
+    last = None
+    limit = rule.until + timedelta(seconds=1) if rule.until is not None else datetime.max
+    for occurrence in occurrence_starts(event.start_time, duration, rule, event.start_time, limit):
+        last = occurrence
+    return (last or event.start_time) + duration
+
+
+def is_active_at(event: models.Event, moment: datetime) -> bool:
+    """Whether an event (or, for a series, any of its occurrences) ends at or after `moment`"""
+    end = last_occurrence_end(event)
+    return end is None or end >= moment
+
+
+def _occurrence(event: models.Event, start: datetime, end: datetime, original_start: datetime, exception=None) -> dict:
+    return {
+        "id": event.id,
+        "occurrence_id": f"{event.id}:{original_start.isoformat()}",
+        "title": exception.title if exception is not None and exception.title is not None else event.title,
+        "description": exception.description if exception is not None and exception.description is not None else event.description,
+        "start_time": start,
+        "end_time": end,
+        "original_start": original_start,
+        "category": event.category,
+        "google_event_id": event.google_event_id,
+        "recurring": True,
+        "modified": exception is not None
+    }
+
+
+def expand_event(event: models.Event, window_start: datetime, window_end: datetime, exceptions: Iterable = ()) -> Iterator[dict]:
+    """
+    Lazily yield a recurring event's occurrences overlapping [window_start, window_end).
+
+    `exceptions` are the event's EventException rows: cancelled ones drop their
+    occurrence, the others override its time, title or description. A moved
+    occurrence shows up where it was moved to, even if its original slot is
+    outside the window.
+    """
+    rule = parse_repeat(event.repeat)
+    duration = event.end_time - event.start_time
+    overrides = {exception.original_start: exception for exception in exceptions}
+
+    produced = 0
+    for original_start in occurrence_starts(event.start_time, duration, rule, window_start, window_end):
+        exception = overrides.pop(original_start, None)
+        if exception is None:
+            start, end = original_start, original_start + duration
+        elif exception.cancelled:
+            continue
+        else:
+            start = exception.start_time or original_start
+            end = exception.end_time or start + duration
+            if not (start < window_end and end > window_start):
+                continue  # Moved out of the window
+        yield _occurrence(event, start, end, original_start, exception)
+        produced += 1
+        if produced >= MAX_OCCURRENCES_PER_WINDOW:
+            logger.warning(f"Recurrence - Stopped expanding event {event.id} at {produced} occurrences")
+            return
+
+    # Occurrences moved into the window from outside it
+    for original_start, exception in overrides.items():
+        if exception.cancelled or exception.start_time is None:
+            continue
+        end = exception.end_time or exception.start_time + duration
+        if exception.start_time < window_end and end > window_start:
+            yield _occurrence(event, exception.start_time, end, original_start, exception)
+
+
+class _OccurrenceCache:
+    """LRU of expanded occurrences per (user, event, window); a user's entries go when their events change"""
+
+    def __init__(self, max_entries: int = OCCURRENCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[List[dict]]:
+        with self._lock:
+            occurrences = self._entries.get(key)
+            if occurrences is not None:
+                self._entries.move_to_end(key)
+            return occurrences
+
+    def put(self, key: tuple, occurrences: List[dict]):
+        with self._lock:
+            self._entries[key] = occurrences
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids: Set[int]):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in user_ids]:
+                del self._entries[key]
+
+
+_occurrence_cache = _OccurrenceCache()
+add_event_change_listener(_occurrence_cache.invalidate)
+
+
+def expand_events(db: Session, events: Iterable[models.Event], window_start: datetime, window_end: datetime) -> List[dict]:
+    """
+    Occurrences of `events` overlapping [window_start, window_end), sorted by start.
+
+    Single events come through as one occurrence (recurring=False). Recurring
+    ones are expanded with their exceptions, which are loaded in one query for
+    whichever events aren't in the memo cache yet.
+    """
+    occurrences = []
+    pending = []
+    for event in events:
+        if event.start_time is None or event.end_time is None:
+            continue
+        if not is_recurring(event):
+            if event.start_time < window_end and event.end_time > window_start:
+                occurrences.append({
+                    "id": event.id,
+                    "occurrence_id": str(event.id),
+                    "title": event.title,
+                    "description": event.description,
+                    "start_time": event.start_time,
+                    "end_time": event.end_time,
+                    "original_start": event.start_time,
+                    "category": event.category,
+                    "google_event_id": event.google_event_id,
+                    "recurring": False,
+                    "modified": False
+                })
+            continue
+
+        key = (event.user_id, event.id, event.updated_at, window_start, window_end)
+        cached = _occurrence_cache.get(key)
+        if cached is not None:
+            occurrences.extend(cached)
+        else:
+            pending.append((key, event))
+
+    if pending:
+        exceptions: Dict[int, list] = defaultdict(list)
+        for exception in db.query(models.EventException).filter(
+            models.EventException.event_id.in_([event.id for _, event in pending])
+        ).all():
+            exceptions[exception.event_id].append(exception)
+
+        for key, event in pending:
+            expanded = list(expand_event(event, window_start, window_end, exceptions[event.id]))
+            _occurrence_cache.put(key, expanded)
+            occurrences.extend(expanded)
+
+    return sorted(occurrences, key=lambda occurrence: occurrence["start_time"])
+
+
+def events_in_window(db: Session, user_id: int, window_start: datetime, window_end: datetime, *criteria) -> List[dict]:
+    """A user's event occurrences in a window: single events overlapping it plus every recurring series started before its end"""
+    events = db.query(models.Event).filter(
+        models.Event.user_id == user_id,
+        models.Event.is_deleted.isnot(True),
+        models.Event.start_time < window_end,
+        or_(models.Event.end_time > window_start, recurring_filter()),
+        *criteria
+    ).all()
+    return expand_events(db, events, window_start, window_end)
@@ -0,0 +1,95 @@
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from models import models
+
+logger = logging.getLogger(__name__)
+
+# Columns added to tables that already existed, as (table, column). Base.metadata.create_all()
+# only creates missing tables, so databases from before the column need an ALTER TABLE.
+ADDED_COLUMNS: List[Tuple[str, str]] = [
+    ("sync_jobs", "params"),
+    ("emails", "gmail_sync_attempts"),
+    ("emails", "gmail_labels"),
+    ("gmail_connections", "email_address"),
+    ("gmail_connections", "watch_expiration"),
+    ("email_attachments", "storage_path"),
+    ("google_calendar_connections", "sync_tokens"),
+    ("events", "google_etag"),
+    ("events", "google_updated"),
+]
+
+# Indexes added to tables that already existed, as (table, index name); built from the model definition
+ADDED_INDEXES: List[Tuple[str, str]] = [
+    ("events", "uq_events_local_title_start"),
+    ("events", "ix_events_period"),
+    ("gmail_connections", "ix_gmail_connections_email_address"),
+    ("emails", "ix_emails_user_thread"),
+]
+
+
+def _add_columns(conn: Connection):
+    inspector = inspect(conn)
+    for table_name, column_name in ADDED_COLUMNS:
+        if column_name in {column["name"] for column in inspector.get_columns(table_name)}:
+            continue
+
+        column = models.Base.metadata.tables[table_name].c[column_name]
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(dialect=conn.dialect)}"
+        if column.default is not None and column.default.is_scalar and isinstance(column.default.arg, (bool, int)):
+            # Existing rows get the model default instead of NULL
+            ddl += f" DEFAULT {str(column.default.arg).lower() if isinstance(column.default.arg, bool) else column.default.arg}"
+        conn.execute(text(ddl))
+        logger.info(f"Schema upgrade - Added column {table_name}.{column_name}")
+
+
+def _add_indexes(conn: Connection):
+    inspector = inspect(conn)
+    for table_name, index_name in ADDED_INDEXES:
+        if index_name in {index["name"] for index in inspector.get_indexes(table_name)}:
+            continue
+
+        index = next(index for index in models.Base.metadata.tables[table_name].indexes if index.name == index_name)
+        ddl_if = getattr(index, "_ddl_if", None)
+        if ddl_if is not None and ddl_if.dialect is not None and ddl_if.dialect != conn.dialect.name:
+            continue  # Limited to another database (e.g. Postgres-only GiST indexes)
+
+        savepoint = conn.begin_nested()
+        try:
+            index.create(conn)
+            savepoint.commit()
+            logger.info(f"Schema upgrade - Created index {index_name} on {table_name}")
+        except Exception as e:
+            # e.g. a unique index over rows that still hold duplicates; retried on the next start
+            savepoint.rollback()
+            logger.warning(f"Schema upgrade - Could not create index {index_name} on {table_name}: {str(e)}")
+
+
+def _scope_gmail_ids_to_user(conn: Connection):
+    """emails.gmail_id used to be unique across all users; it is now unique per user"""
+    if conn.dialect.name != "postgresql":
+        return
+    constraints = {constraint["name"]: constraint["column_names"] for constraint in inspect(conn).get_unique_constraints("emails")}
+    for name, columns in constraints.items():
+        if columns == ["gmail_id"]:
+            conn.execute(text(f'ALTER TABLE emails DROP CONSTRAINT "{name}"'))
+            logger.info(f"Schema upgrade - Dropped global unique constraint {name} on emails.gmail_id")
+    if "uq_emails_user_gmail" not in constraints:
+        conn.execute(text("ALTER TABLE emails ADD CONSTRAINT uq_emails_user_gmail UNIQUE (user_id, gmail_id)"))
+        logger.info("Schema upgrade - Added unique constraint uq_emails_user_gmail")
+
+
+def upgrade_schema(engine: Engine):
+    """
+    Bring tables created by an older version up to the current models.
+
+    Runs on startup right after create_all(); every step checks the live
+    schema first, so it is a no-op on a database that is already current.
+    """
+    with engine.begin() as conn:
+        _add_columns(conn)
+        _add_indexes(conn)
+        _scope_gmail_ids_to_user(conn)
@@ -0,0 +1,125 @@
+import logging
+from typing import Iterable, List, Optional
+
+from sqlalchemy import true
+from sqlalchemy.orm import Session
+
+from models import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 1000
+
+GOOGLE_CALENDAR = "google_calendar"
+GMAIL = "gmail"
+
+# Connection a user needs before changes can be pushed to a target
+CONNECTION_MODELS = {GOOGLE_CALENDAR: models.GoogleCalendarConnection, GMAIL: models.GmailConnection}
+
+# When an entity has several pending entries, the strongest operation stands for all of them
+OPERATION_RANK = {"update": 0, "create": 1, "delete": 2}
+
+
+class OutboxChange:
+    """Pending entries for one entity, folded into a single push"""
+
+    def __init__(self, entity_id: int, operation: str, entry_id: int):
+        self.entity_id = entity_id
+        self.operation = operation
+        self.entry_ids = [entry_id]
+
+    def add(self, operation: str, entry_id: int):
+        if OPERATION_RANK[operation] > OPERATION_RANK[self.operation]:
+            self.operation = operation
+        self.entry_ids.append(entry_id)
+
+
+def record_change(db: Session, user_id: int, target: str, entity_id: int, operation: str):
+    """
+    Append a local change to the outbox.
+
+    Only adds to the session, so the entry commits (or rolls back) together
+    with the change it describes. New rows need a db.flush() first for their ID.
+    """
+    db.add(models.SyncOutbox(user_id=user_id, target=target, entity_id=entity_id, operation=operation))
+
+
+def is_connected(db: Session, user_id: int, target: str) -> bool:
+    """Whether the user has a connection for `target`; without one there is nothing to push recorded changes through"""
+    connection_model = CONNECTION_MODELS[target]
+    return db.query(connection_model.id).filter(connection_model.user_id == user_id).first() is not None
+
+
+def pending_changes(db: Session, user_id: int, target: str, after_id: int = 0, limit: int = OUTBOX_BATCH_SIZE) -> List[OutboxChange]:
+    """
+    The oldest `limit` outbox entries for a user, coalesced per entity in order of first change.
+
+    Pass the last entry ID of the previous batch as `after_id` to move past
+    entries that were left in place for a retry on the next sync.
+    """
+    entries = db.query(models.SyncOutbox.id, models.SyncOutbox.entity_id, models.SyncOutbox.operation).filter(
+        models.SyncOutbox.target == target,
+        models.SyncOutbox.user_id == user_id,
+        models.SyncOutbox.id > after_id
+    ).order_by(models.SyncOutbox.id).limit(limit).all()
+
+    changes = {}
+    for entry in entries:
+        change = changes.get(entry.entity_id)
+        if change is None:
+            changes[entry.entity_id] = OutboxChange(entry.entity_id, entry.operation, entry.id)
+        else:
+            change.add(entry.operation, entry.id)
+    return list(changes.values())
+
+
+def acknowledge(db: Session, changes: Iterable[OutboxChange]) -> int:
+    """Drop the entries behind pushed (or abandoned) changes; commits with the caller's transaction"""
+    entry_ids = [entry_id for change in changes for entry_id in change.entry_ids]
+    if not entry_ids:
+        return 0
+    return db.query(models.SyncOutbox).filter(models.SyncOutbox.id.in_(entry_ids)).delete(synchronize_session=False)
+
+
+def backfill_sync_outbox(user_id: Optional[int] = None) -> int:
+    """
+    Add outbox entries for rows flagged for sync that have none.
+
+    Runs on startup (rows flagged before the outbox existed) and when a user
+    connects (rows edited while they weren't connected). Only users with a
+    connection for the target get entries.
+    """
+    db = SessionLocal()
+    try:
+        added = 0
+        for target, model, flag, pushable in (
+            (GOOGLE_CALENDAR, models.Event, models.Event.needs_google_sync, true()),
+            # Emails that never came from Gmail have nothing to push
+            (GMAIL, models.Email, models.Email.needs_gmail_sync, models.Email.gmail_id.isnot(None))
+        ):
+            queued = db.query(models.SyncOutbox.entity_id).filter(models.SyncOutbox.target == target)
+            connected = db.query(CONNECTION_MODELS[target].user_id)
+            rows = db.query(model.id, model.user_id, model.is_deleted).filter(
+                flag == True,
+                pushable,
+                model.user_id.in_(connected),
+                model.id.notin_(queued),
+                *([model.user_id == user_id] if user_id is not None else [])
+            ).all()
+            db.bulk_insert_mappings(models.SyncOutbox, [
+                {"user_id": row.user_id, "target": target, "entity_id": row.id, "operation": "delete" if row.is_deleted else "update"}
+                for row in rows
+            ])
+            added += len(rows)
+        db.commit()
+
+        if added:
+            logger.info(f"Sync outbox - Queued {added} flagged changes that had no outbox entry")
+        return added
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Sync outbox - Backfill failed: {str(e)}")
+        return 0
+    finally:
+        db.close()
@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config.google import google_config
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledSync:
+    """One queued or running sync for a user"""
+
+    def __init__(self, user_id: int, kind: str, params: Optional[dict] = None, interactive: bool = True):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.params = dict(params or {})
+        self.params["job_id"] = self.id  # Lets runners checkpoint progress against this job
+        self.interactive = interactive
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "kind": self.kind,
+            "status": self.status,
+            "interactive": self.interactive,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class SyncKind:
+    """A registered kind of sync (e.g. "gmail", "calendar")"""
+
+    def __init__(
+        self,
+        name: str,
+        runner: Callable[[int, dict], Awaitable[dict]],
+        discover: Optional[Callable[[], List[int]]] = None,
+        count_changes: Optional[Callable[[dict], int]] = None
+    ):
+        self.name = name
+        self.runner = runner                # async (user_id, params) -> result dict
+        self.discover = discover            # blocking () -> user IDs that should be synced periodically
+        self.count_changes = count_changes  # result dict -> number of changed items, drives the interval
+
+
+class SyncScheduler:
+    """
+    Runs per-user sync jobs in the background.
+
+    - A fixed pool of workers pulls jobs round-robin across users, so one user
+      with a huge mailbox cannot starve everyone else.
+    - Only one job per (user, kind) is queued or running at a time; enqueueing
+      again returns the in-flight job instead of starting an overlapping sync.
+      Different params are merged into a queued job; for a running one they
+      go into a single follow-up job that is queued when it finishes.
+    - Periodic syncs use adaptive intervals: the interval halves when a sync
+      finds changes and doubles when it finds none, between the configured bounds.
+    """
+
+    def __init__(self):
+        self.kinds: Dict[str, SyncKind] = {}
+        self.jobs: Dict[str, ScheduledSync] = {}
+        self.inflight: Dict[tuple, ScheduledSync] = {}
+        self.follow_ups: Dict[tuple, ScheduledSync] = {}  # Waiting for the running job of the same key to finish
+        self.user_queues: Dict[int, deque] = {}
+        self.ready_users = deque()
+        self.busy_users = set()
+        self.intervals: Dict[tuple, float] = {}
+        self.next_run: Dict[tuple, float] = {}
+        self.listeners: List[Callable[[ScheduledSync], None]] = []
+        self.wakeup = None
+        self.tasks: List[asyncio.Task] = []
+
+    def register(self, name: str, runner, discover=None, count_changes=None):
+        """Register a sync kind and the coroutine that runs it"""
+        self.kinds[name] = SyncKind(name, runner, discover, count_changes)
+
+    def add_listener(self, listener: Callable[[ScheduledSync], None]):
+        """Call listener(job) on every job status change"""
+        self.listeners.append(listener)
+
+    async def start(self):
+        """Start the worker pool and the periodic ticker"""
+        if self.tasks:
+            return
+        self.wakeup = asyncio.Condition()
+        workers = max(1, google_config.SYNC_SCHEDULER_WORKERS)
+        self.tasks = [asyncio.create_task(self._worker(i)) for i in range(workers)]
+        self.tasks.append(asyncio.create_task(self._ticker()))
+        logger.info(f"Sync scheduler started with {workers} workers")
+
+    async def stop(self):
+        """Cancel the workers and the ticker"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def get_job(self, job_id: str) -> Optional[ScheduledSync]:
+        return self.jobs.get(job_id)
+
+    def has_interactive_waiting(self, user_id: Optional[int] = None) -> bool:
+        """True if a user-triggered job is queued (for this user, or for anyone if user_id is None)"""
+        queues = [self.user_queues.get(user_id) or ()] if user_id is not None else list(self.user_queues.values())
+        return any(job.interactive for queue in queues for job in queue)
+
+    async def enqueue(self, user_id: int, kind: str, params: Optional[dict] = None, interactive: bool = True) -> ScheduledSync:
+        """Queue a sync for a user, or join the one already queued/running for the same kind"""
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown sync kind: {kind}")
+        if self.wakeup is None:
+            raise RuntimeError("Sync scheduler is not running")
+
+        key = (user_id, kind)
+        existing = self.inflight.get(key)
+        if existing:
+            differing = {name: value for name, value in (params or {}).items() if existing.params.get(name) != value}
+            if differing and existing.status != "queued":
+                # Already running with other params (e.g. other calendars): run again with these once it ends
+                return self._follow_up(existing, params, interactive)
+            if differing:
+                self._merge_params(existing, differing)
+                self._notify(existing)
+                logger.info(f"Sync scheduler - Merged {sorted(differing)} into queued {kind} sync {existing.id} for user {user_id}")
+
+            # A user-triggered request promotes a queued background sync to the front
+            if interactive and not existing.interactive and existing.status == "queued":
+                existing.interactive = True
+                queue = self.user_queues.get(user_id)
+                if queue and existing in queue:
+                    queue.remove(existing)
+                    queue.appendleft(existing)
+            logger.info(f"Sync scheduler - Joining in-flight {kind} sync {existing.id} for user {user_id}")
+            return existing
+
+        job = ScheduledSync(user_id, kind, params, interactive)
+        self.jobs[job.id] = job
+        await self._queue(job)
+        return job
+
+    async def _queue(self, job: ScheduledSync):
+        self.inflight[(job.user_id, job.kind)] = job
+
+        queue = self.user_queues.setdefault(job.user_id, deque())
+        if job.interactive:
+            queue.appendleft(job)
+        else:
+            queue.append(job)
+
+        async with self.wakeup:
+            if job.user_id not in self.busy_users and job.user_id not in self.ready_users:
+                self.ready_users.append(job.user_id)
+            self.wakeup.notify()
+
+        self._notify(job)
+        logger.info(f"Sync scheduler - Queued {job.kind} sync {job.id} for user {job.user_id}")
+
+    def _follow_up(self, running: ScheduledSync, params: dict, interactive: bool) -> ScheduledSync:
+        """The job that runs after `running` with a joining request's differing params (one per user and kind)"""
+        key = (running.user_id, running.kind)
+        job = self.follow_ups.get(key)
+        if job is None:
+            job = ScheduledSync(running.user_id, running.kind, params, interactive)
+            self.jobs[job.id] = job
+            self.follow_ups[key] = job
+        else:
+            self._merge_params(job, params)
+            job.interactive = job.interactive or interactive
+        self._notify(job)
+        logger.info(f"Sync scheduler - {running.kind} sync {job.id} for user {running.user_id} will follow running sync {running.id}")
+        return job
+
+    @staticmethod
+    def _merge_params(job: ScheduledSync, params: dict):
+        """Fold a joining request's params into a waiting job: lists are unioned, other values replaced"""
+        for name, value in params.items():
+            current = job.params.get(name)
+            if isinstance(current, list) and isinstance(value, list):
+                job.params[name] = list(dict.fromkeys(current + value))
+            else:
+                job.params[name] = value
+
+    def _notify(self, job: ScheduledSync):
+        for listener in self.listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"Sync scheduler - Listener failed for job {job.id}: {str(e)}")
+
+    async def _next_job(self) -> ScheduledSync:
+        """Take the next job from the next user in round-robin order"""
+        async with self.wakeup:
+            while not self.ready_users:
+                await self.wakeup.wait()
+            user_id = self.ready_users.popleft()
+            self.busy_users.add(user_id)
+            return self.user_queues[user_id].popleft()
+
+    async def _release_user(self, user_id: int):
+        """Put the user at the back of the line if they still have queued work"""
+        async with self.wakeup:
+            self.busy_users.discard(user_id)
+            if self.user_queues.get(user_id):
+                self.ready_users.append(user_id)
+                self.wakeup.notify()
+            else:
+                self.user_queues.pop(user_id, None)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._next_job()
+            try:
+                await self._run(job)
+            finally:
+                await self._release_user(job.user_id)
+
+    async def _run(self, job: ScheduledSync):
+        kind = self.kinds[job.kind]
+        key = (job.user_id, job.kind)
+
+        job.status = "running"
+        job.started_at = datetime.now()
+        self._notify(job)
+
+        try:
+            job.result = await kind.runner(job.user_id, job.params)
+            job.status = "completed"
+        except Exception as e:
+            job.error = getattr(e, "detail", None) or str(e)
+            job.status = "failed"
+            logger.error(f"Sync scheduler - {job.kind} sync {job.id} for user {job.user_id} failed: {job.error}")
+        finally:
+            job.finished_at = datetime.now()
+            self.inflight.pop(key, None)
+            self._reschedule(key, kind, job)
+            job.done.set()
+            self._notify(job)
+
+        follow_up = self.follow_ups.pop(key, None)
+        if follow_up is not None:
+            await self._queue(follow_up)
+
+        # Windowed jobs (e.g. backfills) ask to be queued again behind whatever arrived meanwhile
+        continuation = (job.result or {}).get("continue_with") if job.status == "completed" else None
+        if continuation is not None:
+            await self.enqueue(job.user_id, job.kind, params=continuation, interactive=False)
+
+    def _reschedule(self, key: tuple, kind: SyncKind, job: ScheduledSync):
+        """Adapt the periodic interval for this user/kind based on how much the last sync changed"""
+        min_interval = google_config.SYNC_MIN_INTERVAL_SECONDS
+        max_interval = google_config.SYNC_MAX_INTERVAL_SECONDS
+        interval = self.intervals.get(key, min_interval)
+
+        if job.status == "completed":
+            changes = kind.count_changes(job.result or {}) if kind.count_changes else 0
+            interval = interval / 2 if changes > 0 else interval * 2
+        else:
+            # Back off on failures (expired tokens, quota) instead of retrying hot
+            interval = interval * 2
+
+        interval = min(max(interval, min_interval), max_interval)
+        self.intervals[key] = interval
+        self.next_run[key] = time.monotonic() + interval
+
+    def _prune_finished_jobs(self, max_age_seconds: int = 3600):
+        """Forget finished jobs after an hour so the registry doesn't grow forever"""
+        now = datetime.now()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at and (now - job.finished_at).total_seconds() > max_age_seconds:
+                del self.jobs[job_id]
+
+    async def _ticker(self):
+        """Discover connected users and enqueue background syncs that are due"""
+        while True:
+            try:
+                now = time.monotonic()
+                for kind in list(self.kinds.values()):
+                    if not kind.discover:
+                        continue
+                    user_ids = await asyncio.to_thread(kind.discover)
+                    for user_id in user_ids:
+                        key = (user_id, kind.name)
+                        if key not in self.next_run:
+                            # First time we see this user: wait one minimum interval before syncing
+                            self.next_run[key] = now + google_config.SYNC_MIN_INTERVAL_SECONDS
+                            continue
+                        if self.next_run[key] <= now and key not in self.inflight:
+                            await self.enqueue(user_id, kind.name, interactive=False)
+                self._prune_finished_jobs()
+            except Exception as e:
+                logger.error(f"Sync scheduler - Ticker failed: {str(e)}")
+
+            await asyncio.sleep(google_config.SYNC_SCHEDULER_TICK_SECONDS)
+
+
+sync_scheduler = SyncScheduler()